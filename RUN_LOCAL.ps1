@@ -9,6 +9,11 @@
     This script is SAFE to run repeatedly (all pipelines are idempotent).
     It does NOT touch the remote Supabase instance.
 
+    With -SkipUnchanged, a category folder whose PIPELINE__ files hash the
+    same as when they were last applied to this database (recorded in the
+    folder's .manifest.json, shared with python -m pipeline.apply) is not
+    re-executed.
+
 .NOTES
     Prerequisites:
         - Docker Desktop running with local Supabase containers
@@ -23,6 +28,7 @@
         .\RUN_LOCAL.ps1 -Category chips -RunQA
         .\RUN_LOCAL.ps1 -Enrich
         .\RUN_LOCAL.ps1 -Enrich -RunQA
+        .\RUN_LOCAL.ps1 -SkipUnchanged
 #>
 
 [CmdletBinding()]
@@ -37,7 +43,10 @@ param(
     [switch]$RunQA,
 
     [Parameter(HelpMessage = "Run ingredient/allergen enrichment via enrich_ingredients.py after pipeline execution. Requires internet (OFF API).")]
-    [switch]$Enrich
+    [switch]$Enrich,
+
+    [Parameter(HelpMessage = "Skip category folders whose pipeline files are unchanged since their last apply to this database.")]
+    [switch]$SkipUnchanged
 )
 
 # ─── Configuration ───────────────────────────────────────────────────────────
@@ -48,6 +57,68 @@ $DB_USER = "postgres"
 
 $PIPELINE_ROOT = Join-Path $PSScriptRoot "db" "pipelines"
 
+# Per-folder record of the files last applied and the database they went to.
+# The fingerprint query must match _FINGERPRINT_SQL in pipeline/apply.py.
+$MANIFEST_FILENAME = ".manifest.json"
+# Delta baseline written by generate_pipeline; promoted once the folder is applied
+# (promote_snapshot in pipeline/sql_generator.py).
+$SNAPSHOT_FILENAME = ".snapshot.json"
+$PENDING_SNAPSHOT_FILENAME = ".snapshot.pending.json"
+$FINGERPRINT_SQL = "SELECT concat_ws(':', (SELECT system_identifier FROM pg_control_system()), d.oid, " +
+    "CASE WHEN to_regclass('supabase_migrations.schema_migrations') IS NOT NULL THEN " +
+    "(xpath('/row/v/text()', query_to_xml(" +
+    "'SELECT max(version) AS v FROM supabase_migrations.schema_migrations', false, true, '')))[1]::text END) " +
+    "FROM pg_database d WHERE d.datname = current_database()"
+
+# ─── Manifest Helpers ───────────────────────────────────────────────────────
+
+# Must hash like file_hashes in pipeline/apply.py: .gz decompressed, and
+# without the "-- Generated: <date>" lines, so a same-content regeneration
+# on another day is still recognised as unchanged.
+function Get-PipelineHashes([System.IO.DirectoryInfo]$folder) {
+    $hashes = @{}
+    $sha = [System.Security.Cryptography.SHA256]::Create()
+    foreach ($file in Get-ChildItem -Path $folder.FullName -Filter "PIPELINE__*" -File) {
+        $stream = [System.IO.File]::OpenRead($file.FullName)
+        if ($file.Extension -eq ".gz") {
+            $stream = [System.IO.Compression.GZipStream]::new($stream, [System.IO.Compression.CompressionMode]::Decompress)
+        }
+        $reader = [System.IO.StreamReader]::new($stream, [System.Text.UTF8Encoding]::new($false))
+        try { $text = $reader.ReadToEnd() } finally { $reader.Dispose() }
+        $text = [regex]::Replace($text, '(?m)^-- Generated:[^\n]*(\n|$)', '')
+        $digest = $sha.ComputeHash([System.Text.Encoding]::UTF8.GetBytes($text))
+        $hashes[$file.Name] = [System.Convert]::ToHexString($digest).ToLowerInvariant()
+    }
+    $sha.Dispose()
+    return $hashes
+}
+
+function Test-FolderUnchanged([System.IO.DirectoryInfo]$folder, [hashtable]$hashes) {
+    $manifestPath = Join-Path $folder.FullName $MANIFEST_FILENAME
+    if ($hashes.Count -eq 0 -or -not (Test-Path $manifestPath)) { return $false }
+    try { $manifest = Get-Content $manifestPath -Raw | ConvertFrom-Json }
+    catch { return $false }
+    if ($manifest.version -ne 2 -or $manifest.fingerprint -ne $script:fingerprint) { return $false }
+    $recorded = @($manifest.files.PSObject.Properties)
+    if ($recorded.Count -ne $hashes.Count) { return $false }
+    foreach ($entry in $recorded) {
+        if ($hashes[$entry.Name] -cne $entry.Value) { return $false }
+    }
+    return $true
+}
+
+function Write-FolderManifest([System.IO.DirectoryInfo]$folder, [hashtable]$hashes) {
+    $files = [ordered]@{}
+    foreach ($name in ($hashes.Keys | Sort-Object)) { $files[$name] = $hashes[$name] }
+    $manifest = [ordered]@{ files = $files; fingerprint = $script:fingerprint; version = 2 }
+    $manifest | ConvertTo-Json | Set-Content -Path (Join-Path $folder.FullName $MANIFEST_FILENAME) -Encoding utf8NoBOM
+}
+
+function Complete-FolderSnapshot([string]$folderPath) {
+    $pending = Join-Path $folderPath $PENDING_SNAPSHOT_FILENAME
+    if (Test-Path $pending) { Move-Item -Path $pending -Destination (Join-Path $folderPath $SNAPSHOT_FILENAME) -Force }
+}
+
 # ─── Preflight Checks ───────────────────────────────────────────────────────
 
 Write-Host ""
@@ -83,6 +154,16 @@ catch {
     exit 1
 }
 
+$fingerprint = ""
+if ($SkipUnchanged) {
+    $fingerprint = ($FINGERPRINT_SQL | docker exec -i $CONTAINER psql -U $DB_USER -d $DB_NAME -At -v ON_ERROR_STOP=1 2>&1 | Out-String).Trim()
+    if ($LASTEXITCODE -ne 0 -or $fingerprint -eq "") {
+        Write-Host "ERROR: Could not read the database fingerprint: $fingerprint" -ForegroundColor Red
+        exit 1
+    }
+    Write-Host "Database fingerprint: $fingerprint" -ForegroundColor DarkGray
+}
+
 # ─── Discover Pipeline Files ────────────────────────────────────────────────
 
 if (-not (Test-Path $PIPELINE_ROOT)) {
@@ -107,19 +188,38 @@ else {
 
 # Collect all SQL files in execution order
 $allFiles = @()
+$manifestFolders = @()
+$folderHashes = @{}
+$unchangedCount = 0
 foreach ($folder in $categoryFolders) {
     $sqlFiles = Get-ChildItem -Path $folder.FullName -Filter "PIPELINE__*.sql" | Sort-Object Name
     if ($sqlFiles.Count -eq 0) {
         Write-Host "  SKIP: $($folder.Name) (no pipeline files)" -ForegroundColor DarkGray
         continue
     }
+    if ($SkipUnchanged) {
+        $hashes = Get-PipelineHashes $folder
+        if (Test-FolderUnchanged $folder $hashes) {
+            Write-Host "  SKIP: $($folder.Name) (unchanged since last apply)" -ForegroundColor DarkGray
+            if (-not $DryRun) { Complete-FolderSnapshot $folder.FullName }
+            $unchangedCount++
+            continue
+        }
+        $folderHashes[$folder.Name] = $hashes
+        $manifestFolders += $folder
+    }
     foreach ($file in $sqlFiles) {
         $allFiles += $file
     }
 }
 
 if ($allFiles.Count -eq 0) {
-    Write-Host "No pipeline files found to execute." -ForegroundColor Yellow
+    if ($unchangedCount -gt 0) {
+        Write-Host "Nothing to execute — all $unchangedCount pipeline folders are unchanged since their last apply." -ForegroundColor Green
+    }
+    else {
+        Write-Host "No pipeline files found to execute." -ForegroundColor Yellow
+    }
     exit 0
 }
 
@@ -150,6 +250,7 @@ if ($DryRun) {
 # Execute each file
 $successCount = 0
 $failCount = 0
+$failedCategory = ""
 $stopwatch = [System.Diagnostics.Stopwatch]::StartNew()
 
 foreach ($file in $allFiles) {
@@ -175,6 +276,7 @@ foreach ($file in $allFiles) {
         Write-Host "  ✗ FAILED" -ForegroundColor Red
         Write-Host "    $output" -ForegroundColor DarkRed
         $failCount++
+        $failedCategory = $file.Directory.Name
         # Stop on first error to prevent cascading failures
         Write-Host ""
         Write-Host "ABORTED: Stopping pipeline due to error." -ForegroundColor Red
@@ -184,6 +286,16 @@ foreach ($file in $allFiles) {
 
 $stopwatch.Stop()
 
+# Record every folder whose files all ran (folders run in order; the run stops at the first failure)
+foreach ($folder in $manifestFolders) {
+    if ($folder.Name -eq $failedCategory) { break }
+    Write-FolderManifest $folder $folderHashes[$folder.Name]
+}
+foreach ($folderPath in @($allFiles | ForEach-Object { $_.Directory.FullName } | Select-Object -Unique)) {
+    if ((Split-Path $folderPath -Leaf) -eq $failedCategory) { break }
+    Complete-FolderSnapshot $folderPath
+}
+
 # ─── Summary ────────────────────────────────────────────────────────────────
 
 Write-Host ""
@@ -192,6 +304,9 @@ Write-Host "  Execution Summary" -ForegroundColor Cyan
 Write-Host "================================================" -ForegroundColor Cyan
 Write-Host "  Succeeded:  $successCount" -ForegroundColor Green
 Write-Host "  Failed:     $failCount" -ForegroundColor $(if ($failCount -gt 0) { "Red" } else { "Green" })
+if ($SkipUnchanged) {
+    Write-Host "  Unchanged:  $unchangedCount folders skipped" -ForegroundColor DarkGray
+}
 Write-Host "  Duration:   $($stopwatch.Elapsed.TotalSeconds.ToString('F1'))s" -ForegroundColor White
 Write-Host "  Target:     LOCAL (docker exec $CONTAINER)" -ForegroundColor Green
 Write-Host ""
@@ -7,10 +7,15 @@ Checks:
   - Required files exist (01, 03, 04, 05)
   - Step 01 uses ON CONFLICT (country, brand, product_name)
   - Step 03 uses ON CONFLICT (product_id)
-  - Step 04 calls score_category()
+  - Step 04 calls score_category() (batched output: in its last batch file)
+  - COPY-format folders (01_copy_load driver) have their CSV payload and
+    the step 01/03/04 patterns in the driver
   - No hardcoded product_id integer literals in INSERT/UPDATE
   - No references to non-portable constructs
 
+Gzip-compressed output (``*.sql.gz`` / ``*.csv.gz``) is checked like the
+plain files.
+
 Usage:
     python check_pipeline_structure.py          # check all categories
     python check_pipeline_structure.py chips    # check one category
@@ -22,6 +27,7 @@ Exit codes:
 
 from __future__ import annotations
 
+import gzip
 import re
 import sys
 from pathlib import Path
@@ -60,14 +66,34 @@ STEP_04_SCORE_CALL = re.compile(
     re.IGNORECASE,
 )
 
+# COPY-format folder: one driver plus its CSV payload replace the step files
+COPY_DRIVER_STEP = "01_copy_load"
+COPY_PAYLOAD_STEP = "00_copy_payload"
+
 # Batch file step pattern: 01_batch_001_insert_products → base step "01_insert_products"
 _BATCH_STEP_RE = re.compile(r"^(\d{2})_batch_\d{3}_(.+)$")
 
 
+def _pipeline_files(folder: Path) -> list[Path]:
+    """The folder's PIPELINE__*.sql files, plain or gzip-compressed."""
+    return sorted([*folder.glob("PIPELINE__*.sql"), *folder.glob("PIPELINE__*.sql.gz")])
+
+
+def _read_sql(path: Path) -> str:
+    """File content as text, decompressing ``.gz`` files."""
+    data = gzip.decompress(path.read_bytes()) if path.suffix == ".gz" else path.read_bytes()
+    return data.decode("utf-8", errors="replace")
+
+
 def _check_required_files(category: str, folder: Path) -> list[str]:
     """Check that all required step files exist for a category."""
     violations: list[str] = []
-    sql_files = {f.name for f in folder.glob("PIPELINE__*.sql")}
+    sql_files = {f.name.removesuffix(".gz") for f in _pipeline_files(folder)}
+    if f"PIPELINE__{category}__{COPY_DRIVER_STEP}.sql" in sql_files:
+        payload = f"PIPELINE__{category}__{COPY_PAYLOAD_STEP}.csv"
+        if not (folder / payload).is_file() and not (folder / f"{payload}.gz").is_file():
+            violations.append(f"[{category}] Missing: {payload}")
+        return violations
     for step in REQUIRED_STEPS:
         single = f"PIPELINE__{category}__{step}.sql"
         if single in sql_files:
@@ -132,9 +158,21 @@ def _check_step_structure(
     elif step == "04_scoring" and not STEP_04_SCORE_CALL.search(content):
         violations.append(f"[{category}/{fname}] Missing CALL score_category()")
 
+    elif step == COPY_DRIVER_STEP:
+        for covered in ("01_insert_products", "03_add_nutrition", "04_scoring"):
+            violations.extend(_check_step_structure(category, fname, covered, content))
+
     return violations
 
 
+def _file_step(fname: str) -> tuple[str, bool]:
+    """(step identifier, is a batch file) — ``01_batch_002_insert_products`` → ``01_insert_products``."""
+    parts = fname.removesuffix(".gz").replace(".sql", "").split("__")
+    raw_step = parts[-1] if len(parts) >= 3 else ""
+    m = _BATCH_STEP_RE.match(raw_step)
+    return (f"{m.group(1)}_{m.group(2)}", True) if m else (raw_step, False)
+
+
 def check_category(folder: Path) -> list[str]:
     """Check a single pipeline category folder. Returns list of violations."""
     violations: list[str] = []
@@ -144,21 +182,21 @@ def check_category(folder: Path) -> list[str]:
     violations.extend(_check_required_files(category, folder))
 
     # 2. Validate each file
-    for sql_file in sorted(folder.glob("PIPELINE__*.sql")):
-        content = sql_file.read_text(encoding="utf-8", errors="replace")
+    files = _pipeline_files(folder)
+    # Batched step 04 scores the category once, after the last batch's labels.
+    scoring_batches = sorted(f.name for f in files if _file_step(f.name) == ("04_scoring", True))
+    for sql_file in files:
+        content = _read_sql(sql_file)
         fname = sql_file.name
-
-        # Extract step identifier (handle batch infix)
-        parts = fname.replace(".sql", "").split("__")
-        raw_step = parts[-1] if len(parts) >= 3 else ""
-        m = _BATCH_STEP_RE.match(raw_step)
-        step = f"{m.group(1)}_{m.group(2)}" if m else raw_step
+        step, batched = _file_step(fname)
 
         # Check for hardcoded product_id integers in step 01 and 03
         if step in ("01_insert_products", "03_add_nutrition"):
             violations.extend(_check_hardcoded_pids(category, fname, content))
 
         # Step-specific structural checks
+        if batched and step == "04_scoring" and fname != scoring_batches[-1]:
+            continue
         violations.extend(_check_step_structure(category, fname, step, content))
 
     return violations
@@ -7,194 +7,122 @@ Generates a migration SQL file that populates:
 Usage:
     python enrich_ingredients.py                    # all countries
     python enrich_ingredients.py --country DE       # DE only
+    python enrich_ingredients.py --cache-dir .off_cache --offline   # replay cached responses
+    python enrich_ingredients.py --country DE --resume   # continue an interrupted run
+    python enrich_ingredients.py --workers 8 --rps 2    # more lookups in flight, higher rate ceiling
+    python enrich_ingredients.py --format staged        # staging tables + one set-based insert per table
+    python enrich_ingredients.py --full                 # ignore the enrichment state, look up everything
+
+Every processed product is journaled to ``.enrich_journal/`` and the
+migration is rewritten every FLUSH_EVERY products, so an interrupted run
+keeps a valid partial migration and ``--resume`` picks up where it stopped.
+
+The outcome of every lookup is kept in ``.enrich_state.sqlite``, and later
+runs only look up products that are new (a changed EAN is a new
+``(country, ean)`` key) or due for a retry.  Products OFF does not know (or
+knows without ingredient/allergen data) are retried at exponentially
+growing intervals, so a nightly run touches tens of products instead of
+every product that is still missing data.
 """
 
 import argparse
+import json
 import os
 import re
-import subprocess
+import sqlite3
 import sys
 import time
+from collections import Counter
+from dataclasses import dataclass
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
+from typing import IO
 
-import requests
+from pipeline import db
+from pipeline.http_cache import add_cache_arguments, configure_from_args
+from pipeline.off_client import CODE_BATCH_SIZE, iter_products_by_codes
+from pipeline.rate_limit import AdaptiveTokenBucket
+from pipeline.utils import replace_column, write_atomic
 
 # ---------------------------------------------------------------------------
 # Config
 # ---------------------------------------------------------------------------
-OFF_PRODUCT_URL = "https://world.openfoodfacts.org/api/v2/product/{ean}.json"
-USER_AGENT = "tryvit/1.0 (https://github.com/ericsocrat/tryvit)"
 FIELDS = "ingredients,allergens_tags,traces_tags,ingredients_analysis_tags"
-DELAY = 1.0  # seconds between requests (conservative to avoid RemoteDisconnected)
-TIMEOUT = 30
-MAX_RETRIES = 3
+DELAY = 1.0  # seconds between requests by default (conservative to avoid RemoteDisconnected)
 
 OUTPUT_DIR = Path(__file__).parent / "supabase" / "migrations"
 # Migration filename is generated dynamically at runtime to avoid overwrites
 MIGRATION_FILE: Path | None = None  # set in main()
 
-DB_CONTAINER = "supabase_db_tryvit"
-DB_USER = "postgres"
-DB_NAME = "postgres"
-
 # ---------------------------------------------------------------------------
 # DB helpers
 # ---------------------------------------------------------------------------
 
 
-def _psql_cmd(query: str) -> list[str]:
-    """Build psql command — CI mode (PGHOST set) uses psql directly,
-    local mode uses docker exec into the Supabase container."""
-    if os.environ.get("PGHOST"):
-        return ["psql", "-t", "-A", "-F", "|", "-c", query]
-    return [
-        "docker",
-        "exec",
-        DB_CONTAINER,
-        "psql",
-        "-U",
-        DB_USER,
-        "-d",
-        DB_NAME,
-        "-t",
-        "-A",
-        "-F",
-        "|",
-        "-c",
-        query,
-    ]
-
-
 def get_products(country_filter: str | None = None) -> list[dict]:
     """Get active products with EANs that are MISSING ingredient or allergen data.
 
     Args:
         country_filter: If set, only return products for this country code (e.g. 'DE').
     """
-    country_clause = f"AND p.country = '{country_filter}'" if country_filter else ""
-    cmd = _psql_cmd(
-        f"""
-        SELECT p.product_id, p.country, p.ean, p.brand, p.product_name, p.category,
-          EXISTS (SELECT 1 FROM product_ingredient pi WHERE pi.product_id = p.product_id) as has_ingredients
-        FROM products p
-        WHERE p.is_deprecated = FALSE
-          AND p.ean IS NOT NULL
-          {country_clause}
-          AND (
-            NOT EXISTS (SELECT 1 FROM product_ingredient pi WHERE pi.product_id = p.product_id)
-            OR NOT EXISTS (SELECT 1 FROM product_allergen_info pai WHERE pai.product_id = p.product_id)
-          )
-        ORDER BY p.product_id;
-    """
-    )
-    result = subprocess.run(cmd, capture_output=True, timeout=30, encoding="utf-8", errors="replace")
-    if result.returncode != 0:
-        print(f"DB query failed: {result.stderr}", file=sys.stderr)
+    country_clause = "AND p.country = %s" if country_filter else ""
+    try:
+        rows = db.fetch_all(
+            f"""
+            SELECT p.product_id, p.country, p.ean, p.brand, p.product_name, p.category,
+              EXISTS (SELECT 1 FROM product_ingredient pi WHERE pi.product_id = p.product_id) as has_ingredients
+            FROM products p
+            WHERE p.is_deprecated = FALSE
+              AND p.ean IS NOT NULL
+              {country_clause}
+              AND (
+                NOT EXISTS (SELECT 1 FROM product_ingredient pi WHERE pi.product_id = p.product_id)
+                OR NOT EXISTS (SELECT 1 FROM product_allergen_info pai WHERE pai.product_id = p.product_id)
+              )
+            ORDER BY p.product_id;
+        """,
+            (country_filter,) if country_filter else None,
+            types=(int, str, str, str, str, str, db.to_bool),
+        )
+    except db.DatabaseError as exc:
+        print(f"DB query failed: {exc}", file=sys.stderr)
         sys.exit(1)
 
-    products = []
-    for line in result.stdout.strip().split("\n"):
-        if not line.strip():
-            continue
-        parts = line.split("|")
-        if len(parts) >= 4:
-            products.append(
-                {
-                    "product_id": int(parts[0]),
-                    "country": parts[1].strip(),
-                    "ean": parts[2].strip(),
-                    "brand": parts[3].strip(),
-                    "product_name": parts[4].strip() if len(parts) > 4 else "",
-                    "category": parts[5].strip() if len(parts) > 5 else "",
-                    "has_ingredients": parts[6].strip() == "t" if len(parts) > 6 else False,
-                }
-            )
-    return products
+    return [
+        {
+            "product_id": product_id,
+            "country": (country or "").strip(),
+            "ean": (ean or "").strip(),
+            "brand": (brand or "").strip(),
+            "product_name": (product_name or "").strip(),
+            "category": (category or "").strip(),
+            "has_ingredients": bool(has_ingredients),
+        }
+        for product_id, country, ean, brand, product_name, category, has_ingredients in rows
+    ]
 
 
 def get_ingredient_ref() -> dict[str, int]:
     """Get ingredient_ref lookup: name_en → ingredient_id."""
-    cmd = _psql_cmd("SELECT ingredient_id, lower(name_en) FROM ingredient_ref ORDER BY ingredient_id;")
-    result = subprocess.run(cmd, capture_output=True, timeout=30, encoding="utf-8", errors="replace")
-    if result.returncode != 0:
-        print(f"DB query failed: {result.stderr}", file=sys.stderr)
+    try:
+        rows = db.fetch_all(
+            "SELECT ingredient_id, lower(name_en) FROM ingredient_ref ORDER BY ingredient_id;", types=(int, str)
+        )
+    except db.DatabaseError as exc:
+        print(f"DB query failed: {exc}", file=sys.stderr)
         sys.exit(1)
 
-    lookup = {}
-    for line in result.stdout.strip().split("\n"):
-        if not line.strip():
-            continue
-        parts = line.split("|", 1)
-        if len(parts) == 2:
-            lookup[parts[1].strip()] = int(parts[0])
-    return lookup
+    return {name.strip(): ingredient_id for ingredient_id, name in rows if name is not None}
 
 
 # ---------------------------------------------------------------------------
-# OFF API
+# Ingredient normalization
 # ---------------------------------------------------------------------------
 
 
-# Shared session for connection pooling (reduces RemoteDisconnected errors)
-_session: requests.Session | None = None
-
-
-def _get_session() -> requests.Session:
-    """Return a shared session with connection pooling."""
-    global _session
-    if _session is None:
-        _session = requests.Session()
-        _session.headers.update({"User-Agent": USER_AGENT})
-        adapter = requests.adapters.HTTPAdapter(
-            max_retries=0,  # we handle retries ourselves
-            pool_connections=5,
-            pool_maxsize=5,
-        )
-        _session.mount("https://", adapter)
-    return _session
-
-
-def fetch_off_product(ean: str) -> dict | None:
-    """Fetch a single product from OFF API."""
-    global _session
-    url = OFF_PRODUCT_URL.format(ean=ean)
-    session = _get_session()
-
-    for attempt in range(MAX_RETRIES + 1):
-        try:
-            resp = session.get(url, params={"fields": FIELDS}, timeout=TIMEOUT)
-            if resp.status_code == 404:
-                return None
-            resp.raise_for_status()
-            data = resp.json()
-            if data.get("status") == 0:
-                return None
-            return data.get("product", {})
-        except KeyboardInterrupt:
-            raise  # re-raise to allow graceful shutdown
-        except (requests.exceptions.ConnectionError, ConnectionError) as exc:
-            # Reset session on connection errors to avoid stale pool
-            _session = None
-            session = _get_session()
-            if attempt < MAX_RETRIES:
-                backoff = DELAY * (attempt + 1) * 3
-                time.sleep(backoff)
-                continue
-            print(f"  Failed for EAN {ean}: {exc}", file=sys.stderr)
-            return None
-        except Exception as exc:
-            if attempt < MAX_RETRIES:
-                time.sleep(DELAY * (attempt + 1) * 2)
-                continue
-            print(f"  Failed for EAN {ean}: {exc}", file=sys.stderr)
-            return None
-    return None
-
-
-# ---------------------------------------------------------------------------
-# Ingredient normalization
-# ---------------------------------------------------------------------------
+_WHITESPACE_RE = re.compile(r"\s+")
+_ADDITIVE_RE = re.compile(r"(en:)?e\d{3}")
 
 
 def _is_garbage_name(name: str) -> bool:
@@ -221,15 +149,14 @@ def normalize_ingredient_name(name: str) -> str:
         name = name.split(":", 1)[1]
     # Clean up
     name = name.replace("-", " ").replace("_", " ")
-    name = re.sub(r"\s+", " ", name).strip()
+    name = _WHITESPACE_RE.sub(" ", name).strip()
     # Title case to match ingredient_ref convention
     return name.lower()
 
 
 def is_additive_tag(tag: str) -> bool:
     """Check if an OFF ingredient ID looks like an additive (e.g., en:e300)."""
-    tag_lower = tag.lower()
-    return bool(re.match(r"(en:)?e\d{3}", tag_lower))
+    return _ADDITIVE_RE.match(tag.lower()) is not None
 
 
 # ---------------------------------------------------------------------------
@@ -243,6 +170,65 @@ def _display_name_for(name: str) -> str:
     return display.strip()[:200]
 
 
+# ---------------------------------------------------------------------------
+# Ingredient taxonomy index
+# ---------------------------------------------------------------------------
+
+TAXONOMY_CACHE_SIZE = 50_000  # distinct OFF ingredient ids/texts memoized per index
+
+
+@dataclass(frozen=True)
+class IngredientRecord:
+    """One OFF ingredient id or text, normalized once.
+
+    ``name`` is the canonical (lowercase) name matched against
+    ingredient_ref; ``ingredient_id`` is its ingredient_ref id, or ``None``
+    for an ingredient the migration has to add.  ``garbage`` records are
+    skipped by :func:`process_ingredients`.
+    """
+
+    name: str
+    display_name: str
+    is_additive: bool
+    garbage: bool
+    ingredient_id: int | None
+
+
+class TaxonomyIndex:
+    """Memoized map from OFF ingredient ids/texts to :class:`IngredientRecord`.
+
+    Products share most of their ingredients, so each distinct id or text
+    is normalized, classified and resolved against ingredient_ref once per
+    index and then served from a bounded LRU memo (*maxsize* entries).
+    Build it once per run from :func:`get_ingredient_ref` (or
+    :meth:`load`) and pass it to every :func:`process_ingredients` call.
+    """
+
+    def __init__(self, ingredient_lookup: dict[str, int], maxsize: int = TAXONOMY_CACHE_SIZE) -> None:
+        self.ingredient_lookup = ingredient_lookup
+        self.record = lru_cache(maxsize=maxsize)(self._build)
+
+    @classmethod
+    def load(cls) -> "TaxonomyIndex":
+        """An index over the current ingredient_ref table."""
+        return cls(get_ingredient_ref())
+
+    def __len__(self) -> int:
+        return len(self.ingredient_lookup)
+
+    def _build(self, raw: str) -> IngredientRecord:
+        name = normalize_ingredient_name(raw)
+        if not name or _is_garbage_name(name):
+            return IngredientRecord(name, "", False, True, None)
+        return IngredientRecord(
+            name,
+            _display_name_for(name),
+            is_additive_tag(raw),
+            False,
+            self.ingredient_lookup.get(name),
+        )
+
+
 _VALID_YES_NO = {"yes", "no", "maybe", "unknown"}
 
 
@@ -255,27 +241,23 @@ def _strip_lang_prefix(val: str) -> str:
 
 def _resolve_ingredient(
     item: dict,
-    off_id: str,
-    name_lower: str,
-    name: str,
-    ingredient_lookup: dict[str, int],
+    record: IngredientRecord,
+    is_additive: bool,
     new_ingredients: dict[str, dict],
 ) -> int | str:
     """Look up or register an ingredient. Returns its ID (int or 'NEW:...')."""
-    ing_id = ingredient_lookup.get(name_lower)
-    if ing_id is not None:
-        return ing_id
-
-    is_add = is_additive_tag(off_id) if off_id else False
-    if name_lower not in new_ingredients:
-        new_ingredients[name_lower] = {
-            "name_en": _display_name_for(name),
-            "is_additive": is_add,
+    if record.ingredient_id is not None:
+        return record.ingredient_id
+
+    if record.name not in new_ingredients:
+        new_ingredients[record.name] = {
+            "name_en": record.display_name,
+            "is_additive": is_additive,
             "vegan": _strip_lang_prefix(item.get("vegan", "unknown") or "unknown"),
             "vegetarian": _strip_lang_prefix(item.get("vegetarian", "unknown") or "unknown"),
             "from_palm_oil": _strip_lang_prefix(item.get("from_palm_oil", "unknown") or "unknown"),
         }
-    return f"NEW:{name_lower}"
+    return f"NEW:{record.name}"
 
 
 def _clamp_percent_estimate(pct_est: float | None) -> float | None:
@@ -289,11 +271,14 @@ def process_ingredients(
     off_product: dict,
     country: str,
     ean: str,
-    ingredient_lookup: dict[str, int],
+    ingredient_lookup: dict[str, int] | TaxonomyIndex,
     new_ingredients: dict[str, dict],
 ) -> list[dict]:
     """Extract ingredient rows for a product.
 
+    *ingredient_lookup* is the run's :class:`TaxonomyIndex`; a plain
+    ingredient_ref ``{name: id}`` dict is wrapped in a one-off index.
+
     Returns list of dicts with keys: country, ean, ingredient_id, position,
     percent, percent_estimate, is_sub_ingredient, parent_ingredient_id
     """
@@ -301,6 +286,7 @@ def process_ingredients(
     if not ingredients:
         return []
 
+    index = ingredient_lookup if isinstance(ingredient_lookup, TaxonomyIndex) else TaxonomyIndex(ingredient_lookup)
     rows: list[dict] = []
 
     def process_item(item: dict, pos: int, is_sub: bool, parent_name: str | None) -> int:
@@ -314,15 +300,14 @@ def process_ingredients(
         # Prefer OFF taxonomy ID (usually English, e.g. "en:water") over raw
         # label text (local language, e.g. "Woda") so the name matches
         # ingredient_ref.name_en after normalization.
-        name = off_id or text
-        name_lower = normalize_ingredient_name(name)
-        if not name_lower or _is_garbage_name(name_lower):
+        record = index.record(off_id or text)
+        if record.garbage:
             return pos
 
         # Resolve for new_ingredients side-effect (registers unknown ingredients)
-        _resolve_ingredient(item, off_id, name_lower, name_lower, ingredient_lookup, new_ingredients)
+        _resolve_ingredient(item, record, record.is_additive if off_id else False, new_ingredients)
 
-        display_name = _display_name_for(name_lower)
+        display_name = record.display_name
 
         rows.append(
             {
@@ -549,6 +534,20 @@ def sql_escape(val: str | None) -> str:
     return "'" + s + "'"
 
 
+def sql_escape_column(values: list[str | None]) -> list[str]:
+    """:func:`sql_escape` over a whole column of values, escaped in one pass."""
+    texts = [v for v in values if v is not None]
+    if not all(isinstance(v, str) for v in texts):
+        texts = list(map(str, texts))
+    literals = replace_column(texts, (("\x00", ""), ("'", "''")), "'", "'")
+    for i in [i for i, lit in enumerate(literals) if "\\" in lit]:
+        literals[i] = "E" + literals[i].replace("\\", "\\\\")
+    if len(literals) < len(values):
+        escaped = iter(literals)
+        literals = ["NULL" if v is None else next(escaped) for v in values]
+    return literals
+
+
 # ---------------------------------------------------------------------------
 # SQL generation constants (avoid duplication flagged by SonarCloud)
 # ---------------------------------------------------------------------------
@@ -557,6 +556,23 @@ SQL_SECTION_SEPARATOR = "-- ═════════════════
 SQL_FROM_VALUES = "FROM (VALUES"
 SQL_JOIN_PRODUCTS = "JOIN products p ON p.country = v.country AND p.ean = v.ean"
 SQL_WHERE_ACTIVE = "WHERE p.is_deprecated IS NOT TRUE"
+SQL_ALLERGEN_INSERT = "INSERT INTO product_allergen_info (product_id, tag, type)"
+SQL_ALLERGEN_SELECT = "SELECT p.product_id, v.tag, v.type"
+SQL_INGREDIENT_INSERT = (
+    "INSERT INTO product_ingredient "
+    "(product_id, ingredient_id, position, percent, percent_estimate, is_sub_ingredient, parent_ingredient_id)"
+)
+SQL_INGREDIENT_SELECT = (
+    "SELECT p.product_id, ir.ingredient_id, v.position, v.percent, v.percent_estimate, "
+    "v.is_sub_ingredient, ir_parent.ingredient_id"
+)
+SQL_JOIN_INGREDIENT = "JOIN ingredient_ref ir ON lower(ir.name_en) = lower(v.ingredient_name)"
+SQL_JOIN_PARENT = "LEFT JOIN ingredient_ref ir_parent ON lower(ir_parent.name_en) = lower(v.parent_ingredient_name)"
+SQL_RESOLVED_PARENT = "  AND NOT (v.is_sub_ingredient AND ir_parent.ingredient_id IS NULL)"
+
+# "sql": batched INSERT … FROM (VALUES …).  "staged": load unlogged staging
+# tables, then one set-based INSERT per table.
+OUTPUT_FORMATS = ("sql", "staged")
 
 
 # ---------------------------------------------------------------------------
@@ -607,14 +623,9 @@ def _gen_new_ingredients_section(new_ingredients: dict[str, dict]) -> list[str]:
 
 def _gen_allergen_batch(batch: list[dict]) -> list[str]:
     """Generate SQL for a single batch of allergen inserts."""
-    lines = ["INSERT INTO product_allergen_info (product_id, tag, type)"]
-    lines.append("SELECT p.product_id, v.tag, v.type")
-    lines.append(SQL_FROM_VALUES)
-    vals = []
-    for r in batch:
-        vals.append(
-            f"  ({sql_escape(r['country'])}, {sql_escape(r['ean'])}, {sql_escape(r['tag'])}, {sql_escape(r['type'])})"
-        )
+    lines = [SQL_ALLERGEN_INSERT, SQL_ALLERGEN_SELECT, SQL_FROM_VALUES]
+    columns = [sql_escape_column([r[key] for r in batch]) for key in ("country", "ean", "tag", "type")]
+    vals = [f"  ({country}, {ean}, {tag}, {tag_type})" for country, ean, tag, tag_type in zip(*columns, strict=True)]
     lines.append(",\n".join(vals))
     lines.append(") AS v(country, ean, tag, type)")
     lines.append(SQL_JOIN_PRODUCTS)
@@ -646,16 +657,13 @@ def _gen_ingredient_batch(batch: list[dict]) -> list[str]:
     time via ingredient_ref.name_en lookups, making migrations portable across
     environments (local, CI, production) where identity-column IDs may differ.
     """
-    lines = [
-        "INSERT INTO product_ingredient (product_id, ingredient_id, position, percent, percent_estimate, is_sub_ingredient, parent_ingredient_id)",
-        "SELECT p.product_id, ir.ingredient_id, v.position, v.percent, v.percent_estimate, v.is_sub_ingredient, ir_parent.ingredient_id",
-        SQL_FROM_VALUES,
-    ]
+    lines = [SQL_INGREDIENT_INSERT, SQL_INGREDIENT_SELECT, SQL_FROM_VALUES]
+    countries, eans, names = (sql_escape_column([r[key] for r in batch]) for key in ("country", "ean", "ingredient_name"))
     vals = []
-    for r in batch:
+    for r, country, ean, ingredient_name in zip(batch, countries, eans, names, strict=True):
         pct, pct_est, parent_name_sql, is_sub = _format_ingredient_row(r)
         vals.append(
-            f"  ({sql_escape(r['country'])}, {sql_escape(r['ean'])}, {sql_escape(r['ingredient_name'])}, {r['position']}, "
+            f"  ({country}, {ean}, {ingredient_name}, {r['position']}, "
             f"{pct}::numeric, {pct_est}::numeric, "
             f"{'true' if is_sub else 'false'}, {parent_name_sql})"
         )
@@ -664,10 +672,10 @@ def _gen_ingredient_batch(batch: list[dict]) -> list[str]:
         ") AS v(country, ean, ingredient_name, position, percent, percent_estimate, is_sub_ingredient, parent_ingredient_name)"
     )
     lines.append(SQL_JOIN_PRODUCTS)
-    lines.append("JOIN ingredient_ref ir ON lower(ir.name_en) = lower(v.ingredient_name)")
-    lines.append("LEFT JOIN ingredient_ref ir_parent ON lower(ir_parent.name_en) = lower(v.parent_ingredient_name)")
+    lines.append(SQL_JOIN_INGREDIENT)
+    lines.append(SQL_JOIN_PARENT)
     lines.append(SQL_WHERE_ACTIVE)
-    lines.append("  AND NOT (v.is_sub_ingredient AND ir_parent.ingredient_id IS NULL)")
+    lines.append(SQL_RESOLVED_PARENT)
     lines.append("ON CONFLICT (product_id, ingredient_id, position) DO NOTHING;")
     lines.append("")
     return lines
@@ -690,13 +698,158 @@ def _gen_ingredient_section(ingredient_rows: list[dict]) -> list[str]:
     return lines
 
 
+# ---------------------------------------------------------------------------
+# Staged output (--format staged)
+# ---------------------------------------------------------------------------
+
+ALLERGEN_STAGE = "enrich_stage_allergen"
+INGREDIENT_STAGE = "enrich_stage_ingredient"
+STAGE_BATCH_SIZE = 1000
+
+
+def _stage_column(sql_type: str, values: list) -> list[str]:
+    """SQL literals for one staging-table column of type *sql_type*."""
+    if sql_type == "text":
+        return sql_escape_column(values)
+    if sql_type == "boolean":
+        return ["true" if v else "false" for v in values]
+    return [_format_nullable(v) for v in values]
+
+
+def _gen_stage(table: str, columns: tuple[tuple[str, str], ...], rows: list[tuple]) -> list[str]:
+    """Create unlogged staging *table*, fill it with plain VALUES batches, and analyze it.
+
+    Plain SQL rather than ``COPY … FROM stdin``, so the migration applies
+    through ``supabase db reset`` / ``db push`` as well as psql.
+    """
+    names = ", ".join(name for name, _type in columns)
+    lines = [
+        f"DROP TABLE IF EXISTS {table};",
+        f"CREATE UNLOGGED TABLE {table} ({', '.join(f'{name} {sql_type}' for name, sql_type in columns)});",
+        "",
+    ]
+    for i in range(0, len(rows), STAGE_BATCH_SIZE):
+        batch = rows[i : i + STAGE_BATCH_SIZE]
+        literals = [
+            _stage_column(sql_type, list(values))
+            for (_name, sql_type), values in zip(columns, zip(*batch, strict=True), strict=True)
+        ]
+        lines.append(f"INSERT INTO {table} ({names}) VALUES")
+        lines.append(",\n".join(f"  ({', '.join(row)})" for row in zip(*literals, strict=True)) + ";")
+        lines.append("")
+    lines.append(f"ANALYZE {table};")
+    lines.append("")
+    return lines
+
+
+def _gen_allergen_staged_section(allergen_rows: list[dict]) -> list[str]:
+    """Generate staged SQL for populating product_allergen_info."""
+    lines = [
+        SQL_SECTION_SEPARATOR,
+        "-- 2. Populate product_allergen_info (staging table, one set-based insert)",
+        SQL_SECTION_SEPARATOR,
+        "-- Resolve product_id by stable key (country + ean) for portability",
+        "",
+    ]
+    columns = (("country", "text"), ("ean", "text"), ("tag", "text"), ("type", "text"))
+    rows = [(r["country"], r["ean"], r["tag"], r["type"]) for r in allergen_rows]
+    lines.extend(_gen_stage(ALLERGEN_STAGE, columns, rows))
+    lines.extend(
+        [
+            SQL_ALLERGEN_INSERT,
+            SQL_ALLERGEN_SELECT,
+            f"FROM {ALLERGEN_STAGE} v",
+            SQL_JOIN_PRODUCTS,
+            SQL_WHERE_ACTIVE,
+            "ON CONFLICT (product_id, tag, type) DO NOTHING;",
+            "",
+            f"DROP TABLE {ALLERGEN_STAGE};",
+            "",
+        ]
+    )
+    return lines
+
+
+def _gen_ingredient_staged_section(ingredient_rows: list[dict]) -> list[str]:
+    """Generate staged SQL for populating product_ingredient.
+
+    product_id and ingredient_id are resolved by the same portable joins as
+    the VALUES batches, but in a single statement over the analyzed staging
+    table, so ingredient_ref is hashed on ``lower(name_en)`` once instead of
+    once per batch.
+    """
+    lines = [
+        SQL_SECTION_SEPARATOR,
+        "-- 3. Populate product_ingredient (staging table, one set-based insert)",
+        SQL_SECTION_SEPARATOR,
+        "-- Resolve product_id by (country + ean) and ingredient_id by name for portability",
+        "",
+    ]
+    columns = (
+        ("country", "text"),
+        ("ean", "text"),
+        ("ingredient_name", "text"),
+        ("position", "integer"),
+        ("percent", "numeric"),
+        ("percent_estimate", "numeric"),
+        ("is_sub_ingredient", "boolean"),
+        ("parent_ingredient_name", "text"),
+    )
+    rows = []
+    for r in ingredient_rows:
+        parent_name = r.get("parent_ingredient_name")
+        # If parent can't be resolved, force is_sub=false to satisfy chk_sub_has_parent
+        is_sub = r["is_sub_ingredient"] and parent_name is not None
+        rows.append(
+            (
+                r["country"],
+                r["ean"],
+                r["ingredient_name"],
+                r["position"],
+                r["percent"],
+                r["percent_estimate"],
+                is_sub,
+                parent_name or None,
+            )
+        )
+    lines.extend(_gen_stage(INGREDIENT_STAGE, columns, rows))
+    lines.extend(
+        [
+            SQL_INGREDIENT_INSERT,
+            SQL_INGREDIENT_SELECT,
+            f"FROM {INGREDIENT_STAGE} v",
+            SQL_JOIN_PRODUCTS,
+            SQL_JOIN_INGREDIENT,
+            SQL_JOIN_PARENT,
+            SQL_WHERE_ACTIVE,
+            SQL_RESOLVED_PARENT,
+            "ON CONFLICT (product_id, ingredient_id, position) DO NOTHING;",
+            "",
+            f"DROP TABLE {INGREDIENT_STAGE};",
+            "",
+        ]
+    )
+    return lines
+
+
 def generate_migration(
     ingredient_rows: list[dict],
     allergen_rows: list[dict],
     new_ingredients: dict[str, dict],
     stats: dict,
+    output_format: str = "sql",
 ) -> str:
-    """Generate the migration SQL."""
+    """Generate the migration SQL.
+
+    *output_format* is one of :data:`OUTPUT_FORMATS`: ``"sql"`` writes
+    batched ``INSERT … FROM (VALUES …)`` statements; ``"staged"`` loads the
+    rows into unlogged staging tables and inserts them with one set-based
+    statement per table.
+    """
+    if output_format not in OUTPUT_FORMATS:
+        msg = f"unknown output format {output_format!r} (expected one of {OUTPUT_FORMATS})"
+        raise ValueError(msg)
+    staged = output_format == "staged"
     lines = [
         "-- Populate product_ingredient and product_allergen_info tables",
         f"-- Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')}",
@@ -715,10 +868,10 @@ def generate_migration(
         lines.extend(_gen_new_ingredients_section(new_ingredients))
 
     if allergen_rows:
-        lines.extend(_gen_allergen_section(allergen_rows))
+        lines.extend((_gen_allergen_staged_section if staged else _gen_allergen_section)(allergen_rows))
 
     if ingredient_rows:
-        lines.extend(_gen_ingredient_section(ingredient_rows))
+        lines.extend((_gen_ingredient_staged_section if staged else _gen_ingredient_section)(ingredient_rows))
 
     # 4. Refresh materialized views
     lines.append(SQL_SECTION_SEPARATOR)
@@ -732,36 +885,321 @@ def generate_migration(
     return "\n".join(lines)
 
 
+# ---------------------------------------------------------------------------
+# Checkpoint journal (--resume)
+# ---------------------------------------------------------------------------
+
+JOURNAL_DIR = Path(__file__).parent / ".enrich_journal"
+FLUSH_EVERY = 250  # products between rewrites of the partial migration
+
+
+def journal_path(country: str | None) -> Path:
+    """The journal of enrichment runs for *country* (``None`` = all countries)."""
+    return JOURNAL_DIR / f"enrich_{(country or 'all').lower()}.jsonl"
+
+
+class EnrichJournal:
+    """Append-only JSONL checkpoint of one enrichment run.
+
+    The first line is a header naming the run's migration file; every
+    following line is one processed product keyed by ``(country, ean)``,
+    with the rows parsed from it and the ingredient_ref entries it
+    registered.  Each line is flushed and fsynced as it is written, so a
+    crash or restart loses at most the product in flight; a torn last line
+    is ignored when the journal is read back.
+    """
+
+    def __init__(self, path: Path, migration: str, entries: list[dict], fh: IO[str]) -> None:
+        self.path = path
+        self.migration = migration
+        self.entries = entries
+        self._fh = fh
+
+    @classmethod
+    def start(cls, path: Path, migration: str) -> "EnrichJournal":
+        """Begin a new journal at *path*, replacing any previous run's."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fh = open(path, "w", encoding="utf-8")  # noqa: SIM115 — closed by close()/discard()
+        journal = cls(path, migration, [], fh)
+        journal._write({"migration": migration, "started": datetime.now().isoformat(timespec="seconds")})
+        return journal
+
+    @classmethod
+    def resume(cls, path: Path) -> "EnrichJournal | None":
+        """Reopen the journal at *path* for appending, or ``None`` if there is none."""
+        if not path.exists():
+            return None
+        header: dict | None = None
+        entries: list[dict] = []
+        with open(path, encoding="utf-8") as fh:
+            for line in fh:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break  # torn write at the crash point; everything before it is intact
+                if header is None:
+                    header = record
+                else:
+                    entries.append(record)
+        if header is None or "migration" not in header:
+            return None
+        fh = open(path, "a", encoding="utf-8")  # noqa: SIM115 — closed by close()/discard()
+        return cls(path, header["migration"], entries, fh)
+
+    def done(self) -> set[tuple[str, str]]:
+        """The ``(country, ean)`` keys already processed."""
+        return {(e["country"], e["ean"]) for e in self.entries}
+
+    def record(self, entry: dict) -> None:
+        """Durably append one processed product."""
+        self.entries.append(entry)
+        self._write(entry)
+
+    def _write(self, record: dict) -> None:
+        self._fh.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+
+    def close(self) -> None:
+        self._fh.close()
+
+    def discard(self) -> None:
+        """Close and delete the journal (the run's migration is complete)."""
+        self.close()
+        self.path.unlink(missing_ok=True)
+
+
+def enrich_product(
+    product: dict,
+    off_data: dict | None,
+    ingredient_lookup: dict[str, int] | TaxonomyIndex,
+    new_ingredients: dict[str, dict],
+) -> dict:
+    """Parse one product's OFF data into a journal entry.
+
+    The entry holds the product's ingredient and allergen rows and the
+    ingredient_ref entries first registered (in *new_ingredients*) by it,
+    so that replaying it rebuilds the same state.
+    """
+    entry: dict = {"country": product["country"], "ean": product["ean"], "found": off_data is not None}
+    if off_data is None:
+        return entry
+    known = set(new_ingredients)
+    # Process ingredients — only for products that don't already have them
+    if not product["has_ingredients"]:
+        entry["ingredients"] = process_ingredients(
+            off_data, product["country"], product["ean"], ingredient_lookup, new_ingredients
+        )
+    entry["allergens"] = process_allergens(off_data, product["country"], product["ean"])
+    entry["new_ingredients"] = {name: ref for name, ref in new_ingredients.items() if name not in known}
+    return entry
+
+
+def apply_entry(
+    entry: dict,
+    stats: dict,
+    ingredient_rows: list[dict],
+    allergen_rows: list[dict],
+    new_ingredients: dict[str, dict],
+) -> None:
+    """Add one journal entry's rows and counts to the run's totals."""
+    stats["processed"] += 1
+    if not entry["found"]:
+        stats["not_found"] += 1
+        return
+    if entry.get("ingredients"):
+        stats["with_ingredients"] += 1
+        ingredient_rows.extend(entry["ingredients"])
+    if entry.get("allergens"):
+        stats["with_allergens"] += 1
+        allergen_rows.extend(entry["allergens"])
+    new_ingredients.update(entry.get("new_ingredients", {}))
+
+
+# ---------------------------------------------------------------------------
+# Enrichment state (incremental runs)
+# ---------------------------------------------------------------------------
+
+STATE_DB = Path(__file__).parent / ".enrich_state.sqlite"
+DAY = 86_400.0
+RETRY_BASE = 1 * DAY  # first retry of a product OFF had nothing for; doubles per attempt
+RETRY_MAX = 30 * DAY  # cap on the retry interval, and re-check interval of enriched products
+
+OUTCOMES = ("enriched", "not_found", "no_ingredients")
+
+_STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS enrich_state (
+    country    TEXT NOT NULL,
+    ean        TEXT NOT NULL,
+    outcome    TEXT NOT NULL,
+    attempts   INTEGER NOT NULL,
+    checked_at REAL NOT NULL,
+    next_check REAL NOT NULL,
+    PRIMARY KEY (country, ean)
+) WITHOUT ROWID;
+"""
+
+
+def entry_outcome(entry: dict) -> str:
+    """The lookup outcome of one journal entry (one of OUTCOMES)."""
+    if not entry["found"]:
+        return "not_found"
+    if entry.get("ingredients") or entry.get("allergens"):
+        return "enriched"
+    return "no_ingredients"
+
+
+def retry_interval(attempts: int) -> float:
+    """Seconds until the next lookup after *attempts* consecutive lookups without data."""
+    return min(RETRY_BASE * 2 ** (attempts - 1), RETRY_MAX)
+
+
+class EnrichState:
+    """SQLite-backed outcome of the last OFF lookup of every product.
+
+    One row per ``(country, ean)``: the outcome, the number of consecutive
+    lookups that brought no data, when it was looked up and when it is
+    next due.  Products without data are due again after
+    :func:`retry_interval` (1, 2, 4 … days, capped at RETRY_MAX); enriched
+    products after RETRY_MAX, in case their migration was never applied.
+    ``products.updated_at`` is not consulted: the pipeline bumps it on
+    every upsert, and a changed EAN already gives a new key.
+
+    Outcomes are only committed once the migration holding their rows has
+    been written; :meth:`close` discards the rest.
+
+    Parameters
+    ----------
+    db_path:
+        State file (default ``STATE_DB``, git-ignored).
+    """
+
+    def __init__(self, db_path: str | Path | None = None) -> None:
+        self.db_path = Path(db_path) if db_path is not None else STATE_DB
+        self._conn = sqlite3.connect(self.db_path)
+        self._conn.executescript(_STATE_SCHEMA)
+        self._conn.commit()
+
+    def close(self) -> None:
+        """Close, rolling back outcomes not yet committed (their migration was never written)."""
+        self._conn.rollback()
+        self._conn.close()
+
+    def recorded(self, keys: set[tuple[str, str]]) -> set[tuple[str, str]]:
+        """The ``(country, ean)`` *keys* that have a committed outcome."""
+        return keys & set(self._conn.execute("SELECT country, ean FROM enrich_state"))
+
+    def select(self, products: list[dict], now: float | None = None) -> tuple[list[dict], Counter]:
+        """The *products* to look up now, and why: counts of new/retry/skipped."""
+        now = time.time() if now is None else now
+        state = {
+            (country, ean): next_check
+            for country, ean, next_check in self._conn.execute("SELECT country, ean, next_check FROM enrich_state")
+        }
+        due: list[dict] = []
+        reasons: Counter = Counter()
+        for product in products:
+            next_check = state.get((product["country"], product["ean"]))
+            if next_check is None:
+                reason = "new"
+            elif now >= next_check:
+                reason = "retry"
+            else:
+                reasons["skipped"] += 1
+                continue
+            reasons[reason] += 1
+            due.append(product)
+        return due, reasons
+
+    def record(self, entry: dict, now: float | None = None) -> str:
+        """Store the outcome of one journal entry and return it (kept once :meth:`commit` runs)."""
+        now = time.time() if now is None else now
+        outcome = entry_outcome(entry)
+        key = (entry["country"], entry["ean"])
+        if outcome == "enriched":
+            attempts, next_check = 0, now + RETRY_MAX
+        else:
+            row = self._conn.execute("SELECT attempts FROM enrich_state WHERE country = ? AND ean = ?", key).fetchone()
+            attempts = (row[0] if row else 0) + 1
+            next_check = now + retry_interval(attempts)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO enrich_state (country, ean, outcome, attempts, checked_at, next_check)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (*key, outcome, attempts, now, next_check),
+        )
+        return outcome
+
+    def commit(self) -> None:
+        """Keep the outcomes recorded so far; call right after writing their migration."""
+        self._conn.commit()
+
+
+# ---------------------------------------------------------------------------
+# Live progress
+# ---------------------------------------------------------------------------
+
+PROGRESS_EVERY = 50  # products between progress lines
+
+
+def progress_line(done: int, total: int, elapsed: float, limiter: AdaptiveTokenBucket) -> str:
+    """One progress report: products done, achieved request rate, retries and ETA."""
+    achieved = limiter.requests / elapsed if elapsed > 0 else 0.0
+    eta = f"{(total - done) * elapsed / done / 60:.1f} min" if done and elapsed > 0 else "?"
+    return (
+        f"Processed {done}/{total} — {achieved:.2f} req/s (limit {limiter.rate:.2f}), "
+        f"retries: {limiter.failures}, backoffs: {limiter.backoffs}, ETA {eta}"
+    )
+
+
+def _write_migration(
+    ingredient_rows: list[dict],
+    allergen_rows: list[dict],
+    new_ingredients: dict[str, dict],
+    stats: dict,
+    output_format: str = "sql",
+) -> None:
+    """(Re)write MIGRATION_FILE atomically from everything collected so far."""
+    sql = generate_migration(ingredient_rows, allergen_rows, new_ingredients, stats, output_format)
+    write_atomic(MIGRATION_FILE, [sql])
+
+
 def main():
     parser = argparse.ArgumentParser(description="Enrich ingredient & allergen data from OFF API")
     parser.add_argument("--country", type=str, default=None, help="Country code filter (e.g. DE, PL)")
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue the last interrupted run: skip journaled EANs and keep writing its migration",
+    )
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent OFF lookup threads (default: 4)")
+    parser.add_argument(
+        "--rps",
+        type=float,
+        default=1.0 / DELAY,
+        help=f"Ceiling on OFF requests/second; lowered automatically while OFF pushes back (default: {1.0 / DELAY:g})",
+    )
+    parser.add_argument(
+        "--format",
+        choices=OUTPUT_FORMATS,
+        default="sql",
+        help="Migration format: batched INSERT … VALUES, or staging tables + one set-based insert (default: sql)",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Look up every product missing data, not only new or retry-due ones (outcomes are still recorded)",
+    )
+    add_cache_arguments(parser)
     args = parser.parse_args()
+    configure_from_args(parser, args)
+    country = args.country.upper() if args.country else None
 
     print("=" * 60)
     print("Ingredient & Allergen Enrichment")
-    if args.country:
-        print(f"  Country filter: {args.country.upper()}")
+    if country:
+        print(f"  Country filter: {country}")
     print("=" * 60)
 
-    # Set migration filename dynamically to avoid overwrites
-    global MIGRATION_FILE
-    ts = datetime.now().strftime("%Y%m%d%H%M%S")
-    MIGRATION_FILE = OUTPUT_DIR / f"{ts}_populate_ingredients_allergens.sql"
-
-    # 1. Load products and ingredient_ref
-    print("\n[1/4] Loading products from database...")
-    products = get_products(country_filter=args.country.upper() if args.country else None)
-    print(f"  Found {len(products)} active products with EANs")
-
-    print("\n[2/4] Loading ingredient_ref...")
-    ingredient_lookup = get_ingredient_ref()
-    print(f"  Found {len(ingredient_lookup)} ingredients in reference table")
-
-    # 2. Fetch from OFF API
-    print("\n[3/4] Fetching ingredient data from OFF API...")
-    print(f"  Rate limit: {DELAY}s between requests")
-    print(f"  Estimated time: ~{len(products) * DELAY / 60:.0f} minutes")
-
     all_ingredient_rows = []
     all_allergen_rows = []
     new_ingredients: dict[str, dict] = {}
@@ -774,46 +1212,101 @@ def main():
         "api_errors": 0,
     }
 
-    try:
-        for i, product in enumerate(products):
-            if (i + 1) % 50 == 0 or i == 0:
+    # Set migration filename dynamically to avoid overwrites; a resumed run keeps its own
+    global MIGRATION_FILE
+    state = EnrichState()
+    journal = EnrichJournal.resume(journal_path(country)) if args.resume else None
+    if journal is not None:
+        MIGRATION_FILE = OUTPUT_DIR / journal.migration
+        for entry in journal.entries:
+            apply_entry(entry, stats, all_ingredient_rows, all_allergen_rows, new_ingredients)
+        print(f"  Resuming {journal.migration}: {stats['processed']} products already processed")
+    else:
+        if args.resume:
+            print("  No journal to resume — starting a new run")
+        elif (unfinished := EnrichJournal.resume(journal_path(country))) is not None:
+            unfinished.close()
+            if state.recorded(unfinished.done()):
+                # Its outcomes already count as looked up; only its journal can still finish their migration.
+                state.close()
                 print(
-                    f"  Processing {i + 1}/{len(products)} "
-                    f"(ingredients: {stats['with_ingredients']}, "
-                    f"allergens: {stats['with_allergens']}, "
-                    f"not found: {stats['not_found']})..."
+                    f"Unfinished run in {journal_path(country)} has recorded outcomes; "
+                    "continue it with --resume, or delete the journal to start over",
+                    file=sys.stderr,
                 )
+                sys.exit(1)
+            print(f"  Replacing the journal of an unfinished run ({journal_path(country)}); use --resume to continue it")
+        ts = datetime.now().strftime("%Y%m%d%H%M%S")
+        MIGRATION_FILE = OUTPUT_DIR / f"{ts}_populate_ingredients_allergens.sql"
+        journal = EnrichJournal.start(journal_path(country), MIGRATION_FILE.name)
 
-            off_data = fetch_off_product(product["ean"])
-            stats["processed"] += 1
+    # 1. Load products and ingredient_ref
+    print("\n[1/4] Loading products from database...")
+    products = get_products(country_filter=country)
+    print(f"  Found {len(products)} active products with EANs missing data")
+    done = journal.done()
+    if done:
+        products = [p for p in products if (p["country"], p["ean"]) not in done]
+        print(f"  {len(products)} left after skipping journaled products")
+    if not args.full:
+        products, reasons = state.select(products)
+        print(
+            f"  {len(products)} to look up: {reasons['new']} new, "
+            f"{reasons['retry']} due for retry ({reasons['skipped']} not due; --full looks up all)"
+        )
 
-            if off_data is None:
-                stats["not_found"] += 1
-                time.sleep(DELAY)
-                continue
+    print("\n[2/4] Loading ingredient_ref...")
+    ingredient_index = TaxonomyIndex.load()
+    print(f"  Found {len(ingredient_index)} ingredients in reference table")
 
-            # Process ingredients — only for products that don't already have them
-            if not product["has_ingredients"]:
-                ing_rows = process_ingredients(
-                    off_data,
-                    product["country"],
-                    product["ean"],
-                    ingredient_lookup,
-                    new_ingredients,
-                )
-                if ing_rows:
-                    stats["with_ingredients"] += 1
-                    all_ingredient_rows.extend(ing_rows)
+    # 2. Fetch from OFF API
+    print("\n[3/4] Fetching ingredient data from OFF API...")
+    limiter = AdaptiveTokenBucket(args.rps)
+    print(
+        f"  Batched lookup: {CODE_BATCH_SIZE} EANs per request, {args.workers} worker(s), "
+        f"up to {args.rps:g} req/s (halved on 429/5xx/disconnects)"
+    )
 
-            # Process allergens/traces
-            alg_rows = process_allergens(off_data, product["country"], product["ean"])
-            if alg_rows:
-                stats["with_allergens"] += 1
-                all_allergen_rows.extend(alg_rows)
+    # Fetches run ahead on the worker threads; parsing stays on this thread.
+    by_ean: dict[str, list[dict]] = {}
+    for product in products:
+        by_ean.setdefault(product["ean"], []).append(product)
+    lookups = iter_products_by_codes(by_ean, fields=FIELDS, workers=args.workers, limiter=limiter)
+    started = time.monotonic()
+    done_now = 0
+    outcomes: Counter = Counter()
 
-            time.sleep(DELAY)
+    interrupted = False
+    try:
+        for ean, off_data in lookups:
+            for product in by_ean[ean]:
+                entry = enrich_product(product, off_data, ingredient_index, new_ingredients)
+                journal.record(entry)
+                outcomes[state.record(entry)] += 1
+                apply_entry(entry, stats, all_ingredient_rows, all_allergen_rows, new_ingredients)
+                done_now += 1
+                if done_now % PROGRESS_EVERY == 0 or done_now == len(products):
+                    print(f"  {progress_line(done_now, len(products), time.monotonic() - started, limiter)}")
+                    print(
+                        f"    ingredients: {stats['with_ingredients']}, "
+                        f"allergens: {stats['with_allergens']}, not found: {stats['not_found']}"
+                    )
+                if stats["processed"] % FLUSH_EVERY == 0:
+                    _write_migration(all_ingredient_rows, all_allergen_rows, new_ingredients, stats, args.format)
+                    state.commit()
     except KeyboardInterrupt:
-        print(f"\n  Interrupted at {stats['processed']}/{len(products)} — generating migration with collected data...")
+        interrupted = True
+        print(f"\n  Interrupted at {stats['processed']} products — generating migration with collected data...")
+    except BaseException:
+        state.close()  # outcomes since the last flush are in no migration; the journal keeps them
+        raise
+    finally:
+        lookups.close()
+    elapsed = time.monotonic() - started
+    print(
+        f"  OFF requests: {limiter.requests} ({limiter.requests / elapsed if elapsed else 0:.2f} req/s), "
+        f"retries: {limiter.failures}, rate backoffs: {limiter.backoffs}"
+    )
 
     # 3. Generate migration
     print("\n[4/4] Generating migration SQL...")
@@ -821,13 +1314,21 @@ def main():
     print(f"  With ingredients: {stats['with_ingredients']}")
     print(f"  With allergens/traces: {stats['with_allergens']}")
     print(f"  Not found on OFF: {stats['not_found']}")
+    print(f"  Looked up without data (retried later): {outcomes['not_found'] + outcomes['no_ingredients']}")
     print(f"  New ingredients to add: {len(new_ingredients)}")
     print(f"  Total ingredient rows: {len(all_ingredient_rows)}")
     print(f"  Total allergen rows: {len(all_allergen_rows)}")
 
-    sql = generate_migration(all_ingredient_rows, all_allergen_rows, new_ingredients, stats)
+    _write_migration(all_ingredient_rows, all_allergen_rows, new_ingredients, stats, args.format)
+    state.commit()
+    state.close()
+    if interrupted:
+        journal.close()
+        resume = f"--country {country} --resume" if country else "--resume"
+        print(f"\n  Journal kept at {journal.path} — continue with: python enrich_ingredients.py {resume}")
+    else:
+        journal.discard()
 
-    MIGRATION_FILE.write_text(sql, encoding="utf-8")
     print(f"\n  Migration written to: {MIGRATION_FILE}")
     print(f"  File size: {MIGRATION_FILE.stat().st_size / 1024:.1f} KB")
     print("\nDone! Run the migration with:")
@@ -0,0 +1,501 @@
+"""Apply generated pipeline SQL to the database, one category at a time.
+
+Each category folder (``db/pipelines/<slug>``) is applied over **one
+connection in one transaction**: its ``PIPELINE__*.sql`` files run in
+sorted order, each inside its own savepoint, and any failure rolls the
+whole category back — the database never keeps step 01 without step 03.
+Every file is timed and every statement's command tag and rows affected
+are recorded in the returned :class:`ApplyResult`.
+
+Several categories can be applied concurrently (``--jobs N``), each on
+its own pooled connection, as long as their EAN sets don't intersect:
+a category whose EANs overlap an earlier, unfinished one waits for it, so
+overlapping categories still apply in the given order.  A category that
+loses a deadlock is retried on its own once the others are done.
+
+Works with both :mod:`pipeline.db` backends; with the psql fallback each
+category is a single ``psql`` session.  COPY-format folders
+(``sql_generator`` ``output_format="copy"``) are supported too: the
+driver's ``\\copy … from pstdin`` line is fed the CSV payload, inline in
+the psql script or through ``cursor.copy()`` on a pooled connection.
+
+With ``--skip-unchanged`` a folder whose files hash the same as when it
+was last applied to this database (its ``.manifest.json``) is skipped:
+an idle refresh then re-applies nothing.
+
+Usage::
+
+    python -m pipeline.apply db/pipelines/dairy db/pipelines/bread
+    python -m pipeline.apply --all --jobs 4
+    python -m pipeline.apply --all --country DE --verbose
+    python -m pipeline.apply --all --delta
+    python -m pipeline.apply --all --skip-unchanged
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import hashlib
+import json
+import re
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from pipeline import db
+from pipeline.categories import CATEGORY_SEARCH_TERMS
+from pipeline.ean_registry import claim_files, scan_eans
+from pipeline.run import pipeline_dir_slug
+from pipeline.sql_generator import copy_payload_path, promote_snapshot
+from pipeline.utils import open_text, write_atomic
+
+# ---------------------------------------------------------------------------
+# Constants
+# ---------------------------------------------------------------------------
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+PIPELINE_DIR = PROJECT_ROOT / "db" / "pipelines"
+
+SQL_GLOB = "PIPELINE__*.sql"
+# sql_generator.generate_delta output, applied instead of the full files with --delta.
+DELTA_GLOB = "DELTA__*.sql"
+
+# Command tags that carry a row count: "INSERT 0 30", "UPDATE 5", "DELETE 0", ...
+_ROWS_TAG_RE = re.compile(r"^(INSERT \d+|UPDATE|DELETE|MERGE|COPY|SELECT) (\d+)$")
+_OTHER_TAG_RE = re.compile(r"^(CREATE|ALTER|DROP|CALL|DO|TRUNCATE|REFRESH|ANALYZE|GRANT|REVOKE|COMMENT)\b[A-Z ]*$")
+_TIMING_RE = re.compile(r"^Time: ([\d.]+) ms")
+_MARKER = "@@apply "
+_ERROR_LINE_RE = re.compile(r"^psql:[^:]*:(\d+): ERROR", re.MULTILINE)
+_RETRYABLE = ("deadlock detected", "could not serialize access")
+# psql meta-command in COPY drivers: "\copy <table> from pstdin with (...)"
+_COPY_RE = re.compile(r"^\\copy\s+(\S+)\s+from\s+pstdin\b(.*)$", re.IGNORECASE | re.MULTILINE)
+COPY_CHUNK_BYTES = 1 << 16
+
+# Per-folder record of what was last applied, and to which database.
+MANIFEST_FILENAME = ".manifest.json"
+MANIFEST_VERSION = 2
+# Header line carrying the generation date; left out of file hashes.
+_GENERATED_PREFIX = b"-- Generated:"
+# Identifies the database a folder was applied to: a re-created cluster or
+# database (``supabase db reset``) or a new migration changes it.  The
+# migrations table is absent on a plain ``psql``-migrated database, hence the
+# guarded lookup.  RUN_LOCAL.ps1 runs the same query — keep them in sync.
+_FINGERPRINT_SQL = (
+    "SELECT concat_ws(':', (SELECT system_identifier FROM pg_control_system()), d.oid, "
+    "CASE WHEN to_regclass('supabase_migrations.schema_migrations') IS NOT NULL THEN "
+    "(xpath('/row/v/text()', query_to_xml("
+    "'SELECT max(version) AS v FROM supabase_migrations.schema_migrations', false, true, '')))[1]::text END) "
+    "FROM pg_database d WHERE d.datname = current_database()"
+)
+
+
+class ApplyError(db.DatabaseError):
+    """A category failed and was rolled back; ``result`` holds the details."""
+
+    def __init__(self, result: ApplyResult) -> None:
+        super().__init__(f"{result.folder}: {result.failed_file} failed — rolled back: {result.error}")
+        self.result = result
+
+
+@dataclass
+class FileResult:
+    """Timing and per-statement outcome of one SQL file."""
+
+    name: str
+    seconds: float = 0.0
+    # (command tag, rows affected; -1 when the command has no row count)
+    statements: list[tuple[str, int]] = field(default_factory=list)
+
+    @property
+    def rows_affected(self) -> int:
+        return sum(rows for _tag, rows in self.statements if rows > 0)
+
+
+@dataclass
+class ApplyResult:
+    """Outcome of applying one category folder."""
+
+    folder: str
+    files: list[FileResult] = field(default_factory=list)
+    seconds: float = 0.0
+    committed: bool = False
+    error: str | None = None
+    failed_file: str | None = None
+    # Not applied: unchanged since the manifest's apply to the same database.
+    skipped: bool = False
+
+    @property
+    def rows_affected(self) -> int:
+        return sum(f.rows_affected for f in self.files)
+
+    def summary(self) -> dict:
+        """JSON-friendly form for reports."""
+        return {
+            "folder": self.folder,
+            "committed": self.committed,
+            "skipped": self.skipped,
+            "seconds": round(self.seconds, 3),
+            "rows_affected": self.rows_affected,
+            "error": self.error,
+            "failed_file": self.failed_file,
+            "files": [
+                {"name": f.name, "seconds": round(f.seconds, 3), "rows_affected": f.rows_affected} for f in self.files
+            ],
+        }
+
+
+def sql_files(folder: Path, pattern: str = SQL_GLOB) -> list[Path]:
+    """The folder's *pattern* SQL files (plain or ``.sql.gz``), in apply order."""
+    if not folder.is_dir():
+        return []
+    return sorted([*folder.glob(pattern), *folder.glob(f"{pattern}.gz")], key=lambda p: p.name.removesuffix(".gz"))
+
+
+# ---------------------------------------------------------------------------
+# Manifest
+# ---------------------------------------------------------------------------
+
+
+def db_fingerprint(backend: db.PoolBackend | db.PsqlBackend | None = None) -> str:
+    """Identity of the target database and its schema version (see :data:`_FINGERPRINT_SQL`)."""
+    rows = (backend or db.get_backend()).fetch_all(_FINGERPRINT_SQL)
+    return str(rows[0][0]) if rows else ""
+
+
+def file_hashes(folder: Path) -> dict[str, str]:
+    """SHA-256 of every ``PIPELINE__*`` file in *folder* (SQL, ``.gz`` and COPY payloads).
+
+    ``.gz`` files are hashed decompressed, and ``-- Generated: <date>``
+    lines are skipped, so SQL regenerated unchanged on another day keeps
+    its hash.  ``Get-PipelineHashes`` in RUN_LOCAL.ps1 must hash the same way.
+    """
+    hashes = {}
+    for path in sorted(folder.glob("PIPELINE__*")):
+        digest = hashlib.sha256()
+        with gzip.open(path, "rb") if path.suffix == ".gz" else open(path, "rb") as fh:
+            for line in fh:
+                if not line.startswith(_GENERATED_PREFIX):
+                    digest.update(line)
+        hashes[path.name] = digest.hexdigest()
+    return hashes
+
+
+def _read_manifest(folder: Path) -> dict:
+    try:
+        manifest = json.loads((folder / MANIFEST_FILENAME).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return manifest if isinstance(manifest, dict) and manifest.get("version") == MANIFEST_VERSION else {}
+
+
+def folder_unchanged(folder: Path, fingerprint: str, hashes: dict[str, str] | None = None) -> bool:
+    """True when *folder*'s manifest records exactly its current files, applied at *fingerprint*."""
+    manifest = _read_manifest(folder)
+    hashes = file_hashes(folder) if hashes is None else hashes
+    return bool(hashes) and manifest.get("fingerprint") == fingerprint and manifest.get("files") == hashes
+
+
+def write_manifest(folder: Path, fingerprint: str, hashes: dict[str, str]) -> None:
+    """Record that *hashes* were applied to the database at *fingerprint*."""
+    manifest = {"version": MANIFEST_VERSION, "fingerprint": fingerprint, "files": hashes}
+    write_atomic(folder / MANIFEST_FILENAME, [json.dumps(manifest, indent=2, sort_keys=True), "\n"])
+
+
+# ---------------------------------------------------------------------------
+# Backends
+# ---------------------------------------------------------------------------
+
+
+def _execute_collect(cur, sql: str, file_result: FileResult) -> None:
+    """Run a multi-statement *sql* on *cur*, recording each command tag."""
+    if not sql.strip():
+        return
+    cur.execute(sql)
+    while True:
+        if cur.statusmessage:
+            file_result.statements.append((cur.statusmessage, cur.rowcount))
+        if not cur.nextset():
+            break
+
+
+def _copy_in(cur, table: str, options: str, payload: Path, file_result: FileResult) -> None:
+    """Stream *payload* into ``COPY table FROM STDIN``."""
+    opener = gzip.open if payload.suffix == ".gz" else open
+    with cur.copy(f"COPY {table} FROM STDIN{options}") as copy, opener(payload, "rb") as fh:
+        while chunk := fh.read(COPY_CHUNK_BYTES):
+            copy.write(chunk)
+    file_result.statements.append((f"COPY {cur.rowcount}", cur.rowcount))
+
+
+def _apply_pooled(backend: db.PoolBackend, files: list[Path], result: ApplyResult) -> None:
+    """One pooled connection: outer transaction, one savepoint per file."""
+    with backend.connection() as conn, conn.transaction():
+        for path in files:
+            file_result = FileResult(path.name)
+            result.files.append(file_result)
+            result.failed_file = path.name
+            start = time.perf_counter()
+            with open_text(path) as fh:
+                text = fh.read()
+            # Nested transaction() = SAVEPOINT … RELEASE / ROLLBACK TO.
+            with conn.transaction(), conn.cursor() as cur:
+                match = _COPY_RE.search(text)
+                if match is None:
+                    _execute_collect(cur, text, file_result)
+                else:
+                    _execute_collect(cur, text[: match.start()], file_result)
+                    _copy_in(cur, match.group(1), match.group(2), copy_payload_path(path), file_result)
+                    _execute_collect(cur, text[match.end() :], file_result)
+            file_result.seconds = time.perf_counter() - start
+    result.failed_file = None
+
+
+def _psql_apply_script(files: list[Path]) -> tuple[str, list[tuple[int, str]]]:
+    """One psql script for the category; also returns (first line, file) per file."""
+    lines = ["\\timing on", "BEGIN;"]
+    starts: list[tuple[int, str]] = []
+    for path in files:
+        lines.append(f"\\echo '{_MARKER}{path.name}'")
+        lines.append("SAVEPOINT pipeline_file;")
+        starts.append((len(lines) + 1, path.name))
+        with open_text(path) as fh:
+            text = fh.read()
+        for line in text.splitlines():
+            lines.append(line)
+            if _COPY_RE.match(line):
+                # pstdin is the script itself here: inline the payload, then end-of-data.
+                with open_text(copy_payload_path(path)) as payload:
+                    lines.extend(payload.read().splitlines())
+                lines.append("\\.")
+        lines.append(";")
+        lines.append("RELEASE SAVEPOINT pipeline_file;")
+    lines.append("COMMIT;")
+    return "\n".join(lines) + "\n", starts
+
+
+def _parse_psql_output(stdout: str, result: ApplyResult) -> None:
+    current: FileResult | None = None
+    for line in stdout.splitlines():
+        if line.startswith(_MARKER):
+            current = FileResult(line[len(_MARKER) :])
+            result.files.append(current)
+        elif current is None:
+            continue
+        elif match := _TIMING_RE.match(line):
+            current.seconds += float(match.group(1)) / 1000
+        elif match := _ROWS_TAG_RE.match(line):
+            current.statements.append((line, int(match.group(2))))
+        elif _OTHER_TAG_RE.match(line):
+            current.statements.append((line, -1))
+
+
+def _apply_psql(backend: db.PsqlBackend, files: list[Path], result: ApplyResult) -> None:
+    """One psql session: ``BEGIN``, a savepoint per file, ``COMMIT`` (never reached on error)."""
+    script, starts = _psql_apply_script(files)
+    try:
+        stdout = backend.run_script(script, "-t", "-A")
+    except db.DatabaseError as exc:
+        match = _ERROR_LINE_RE.search(str(exc))
+        if match:
+            line_no = int(match.group(1))
+            result.failed_file = next((name for start, name in reversed(starts) if start <= line_no), None)
+        raise
+    _parse_psql_output(stdout, result)
+
+
+# ---------------------------------------------------------------------------
+# Public API
+# ---------------------------------------------------------------------------
+
+
+def apply_folder(
+    folder: str | Path,
+    *,
+    backend: db.PoolBackend | db.PsqlBackend | None = None,
+    delta: bool = False,
+    fingerprint: str | None = None,
+) -> ApplyResult:
+    """Apply every ``PIPELINE__*.sql`` file in *folder* in one transaction.
+
+    With *delta*, apply the folder's ``DELTA__*.sql`` file instead (the
+    changes since the previous generation, see
+    :func:`pipeline.sql_generator.generate_delta`).
+
+    With a *fingerprint* (:func:`db_fingerprint`), a folder whose manifest
+    records the same file hashes at the same fingerprint is skipped
+    (``result.skipped``), and a successful apply rewrites the manifest.
+    Delta applies neither consult nor write it.
+
+    Once the folder's generation is in the database (committed, or skipped
+    as already applied), its pending snapshot becomes the baseline of the
+    next delta (:func:`pipeline.sql_generator.promote_snapshot`).  A failed
+    apply leaves the baseline where it was.
+
+    Raises
+    ------
+    ApplyError
+        When any statement fails; nothing from the folder is committed.
+    """
+    folder = Path(folder)
+    result = ApplyResult(folder.name)
+    files = sql_files(folder, DELTA_GLOB if delta else SQL_GLOB)
+    if not files:
+        result.committed = True
+        return result
+    hashes = file_hashes(folder) if fingerprint is not None and not delta else None
+    if hashes is not None and folder_unchanged(folder, fingerprint, hashes):
+        result.committed = result.skipped = True
+        promote_snapshot(folder)
+        return result
+
+    backend = backend or db.get_backend()
+    start = time.perf_counter()
+    try:
+        if isinstance(backend, db.PoolBackend):
+            _apply_pooled(backend, files, result)
+        else:
+            _apply_psql(backend, files, result)
+    except db.DatabaseError as exc:
+        result.seconds = time.perf_counter() - start
+        result.error = str(exc).strip().splitlines()[0] if str(exc).strip() else type(exc).__name__
+        raise ApplyError(result) from exc
+    result.seconds = time.perf_counter() - start
+    result.committed = True
+    if hashes is not None:
+        write_manifest(folder, fingerprint, hashes)
+    promote_snapshot(folder)
+    return result
+
+
+def folder_eans(folder: Path) -> set[str]:
+    """EANs claimed by *folder*'s insert SQL or COPY payload (the conflict key for concurrent apply)."""
+    return {ean for path in claim_files(folder) for ean in scan_eans(path)}
+
+
+def _apply_or_result(
+    folder: Path,
+    backend: db.PoolBackend | db.PsqlBackend | None,
+    delta: bool = False,
+    fingerprint: str | None = None,
+) -> ApplyResult:
+    try:
+        return apply_folder(folder, backend=backend, delta=delta, fingerprint=fingerprint)
+    except ApplyError as exc:
+        return exc.result
+
+
+def apply_folders(
+    folders: list[Path],
+    *,
+    jobs: int = 1,
+    backend: db.PoolBackend | db.PsqlBackend | None = None,
+    delta: bool = False,
+    skip_unchanged: bool = False,
+) -> list[ApplyResult]:
+    """Apply each folder in its own transaction; results are returned in *folders* order.
+
+    With ``jobs > 1`` up to *jobs* folders run at once.  A folder only
+    starts when its EANs are disjoint from every earlier folder that has
+    not finished yet.  Failed folders are reported, not raised; one that
+    lost a deadlock is retried alone after the rest.  With
+    *skip_unchanged*, folders unchanged since their last apply to this
+    database are skipped (see :func:`apply_folder`).
+    """
+    fingerprint = db_fingerprint(backend) if skip_unchanged and not delta else None
+    if jobs <= 1:
+        return [_apply_or_result(folder, backend, delta, fingerprint) for folder in folders]
+
+    backend = backend or db.get_backend()
+    eans = [folder_eans(folder) for folder in folders]
+    results: list[ApplyResult | None] = [None] * len(folders)
+    pending = list(range(len(folders)))
+    running: dict[Future, int] = {}
+
+    with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="apply") as pool:
+        while pending or running:
+            # Unfinished folders ahead of each candidate, in order.
+            blocked: set[str] = set()
+            for i in running.values():
+                blocked |= eans[i]
+            for i in list(pending):
+                if len(running) >= jobs:
+                    break
+                if eans[i].isdisjoint(blocked):
+                    pending.remove(i)
+                    running[pool.submit(_apply_or_result, folders[i], backend, delta, fingerprint)] = i
+                blocked |= eans[i]
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[running.pop(future)] = future.result()
+
+    for i, result in enumerate(results):
+        if result is not None and not result.committed and any(s in (result.error or "") for s in _RETRYABLE):
+            results[i] = _apply_or_result(folders[i], backend, delta, fingerprint)
+    return [result for result in results if result is not None]
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+
+def _resolve_folders(args: argparse.Namespace) -> list[Path]:
+    if args.all:
+        pattern = DELTA_GLOB if args.delta else SQL_GLOB
+        folders = sorted(p for p in PIPELINE_DIR.iterdir() if p.is_dir() and sql_files(p, pattern))
+        if args.country:
+            slugs = {pipeline_dir_slug(category, args.country.upper()) for category in CATEGORY_SEARCH_TERMS}
+            folders = [p for p in folders if p.name in slugs]
+        return folders
+    return [Path(f) if Path(f).is_dir() else PIPELINE_DIR / f for f in args.folders]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Apply pipeline SQL folders, one transaction per category")
+    parser.add_argument("folders", nargs="*", help="Folder paths or slugs under db/pipelines")
+    parser.add_argument("--all", action="store_true", help="Apply every folder under db/pipelines")
+    parser.add_argument("--country", default=None, help="With --all: only this country's folders (e.g. PL, DE)")
+    parser.add_argument("--jobs", type=int, default=1, help="Categories applied concurrently (default: 1)")
+    parser.add_argument("--delta", action="store_true", help="Apply each folder's DELTA__ file, not the full files")
+    parser.add_argument(
+        "--skip-unchanged", action="store_true", help="Skip folders unchanged since their last apply to this database"
+    )
+    parser.add_argument("--verbose", action="store_true", help="Print per-file timings and row counts")
+    args = parser.parse_args()
+
+    folders = _resolve_folders(args)
+    if not folders:
+        parser.error("no folders to apply (pass folder names or --all)")
+
+    start = time.perf_counter()
+    results = apply_folders(folders, jobs=args.jobs, delta=args.delta, skip_unchanged=args.skip_unchanged)
+    failed = [r for r in results if not r.committed]
+    for result in results:
+        if result.skipped:
+            print(f"  --  {result.folder:<40} unchanged since last apply, skipped")
+            continue
+        status = "OK " if result.committed else "ERR"
+        print(
+            f"  {status} {result.folder:<40} {len(result.files):>2} files "
+            f"{result.rows_affected:>7} rows {result.seconds:7.2f}s"
+        )
+        if args.verbose:
+            for f in result.files:
+                print(f"        {f.name:<60} {f.rows_affected:>7} rows {f.seconds:7.3f}s")
+        if result.error:
+            print(f"        {result.failed_file}: {result.error}")
+
+    skipped = sum(r.skipped for r in results)
+    print(
+        f"\n  Applied {len(results) - len(failed) - skipped}/{len(results)} folders "
+        f"({skipped} unchanged) in {time.perf_counter() - start:.1f}s"
+    )
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Shared fixtures for the SQL generator tests (batch, delta and COPY output)."""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+PRODUCT_TEMPLATE = {
+    "brand": "TestBrand",
+    "product_name": "Product",
+    "ean": "5900000000000",
+    "product_type": "Grocery",
+    "prep_method": "not-applicable",
+    "store_availability": None,
+    "controversies": "none",
+    "calories": 100,
+    "total_fat_g": 5.0,
+    "saturated_fat_g": 2.0,
+    "trans_fat_g": 0.0,
+    "carbs_g": 15.0,
+    "sugars_g": 5.0,
+    "fibre_g": 1.0,
+    "protein_g": 3.0,
+    "salt_g": 0.5,
+    "nutri_score_label": "C",
+    "nutri_score_source": "off_computed",
+    "nova_group": "3",
+    "source_url": "https://world.openfoodfacts.org/product/1234",
+    "image_url": "https://images.openfoodfacts.org/img.jpg",
+}
+
+
+def make_products(n: int, **overrides: object) -> list[dict]:
+    """Create *n* distinct product dicts for testing (*overrides* applied to each)."""
+    products = []
+    for i in range(1, n + 1):
+        p = dict(PRODUCT_TEMPLATE, **overrides)
+        p["brand"] = f"Brand{i}"
+        p["product_name"] = f"Product {i}"
+        p["ean"] = f"{5900000000000 + i}"
+        products.append(p)
+    return products
+
+
+@pytest.fixture
+def tmp_output(tmp_path: Path) -> Path:
+    """Return a fresh output directory for a fake category."""
+    out = tmp_path / "test-cat"
+    out.mkdir()
+    return out
@@ -0,0 +1,384 @@
+"""Bulk ingestion from a local Open Food Facts data dump.
+
+Streams the official OFF JSONL export (``openfoodfacts-products.jsonl.gz``)
+or the Parquet export in a single pass and builds pipeline SQL for every
+requested category and country at once — no API calls, no rate limit.
+
+Each dump row is filtered by ``countries_tags`` and routed to categories
+through the ``DB_TO_OFF_TAGS`` mapping (the same tags used by the API tag
+search), then run through the usual ``extract_product_data`` →
+``validate_product`` chain.  Only the ``max_products * 3`` best candidates
+per (country, category) — by market relevance — are kept in memory, so
+memory stays bounded no matter how large the dump is.  The final dedup,
+ranking and ``generate_pipeline`` step is shared with :mod:`pipeline.run`.
+
+The API's keyword-search fallback has no dump equivalent; categories are
+matched by OFF category tags only.
+
+Usage::
+
+    python -m pipeline.dump_ingest --dump openfoodfacts-products.jsonl.gz
+    python -m pipeline.dump_ingest --dump food.parquet --country PL --category Dairy --dry-run
+
+Parquet support requires ``pyarrow`` (``pip install pyarrow``).
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import heapq
+import json
+import logging
+import sys
+import time
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+from pipeline.categories import CATEGORY_SEARCH_TERMS, DB_TO_OFF_TAGS
+from pipeline.http_cache import add_cache_arguments, configure_from_args, get_cache
+from pipeline.off_client import market_scorer
+from pipeline.run import (
+    _COUNTRY_OFF_NAME,
+    PIPELINE_DIR,
+    _ProductMemo,
+    _Tally,
+    pipeline_dir_slug,
+    select_and_generate,
+)
+from pipeline.sql_generator import BATCH_SIZE, OUTPUT_FORMATS
+
+logger = logging.getLogger(__name__)
+
+# Countries built by default (--country ALL), as in pipeline.orchestrate; the
+# wider OFF name table in pipeline.run serves fetch_off_category.
+SUPPORTED_COUNTRIES = ["PL", "DE"]
+PARQUET_BATCH_ROWS = 10_000
+
+# ---------------------------------------------------------------------------
+# Dump readers
+# ---------------------------------------------------------------------------
+
+
+def _is_parquet(path: Path) -> bool:
+    return path.suffix.lower() == ".parquet"
+
+
+def _iter_jsonl(path: Path, needles: tuple[str, ...]) -> Iterator[dict | None]:
+    """Yield one product per JSONL line; lines without any *needle* yield ``None``.
+
+    The substring pre-filter skips ``json.loads`` for the vast majority of
+    rows (products not sold in a requested country).
+    """
+    opener = gzip.open if path.suffix.lower() == ".gz" else open
+    with opener(path, "rt", encoding="utf-8") as fh:
+        for line in fh:
+            if not any(n in line for n in needles):
+                yield None
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                logger.debug("Skipping malformed dump line")
+                yield None
+
+
+def _localized_text(value: Any) -> Any:
+    """Collapse a Parquet ``[{lang, text}, ...]`` field to a plain string."""
+    if not isinstance(value, list) or not value or not isinstance(value[0], dict) or "text" not in value[0]:
+        return value
+    for item in value:
+        if item.get("lang") == "main":
+            return item.get("text")
+    return value[0].get("text")
+
+
+def _parquet_row_to_off(row: dict) -> dict:
+    """Map a Parquet export row onto the JSON/API product shape."""
+    product = {key: _localized_text(val) for key, val in row.items()}
+    nutriments = row.get("nutriments")
+    if isinstance(nutriments, list):
+        flat: dict[str, Any] = {}
+        for item in nutriments:
+            name = item.get("name")
+            if not name:
+                continue
+            flat[name] = item.get("value")
+            if item.get("100g") is not None:
+                flat[f"{name}_100g"] = item["100g"]
+        product["nutriments"] = flat
+    return product
+
+
+def _iter_parquet(path: Path) -> Iterator[dict | None]:
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        msg = "pyarrow is required to read Parquet dumps: pip install pyarrow"
+        raise SystemExit(msg) from None
+
+    parquet = pq.ParquetFile(path)
+    for batch in parquet.iter_batches(batch_size=PARQUET_BATCH_ROWS):
+        for row in batch.to_pylist():
+            yield _parquet_row_to_off(row)
+
+
+def iter_dump(path: str | Path, country_tags: list[str]) -> Iterator[dict | None]:
+    """Stream raw OFF products from a JSONL(.gz) or Parquet dump.
+
+    ``None`` marks rows skipped by the cheap country pre-filter (JSONL
+    only); callers still count them as scanned.
+    """
+    path = Path(path)
+    if _is_parquet(path):
+        return _iter_parquet(path)
+    return _iter_jsonl(path, tuple(f'"{tag}"' for tag in country_tags))
+
+
+# ---------------------------------------------------------------------------
+# Candidate selection
+# ---------------------------------------------------------------------------
+
+
+@dataclass
+class _Bucket:
+    """Bounded best-candidate set for one (country, category)."""
+
+    country: str
+    category: str
+    cap: int
+    memo: _ProductMemo
+    heap: list[tuple[int, int, dict]] = field(default_factory=list)
+    tally: _Tally = field(default_factory=_Tally)
+
+    def __post_init__(self) -> None:
+        self.tally.max_blocked = self.cap
+        self.score = market_scorer(self.country)
+
+    def offer(self, product: dict, seq: int) -> None:
+        # Min-heap on (score, -seq): the root is the worst candidate — lowest
+        # score, latest in the dump — and is replaced first.
+        item = (self.score(product), -seq, product)
+        if len(self.heap) < self.cap:
+            heapq.heappush(self.heap, item)
+        elif item[:2] > self.heap[0][:2]:
+            heapq.heapreplace(self.heap, item)
+
+    def candidates(self) -> list[dict]:
+        """Kept candidates in dump order (so first-seen dedup is deterministic)."""
+        return [p for _score, _neg_seq, p in sorted(self.heap, key=lambda it: -it[1])]
+
+
+def _tag_index(categories: list[str]) -> dict[str, list[str]]:
+    index: dict[str, list[str]] = {}
+    for category in categories:
+        for tag in DB_TO_OFF_TAGS.get(category, []):
+            index.setdefault(tag, []).append(category)
+    return index
+
+
+def _route(bucket: _Bucket, raw: dict, seq: int, min_completeness: float, max_warnings: int) -> None:
+    """Run one dump row through extract → validate into *bucket*."""
+    product = bucket.memo.extract(raw)
+    if product is None:
+        return
+    try:
+        completeness = float(product.get("_completeness", 0))
+    except (ValueError, TypeError):
+        completeness = 0.0
+    if completeness < min_completeness:
+        return
+    result = bucket.memo.validate(product)
+    if bucket.tally.admit(result, max_warnings):
+        bucket.offer(result, seq)
+
+
+def scan_dump(
+    dump: str | Path,
+    countries: list[str],
+    categories: list[str],
+    max_products: int,
+    min_completeness: float = 0.0,
+    max_warnings: int = 3,
+) -> tuple[dict[tuple[str, str], _Bucket], dict]:
+    """Single pass over *dump*, returning per-(country, category) buckets and scan stats."""
+    cache = get_cache()
+    country_tags = {c: f"en:{_COUNTRY_OFF_NAME[c]}" for c in countries}
+    buckets = {
+        (country, category): _Bucket(country, category, max_products * 3, _ProductMemo(category, cache))
+        for country in countries
+        for category in categories
+    }
+    index = _tag_index(categories)
+    stats = {"rows_scanned": 0, "rows_in_country": 0, "rows_routed": 0, "seconds": 0.0}
+
+    start = time.monotonic()
+    for seq, raw in enumerate(iter_dump(dump, list(country_tags.values()))):
+        stats["rows_scanned"] += 1
+        if stats["rows_scanned"] % 500_000 == 0:
+            logger.info("  ... %d rows scanned, %d routed", stats["rows_scanned"], stats["rows_routed"])
+        if raw is None:
+            continue
+        tags = raw.get("countries_tags") or []
+        in_countries = [c for c, tag in country_tags.items() if tag in tags]
+        if not in_countries:
+            continue
+        stats["rows_in_country"] += 1
+        matched = {cat for tag in raw.get("categories_tags") or [] for cat in index.get(tag, ())}
+        if not matched:
+            continue
+        stats["rows_routed"] += 1
+        for country in in_countries:
+            for category in matched:
+                _route(buckets[(country, category)], raw, seq, min_completeness, max_warnings)
+    stats["seconds"] = round(time.monotonic() - start, 2)
+    return buckets, stats
+
+
+# ---------------------------------------------------------------------------
+# Entry point
+# ---------------------------------------------------------------------------
+
+
+def ingest_dump(
+    dump: str | Path,
+    countries: list[str],
+    categories: list[str] | None = None,
+    max_products: int = 100,
+    output_root: str | Path | None = None,
+    dry_run: bool = False,
+    min_completeness: float = 0.0,
+    max_warnings: int = 3,
+    batch_size: int = BATCH_SIZE,
+    output_format: str = "sql",
+    compress: bool = False,
+) -> dict:
+    """Build pipeline SQL for every (country, category) from one dump pass.
+
+    Categories are generated in sorted order per country (PL first), the
+    same order as :mod:`pipeline.orchestrate`, so cross-category EAN dedup
+    keeps its first-writer-wins behaviour.
+
+    Returns
+    -------
+    dict
+        Scan statistics plus ``categories``: per-folder run statistics.
+    """
+    categories = sorted(categories or CATEGORY_SEARCH_TERMS)
+    pipeline_dir = Path(output_root) if output_root is not None else PIPELINE_DIR
+
+    print("TryVit — Open Food Facts dump ingestion")
+    print("=" * 42)
+    print(f"Dump:       {dump}")
+    print(f"Countries:  {', '.join(countries)}")
+    print(f"Categories: {len(categories)}")
+    print()
+
+    buckets, stats = scan_dump(dump, countries, categories, max_products, min_completeness, max_warnings)
+    rate = stats["rows_scanned"] / stats["seconds"] if stats["seconds"] else 0.0
+    print(
+        f"Scanned {stats['rows_scanned']:,} rows in {stats['seconds']}s ({rate:,.0f} rows/s): "
+        f"{stats['rows_in_country']:,} in country, {stats['rows_routed']:,} matched a category"
+    )
+
+    stats["categories"] = {}
+    for country in countries:
+        for category in categories:
+            bucket = buckets[(country, category)]
+            slug = pipeline_dir_slug(category, country)
+            print(f"\n[{country}] {category} — {len(bucket.heap)} candidates")
+            stats["categories"][slug] = select_and_generate(
+                category,
+                bucket.candidates(),
+                bucket.tally,
+                bucket.memo,
+                country=country,
+                max_products=max_products,
+                output_dir=pipeline_dir / slug,
+                dry_run=dry_run,
+                batch_size=batch_size,
+                output_format=output_format,
+                compress=compress,
+                pipeline_dir=pipeline_dir,
+            )
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="TryVit — build pipeline SQL for all categories from a local OFF data dump.",
+    )
+    parser.add_argument("--dump", required=True, help="Path to the OFF JSONL(.gz) or Parquet export")
+    parser.add_argument(
+        "--country",
+        default="ALL",
+        help=f"Country to build: {', '.join(SUPPORTED_COUNTRIES)}, or ALL (default: ALL)",
+    )
+    parser.add_argument("--category", default=None, help="Single category (default: all)")
+    parser.add_argument(
+        "--max-products",
+        type=int,
+        default=100,
+        help="Maximum products per category (default: 100)",
+    )
+    parser.add_argument(
+        "--output-root",
+        default=None,
+        help="Root folder for per-category pipeline folders (default: db/pipelines)",
+    )
+    parser.add_argument("--dry-run", action="store_true", help="Scan and report without writing files")
+    parser.add_argument("--min-completeness", type=float, default=0.0, help="Min OFF completeness 0-1")
+    parser.add_argument("--max-warnings", type=int, default=3, help="Drop products with more warnings")
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=BATCH_SIZE,
+        help=f"Max products per batch file (default: {BATCH_SIZE}, 0 = no batching)",
+    )
+    parser.add_argument(
+        "--format",
+        choices=OUTPUT_FORMATS,
+        default="sql",
+        help="Output format: per-step SQL files, or a CSV payload + COPY driver (default: sql)",
+    )
+    parser.add_argument(
+        "--gzip",
+        action="store_true",
+        help="Write the SQL/CSV files gzip-compressed (*.sql.gz, *.csv.gz)",
+    )
+    add_cache_arguments(parser)
+    args = parser.parse_args()
+    configure_from_args(parser, args)
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+
+    countries = SUPPORTED_COUNTRIES if args.country.upper() == "ALL" else [args.country.upper()]
+    if any(c not in SUPPORTED_COUNTRIES for c in countries):
+        print(f"ERROR: Unsupported country '{args.country}'. Supported: {', '.join(SUPPORTED_COUNTRIES)}")
+        sys.exit(1)
+    if args.category and args.category not in CATEGORY_SEARCH_TERMS:
+        print(f"ERROR: Unknown category '{args.category}'.")
+        sys.exit(1)
+    if not Path(args.dump).is_file():
+        print(f"ERROR: Dump not found: {args.dump}")
+        sys.exit(1)
+
+    ingest_dump(
+        args.dump,
+        countries,
+        categories=[args.category] if args.category else None,
+        max_products=args.max_products,
+        output_root=args.output_root,
+        dry_run=args.dry_run,
+        min_completeness=args.min_completeness,
+        max_warnings=args.max_warnings,
+        batch_size=args.batch_size,
+        output_format=args.format,
+        compress=args.gzip,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""Persistent index of the EANs claimed by each pipeline folder.
+
+Cross-category EAN dedup (:func:`pipeline.run._cross_category_ean_dedup`)
+needs every EAN already present in the *other* folders under
+``db/pipelines``.  Regex-scanning every ``01_insert_products`` SQL file for
+each category run makes a full orchestrator run quadratic in SQL bytes, so
+the EANs are kept in a small SQLite index next to the folders
+(``db/pipelines/.ean_registry.sqlite``, git-ignored).
+
+A ``--format copy`` folder has no insert SQL; its EANs are read from the
+CSV payload (``00_copy_payload.csv``) instead.
+
+Each indexed SQL file or payload is recorded with its ``mtime_ns`` and size.  Every
+lookup first re-stats the insert files (a directory listing, no reads) and
+re-scans only files that were added, changed or removed — so the index can
+never serve EANs that disagree with the SQL on disk, whoever wrote it.
+:func:`folder_written` refreshes one folder right after
+:func:`pipeline.sql_generator.generate_pipeline` has written it.
+"""
+
+from __future__ import annotations
+
+import logging
+import re
+import sqlite3
+import threading
+from collections import Counter
+from pathlib import Path
+
+from pipeline.sql_generator import COPY_PAYLOAD_STEP, copy_payload_eans
+from pipeline.utils import open_text
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Constants
+# ---------------------------------------------------------------------------
+REGISTRY_FILENAME = ".ean_registry.sqlite"
+
+# Insert files whose EANs count as "claimed" by their folder.
+INSERT_GLOB = "PIPELINE__*__01_insert_products.sql"
+# ... and their gzip-compressed form (``generate_pipeline(compress=True)``).
+INSERT_GZ_GLOB = f"{INSERT_GLOB}.gz"
+# COPY payloads (``generate_pipeline(output_format="copy")``), which replace the insert SQL.
+PAYLOAD_GLOB = f"PIPELINE__*__{COPY_PAYLOAD_STEP}.csv"
+PAYLOAD_GZ_GLOB = f"{PAYLOAD_GLOB}.gz"
+
+# Pattern to extract EAN literals from pipeline 01_insert SQL files.
+# Matches EAN values in:  ('brand', 'name', 'EAN1234567890', ...)
+EAN_IN_SQL_RE = re.compile(r"'(\d{8}|\d{13})'")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path     TEXT PRIMARY KEY,
+    folder   TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size     INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS eans (
+    ean  TEXT NOT NULL,
+    path TEXT NOT NULL REFERENCES files (path) ON DELETE CASCADE,
+    PRIMARY KEY (path, ean)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS eans_ean ON eans (ean);
+"""
+
+
+def insert_files(folder: Path) -> list[Path]:
+    """The insert SQL files in *folder*, plain or gzip-compressed."""
+    return sorted([*folder.glob(INSERT_GLOB), *folder.glob(INSERT_GZ_GLOB)])
+
+
+def claim_files(folder: Path) -> list[Path]:
+    """The files whose EANs *folder* claims: its insert SQL and COPY payloads."""
+    return sorted([*insert_files(folder), *folder.glob(PAYLOAD_GLOB), *folder.glob(PAYLOAD_GZ_GLOB)])
+
+
+def scan_eans(path: Path) -> set[str]:
+    """Return the EANs in one claim file, insert SQL or COPY payload (empty if unreadable)."""
+    if f"__{COPY_PAYLOAD_STEP}.csv" in path.name:
+        return copy_payload_eans(path)
+    return scan_sql_eans(path)
+
+
+def scan_sql_eans(sql_file: Path) -> set[str]:
+    """Return the EAN literals in one insert SQL file (empty if unreadable)."""
+    try:
+        with open_text(sql_file) as fh:
+            content = fh.read()
+    except (OSError, EOFError):
+        return set()
+    return {match.group(1) for match in EAN_IN_SQL_RE.finditer(content)}
+
+
+# ---------------------------------------------------------------------------
+# Registry
+# ---------------------------------------------------------------------------
+
+
+class EanRegistry:
+    """SQLite-backed EAN → pipeline folder index for one pipelines root.
+
+    Parameters
+    ----------
+    pipeline_dir:
+        Root containing one folder per (category, country), e.g. ``db/pipelines``.
+    db_path:
+        Index file (default ``<pipeline_dir>/.ean_registry.sqlite``).
+    """
+
+    def __init__(self, pipeline_dir: str | Path, db_path: str | Path | None = None) -> None:
+        self.pipeline_dir = Path(pipeline_dir)
+        self.db_path = Path(db_path) if db_path is not None else self.pipeline_dir / REGISTRY_FILENAME
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+        self.stats = {"files_scanned": 0, "files_reused": 0}
+        # In-memory view of the index (folder → EANs, EAN → folder count),
+        # rebuilt after a refresh that changed anything.
+        self._by_folder: dict[str, set[str]] | None = None
+        self._folder_count: Counter[str] = Counter()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # -- maintenance ---------------------------------------------------------
+
+    def _insert_files(self, folder: str | None = None) -> dict[str, tuple[str, int, int]]:
+        """Stat the claim files on disk: relative path → (folder, mtime_ns, size)."""
+        folders = [self.pipeline_dir / folder] if folder else sorted(self.pipeline_dir.iterdir())
+        found: dict[str, tuple[str, int, int]] = {}
+        for path in folders:
+            if not path.is_dir():
+                continue
+            for sql_file in claim_files(path):
+                try:
+                    st = sql_file.stat()
+                except OSError:
+                    continue
+                found[f"{path.name}/{sql_file.name}"] = (path.name, st.st_mtime_ns, st.st_size)
+        return found
+
+    def refresh(self, folder: str | None = None) -> None:
+        """Bring the index in line with the SQL on disk (one *folder*, or all)."""
+        on_disk = self._insert_files(folder)
+        with self._lock:
+            if folder:
+                rows = self._conn.execute(
+                    "SELECT path, folder, mtime_ns, size FROM files WHERE folder = ?", (folder,)
+                ).fetchall()
+            else:
+                rows = self._conn.execute("SELECT path, folder, mtime_ns, size FROM files").fetchall()
+            indexed = {path: (fold, mtime_ns, size) for path, fold, mtime_ns, size in rows}
+
+            removed = [path for path in indexed if path not in on_disk]
+            changed = [path for path, meta in on_disk.items() if indexed.get(path) != meta]
+            self.stats["files_reused"] += len(on_disk) - len(changed)
+            if not removed and not changed:
+                return
+            self._conn.executemany("DELETE FROM files WHERE path = ?", [(p,) for p in removed + changed])
+            for path in changed:
+                fold, mtime_ns, size = on_disk[path]
+                eans = scan_eans(self.pipeline_dir / path)
+                self._conn.execute(
+                    "INSERT INTO files (path, folder, mtime_ns, size) VALUES (?, ?, ?, ?)",
+                    (path, fold, mtime_ns, size),
+                )
+                self._conn.executemany("INSERT INTO eans (ean, path) VALUES (?, ?)", [(e, path) for e in eans])
+                self.stats["files_scanned"] += 1
+            self._conn.commit()
+            self._by_folder = None
+        logger.debug("EAN registry: %d file(s) re-indexed, %d removed", len(changed), len(removed))
+
+    # -- lookups -------------------------------------------------------------
+
+    def _view(self) -> dict[str, set[str]]:
+        """Folder → EANs, loaded from the index when stale (caller holds the lock)."""
+        if self._by_folder is None:
+            by_folder: dict[str, set[str]] = {}
+            rows = self._conn.execute("SELECT f.folder, e.ean FROM eans e JOIN files f ON f.path = e.path")
+            for folder, ean in rows:
+                by_folder.setdefault(folder, set()).add(ean)
+            self._folder_count = Counter(ean for eans in by_folder.values() for ean in eans)
+            self._by_folder = by_folder
+        return self._by_folder
+
+    def existing_eans(self, exclude_folder: str) -> set[str]:
+        """EANs claimed by every folder except *exclude_folder* (index refreshed first)."""
+        self.refresh()
+        with self._lock:
+            by_folder = self._view()
+            own = by_folder.get(exclude_folder, set())
+            # Everything, minus the EANs no other folder also claims.
+            return set(self._folder_count) - {ean for ean in own if self._folder_count[ean] == 1}
+
+    def folders_for(self, ean: str) -> list[str]:
+        """Folders whose insert SQL contains *ean* (index refreshed first)."""
+        self.refresh()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT f.folder FROM eans e JOIN files f ON f.path = e.path WHERE e.ean = ? ORDER BY 1",
+                (ean,),
+            )
+            return [folder for (folder,) in rows]
+
+
+# ---------------------------------------------------------------------------
+# Process-wide registries
+# ---------------------------------------------------------------------------
+
+_registries: dict[Path, EanRegistry] = {}
+_registries_lock = threading.Lock()
+
+
+def registry_for(pipeline_dir: str | Path) -> EanRegistry | None:
+    """Return the shared registry for *pipeline_dir* (``None`` if it is not a folder)."""
+    root = Path(pipeline_dir).resolve()
+    if not root.is_dir():
+        return None
+    with _registries_lock:
+        registry = _registries.get(root)
+        if registry is None:
+            registry = _registries[root] = EanRegistry(root)
+        return registry
+
+
+def folder_written(output_dir: str | Path) -> None:
+    """Re-index *output_dir* after SQL generation, if its root has an open registry."""
+    folder = Path(output_dir).resolve()
+    with _registries_lock:
+        registry = _registries.get(folder.parent)
+    if registry is not None:
+        registry.refresh(folder.name)
+
+
+def reset() -> None:
+    """Close every shared registry (used by tests)."""
+    with _registries_lock:
+        for registry in _registries.values():
+            registry.close()
+        _registries.clear()
@@ -0,0 +1,440 @@
+"""Persistent on-disk cache for Open Food Facts JSON responses.
+
+All OFF clients (``pipeline.off_client``, ``pipeline.image_importer``,
+``enrich_ingredients.py`` and ``fetch_off_category.py``) share one SQLite
+cache so that re-running a category — for example after a failed DB apply —
+replays earlier responses instead of re-downloading them.
+
+Entries are keyed by URL plus normalised (sorted) query params and stored
+zlib-compressed.  Each entry expires after a TTL, after which clients that
+support it revalidate with ``If-None-Match`` / ``If-Modified-Since`` and a
+``304`` reuses the stored body.  Once the cache grows past its size cap the
+least recently used entries are evicted.  In *offline*
+mode no request is ever sent: hits are served regardless of age and misses
+return ``None``, which lets CI replay a recorded cache with no network.
+
+The cache is disabled unless configured, either programmatically via
+:func:`configure` or from the ``--cache-dir/--cache-ttl/--offline`` CLI
+flags added by :func:`add_cache_arguments`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+from urllib.parse import urlencode
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Constants
+# ---------------------------------------------------------------------------
+CACHE_FILENAME = "off_http_cache.sqlite"
+DEFAULT_TTL_HOURS = 24.0
+DEFAULT_MAX_MB = 512
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key           TEXT PRIMARY KEY,
+    url           TEXT NOT NULL,
+    body          BLOB NOT NULL,
+    size          INTEGER NOT NULL,
+    fetched_at    REAL NOT NULL,
+    last_access   REAL NOT NULL,
+    etag          TEXT,
+    last_modified TEXT,
+    raw_size      INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access);
+CREATE TABLE IF NOT EXISTS product_records (
+    stage           TEXT NOT NULL,
+    category        TEXT NOT NULL,
+    code            TEXT NOT NULL,
+    last_modified_t INTEGER NOT NULL,
+    record          BLOB NOT NULL,
+    PRIMARY KEY (stage, category, code)
+);
+CREATE TABLE IF NOT EXISTS generations (
+    output_dir TEXT PRIMARY KEY,
+    digest     TEXT NOT NULL
+);
+"""
+
+# Columns added after the first cache release — created on open if missing.
+_ADDED_COLUMNS = {
+    "etag": "TEXT",
+    "last_modified": "TEXT",
+    "raw_size": "INTEGER NOT NULL DEFAULT 0",
+}
+
+
+def cache_key(url: str, params: dict | None = None) -> str:
+    """Return the content key for *url* + *params* (param order is irrelevant)."""
+    query = urlencode(sorted((str(k), str(v)) for k, v in (params or {}).items()))
+    return hashlib.sha256(f"{url}?{query}".encode()).hexdigest()
+
+
+@dataclass
+class Fetched:
+    """Result of a (possibly conditional) GET made on behalf of the cache.
+
+    ``not_modified`` marks a ``304 Not Modified`` answer to a conditional
+    request; ``payload`` is then ignored and the cached body is reused.
+    """
+
+    payload: Any | None
+    etag: str | None = None
+    last_modified: str | None = None
+    not_modified: bool = False
+
+
+def _dumps(value: Any) -> bytes:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+# ---------------------------------------------------------------------------
+# Cache
+# ---------------------------------------------------------------------------
+
+
+class HttpCache:
+    """SQLite-backed JSON response cache with TTL, revalidation and LRU size cap.
+
+    Safe to share between threads.  Besides raw responses the cache keeps
+    per-product derived records keyed on OFF's ``last_modified_t`` so that
+    unchanged products need not be re-extracted (see :meth:`get_record`).
+
+    Parameters
+    ----------
+    cache_dir:
+        Directory holding the cache database (created if missing).
+    ttl_hours:
+        Entries older than this are revalidated (ignored offline).
+    max_mb:
+        Size cap for stored (compressed) bodies; LRU entries are evicted
+        once it is exceeded.
+    offline:
+        Never hit the network — serve any cached entry, miss otherwise.
+    clock:
+        Injectable wall-clock (used by tests).
+    """
+
+    def __init__(
+        self,
+        cache_dir: str | Path,
+        ttl_hours: float = DEFAULT_TTL_HOURS,
+        max_mb: float = DEFAULT_MAX_MB,
+        offline: bool = False,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.cache_dir = Path(cache_dir)
+        self.ttl_hours = ttl_hours
+        self.max_mb = max_mb
+        self.offline = offline
+        self._ttl = ttl_hours * 3600
+        self._max_bytes = int(max_mb * 1024 * 1024)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.cache_dir / CACHE_FILENAME, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        existing = {row[1] for row in self._conn.execute("PRAGMA table_info(responses)")}
+        for column, decl in _ADDED_COLUMNS.items():
+            if column not in existing:
+                self._conn.execute(f"ALTER TABLE responses ADD COLUMN {column} {decl}")
+        self._conn.commit()
+        self.stats = {"hits": 0, "misses": 0, "revalidated": 0, "bytes_saved": 0}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # -- responses -----------------------------------------------------------
+
+    def get(self, url: str, params: dict | None = None) -> Any | None:
+        """Return the cached JSON payload, or ``None`` on a miss / expiry."""
+        key = cache_key(url, params)
+        with self._lock:
+            row = self._conn.execute("SELECT body, fetched_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or not self._is_fresh(row[1]):
+                return None
+            self._touch(key, refetched=False)
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(
+        self,
+        url: str,
+        params: dict | None,
+        payload: Any,
+        etag: str | None = None,
+        last_modified: str | None = None,
+    ) -> None:
+        """Store *payload* (any JSON-serialisable value) and enforce the size cap."""
+        raw = _dumps(payload)
+        body = zlib.compress(raw)
+        now = self._clock()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses "
+                "(key, url, body, size, fetched_at, last_access, etag, last_modified, raw_size) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (cache_key(url, params), url, body, len(body), now, now, etag, last_modified, len(raw)),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _is_fresh(self, fetched_at: float) -> bool:
+        return self.offline or self._clock() - fetched_at <= self._ttl
+
+    def _touch(self, key: str, refetched: bool) -> None:
+        """Bump LRU position (and, after a 304, the freshness clock) of *key*."""
+        now = self._clock()
+        if refetched:
+            self._conn.execute("UPDATE responses SET last_access = ?, fetched_at = ? WHERE key = ?", (now, now, key))
+        else:
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+        self._conn.commit()
+
+    def _evict(self) -> None:
+        """Drop least-recently-used entries until the total size fits the cap."""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self._max_bytes:
+            return
+        doomed: list[tuple[str]] = []
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_access, key"):
+            if total <= self._max_bytes:
+                break
+            doomed.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+        logger.debug("HTTP cache: evicted %d entries", len(doomed))
+
+    def _count(self, stat: str, n: int = 1) -> None:
+        with self._lock:
+            self.stats[stat] += n
+
+    def fetch(self, url: str, params: dict | None, fetch: Callable[[], Any | None]) -> Any | None:
+        """Return the cached payload for *url*, calling *fetch* on a miss.
+
+        ``None`` results from *fetch* (request failures) are not cached.
+        Offline, a miss returns ``None`` without calling *fetch*.
+        """
+        return self.revalidate(url, params, lambda _headers: Fetched(fetch()))
+
+    def revalidate(
+        self,
+        url: str,
+        params: dict | None,
+        fetch: Callable[[dict[str, str]], Fetched | None],
+    ) -> Any | None:
+        """Like :meth:`fetch`, but revalidates expired entries conditionally.
+
+        *fetch* receives the ``If-None-Match`` / ``If-Modified-Since``
+        headers for the stored validators (empty when there are none) and
+        returns a :class:`Fetched`.  A ``304`` refreshes the entry's TTL and
+        returns the cached body, counting its size in ``stats["bytes_saved"]``.
+        """
+        key = cache_key(url, params)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body, fetched_at, etag, last_modified, raw_size FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self._is_fresh(row[1]):
+                self._touch(key, refetched=False)
+                self.stats["hits"] += 1
+                self.stats["bytes_saved"] += row[4]
+                return json.loads(zlib.decompress(row[0]))
+        if self.offline:
+            logger.debug("HTTP cache: offline miss for %s %s", url, params)
+            self._count("misses")
+            return None
+
+        headers: dict[str, str] = {}
+        if row is not None and row[2]:
+            headers["If-None-Match"] = row[2]
+        if row is not None and row[3]:
+            headers["If-Modified-Since"] = row[3]
+        result = fetch(headers)
+
+        if result is not None and result.not_modified and row is not None:
+            with self._lock:
+                self._touch(key, refetched=True)
+                self.stats["revalidated"] += 1
+                self.stats["bytes_saved"] += row[4]
+            return json.loads(zlib.decompress(row[0]))
+        self._count("misses")
+        if result is None or result.payload is None:
+            return None
+        self.put(url, params, result.payload, result.etag, result.last_modified)
+        return result.payload
+
+    # -- derived product records --------------------------------------------
+
+    def get_record(self, stage: str, category: str, code: str, last_modified_t: int) -> tuple[bool, Any]:
+        """Look up a derived record for an unchanged product.
+
+        Returns ``(True, record)`` when a record was stored for *code* at the
+        same ``last_modified_t`` (``record`` may itself be ``None``), else
+        ``(False, None)``.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT record FROM product_records "
+                "WHERE stage = ? AND category = ? AND code = ? AND last_modified_t = ?",
+                (stage, category, code, last_modified_t),
+            ).fetchone()
+        if row is None:
+            return False, None
+        return True, json.loads(zlib.decompress(row[0]))
+
+    def put_record(self, stage: str, category: str, code: str, last_modified_t: int, record: Any) -> None:
+        """Store the derived record for *code* at ``last_modified_t``."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO product_records (stage, category, code, last_modified_t, record) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (stage, category, code, last_modified_t, zlib.compress(_dumps(record))),
+            )
+            self._conn.commit()
+
+    def generation_digest(self, output_dir: str | Path) -> str | None:
+        """Return the input digest recorded for the SQL last generated in *output_dir*."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT digest FROM generations WHERE output_dir = ?", (str(Path(output_dir).resolve()),)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_generation_digest(self, output_dir: str | Path, digest: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO generations (output_dir, digest) VALUES (?, ?)",
+                (str(Path(output_dir).resolve()), digest),
+            )
+            self._conn.commit()
+
+    def cli_args(self) -> list[str]:
+        """Return CLI flags that reproduce this configuration in a subprocess."""
+        args = ["--cache-dir", str(self.cache_dir), "--cache-ttl", str(self.ttl_hours)]
+        args += ["--cache-max-mb", str(self.max_mb)]
+        if self.offline:
+            args.append("--offline")
+        return args
+
+
+# ---------------------------------------------------------------------------
+# Process-wide configuration
+# ---------------------------------------------------------------------------
+
+_active: HttpCache | None = None
+_local = threading.local()
+
+
+def configure(
+    cache_dir: str | Path | None,
+    ttl_hours: float = DEFAULT_TTL_HOURS,
+    max_mb: float = DEFAULT_MAX_MB,
+    offline: bool = False,
+) -> HttpCache | None:
+    """Install (or with ``cache_dir=None`` remove) the process-wide cache."""
+    global _active
+    if _active is not None:
+        _active.close()
+    _active = HttpCache(cache_dir, ttl_hours, max_mb, offline) if cache_dir else None
+    return _active
+
+
+def get_cache() -> HttpCache | None:
+    """Return the process-wide cache, or ``None`` when caching is disabled."""
+    return _active
+
+
+def cached_json(url: str, params: dict | None, fetch: Callable[[], Any | None]) -> Any | None:
+    """Route *fetch* through the process-wide cache when one is configured."""
+    _local.cached = False
+    if _active is None:
+        return fetch()
+    fetched = False
+
+    def tracked() -> Any | None:
+        nonlocal fetched
+        fetched = True
+        return fetch()
+
+    payload = _active.fetch(url, params, tracked)
+    _local.cached = not fetched
+    return payload
+
+
+def revalidated_json(
+    url: str,
+    params: dict | None,
+    fetch: Callable[[dict[str, str]], Fetched | None],
+) -> Any | None:
+    """Conditional-request variant of :func:`cached_json` (see :meth:`HttpCache.revalidate`)."""
+    _local.cached = False
+    if _active is None:
+        result = fetch({})
+        return None if result is None else result.payload
+    fetched = False
+
+    def tracked(headers: dict[str, str]) -> Fetched | None:
+        nonlocal fetched
+        fetched = True
+        return fetch(headers)
+
+    payload = _active.revalidate(url, params, tracked)
+    _local.cached = not fetched
+    return payload
+
+
+def last_request_cached() -> bool:
+    """Whether the calling thread's last :func:`cached_json` call skipped the network.
+
+    Clients use this to skip their politeness delay after a cache hit.
+    """
+    return getattr(_local, "cached", False)
+
+
+def add_cache_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the shared ``--cache-dir/--cache-ttl/--cache-max-mb/--offline`` flags."""
+    group = parser.add_argument_group("HTTP cache")
+    group.add_argument(
+        "--cache-dir",
+        default=None,
+        help="Cache OFF API responses in this directory (default: no cache)",
+    )
+    group.add_argument(
+        "--cache-ttl",
+        type=float,
+        default=DEFAULT_TTL_HOURS,
+        help=f"Hours before a cached response expires (default: {DEFAULT_TTL_HOURS:g})",
+    )
+    group.add_argument(
+        "--cache-max-mb",
+        type=float,
+        default=DEFAULT_MAX_MB,
+        help=f"Cache size cap in MB; least recently used entries are evicted (default: {DEFAULT_MAX_MB})",
+    )
+    group.add_argument(
+        "--offline",
+        action="store_true",
+        help="Serve OFF responses from --cache-dir only; never touch the network",
+    )
+
+
+def configure_from_args(parser: argparse.ArgumentParser, args: argparse.Namespace) -> HttpCache | None:
+    """Configure the process-wide cache from parsed :func:`add_cache_arguments` flags."""
+    if args.offline and not args.cache_dir:
+        parser.error("--offline requires --cache-dir")
+    return configure(args.cache_dir, args.cache_ttl, args.cache_max_mb, args.offline)
@@ -23,17 +23,17 @@ from __future__ import annotations
 import argparse
 import datetime
 import logging
-import os
-import subprocess
 import sys
-import time
 from pathlib import Path
 from typing import Any
 
+from pipeline import db
+from pipeline.http_cache import add_cache_arguments, configure_from_args
 from pipeline.off_client import (
     OFF_PRODUCT_URL,
     _get_json,
     _session,
+    fetch_products_by_codes,
 )
 from pipeline.utils import slug as _slug
 
@@ -46,14 +46,6 @@ logger = logging.getLogger(__name__)
 # OFF image fields we request
 IMAGE_FIELDS = "images,image_front_url,image_ingredients_url,image_nutrition_url"
 
-# Delay between OFF API requests (conservative for rate-limiting)
-REQUEST_DELAY = 0.5  # seconds
-
-# DB connection constants (matching enrich_ingredients.py)
-DB_CONTAINER = "supabase_db_tryvit"
-DB_USER = "postgres"
-DB_NAME = "postgres"
-
 # Mapping from OFF image key prefix → our image_type
 OFF_TYPE_MAP = {
     "front": "front",
@@ -281,29 +273,6 @@ def generate_image_sql(
 # ---------------------------------------------------------------------------
 
 
-def _psql_cmd(query: str) -> list[str]:
-    """Build psql command — CI mode (PGHOST set) uses psql directly,
-    local mode uses docker exec into the Supabase container."""
-    if os.environ.get("PGHOST"):
-        return ["psql", "-t", "-A", "-F", "|", "-c", query]
-    return [
-        "docker",
-        "exec",
-        DB_CONTAINER,
-        "psql",
-        "-U",
-        DB_USER,
-        "-d",
-        DB_NAME,
-        "-t",
-        "-A",
-        "-F",
-        "|",
-        "-c",
-        query,
-    ]
-
-
 def _get_products_with_eans(
     category: str | None = None,
     country: str | None = None,
@@ -316,40 +285,30 @@ def _get_products_with_eans(
         "p.is_deprecated = FALSE",
         "p.ean IS NOT NULL",
     ]
+    params: list[str] = []
     if category:
-        clauses.append(f"p.category = '{category}'")
+        clauses.append("p.category = %s")
+        params.append(category)
     if country:
-        clauses.append(f"p.country = '{country}'")
+        clauses.append("p.country = %s")
+        params.append(country)
 
     where = " AND ".join(clauses)
-    cmd = _psql_cmd(
-        f"SELECT p.product_id, p.country, p.ean, p.brand, p.product_name, p.category "
-        f"FROM products p WHERE {where} ORDER BY p.category, p.product_id"
-    )
-    result = subprocess.run(
-        cmd, capture_output=True, timeout=30, encoding="utf-8", errors="replace"
-    )
-    if result.returncode != 0:
-        logger.error("DB query failed: %s", result.stderr)
+    try:
+        rows = db.fetch_all(
+            f"SELECT p.product_id, p.country, p.ean, p.brand, p.product_name, p.category "
+            f"FROM products p WHERE {where} ORDER BY p.category, p.product_id",
+            params,
+            types=(str,) * 6,
+        )
+    except db.DatabaseError as exc:
+        logger.error("DB query failed: %s", exc)
         sys.exit(1)
 
-    products: list[dict[str, str]] = []
-    for line in result.stdout.strip().split("\n"):
-        if not line.strip():
-            continue
-        parts = line.split("|")
-        if len(parts) < 6:
-            continue
-        products.append(
-            {
-                "product_id": parts[0],
-                "country": parts[1],
-                "ean": parts[2],
-                "brand": parts[3],
-                "product_name": parts[4],
-                "category": parts[5],
-            }
-        )
+    keys = ("product_id", "country", "ean", "brand", "product_name", "category")
+    products: list[dict[str, str]] = [
+        {key: value or "" for key, value in zip(keys, row, strict=True)} for row in rows
+    ]
     return products
 
 
@@ -489,8 +448,10 @@ def main() -> None:
         action="store_true",
         help="Also apply the generated SQL files to the database",
     )
+    add_cache_arguments(parser)
 
     args = parser.parse_args()
+    configure_from_args(parser, args)
 
     logging.basicConfig(
         level=logging.INFO,
@@ -530,10 +491,13 @@ def main() -> None:
             len(cat_products),
         )
 
+        # One search request per 100 EANs; misses are retried one by one.
+        off_products = fetch_products_by_codes((p["ean"] for p in cat_products), fields=IMAGE_FIELDS)
         product_images: list[dict[str, Any]] = []
         for p in cat_products:
             ean = p["ean"]
-            images = fetch_product_images(ean)
+            off_product = off_products.get(ean)
+            images = _extract_images(off_product, ean) if off_product else []
             if images:
                 product_images.append(
                     {
@@ -545,7 +509,6 @@ def main() -> None:
                 )
                 total_images += len(images)
                 total_products_with_images += 1
-            time.sleep(REQUEST_DELAY)
 
         coverage = (
             f"{len(product_images)}/{len(cat_products)} "
@@ -614,65 +577,25 @@ def main() -> None:
     if args.apply and sql_files_written:
         logger.info("Applying %d SQL files to database...", len(sql_files_written))
         for filepath in sql_files_written:
-            cmd_parts: list[str]
-            if os.environ.get("PGHOST"):
-                cmd_parts = ["psql", "-v", "ON_ERROR_STOP=1", "-f", str(filepath)]
-            else:
-                # Read file and pipe to docker exec
-                sql_content = filepath.read_text(encoding="utf-8")
-                cmd_parts = [
-                    "docker",
-                    "exec",
-                    "-i",
-                    DB_CONTAINER,
-                    "psql",
-                    "-U",
-                    DB_USER,
-                    "-d",
-                    DB_NAME,
-                    "-v",
-                    "ON_ERROR_STOP=1",
-                ]
-                result = subprocess.run(
-                    cmd_parts,
-                    input=sql_content,
-                    capture_output=True,
-                    timeout=60,
-                    encoding="utf-8",
-                    errors="replace",
-                )
-                if result.returncode != 0:
-                    logger.error("Failed to apply %s: %s", filepath.name, result.stderr)
-                else:
-                    logger.info("  Applied: %s", filepath.name)
-                continue
-            result = subprocess.run(
-                cmd_parts,
-                capture_output=True,
-                timeout=60,
-                encoding="utf-8",
-                errors="replace",
-            )
-            if result.returncode != 0:
-                logger.error("Failed to apply %s: %s", filepath.name, result.stderr)
+            try:
+                db.execute_file(filepath)
+            except db.DatabaseError as exc:
+                logger.error("Failed to apply %s: %s", filepath.name, exc)
             else:
                 logger.info("  Applied: %s", filepath.name)
 
         # Verify final counts
-        verify_cmd = _psql_cmd(
-            "SELECT count(*) AS total, "
-            "count(DISTINCT product_id) AS products_with_images "
-            "FROM product_images WHERE source = 'off_api'"
-        )
-        result = subprocess.run(
-            verify_cmd,
-            capture_output=True,
-            timeout=30,
-            encoding="utf-8",
-            errors="replace",
-        )
-        if result.returncode == 0:
-            print(f"\n  DB verification: {result.stdout.strip()}")
+        try:
+            total, with_images = db.fetch_one(
+                "SELECT count(*) AS total, "
+                "count(DISTINCT product_id) AS products_with_images "
+                "FROM product_images WHERE source = 'off_api'",
+                types=(int, int),
+            )
+        except db.DatabaseError:
+            pass
+        else:
+            print(f"\n  DB verification: {total}|{with_images}")
     elif not args.dry_run and sql_files_written:
         print("  To apply, re-run with --apply or execute:")
         print("  .\\RUN_LOCAL.ps1")
@@ -6,14 +6,20 @@ schema, and respects the OFF API rate-limit guidelines.
 
 from __future__ import annotations
 
+import heapq
 import logging
 import re
+import threading
 import time
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Any
 
 import requests
 
 from pipeline.categories import CATEGORY_SEARCH_TERMS, DB_TO_OFF_TAGS, resolve_category
+from pipeline.http_cache import Fetched, last_request_cached, revalidated_json
+from pipeline.rate_limit import TokenBucket
 
 logger = logging.getLogger(__name__)
 
@@ -24,29 +30,79 @@ OFF_SEARCH_URL = "https://world.openfoodfacts.org/api/v2/search"
 OFF_PRODUCT_URL = "https://world.openfoodfacts.org/api/v2/product/{ean}.json"
 USER_AGENT = "tryvit/1.0 (https://github.com/ericsocrat/tryvit)"
 PAGE_SIZE = 50
+CODE_BATCH_SIZE = 100  # barcodes per search request in the batched EAN lookup
 REQUEST_DELAY = 1.0  # seconds between requests
 REQUEST_TIMEOUT = 90  # seconds (OFF API can be slow)
 MAX_RETRIES = 3
+# Default global budget for the concurrent fetch mode — same average rate
+# as the serial mode's REQUEST_DELAY, but without idle sleeps between pages.
+DEFAULT_RPS = 1.0 / REQUEST_DELAY
 
 
-def _get_json(session: requests.Session, url: str, params: dict) -> dict | None:
-    """GET with retry on timeout / server error.
+def _get_json(
+    session: requests.Session,
+    url: str,
+    params: dict,
+    limiter: TokenBucket | None = None,
+) -> dict | None:
+    """GET with retry on timeout / server error, via the shared HTTP cache.
 
     Handles HTTP errors, connection failures, timeouts, and malformed JSON
     responses.  Returns ``None`` after exhausting retries so callers can
-    gracefully degrade.
+    gracefully degrade.  When *limiter* is given, every attempt (including
+    retries) first acquires a token from it.  When an HTTP cache is
+    configured (see :mod:`pipeline.http_cache`) fresh cached responses are
+    returned without touching the network or the limiter, and expired ones
+    are revalidated with ``If-None-Match`` / ``If-Modified-Since`` — a
+    ``304 Not Modified`` reuses the cached body.
+    """
+    return revalidated_json(url, params, lambda headers: _fetch_json(session, url, params, limiter, headers))
+
+
+def _fetch_json(
+    session: requests.Session,
+    url: str,
+    params: dict,
+    limiter: TokenBucket | None,
+    headers: dict[str, str],
+) -> Fetched | None:
+    """Uncached (optionally conditional) GET behind :func:`_get_json`.
+
+    Every attempt reports back to *limiter* (``on_success`` /
+    ``on_failure``) so an :class:`~pipeline.rate_limit.AdaptiveTokenBucket`
+    can slow down when OFF pushes back.  A 404 is an answer (unknown
+    product), not a failure: it is returned as ``{"status": 0}``.
     """
     for attempt in range(MAX_RETRIES + 1):
         try:
-            resp = session.get(url, params=params, timeout=REQUEST_TIMEOUT)
+            if limiter is not None:
+                limiter.acquire()
+            resp = session.get(url, params=params, timeout=REQUEST_TIMEOUT, headers=headers or None)
+            if resp.status_code == 304:
+                if limiter is not None:
+                    limiter.on_success()
+                return Fetched(None, not_modified=True)
+            if resp.status_code == 404:
+                if limiter is not None:
+                    limiter.on_success()
+                return Fetched({"status": 0})
             resp.raise_for_status()
-            return resp.json()
+            fetched = Fetched(
+                resp.json(),
+                etag=resp.headers.get("ETag"),
+                last_modified=resp.headers.get("Last-Modified"),
+            )
+            if limiter is not None:
+                limiter.on_success()
+            return fetched
         except (ValueError, KeyError) as exc:
             # json.JSONDecodeError is a subclass of ValueError — catches
             # malformed responses (e.g. HTML error pages returned as 200).
             logger.warning("Malformed JSON from %s: %s", url, exc)
             return None
         except (requests.RequestException, TimeoutError, ConnectionError) as exc:
+            if limiter is not None:
+                limiter.on_failure(_is_congestion(exc))
             if attempt < MAX_RETRIES:
                 wait = REQUEST_DELAY * (attempt + 1) * 2
                 logger.debug("Retry %d for %s: %s (wait %.0fs)", attempt + 1, url, exc, wait)
@@ -57,6 +113,21 @@ def _get_json(session: requests.Session, url: str, params: dict) -> dict | None:
     return None
 
 
+def _is_congestion(exc: BaseException) -> bool:
+    """Whether a failed request means OFF is overloaded: HTTP 429, 5xx or a dropped connection."""
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        status = exc.response.status_code
+        return status == 429 or status >= 500
+    # requests wraps http.client.RemoteDisconnected and resets in ConnectionError.
+    return isinstance(exc, (requests.ConnectionError, ConnectionError))
+
+
+def _throttle() -> None:
+    """Sleep ``REQUEST_DELAY`` unless the last request was a cache hit."""
+    if not last_request_cached():
+        time.sleep(REQUEST_DELAY)
+
+
 def _session() -> requests.Session:
     """Return a reusable requests session with the correct User-Agent."""
     s = requests.Session()
@@ -64,6 +135,18 @@ def _session() -> requests.Session:
     return s
 
 
+_thread_local = threading.local()
+
+
+def _thread_session() -> requests.Session:
+    """Return a per-thread session (``requests.Session`` is not thread-safe)."""
+    session = getattr(_thread_local, "session", None)
+    if session is None:
+        session = _session()
+        _thread_local.session = session
+    return session
+
+
 def _safe_int(value: Any, default: int = 0) -> int:
     """Safely convert a value to int, returning *default* on failure."""
     try:
@@ -81,16 +164,15 @@ def _search_by_tags(
     session: requests.Session,
     off_tags: list[str],
     seen_codes: set[str],
-    results: list[dict],
     max_results: int,
     country: str = "poland",
-) -> None:
-    """Phase 1: search OFF by category tags (mutates *results* and *seen_codes*)."""
+) -> Iterator[list[dict]]:
+    """Phase 1: search OFF by category tags, yielding each page's new products (mutates *seen_codes*)."""
     for tag in off_tags:
-        if len(results) >= max_results:
+        if len(seen_codes) >= max_results:
             return
         page = 1
-        while len(results) < max_results:
+        while len(seen_codes) < max_results:
             params: dict[str, Any] = {
                 "categories_tags_en": tag,
                 "countries_tags_en": country,
@@ -103,28 +185,29 @@ def _search_by_tags(
             products = data.get("products", [])
             if not products:
                 break
-            _collect_products(products, seen_codes, results, max_results)
+            new = _collect_products(products, seen_codes, max_results)
+            if new:
+                yield new
             if page * PAGE_SIZE >= _safe_int(data.get("count", 0)):
                 break
             page += 1
-            time.sleep(REQUEST_DELAY)
-        time.sleep(REQUEST_DELAY)
+            _throttle()
+        _throttle()
 
 
 def _search_by_terms(
     session: requests.Session,
     search_terms: list[str],
     seen_codes: set[str],
-    results: list[dict],
     max_results: int,
     country: str = "poland",
-) -> None:
-    """Phase 2: fall back to keyword search (mutates *results* and *seen_codes*)."""
+) -> Iterator[list[dict]]:
+    """Phase 2: fall back to keyword search, yielding each page's new products (mutates *seen_codes*)."""
     for term in search_terms:
-        if len(results) >= max_results:
+        if len(seen_codes) >= max_results:
             return
         page = 1
-        while len(results) < max_results:
+        while len(seen_codes) < max_results:
             params: dict[str, Any] = {
                 "search_terms": term,
                 "countries_tags_en": country,
@@ -137,34 +220,160 @@ def _search_by_terms(
             products = data.get("products", [])
             if not products:
                 break
-            _collect_products(products, seen_codes, results, max_results)
+            new = _collect_products(products, seen_codes, max_results)
+            if new:
+                yield new
             if page * PAGE_SIZE >= _safe_int(data.get("count", 0)):
                 break
             page += 1
-            time.sleep(REQUEST_DELAY)
-        time.sleep(REQUEST_DELAY)
+            _throttle()
+        _throttle()
 
 
 def _collect_products(
     products: list[dict],
     seen_codes: set[str],
-    results: list[dict],
     max_results: int,
-) -> None:
-    """Append unseen products to *results* (mutates both collections)."""
+) -> list[dict]:
+    """Return the unseen products of one page (mutates *seen_codes*).
+
+    Every collected product adds exactly one code to *seen_codes*, so its
+    size is the running result count; collection stops at *max_results*.
+    """
+    new: list[dict] = []
     for p in products:
+        if len(seen_codes) >= max_results:
+            break
         code = p.get("code", "")
         if code and code not in seen_codes:
             seen_codes.add(code)
-            results.append(p)
-            if len(results) >= max_results:
-                return
+            new.append(p)
+    return new
+
+
+def _search_queries(off_tags: list[str], search_terms: list[str], country: str) -> list[dict[str, Any]]:
+    """Build the ordered base params for every tag query, then every term query."""
+    queries: list[dict[str, Any]] = [{"categories_tags_en": tag, "countries_tags_en": country} for tag in off_tags]
+    queries.extend({"search_terms": term, "countries_tags_en": country} for term in search_terms)
+    return queries
+
+
+def _search_concurrent(
+    queries: list[dict[str, Any]],
+    seen_codes: set[str],
+    max_results: int,
+    workers: int,
+    limiter: TokenBucket,
+) -> Iterator[list[dict]]:
+    """Fetch search pages on a worker pool, yielding them in serial order.
+
+    Pages are *fetched* speculatively (the first page of the next few
+    queries, and the next few pages of the current query) but *consumed*
+    strictly in the same order as :func:`_search_by_tags` followed by
+    :func:`_search_by_terms`, with the same stop conditions.  The yielded
+    products are therefore identical to the serial mode for the same API
+    responses.  Outstanding speculative requests are cancelled as soon as
+    *max_results* is reached (or the consumer stops iterating).
+    """
+
+    def fetch(base: dict[str, Any], page: int) -> dict | None:
+        params = {**base, "page": page, "page_size": PAGE_SIZE}
+        return _get_json(_thread_session(), OFF_SEARCH_URL, params, limiter=limiter)
+
+    first_pages: dict[int, Future] = {}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="off-search") as pool:
+        try:
+            for i, base in enumerate(queries):
+                if len(seen_codes) >= max_results:
+                    return
+                for j in range(i, min(i + workers, len(queries))):
+                    if j not in first_pages:
+                        first_pages[j] = pool.submit(fetch, queries[j], 1)
+
+                page = 1
+                data = first_pages.pop(i).result()
+                ahead: dict[int, Future] = {}
+                try:
+                    while data is not None and len(seen_codes) < max_results:
+                        products = data.get("products", [])
+                        if not products:
+                            break
+                        new = _collect_products(products, seen_codes, max_results)
+                        count = _safe_int(data.get("count", 0))
+                        last = page * PAGE_SIZE >= count or len(seen_codes) >= max_results
+                        if not last:
+                            # Queue the next pages before handing this one to the consumer.
+                            last_page = -(-count // PAGE_SIZE)
+                            for nxt in range(page + 1, min(page + workers, last_page) + 1):
+                                if nxt not in ahead:
+                                    ahead[nxt] = pool.submit(fetch, base, nxt)
+                        if new:
+                            yield new
+                        if last:
+                            break
+                        page += 1
+                        data = ahead.pop(page).result()
+                finally:
+                    for future in ahead.values():
+                        future.cancel()
+        finally:
+            for future in first_pages.values():
+                future.cancel()
+
+
+def iter_search_products(
+    category: str,
+    max_results: int = 50,
+    country: str = "poland",
+    workers: int = 1,
+    rps: float | None = None,
+    limiter: TokenBucket | None = None,
+    off_tags: list[str] | None = None,
+) -> Iterator[list[dict]]:
+    """Lazily search OFF, yielding one page of newly seen raw products at a time.
+
+    Same strategy, order and stop conditions as :func:`search_products`
+    (which simply concatenates the pages), but a page is handed to the
+    caller as soon as it arrives, so downstream processing can start
+    before the search finishes and only one page is held at a time.
+    Requests for later pages are not sent until the caller asks for them
+    (serial mode) or are limited to *workers* pages ahead (concurrent mode).
+
+    Passing a *limiter* selects the concurrent mode even with
+    ``workers=1``, so several searches running at once (e.g. one per
+    category) share a single request budget.
+
+    Explicit *off_tags* (e.g. ``["en:chips"]``) are searched instead of
+    the category's own tags, without the keyword fallback.
+    """
+    if off_tags is None:
+        search_terms = CATEGORY_SEARCH_TERMS.get(category, [category.lower()])
+        off_tags = DB_TO_OFF_TAGS.get(category, [])
+    else:
+        search_terms = []
+    seen_codes: set[str] = set()
+
+    if workers > 1 or limiter is not None:
+        limiter = limiter or TokenBucket(rps or DEFAULT_RPS)
+        queries = _search_queries(off_tags, search_terms, country)
+        yield from _search_concurrent(queries, seen_codes, max_results, workers, limiter)
+        return
+
+    with _session() as session:
+        # Phase 1: Search by OFF category tags
+        yield from _search_by_tags(session, off_tags, seen_codes, max_results, country)
+
+        # Phase 2: Fall back to keyword search if needed
+        if len(seen_codes) < max_results:
+            yield from _search_by_terms(session, search_terms, seen_codes, max_results, country)
 
 
 def search_products(
     category: str,
     max_results: int = 50,
     country: str = "poland",
+    workers: int = 1,
+    rps: float | None = None,
 ) -> list[dict]:
     """Search Open Food Facts for products in *category* sold in *country*.
 
@@ -174,8 +383,12 @@ def search_products(
     2. **Term search** — fall back to keyword search terms if tag search
        didn't find enough results.
 
-    Both phases filter by ``countries_tags_en=<country>`` and rate-limit
-    to one request per second.
+    Both phases filter by ``countries_tags_en=<country>``.  With the
+    default ``workers=1`` requests are sent serially and rate-limited to
+    one request per second.  With ``workers > 1`` pages are fetched
+    concurrently under a shared token bucket of *rps* requests per second;
+    the returned products (and their order) are the same as in serial mode.
+    See :func:`iter_search_products` for the page-at-a-time variant.
 
     Parameters
     ----------
@@ -186,26 +399,19 @@ def search_products(
     country:
         OFF country name for ``countries_tags_en`` filter
         (e.g. ``"poland"``, ``"germany"``).
+    workers:
+        Number of concurrent fetch threads.  ``1`` keeps the serial mode.
+    rps:
+        Global requests-per-second budget for the concurrent mode
+        (default ``DEFAULT_RPS``).  Ignored when ``workers == 1``.
 
     Returns
     -------
     list[dict]
         Raw OFF product dicts (un-normalised).
     """
-    search_terms = CATEGORY_SEARCH_TERMS.get(category, [category.lower()])
-    off_tags = DB_TO_OFF_TAGS.get(category, [])
-    seen_codes: set[str] = set()
-    results: list[dict] = []
-
-    with _session() as session:
-        # Phase 1: Search by OFF category tags
-        _search_by_tags(session, off_tags, seen_codes, results, max_results, country)
-
-        # Phase 2: Fall back to keyword search if needed
-        if len(results) < max_results:
-            _search_by_terms(session, search_terms, seen_codes, results, max_results, country)
-
-    return results[:max_results]
+    pages = iter_search_products(category, max_results=max_results, country=country, workers=workers, rps=rps)
+    return [p for page in pages for p in page]
 
 
 def search_polish_products(
@@ -219,6 +425,20 @@ def search_polish_products(
     return search_products(category, max_results=max_results, country="poland")
 
 
+def _get_product(
+    session: requests.Session,
+    ean: str,
+    limiter: TokenBucket | None = None,
+    fields: str | None = None,
+) -> dict | None:
+    """The raw OFF product for *ean*, or *None* on failure / not found."""
+    params = {"fields": fields} if fields else {}
+    data = _get_json(session, OFF_PRODUCT_URL.format(ean=ean), params, limiter=limiter)
+    if data is None or data.get("status") != 1:
+        return None
+    return data.get("product") or None
+
+
 def fetch_product_by_ean(ean: str) -> dict | None:
     """Fetch a single product from OFF by its EAN barcode.
 
@@ -233,15 +453,122 @@ def fetch_product_by_ean(ean: str) -> dict | None:
         The raw OFF product dict, or *None* on failure / not found.
     """
     with _session() as session:
-        url = OFF_PRODUCT_URL.format(ean=ean)
-        data = _get_json(session, url, {})
-        if data is None:
-            return None
+        return _get_product(session, ean)
 
-        if data.get("status") != 1:
-            return None
 
-        return data.get("product")
+def _lookup_codes(
+    session: requests.Session,
+    codes: list[str],
+    fields: str | None = None,
+    limiter: TokenBucket | None = None,
+    fallback: bool = True,
+) -> list[tuple[str, dict | None]]:
+    """One batch of :func:`iter_products_by_codes`: ``(code, product or None)`` per code.
+
+    Serially (no *limiter*) every request is followed by :func:`_throttle`.
+    """
+
+    def paced(fetch: Callable[[], Any]) -> Any:
+        result = fetch()
+        if limiter is None:
+            _throttle()
+        return result
+
+    if fields and "code" not in fields.split(","):
+        fields = f"code,{fields}"
+    params: dict[str, Any] = {"code": ",".join(codes), "page_size": len(codes)}
+    if fields:
+        params["fields"] = fields
+    data = paced(lambda: _get_json(session, OFF_SEARCH_URL, params, limiter=limiter))
+    by_code = {str(p.get("code")): p for p in (data or {}).get("products", []) if p.get("code")}
+
+    results: list[tuple[str, dict | None]] = []
+    for code in codes:
+        product = by_code.get(code)
+        if product is None and fallback:
+            # The search index lags the product database; ask for the code itself.
+            product = paced(lambda code=code: _get_product(session, code, limiter, fields))
+        results.append((code, product))
+    return results
+
+
+def iter_products_by_codes(
+    codes: Iterable[str],
+    fields: str | None = None,
+    batch_size: int = CODE_BATCH_SIZE,
+    workers: int = 1,
+    rps: float | None = None,
+    limiter: TokenBucket | None = None,
+    fallback: bool = True,
+) -> Iterator[tuple[str, dict | None]]:
+    """Look up many OFF products by barcode with one search request per *batch_size* codes.
+
+    Each batch is one ``/api/v2/search?code=a,b,c`` request restricted to
+    *fields* (``code`` is always added); codes the search does not return
+    are then fetched one at a time from the product endpoint, unless
+    *fallback* is off.  Yields ``(code, product)`` for every distinct code
+    in input order, with ``None`` for codes OFF does not know (or that
+    failed).  Serially each request is followed by the usual throttle;
+    with ``workers > 1`` (or a shared *limiter*) up to *workers* batches
+    are fetched ahead on a thread pool under the token bucket.
+    """
+    unique = list(dict.fromkeys(codes))
+    batches = [unique[i : i + batch_size] for i in range(0, len(unique), batch_size)]
+
+    if workers > 1 or limiter is not None:
+        bucket = limiter or TokenBucket(rps or DEFAULT_RPS)
+
+        def fetch(batch: list[str]) -> list[tuple[str, dict | None]]:
+            return _lookup_codes(_thread_session(), batch, fields, bucket, fallback)
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="off-codes") as pool:
+            ahead: list[Future] = []
+            try:
+                for batch in batches:
+                    ahead.append(pool.submit(fetch, batch))
+                    if len(ahead) > workers:
+                        yield from ahead.pop(0).result()
+                for future in ahead:
+                    yield from future.result()
+            finally:
+                for future in ahead:
+                    future.cancel()
+        return
+
+    with _session() as session:
+        for batch in batches:
+            yield from _lookup_codes(session, batch, fields, None, fallback)
+
+
+def fetch_products_by_codes(codes: Iterable[str], fields: str | None = None, **kwargs: Any) -> dict[str, dict]:
+    """``{code: product}`` for the *codes* OFF knows; see :func:`iter_products_by_codes`."""
+    return {code: product for code, product in iter_products_by_codes(codes, fields, **kwargs) if product}
+
+
+def iter_products_by_eans(
+    eans: Iterable[str],
+    workers: int = 1,
+    rps: float | None = None,
+    limiter: TokenBucket | None = None,
+) -> Iterator[list[dict]]:
+    """Fetch the OFF products for *eans*, yielding them ``PAGE_SIZE`` EANs at a time.
+
+    The EAN-list counterpart of :func:`iter_search_products`, with the
+    same serial / concurrent modes, built on the batched
+    :func:`iter_products_by_codes` lookup.  Products come back in input
+    order; repeated EANs are fetched once and EANs OFF does not know are
+    skipped.
+    """
+    page: list[dict] = []
+    lookups = iter_products_by_codes(eans, workers=workers, rps=rps, limiter=limiter)
+    for seen, (_code, product) in enumerate(lookups, start=1):
+        if product is not None:
+            page.append(product)
+        if seen % PAGE_SIZE == 0 and page:
+            yield page
+            page = []
+    if page:
+        yield page
 
 
 # ---------------------------------------------------------------------------
@@ -373,27 +700,50 @@ def polish_market_score(product: dict) -> int:
       +1  Store availability mentions a known Polish retailer
       +1  OFF completeness ≥ 0.5
     """
-    score = 0
-    ean = product.get("ean", "")
-    if ean.startswith("590"):
-        score += 3
-
-    name = product.get("product_name", "")
-    if re.search(r"[ąćęłńóśźżĄĆĘŁŃÓŚŹŻ]", name):
-        score += 2
+    return market_score(product, "PL")
 
-    stores = (product.get("store_availability") or "").lower()
-    if any(r in stores for r in POLISH_RETAILERS):
-        score += 1
 
+def _completeness_point(product: dict) -> int:
     try:
         completeness = float(product.get("_completeness", 0))
     except (ValueError, TypeError):
         completeness = 0.0
-    if completeness >= 0.5:
-        score += 1
+    return 1 if completeness >= 0.5 else 0
+
+
+class _MarketScorer:
+    """Per-country :func:`market_score` with its matchers compiled once.
+
+    The GS1 prefixes become a single ``str.startswith`` tuple, the
+    diacritic class a compiled regex, and the retailer list one compiled
+    alternation (substring semantics, same as ``any(r in stores ...)``).
+    """
+
+    def __init__(self, gs1_prefixes: list[str], retailers: set[str], diacritic_re: str) -> None:
+        self.prefixes = tuple(gs1_prefixes)
+        self.diacritics = re.compile(diacritic_re)
+        alternation = "|".join(re.escape(r) for r in sorted(retailers, key=len, reverse=True))
+        self.retailers = re.compile(alternation)
+
+    def __call__(self, product: dict) -> int:
+        score = 0
+        if (product.get("ean") or "").startswith(self.prefixes):
+            score += 3
+        if self.diacritics.search(product.get("product_name") or ""):
+            score += 2
+        if self.retailers.search((product.get("store_availability") or "").lower()):
+            score += 1
+        return score + _completeness_point(product)
+
+
+_MARKET_SCORERS: dict[str, _MarketScorer] = {
+    code: _MarketScorer(*data) for code, data in _COUNTRY_MARKET_DATA.items()
+}
+
 
-    return score
+def market_scorer(country_code: str = "PL") -> Callable[[dict], int]:
+    """Return the compiled :func:`market_score` function for *country_code*."""
+    return _MARKET_SCORERS.get(country_code, _completeness_point)
 
 
 def market_score(product: dict, country_code: str = "PL") -> int:
@@ -407,39 +757,32 @@ def market_score(product: dict, country_code: str = "PL") -> int:
       +2  Product name contains country-specific diacritics
       +1  Store availability mentions a known retailer
       +1  OFF completeness >= 0.5
-    """
-    data = _COUNTRY_MARKET_DATA.get(country_code)
-    if data is None:
-        # Fallback: only completeness matters
-        try:
-            completeness = float(product.get("_completeness", 0))
-        except (ValueError, TypeError):
-            completeness = 0.0
-        return 1 if completeness >= 0.5 else 0
-
-    gs1_prefixes, retailers, diacritic_re = data
-    score = 0
 
-    ean = product.get("ean", "")
-    if any(ean.startswith(prefix) for prefix in gs1_prefixes):
-        score += 3
-
-    name = product.get("product_name", "")
-    if re.search(diacritic_re, name):
-        score += 2
+    Unconfigured countries score on completeness only.  Use
+    :func:`market_scorer` to score many products for one country.
+    """
+    return market_scorer(country_code)(product)
 
-    stores = (product.get("store_availability") or "").lower()
-    if any(r in stores for r in retailers):
-        score += 1
 
-    try:
-        completeness = float(product.get("_completeness", 0))
-    except (ValueError, TypeError):
-        completeness = 0.0
-    if completeness >= 0.5:
-        score += 1
+def top_k_by_market_score(products: Iterable[dict], k: int, country_code: str = "PL") -> list[dict]:
+    """Return the *k* highest-scoring products, best first.
 
-    return score
+    Each product is scored once and only *k* are held at a time (a
+    min-heap keyed on ``(score, -position)``).  Ties keep input order, so
+    the result equals a stable descending sort followed by ``[:k]``.
+    """
+    if k <= 0:
+        return []
+    score = market_scorer(country_code)
+    heap: list[tuple[int, int, dict]] = []
+    for seq, product in enumerate(products):
+        item = (score(product), -seq, product)
+        if len(heap) < k:
+            heapq.heappush(heap, item)
+        elif item[:2] > heap[0][:2]:
+            heapq.heapreplace(heap, item)
+    heap.sort(key=lambda it: it[:2], reverse=True)
+    return [product for _score, _neg_seq, product in heap]
 
 
 def _detect_prep_method(categories_tags: list[str], product_name: str) -> str | None:
@@ -2,10 +2,10 @@
 
 Sequences the pipeline for all categories in a country:
   1. pipeline.run → fetch from OFF API → generate SQL files
-  2. Execute generated SQL against target DB
+  2. Execute generated SQL against target DB (pipeline.apply: one transaction per category)
   3. enrich_ingredients → generate enrichment SQL
   4. Execute enrichment SQL
-  5. CALL score_category('CategoryName') via psql
+  5. CALL score_category('CategoryName') via pipeline.db
   6. Log results to JSON report
 
 Usage::
@@ -15,6 +15,24 @@ Usage::
     python -m pipeline.orchestrate --category "Dairy" --country PL
     python -m pipeline.orchestrate --dry-run
     python -m pipeline.orchestrate --stale-only --stale-days 90
+    python -m pipeline.orchestrate --category "Dairy" --cache-dir .off_cache
+    python -m pipeline.orchestrate --country PL --jobs 4 --rps 2
+    python -m pipeline.orchestrate --country PL --diff
+    python -m pipeline.orchestrate --country PL --skip-unchanged
+
+With ``--diff`` each category applies only its ``DELTA__`` file — the
+inserts, updates and deprecations since the previous generation — instead
+of the deprecate-everything refresh in the full ``PIPELINE__*`` files.
+
+With ``--skip-unchanged`` a category whose regenerated SQL is byte-identical
+to what was last applied to the same database (``pipeline.apply`` manifest)
+is not re-executed, so a mostly idle refresh barely touches the database.
+
+With ``--jobs N`` the network-bound part of step 1 (OFF search, extraction,
+validation) runs for up to N categories at once under one shared OFF rate
+limiter, while SQL generation (cross-category EAN dedup is
+first-writer-wins), DB execution, enrichment and scoring stay serialized
+in category order — the generated SQL and the report match ``--jobs 1``.
 """
 
 from __future__ import annotations
@@ -22,15 +40,22 @@ from __future__ import annotations
 import argparse
 import json
 import logging
-import os
 import subprocess
 import sys
 import time
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import UTC, datetime
 from pathlib import Path
+from typing import Any
 
+from pipeline import db
+from pipeline.apply import ApplyResult, apply_folder, db_fingerprint
 from pipeline.categories import CATEGORY_SEARCH_TERMS
-from pipeline.run import run_pipeline
+from pipeline.http_cache import add_cache_arguments, configure_from_args, get_cache
+from pipeline.off_client import DEFAULT_RPS
+from pipeline.rate_limit import TokenBucket
+from pipeline.run import PreparedCategory, generate_prepared, prepare_category, run_pipeline
 from pipeline.utils import slug as _slug
 
 logger = logging.getLogger(__name__)
@@ -44,81 +69,34 @@ PIPELINE_DIR = PROJECT_ROOT / "db" / "pipelines"
 REPORTS_DIR = PROJECT_ROOT / "pipeline" / "reports"
 ENRICH_SCRIPT = PROJECT_ROOT / "enrich_ingredients.py"
 
-DB_CONTAINER = "supabase_db_tryvit"
-DB_USER = "postgres"
-DB_NAME = "postgres"
-
 _COUNTRY_OFF_NAME: dict[str, str] = {"PL": "poland", "DE": "germany"}
 SUPPORTED_COUNTRIES = list(_COUNTRY_OFF_NAME)
 
 # Stale product cap: max EANs to re-fetch per category per run.
 STALE_BATCH_LIMIT = 50
 
+# Per-category phases timed in the report (seconds).
+PHASES = ("stale_check", "fetch", "generate", "execute_sql", "enrich", "score")
+
 
 # ---------------------------------------------------------------------------
 # DB helpers
 # ---------------------------------------------------------------------------
 
 
-def _psql_cmd(query: str) -> list[str]:
-    """Build psql command — CI mode (DATABASE_URL set) uses psql directly,
-    local mode uses docker exec into the Supabase container."""
-    db_url = os.environ.get("DATABASE_URL")
-    if db_url:
-        return ["psql", db_url, "-t", "-A", "-F", "|", "-c", query]
-    return [
-        "docker",
-        "exec",
-        DB_CONTAINER,
-        "psql",
-        "-U",
-        DB_USER,
-        "-d",
-        DB_NAME,
-        "-t",
-        "-A",
-        "-F",
-        "|",
-        "-c",
-        query,
-    ]
-
-
-def _run_psql(query: str) -> str:
-    """Execute a psql query and return stdout."""
-    cmd = _psql_cmd(query)
-    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-    return result.stdout.strip()
-
-
-def _execute_sql_file(filepath: Path) -> None:
-    """Execute a single SQL file against the database."""
-    db_url = os.environ.get("DATABASE_URL")
-    if db_url:
-        cmd = ["psql", db_url, "-f", str(filepath)]
-    else:
-        # Read file content and pipe via docker exec
-        sql = filepath.read_text(encoding="utf-8")
-        cmd = [
-            "docker",
-            "exec",
-            "-i",
-            DB_CONTAINER,
-            "psql",
-            "-U",
-            DB_USER,
-            "-d",
-            DB_NAME,
-        ]
-        subprocess.run(
-            cmd,
-            input=sql,
-            capture_output=True,
-            text=True,
-            check=True,
-        )
-        return
-    subprocess.run(cmd, capture_output=True, text=True, check=True)
+def _run_psql(query: str, params: tuple | None = None) -> str:
+    """Run *query* with ``%s`` *params*; return the first value as text (``""`` if none)."""
+    value = db.fetch_value(query, params)
+    return "" if value is None else str(value)
+
+
+def _timed(timings: dict[str, float], phase: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Call ``fn(*args, **kwargs)``, adding its wall-clock seconds to ``timings[phase]``."""
+    start = time.monotonic()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        timings[phase] = round(timings.get(phase, 0.0) + time.monotonic() - start, 3)
 
 
 # ---------------------------------------------------------------------------
@@ -137,12 +115,21 @@ class PipelineOrchestrator:
         stale_days: int = 90,
         dry_run: bool = False,
         stale_only: bool = False,
+        jobs: int = 1,
+        rps: float | None = None,
+        diff: bool = False,
+        skip_unchanged: bool = False,
     ) -> None:
         self.country = country.upper()
         self.max_products = max_products
         self.stale_days = stale_days
         self.dry_run = dry_run
         self.stale_only = stale_only
+        self.jobs = max(jobs, 1)
+        self.rps = rps
+        self.diff = diff
+        self.skip_unchanged = skip_unchanged
+        self._fingerprint: str | None = None
 
         # Resolve category list — default to all categories in CATEGORY_SEARCH_TERMS.
         if categories:
@@ -166,7 +153,16 @@ class PipelineOrchestrator:
             "products_enriched": 0,
             "products_scored": 0,
             "stale_products_refreshed": 0,
+            "raw_products_checked": 0,
+            "unchanged_products": 0,
+            "unchanged_ratio": 0.0,
+            "http_bytes_saved": 0,
+            "jobs": self.jobs,
+            "diff": self.diff,
+            "delta_rows": {"full": 0, "delta": 0},
+            "sql_folders_skipped": 0,
             "duration_seconds": 0,
+            "phase_seconds": dict.fromkeys(PHASES, 0.0),
             "errors": [],
             "warnings": [],
             "category_results": [],
@@ -183,46 +179,71 @@ class PipelineOrchestrator:
         print(f"\n{'='*60}")
         print("  TryVit — Data Refresh Orchestrator")
         print(f"  Country:  {self.country}")
-        print(f"  Mode:     {'DRY RUN' if self.dry_run else 'LIVE'}")
+        print(f"  Mode:     {'DRY RUN' if self.dry_run else 'LIVE'}{' (diff)' if self.diff else ''}")
         print(f"  Categories: {len(self.categories)}")
+        if self.jobs > 1:
+            print(f"  Jobs:     {self.jobs} concurrent OFF fetches")
         if self.stale_only:
             print(f"  Stale-only: products older than {self.stale_days} days")
         print(f"{'='*60}\n")
 
-        for i, category in enumerate(self.categories, 1):
-            print(f"\n[{i}/{len(self.categories)}] {category}")
-            print("-" * 40)
-            cat_result = self.run_category(category)
-            self._report["category_results"].append(cat_result)
-            self._report["categories_processed"] += 1
+        cache = get_cache()
+        bytes_saved_before = cache.stats["bytes_saved"] if cache is not None else 0
+
+        if self.jobs > 1:
+            self._run_concurrent()
+        else:
+            for i, category in enumerate(self.categories, 1):
+                self._print_category_header(i, category)
+                self._record(self.run_category(category))
 
         self._report["duration_seconds"] = round(time.monotonic() - start, 1)
+        if cache is not None:
+            self._report["http_bytes_saved"] = cache.stats["bytes_saved"] - bytes_saved_before
+        checked = self._report["raw_products_checked"]
+        if checked:
+            self._report["unchanged_ratio"] = round(self._report["unchanged_products"] / checked, 3)
 
         # Write report
         report_path = self._write_report()
         self._print_summary(report_path)
         return self._report
 
-    def run_category(self, category: str) -> dict:
+    def run_category(self, category: str, prefetch: Future | None = None) -> dict:
         """Run the full pipeline for one category.
 
+        *prefetch* is a :meth:`_prefetch_category` future (``--jobs`` mode):
+        the stale check and OFF fetch already ran on a worker thread, and
+        only the serialized phases (SQL generation onwards) run here.
+
         Returns a per-category result dict.
         """
         result: dict = {
             "category": category,
             "status": "success",
             "products_fetched": 0,
+            "unchanged_products": 0,
+            "sql_regenerated": False,
             "sql_files_executed": 0,
+            "sql_rows_affected": 0,
             "enriched": False,
             "scored": False,
             "stale_count": 0,
             "error": None,
+            "timings": dict.fromkeys(PHASES, 0.0),
         }
+        timings = result["timings"]
 
         try:
+            prepared: PreparedCategory | None = None
+            if prefetch is not None:
+                stale_count, prepared, prefetch_timings = prefetch.result()
+                timings.update(prefetch_timings)
+            elif not self.dry_run:
+                stale_count = _timed(timings, "stale_check", self._detect_stale_products, category)
+
             # Phase 1: Detect stale products (informational)
             if not self.dry_run:
-                stale_count = self._detect_stale_products(category)
                 result["stale_count"] = stale_count
                 if stale_count:
                     print(f"  Stale products: {stale_count}")
@@ -237,13 +258,35 @@ class PipelineOrchestrator:
             slug_base = _slug(category)
             dir_slug = f"{slug_base}-{self.country.lower()}" if self.country != "PL" else slug_base
 
-            print("  Fetching from OFF API...")
-            run_pipeline(
-                category=category,
-                max_products=self.max_products,
-                dry_run=self.dry_run,
-                country=self.country,
-            )
+            if prepared is not None:
+                print(f"  Fetched from OFF API ({len(prepared.validated)} validated candidates)")
+                stats = _timed(
+                    timings,
+                    "generate",
+                    generate_prepared,
+                    prepared,
+                    max_products=self.max_products,
+                    dry_run=self.dry_run,
+                    diff=self.diff,
+                )
+            else:
+                print("  Fetching from OFF API...")
+                stats = run_pipeline(
+                    category=category,
+                    max_products=self.max_products,
+                    dry_run=self.dry_run,
+                    country=self.country,
+                    diff=self.diff,
+                    timings=timings,
+                )
+            if stats:
+                result["products_fetched"] = stats["products"]
+                result["unchanged_products"] = stats["unchanged_products"]
+                result["sql_regenerated"] = stats["sql_regenerated"]
+                self._report["raw_products_checked"] += stats["raw_products"]
+                self._report["unchanged_products"] += stats["unchanged_products"]
+                if "delta" in stats:
+                    result["delta"] = stats["delta"]
 
             if self.dry_run:
                 result["status"] = "dry_run"
@@ -251,13 +294,20 @@ class PipelineOrchestrator:
 
             # Phase 3: Execute generated SQL files
             output_dir = PIPELINE_DIR / dir_slug
-            sql_count = self._execute_sql_files(output_dir)
-            result["sql_files_executed"] = sql_count
-            print(f"  Executed {sql_count} SQL files")
+            applied = _timed(timings, "execute_sql", self._execute_sql_files, output_dir)
+            if applied.skipped:
+                result["sql_skipped"] = True
+                self._report["sql_folders_skipped"] += 1
+                print("  SQL unchanged since last apply — skipped")
+            else:
+                result["sql_files_executed"] = len(applied.files)
+                result["sql_rows_affected"] = applied.rows_affected
+                result["sql_files"] = applied.summary()["files"]
+                print(f"  Executed {len(applied.files)} SQL files in one transaction ({applied.rows_affected} rows)")
 
             # Phase 4: Enrich ingredients/allergens
             try:
-                self._enrich_category(category)
+                _timed(timings, "enrich", self._enrich_category, category)
                 result["enriched"] = True
                 print("  Enrichment complete")
             except Exception as exc:
@@ -267,7 +317,7 @@ class PipelineOrchestrator:
                 print(f"  Enrichment skipped (error: {exc})")
 
             # Phase 5: Score category
-            self._score_category(category)
+            _timed(timings, "score", self._score_category, category)
             result["scored"] = True
             self._report["products_scored"] += 1
             print("  Scoring complete")
@@ -282,35 +332,98 @@ class PipelineOrchestrator:
 
         return result
 
+    # -- concurrent mode -----------------------------------------------------
+
+    def _run_concurrent(self) -> None:
+        """``--jobs N``: prefetch categories on a thread pool, finish them in order.
+
+        Up to ``jobs`` categories are searched/extracted/validated at once
+        (and at most ``2 * jobs`` held ready), all sharing one OFF
+        :class:`TokenBucket`.  The main thread consumes
+        the results strictly in category order, so SQL generation
+        (first-writer-wins EAN dedup), SQL execution and scoring never
+        overlap and produce the same output as the sequential mode.
+        """
+        limiter = TokenBucket(self.rps or DEFAULT_RPS)
+        futures: dict[int, Future] = {}
+        with ThreadPoolExecutor(max_workers=self.jobs, thread_name_prefix="orchestrate") as pool:
+            try:
+                for i, category in enumerate(self.categories):
+                    # Keep at most 2 * jobs categories fetched ahead of the serialized stage.
+                    for j in range(i, min(i + 2 * self.jobs, len(self.categories))):
+                        if j not in futures:
+                            futures[j] = pool.submit(self._prefetch_category, self.categories[j], limiter)
+                    self._print_category_header(i + 1, category)
+                    self._record(self.run_category(category, prefetch=futures.pop(i)))
+            finally:
+                for future in futures.values():
+                    future.cancel()
+
+    def _prefetch_category(
+        self, category: str, limiter: TokenBucket
+    ) -> tuple[int, PreparedCategory | None, dict[str, float]]:
+        """Worker-thread part of :meth:`run_category`: stale check + OFF fetch.
+
+        Returns ``(stale_count, prepared, timings)``; *prepared* is ``None``
+        when ``--stale-only`` will skip the category.
+        """
+        timings: dict[str, float] = {}
+        stale_count = 0
+        if not self.dry_run:
+            stale_count = _timed(timings, "stale_check", self._detect_stale_products, category)
+            if self.stale_only and stale_count == 0:
+                return stale_count, None, timings
+        prepared = prepare_category(
+            category,
+            max_products=self.max_products,
+            country=self.country,
+            limiter=limiter,
+        )
+        timings["fetch"] = prepared.fetch_seconds
+        return stale_count, prepared, timings
+
+    def _print_category_header(self, i: int, category: str) -> None:
+        print(f"\n[{i}/{len(self.categories)}] {category}")
+        print("-" * 40)
+
+    def _record(self, cat_result: dict) -> None:
+        self._report["category_results"].append(cat_result)
+        self._report["categories_processed"] += 1
+        for phase, seconds in cat_result["timings"].items():
+            self._report["phase_seconds"][phase] = round(self._report["phase_seconds"][phase] + seconds, 3)
+        if "delta" in cat_result:
+            self._report["delta_rows"]["full"] += cat_result["delta"]["rows_full"]
+            self._report["delta_rows"]["delta"] += cat_result["delta"]["rows_delta"]
+
     # -- internal methods ----------------------------------------------------
 
     def _detect_stale_products(self, category: str) -> int:
         """Count products older than stale_days in this category."""
         try:
             count_str = _run_psql(
-                f"SELECT COUNT(*) FROM products "
-                f"WHERE category = '{category}' AND country = '{self.country}' "
-                f"AND is_deprecated IS NOT TRUE AND ean IS NOT NULL "
-                f"AND (last_fetched_at IS NULL "
-                f"OR last_fetched_at < NOW() - INTERVAL '{self.stale_days} days') "
-                f"LIMIT 1;"
+                "SELECT COUNT(*) FROM products "
+                "WHERE category = %s AND country = %s "
+                "AND is_deprecated IS NOT TRUE AND ean IS NOT NULL "
+                "AND (last_fetched_at IS NULL "
+                "OR last_fetched_at < NOW() - make_interval(days => %s));",
+                (category, self.country, self.stale_days),
             )
             return int(count_str) if count_str else 0
-        except (subprocess.CalledProcessError, ValueError):
+        except (db.DatabaseError, ValueError):
             return 0
 
-    def _execute_sql_files(self, folder: Path) -> int:
-        """Execute all pipeline SQL files in a folder in sorted order.
+    def _execute_sql_files(self, folder: Path) -> ApplyResult:
+        """Apply all pipeline SQL files in a folder, in sorted order, as one transaction.
 
-        Returns the number of files executed.
+        With ``diff`` only the folder's ``DELTA__`` file is applied.  With
+        ``skip_unchanged`` a folder whose manifest shows it already applied
+        to this database is skipped (``ApplyResult.skipped``).
+        Raises :class:`~pipeline.apply.ApplyError` (nothing committed) when
+        any statement fails.
         """
-        if not folder.is_dir():
-            return 0
-
-        sql_files = sorted(folder.glob("PIPELINE__*.sql"))
-        for sql_file in sql_files:
-            _execute_sql_file(sql_file)
-        return len(sql_files)
+        if self.skip_unchanged and not self.diff and self._fingerprint is None:
+            self._fingerprint = db_fingerprint()
+        return apply_folder(folder, delta=self.diff, fingerprint=self._fingerprint)
 
     def _enrich_category(self, category: str) -> None:
         """Run enrich_ingredients.py for the category's country."""
@@ -324,11 +437,14 @@ class PipelineOrchestrator:
             "--country",
             self.country,
         ]
+        cache = get_cache()
+        if cache is not None:
+            cmd += cache.cli_args()
         subprocess.run(cmd, capture_output=True, text=True, check=True)
 
     def _score_category(self, category: str) -> None:
-        """CALL score_category('CategoryName') via psql."""
-        _run_psql(f"CALL score_category('{category}');")
+        """CALL score_category('CategoryName')."""
+        db.execute("CALL score_category(%s);", (category,))
 
     # -- reporting -----------------------------------------------------------
 
@@ -351,6 +467,23 @@ class PipelineOrchestrator:
         print(f"  Mode:       {'DRY RUN' if r['dry_run'] else 'LIVE'}")
         print(f"  Categories: {r['categories_processed']}")
         print(f"  Duration:   {r['duration_seconds']}s")
+        busiest = {phase: secs for phase, secs in r["phase_seconds"].items() if secs}
+        if busiest:
+            print("  Phases:     " + ", ".join(f"{phase} {secs:.1f}s" for phase, secs in busiest.items()))
+        if r["raw_products_checked"]:
+            print(
+                f"  Unchanged:  {r['unchanged_products']}/{r['raw_products_checked']} products "
+                f"({r['unchanged_ratio']:.0%}), {r['http_bytes_saved'] / 1e6:.1f} MB not re-downloaded"
+            )
+
+        rows = r["delta_rows"]
+        if rows["full"]:
+            print(
+                f"  Delta:      ~{rows['delta']:,} row writes instead of ~{rows['full']:,} "
+                f"({1 - rows['delta'] / rows['full']:.0%} fewer than full refreshes)"
+            )
+        if r["sql_folders_skipped"]:
+            print(f"  SQL:        {r['sql_folders_skipped']} folders unchanged since last apply, skipped")
 
         success = sum(1 for c in r["category_results"] if c["status"] == "success")
         errors = sum(1 for c in r["category_results"] if c["status"] == "error")
@@ -413,8 +546,32 @@ def main() -> None:
         default=90,
         help="Products older than N days are considered stale (default: 90)",
     )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Categories fetched from OFF concurrently (default: 1 = sequential)",
+    )
+    parser.add_argument(
+        "--rps",
+        type=float,
+        default=None,
+        help=f"Shared OFF requests/second budget when --jobs > 1 (default: {DEFAULT_RPS:g})",
+    )
+    parser.add_argument(
+        "--diff",
+        action="store_true",
+        help="Apply only what changed since the previous generation (DELTA__ files)",
+    )
+    parser.add_argument(
+        "--skip-unchanged",
+        action="store_true",
+        help="Skip SQL folders whose files are unchanged since their last apply to this database",
+    )
+    add_cache_arguments(parser)
 
     args = parser.parse_args()
+    configure_from_args(parser, args)
 
     logging.basicConfig(
         level=logging.INFO,
@@ -442,6 +599,10 @@ def main() -> None:
             stale_days=args.stale_days,
             dry_run=args.dry_run,
             stale_only=args.stale_only,
+            jobs=args.jobs,
+            rps=args.rps,
+            diff=args.diff,
+            skip_unchanged=args.skip_unchanged,
         )
         report = orchestrator.run_all()
         all_reports.append(report)
@@ -0,0 +1,154 @@
+"""Thread-safe request rate limiting for Open Food Facts clients.
+
+A single :class:`TokenBucket` can be shared by any number of worker threads
+so that the *global* request rate stays within the configured budget, no
+matter how many requests are in flight at once.  :class:`AdaptiveTokenBucket`
+additionally slows down when OFF pushes back (AIMD) and keeps the request
+counters behind live progress reports.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections.abc import Callable
+
+
+class TokenBucket:
+    """Token-bucket rate limiter shared across threads.
+
+    Tokens refill continuously at *rate* per second up to *burst*.  Each
+    :meth:`acquire` call consumes one token, blocking until one is
+    available.
+
+    Parameters
+    ----------
+    rate:
+        Sustained requests per second (must be > 0).
+    burst:
+        Maximum number of tokens that can accumulate while idle.  ``1``
+        (the default) means requests are evenly spaced with no bursting.
+    clock, sleep:
+        Injectable time sources (used by tests).
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        if rate <= 0:
+            msg = f"rate must be > 0, got {rate}"
+            raise ValueError(msg)
+        if burst < 1:
+            msg = f"burst must be >= 1, got {burst}"
+            raise ValueError(msg)
+        self.rate = float(rate)
+        self.burst = burst
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Consume one token and return how long the caller must wait for it."""
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1.0
+            if self._tokens >= 0:
+                return 0.0
+            # Token is borrowed from the future — wait until it has refilled.
+            return -self._tokens / self.rate
+
+    def acquire(self) -> float:
+        """Block until a request may be sent.  Returns the seconds waited."""
+        wait = self._reserve()
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+    def on_success(self) -> None:
+        """Feedback hook: the last request succeeded.  A fixed bucket ignores it."""
+
+    def on_failure(self, congested: bool) -> None:
+        """Feedback hook: a request attempt failed — *congested* for 429/5xx/dropped connections."""
+
+
+class AdaptiveTokenBucket(TokenBucket):
+    """Token bucket whose rate follows OFF's feedback, AIMD-style.
+
+    Starts at *ceiling* requests per second.  Every congested failure
+    (HTTP 429, 5xx, a dropped connection) multiplies the rate by
+    *decrease*, at most once per request interval so that one overload
+    seen by several in-flight requests counts once, and never below
+    *floor*; every success adds *increase* back, never above *ceiling*.
+
+    Parameters
+    ----------
+    ceiling:
+        Maximum (and initial) requests per second (must be > 0).
+    floor:
+        Minimum requests per second (default: ``ceiling / 20``).
+    increase:
+        Requests per second regained per success (default: ``ceiling / 20``).
+    decrease:
+        Rate multiplier per congestion event (default: ``0.5``).
+    burst, clock, sleep:
+        As for :class:`TokenBucket`.
+
+    Attributes
+    ----------
+    requests, successes, failures, backoffs:
+        Attempts sent, attempts that succeeded, attempts that failed (and
+        were retried or given up on) and rate decreases so far.
+    """
+
+    def __init__(
+        self,
+        ceiling: float,
+        floor: float | None = None,
+        increase: float | None = None,
+        decrease: float = 0.5,
+        burst: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        super().__init__(ceiling, burst=burst, clock=clock, sleep=sleep)
+        if not 0 < decrease < 1:
+            msg = f"decrease must be in (0, 1), got {decrease}"
+            raise ValueError(msg)
+        self.ceiling = self.rate
+        self.floor = min(floor if floor is not None else self.ceiling / 20, self.ceiling)
+        self.increase = increase if increase is not None else self.ceiling / 20
+        self.decrease = decrease
+        self.requests = 0
+        self.successes = 0
+        self.failures = 0
+        self.backoffs = 0
+        self._last_backoff = float("-inf")
+
+    def _reserve(self) -> float:
+        wait = super()._reserve()
+        with self._lock:
+            self.requests += 1
+        return wait
+
+    def on_success(self) -> None:
+        with self._lock:
+            self.successes += 1
+            self.rate = min(self.ceiling, self.rate + self.increase)
+
+    def on_failure(self, congested: bool) -> None:
+        with self._lock:
+            self.failures += 1
+            now = self._clock()
+            if not congested or now - self._last_backoff < 1.0 / self.rate:
+                return
+            self._last_backoff = now
+            self.backoffs += 1
+            self.rate = max(self.floor, self.rate * self.decrease)
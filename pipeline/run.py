@@ -4,101 +4,136 @@ Usage::
 
     python -m pipeline.run --category "Dairy" --max-products 30
     python -m pipeline.run --category "Chips" --dry-run
+    python -m pipeline.run --category "Chips" --ean-file eans.txt --workers 4
+    python -m pipeline.run --category "Chips" --off-tag en:crisps --max-products 100
 """
 
 from __future__ import annotations
 
 import argparse
+import functools
+import hashlib
+import itertools
+import json
 import logging
 import math
-import re
+import sqlite3
 import sys
+import time
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
 from pathlib import Path
+from types import ModuleType
 
 from tqdm import tqdm
 
+from pipeline import categories, ean_registry, off_client, sql_generator, validator
 from pipeline.categories import CATEGORY_SEARCH_TERMS, resolve_category
-from pipeline.off_client import extract_product_data, market_score, search_products
+from pipeline.http_cache import HttpCache, add_cache_arguments, configure_from_args, get_cache
+from pipeline.off_client import (
+    DEFAULT_RPS,
+    _safe_int,
+    extract_product_data,
+    iter_products_by_eans,
+    iter_search_products,
+    top_k_by_market_score,
+)
+from pipeline.rate_limit import TokenBucket
 from pipeline.sql_generator import BATCH_SIZE, generate_pipeline
-from pipeline.utils import slug as _slug
+from pipeline.utils import (
+    prefetch,
+    slug as _slug,
+)
 from pipeline.validator import validate_product
 
 logger = logging.getLogger(__name__)
 
+PIPELINE_DIR = Path(__file__).resolve().parent.parent / "db" / "pipelines"
+
 # ---------------------------------------------------------------------------
 # Helpers
 # ---------------------------------------------------------------------------
 
 
-def _dedup(products: list[dict]) -> list[dict]:
+def pipeline_dir_slug(category: str, country: str) -> str:
+    """Return the ``db/pipelines`` folder name for *category* in *country*.
+
+    Non-PL categories get a country suffix on the folder name.
+    """
+    slug_base = _slug(category)
+    return f"{slug_base}-{country.lower()}" if country != "PL" else slug_base
+
+
+@functools.cache
+def _source_hash(*modules: ModuleType) -> str:
+    """sha256 of the source files of *modules*, so that derived results change with the code."""
+    h = hashlib.sha256()
+    for module in modules:
+        h.update(Path(module.__file__).read_bytes())
+    return h.hexdigest()
+
+
+def _processing_version() -> str:
+    """Source hash of the extraction and validation code (off_client, validator, categories)."""
+    return _source_hash(off_client, validator, categories)
+
+
+def _dedup(products: Iterable[dict]) -> Iterator[dict]:
     """De-duplicate products by (brand, product_name), keeping first seen.
 
     Uses lower/strip to match the DB identity_key: md5(lower(trim(brand)) || '::' || lower(trim(product_name))).
+    Only the identity keys are retained, so the input can be a stream.
     """
     seen: set[tuple[str, str]] = set()
-    unique: list[dict] = []
     for p in products:
         key = (p["brand"].lower().strip(), p["product_name"].lower().strip())
         if key not in seen:
             seen.add(key)
-            unique.append(p)
-    return unique
-
-
-# Pattern to extract EAN literals from pipeline 01_insert SQL files.
-# Matches EAN values in:  ('brand', 'name', 'EAN1234567890', ...)
-_EAN_IN_SQL_RE = re.compile(r"'(\d{8}|\d{13})'")
+            yield p
 
 
 def _collect_existing_eans(pipeline_dir: Path, exclude_slug: str) -> set[str]:
-    """Scan all pipeline 01_insert_products SQL files for EAN values.
+    """Return the set of EANs already claimed by *other* categories.
 
-    Returns the set of EANs already claimed by *other* categories
-    (i.e. all folders except *exclude_slug*).
+    i.e. the EANs in the ``01_insert_products`` SQL (or COPY payload) of every
+    folder under *pipeline_dir* except *exclude_slug*, served from the persistent
+    :mod:`pipeline.ean_registry` index (re-scanned only for changed files).
+    Falls back to scanning the SQL directly if the index cannot be opened.
     """
-    eans: set[str] = set()
     if not pipeline_dir.is_dir():
-        return eans
+        return set()
+    try:
+        registry = ean_registry.registry_for(pipeline_dir)
+        if registry is not None:
+            return registry.existing_eans(exclude_slug)
+    except sqlite3.Error as exc:
+        logger.warning("EAN registry unavailable (%s) — scanning pipeline SQL", exc)
+    eans: set[str] = set()
     for folder in pipeline_dir.iterdir():
         if not folder.is_dir() or folder.name == exclude_slug:
             continue
-        for sql_file in folder.glob("PIPELINE__*__01_insert_products.sql"):
-            try:
-                content = sql_file.read_text(encoding="utf-8")
-            except OSError:
-                continue
-            for match in _EAN_IN_SQL_RE.finditer(content):
-                eans.add(match.group(1))
+        for path in ean_registry.claim_files(folder):
+            eans |= ean_registry.scan_eans(path)
     return eans
 
 
 def _cross_category_ean_dedup(
-    products: list[dict],
-    pipeline_dir: Path,
-    current_slug: str,
-) -> tuple[list[dict], list[dict]]:
+    products: Iterable[dict],
+    existing_eans: set[str],
+    dropped: list[dict],
+) -> Iterator[dict]:
     """Remove products whose EANs already exist in other category pipelines.
 
     First-writer-wins: the category that already has the EAN keeps it.
-
-    Returns
-    -------
-    tuple
-        (kept_products, dropped_products)
+    *existing_eans* comes from :func:`_collect_existing_eans`; removed
+    products are appended to *dropped*.
     """
-    existing_eans = _collect_existing_eans(pipeline_dir, current_slug)
-    if not existing_eans:
-        return products, []
-
-    kept: list[dict] = []
-    dropped: list[dict] = []
     for p in products:
         ean = p.get("ean") or ""
         if ean and ean in existing_eans:
             dropped.append(p)
         else:
-            kept.append(p)
-    return kept, dropped
+            yield p
 
 
 # ---------------------------------------------------------------------------
@@ -106,70 +141,235 @@ def _cross_category_ean_dedup(
 # ---------------------------------------------------------------------------
 
 
+class _ProductMemo:
+    """Reuse extraction/validation results for products OFF has not modified.
+
+    Results are stored in the HTTP cache keyed on ``(category, code,
+    last_modified_t)`` and the source hash of the extraction/validation code
+    (:func:`_processing_version`); a product whose ``last_modified_t``
+    matches a record stored by the same code skips
+    :func:`extract_product_data` and :func:`validate_product`.
+    Without a configured cache (or without ``last_modified_t``) every
+    product is processed normally.
+
+    Products whose OFF tags resolve to another category are dropped unless
+    *filter_category* is off (EAN-list and explicit-tag runs, where the
+    caller has already chosen the category).
+    """
+
+    def __init__(self, category: str, cache: HttpCache | None = None, filter_category: bool = True) -> None:
+        self.category = category
+        self.cache = cache
+        self.filter_category = filter_category
+        version = _processing_version()
+        self._extract_kind = f"{'extract' if filter_category else 'extract-unfiltered'}:{version}"
+        self._validate_kind = f"validate:{version}"
+        self.total = 0
+        self.unchanged = 0
+
+    def extract(self, raw: dict) -> dict | None:
+        self.total += 1
+        code = str(raw.get("code") or "")
+        last_modified_t = _safe_int(raw.get("last_modified_t"), default=-1)
+        if self.cache is None or not code or last_modified_t < 0:
+            return self._extract(raw)
+        hit, product = self.cache.get_record(self._extract_kind, self.category, code, last_modified_t)
+        if hit:
+            self.unchanged += 1
+            return product
+        product = self._extract(raw)
+        if product is not None:
+            product["_last_modified_t"] = last_modified_t
+        self.cache.put_record(self._extract_kind, self.category, code, last_modified_t, product)
+        return product
+
+    def _extract(self, raw: dict) -> dict | None:
+        product = extract_product_data(raw)
+        if product is None:
+            return None
+        if self.filter_category:
+            resolved = resolve_category(raw.get("categories_tags", []))
+            if resolved is not None and resolved != self.category:
+                return None
+        product["category"] = self.category
+        return product
+
+    def validate(self, product: dict) -> dict:
+        last_modified_t = product.get("_last_modified_t")
+        code = product.get("ean") or ""
+        if self.cache is None or last_modified_t is None or not code:
+            return validate_product(product, self.category)
+        hit, result = self.cache.get_record(self._validate_kind, self.category, code, last_modified_t)
+        if not hit:
+            result = validate_product(product, self.category)
+            self.cache.put_record(self._validate_kind, self.category, code, last_modified_t, result)
+        return result
+
+
+@dataclass
+class _Tally:
+    """Counters filled in while a product stream is consumed.
+
+    ``blocked`` holds products blocked by anomaly errors (absolute cap
+    violations) for the anomaly report, at most *max_blocked* of them.
+    """
+
+    validated: int = 0
+    unique: int = 0
+    warn_count: int = 0
+    blocked: list[dict] = field(default_factory=list)
+    ean_dropped: list[dict] = field(default_factory=list)
+    max_blocked: int | None = None
+
+    def admit(self, result: dict, max_warnings: int) -> bool:
+        """Record one :func:`validate_product` result; return whether it is kept."""
+        if result.get("anomaly_errors"):
+            self.warn_count += 1
+            if self.max_blocked is None or len(self.blocked) < self.max_blocked:
+                self.blocked.append(result)
+            return False
+        n_warnings = len(result.get("validation_warnings", []))
+        if n_warnings:
+            self.warn_count += 1
+        if n_warnings > max_warnings:
+            return False
+        self.validated += 1
+        return True
+
+
 def _extract_products(
-    raw_products: list[dict],
+    raw_products: Iterable[dict],
     category: str,
     min_completeness: float,
-) -> list[dict]:
-    """Phase 2: extract, normalise, and filter raw OFF products."""
-    extracted: list[dict] = []
-    for raw in tqdm(raw_products, desc="Extracting", leave=False):
-        product = extract_product_data(raw)
+    memo: _ProductMemo | None = None,
+) -> Iterator[dict]:
+    """Phase 2: extract, normalise, and filter raw OFF products (streaming)."""
+    memo = memo or _ProductMemo(category)
+    for raw in raw_products:
+        product = memo.extract(raw)
         if product is None:
             continue
-        off_cats = raw.get("categories_tags", [])
-        resolved = resolve_category(off_cats)
-        if resolved is not None and resolved != category:
-            continue
-        product["category"] = category
         try:
             completeness = float(product.get("_completeness", 0))
         except (ValueError, TypeError):
             completeness = 0.0
         if completeness < min_completeness:
             continue
-        extracted.append(product)
-    return extracted
+        yield product
 
 
 def _validate_products(
-    extracted: list[dict],
+    extracted: Iterable[dict],
     category: str,
     max_warnings: int,
-) -> tuple[list[dict], int, list[dict]]:
-    """Phase 3: validate products and count warnings.
+    tally: _Tally,
+    memo: _ProductMemo | None = None,
+) -> Iterator[dict]:
+    """Phase 3: validate products (streaming), counting warnings into *tally*."""
+    memo = memo or _ProductMemo(category)
+    for product in extracted:
+        result = memo.validate(product)
+        if tally.admit(result, max_warnings):
+            yield result
 
-    Returns
-    -------
-    tuple
-        (validated_products, warning_count, blocked_products)
-        ``blocked_products`` contains products blocked by anomaly errors
-        (absolute cap violations).
+
+def _search_stream(
+    category: str,
+    max_results: int,
+    country: str,
+    workers: int,
+    rps: float | None,
+    limiter: TokenBucket | None = None,
+    eans: list[str] | None = None,
+    off_tags: list[str] | None = None,
+) -> Iterator[dict]:
+    """Raw OFF products, one search page prefetched while the previous one is processed.
+
+    With *eans* the listed products are fetched first
+    (:func:`iter_products_by_eans`); the search then runs over *off_tags*
+    if given, or over the category's own tags and terms when there is no
+    EAN list either.  A fetch failure ends the stream early (logged)
+    instead of aborting the run; products already received are still used.
     """
-    validated: list[dict] = []
-    blocked: list[dict] = []
-    warn_count = 0
-    for product in tqdm(extracted, desc="Validating", leave=False):
-        result = validate_product(product, category)
-        anomaly_errors = result.get("anomaly_errors", [])
-        if anomaly_errors:
-            blocked.append(result)
-            warn_count += 1
-            continue
-        n_warnings = len(result.get("validation_warnings", []))
-        if n_warnings > max_warnings:
-            warn_count += 1
-            continue
-        if n_warnings > 0:
-            warn_count += 1
-        validated.append(result)
-    return validated, warn_count, blocked
+    sources: list[Iterable[list[dict]]] = []
+    if eans:
+        sources.append(iter_products_by_eans(eans, workers=workers, rps=rps, limiter=limiter))
+    if off_tags or not eans:
+        sources.append(
+            iter_search_products(
+                category,
+                max_results=max_results,
+                country=country,
+                workers=workers,
+                rps=rps,
+                limiter=limiter,
+                off_tags=off_tags,
+            )
+        )
+    pages = itertools.chain.from_iterable(sources)
+    try:
+        for page in prefetch(pages, depth=1):
+            yield from page
+    except Exception as exc:
+        logger.error("Search failed with unexpected error: %s", exc)
+
+
+def _generation_digest(
+    category: str,
+    products: list[dict],
+    country: str,
+    batch_size: int,
+    output_format: str = "sql",
+    compress: bool = False,
+) -> str | None:
+    """Fingerprint the inputs of :func:`generate_pipeline` for unchanged-output detection.
+
+    Covers the selected products (by EAN, identity and ``last_modified_t``),
+    the generation parameters and the source of the SQL generator and of the
+    extraction/validation code that produced the products.  Returns
+    ``None`` when any product lacks ``last_modified_t`` (no safe fingerprint).
+    """
+    keys = []
+    for p in products:
+        if p.get("_last_modified_t") is None:
+            return None
+        keys.append([p.get("ean"), p["brand"], p["product_name"], p["_last_modified_t"]])
+    h = hashlib.sha256(_source_hash(sql_generator).encode())
+    h.update(_processing_version().encode())
+    h.update(json.dumps([category, country, batch_size, output_format, compress, keys]).encode())
+    return h.hexdigest()
 
 
 # Country code → OFF country name for API queries
 _COUNTRY_OFF_NAME: dict[str, str] = {
     "PL": "poland",
     "DE": "germany",
+    "FR": "france",
+    "ES": "spain",
+    "IT": "italy",
+    "GB": "united-kingdom",
+    "US": "united-states",
+    "CZ": "czech-republic",
+    "SK": "slovakia",
+    "AT": "austria",
+    "NL": "netherlands",
+    "BE": "belgium",
+    "SE": "sweden",
+    "DK": "denmark",
+    "NO": "norway",
+    "FI": "finland",
+    "PT": "portugal",
+    "RO": "romania",
+    "HU": "hungary",
+    "BG": "bulgaria",
+    "HR": "croatia",
+    "LT": "lithuania",
+    "LV": "latvia",
+    "EE": "estonia",
+    "SI": "slovenia",
+    "IE": "ireland",
+    "GR": "greece",
+    "CH": "switzerland",
 }
 
 
@@ -182,15 +382,26 @@ def run_pipeline(
     max_warnings: int = 3,
     country: str = "PL",
     batch_size: int = BATCH_SIZE,
-) -> None:
+    output_format: str = "sql",
+    compress: bool = False,
+    diff: bool = False,
+    workers: int = 1,
+    rps: float | None = None,
+    timings: dict | None = None,
+    eans: list[str] | None = None,
+    off_tags: list[str] | None = None,
+) -> dict:
     """Execute the full pipeline for a single category.
 
     Parameters
     ----------
     category:
-        Database category name (must exist in ``CATEGORY_SEARCH_TERMS``).
+        Database category name (must exist in ``CATEGORY_SEARCH_TERMS``
+        unless *eans* or *off_tags* say what to fetch).
     max_products:
-        Maximum number of products to fetch from OFF.
+        Maximum number of products to fetch from OFF.  With *eans* every
+        valid listed product is kept, and search results only fill the
+        remaining ``max_products - len(eans)`` places.
     output_dir:
         Directory for SQL output.  Defaults to ``db/pipelines/{slug}/``.
     dry_run:
@@ -201,8 +412,37 @@ def run_pipeline(
         Products with more than this many validation warnings are dropped.
     country:
         ISO 3166-1 alpha-2 country code (default ``"PL"``).
+    output_format:
+        ``"sql"`` (per-step SQL files) or ``"copy"`` (CSV payload + COPY
+        driver); see :func:`pipeline.sql_generator.generate_pipeline`.
+    compress:
+        Write the files gzip-compressed (``*.sql.gz`` / ``*.csv.gz``).
+    diff:
+        Also write ``DELTA__{slug}__changes.sql``, only the changes since
+        the previous generation (:func:`pipeline.sql_generator.generate_delta`).
+    workers:
+        Concurrent OFF fetch threads (``1`` = serial, rate-limited by sleep).
+    rps:
+        Global OFF requests-per-second budget when ``workers > 1``.
+    timings:
+        If given, filled with ``fetch`` (phases 1-4) and ``generate``
+        (phase 5) wall-clock seconds.
+    eans:
+        EAN-list mode: fetch these products by barcode (in order, before
+        any search) instead of searching the category.
+    off_tags:
+        Tag mode: search these OFF category tags (e.g. ``"en:chips"``)
+        instead of the category's own tags and keyword terms.  In both
+        modes products are filed under *category* whatever their OFF tags.
+
+    Returns
+    -------
+    dict
+        Run statistics: ``products`` (selected), ``raw_products``,
+        ``unchanged_products`` (raw products reused because their OFF
+        ``last_modified_t`` was unchanged) and ``sql_regenerated``.
     """
-    if category not in CATEGORY_SEARCH_TERMS:
+    if category not in CATEGORY_SEARCH_TERMS and not (eans or off_tags):
         valid = ", ".join(sorted(CATEGORY_SEARCH_TERMS))
         print(f"ERROR: Unknown category '{category}'.")
         print(f"Valid categories: {valid}")
@@ -210,12 +450,8 @@ def run_pipeline(
 
     off_country = _COUNTRY_OFF_NAME.get(country, country.lower())
 
-    project_root = Path(__file__).resolve().parent.parent
     if output_dir is None:
-        slug_base = _slug(category)
-        # Non-PL categories get a country suffix on the folder name
-        dir_slug = f"{slug_base}-{country.lower()}" if country != "PL" else slug_base
-        output_dir = str(project_root / "db" / "pipelines" / dir_slug)
+        output_dir = str(PIPELINE_DIR / pipeline_dir_slug(category, country))
 
     print("TryVit — Open Food Facts Pipeline")
     print("=" * 42)
@@ -223,47 +459,367 @@ def run_pipeline(
     print(f"Country:  {country} ({off_country})")
     print()
 
-    # 1. Search OFF
-    print(f"Searching Open Food Facts for {off_country.title()} products...")
-    try:
-        raw_products = search_products(category, max_results=max_products * 3, country=off_country)
-    except Exception as exc:
-        logger.error("Search failed with unexpected error: %s", exc)
-        raw_products = []
-    print(f"  Found {len(raw_products)} raw products")
+    # 1-3. Search OFF → extract & normalise → validate, as one stream: the
+    # next search page is fetched while the current one is processed, and
+    # only the running top-K (by market score) is kept in memory.
+    # Unchanged products reuse earlier extraction/validation results.
+    if eans:
+        print(f"Fetching {len(eans)} products by EAN from Open Food Facts...")
+    if off_tags or not eans:
+        tags = f" tagged {', '.join(off_tags)}" if off_tags else ""
+        print(f"Searching Open Food Facts for {off_country.title()} products{tags}...")
+    started = time.monotonic()
+    memo = _ProductMemo(category, get_cache(), filter_category=not (eans or off_tags))
+    tally = _Tally()
+    search_products = max(max_products - len(eans), 0) if eans else max_products
+    validated = _validated_stream(
+        category,
+        memo,
+        tally,
+        max_results=search_products * 3,
+        off_country=off_country,
+        min_completeness=min_completeness,
+        max_warnings=max_warnings,
+        workers=workers,
+        rps=rps,
+        eans=eans,
+        off_tags=off_tags,
+    )
+    selected = select_products(
+        category,
+        validated,
+        tally,
+        country=country,
+        max_products=max_products,
+        output_dir=output_dir,
+        listed_eans=eans,
+    )
+    fetched = time.monotonic()
 
-    if not raw_products:
-        print("\nNo products found. The OFF API may be unavailable.\nTry again later or increase --max-products.")
+    if not _print_fetch_summary(memo, tally):
         sys.exit(0)
 
-    # 2. Extract & normalise
-    extracted = _extract_products(raw_products, category, min_completeness)
+    stats = generate_selected(
+        category,
+        selected,
+        tally,
+        memo,
+        country=country,
+        max_products=max_products,
+        output_dir=output_dir,
+        dry_run=dry_run,
+        batch_size=batch_size,
+        output_format=output_format,
+        compress=compress,
+        diff=diff,
+    )
+    if timings is not None:
+        timings["fetch"] = round(fetched - started, 3)
+        timings["generate"] = round(time.monotonic() - fetched, 3)
+    if not stats["products"]:
+        sys.exit(0)
+    return stats
 
-    # 3. Validate
-    validated, warn_count, blocked = _validate_products(extracted, category, max_warnings)
-    print(f"  After validation: {len(validated)} products")
 
-    # 4. De-duplicate (within this category run)
-    unique = _dedup(validated)
-    print(f"  After dedup: {len(unique)} unique products")
-    if warn_count:
-        print(f"  Warnings: {warn_count} products outside expected ranges")
+def _validated_stream(
+    category: str,
+    memo: _ProductMemo,
+    tally: _Tally,
+    *,
+    max_results: int,
+    off_country: str,
+    min_completeness: float,
+    max_warnings: int,
+    workers: int = 1,
+    rps: float | None = None,
+    limiter: TokenBucket | None = None,
+    progress: bool = True,
+    eans: list[str] | None = None,
+    off_tags: list[str] | None = None,
+) -> Iterator[dict]:
+    """Phases 1-3 as one generator: OFF fetch (search or EAN list) → extract → validate."""
+    raw: Iterable[dict] = _search_stream(category, max_results, off_country, workers, rps, limiter, eans, off_tags)
+    if progress:
+        raw = tqdm(raw, desc="Processing", unit="product", leave=False)
+    extracted = _extract_products(raw, category, min_completeness, memo)
+    return _validate_products(extracted, category, max_warnings, tally, memo)
 
-    # 4b. Cross-category EAN dedup (first-writer-wins)
-    pipeline_base = project_root / "db" / "pipelines"
-    slug_base = _slug(category)
-    dir_slug = f"{slug_base}-{country.lower()}" if country != "PL" else slug_base
-    unique, ean_dropped = _cross_category_ean_dedup(unique, pipeline_base, dir_slug)
-    if ean_dropped:
-        print(f"  Cross-category EAN dedup: {len(ean_dropped)} product(s) removed (EAN already in another category)")
-        for dp in ean_dropped:
+
+def _print_fetch_summary(memo: _ProductMemo, tally: _Tally) -> bool:
+    """Print the phase 1-3 counts; return ``False`` when OFF returned nothing."""
+    print(f"  Found {memo.total} raw products")
+    if not memo.total:
+        print("\nNo products found. The OFF API may be unavailable.\nTry again later or increase --max-products.")
+        return False
+    if memo.unchanged:
+        print(f"  Unchanged since last run: {memo.unchanged}/{memo.total} products")
+    print(f"  After validation: {tally.validated} products")
+    return True
+
+
+# ---------------------------------------------------------------------------
+# Two-stage API (concurrent multi-category runs)
+# ---------------------------------------------------------------------------
+
+
+@dataclass
+class PreparedCategory:
+    """Validated OFF products for one category, ready for selection and SQL generation.
+
+    Produced by :func:`prepare_category` (network-bound, safe to run for
+    several categories at once); consumed by :func:`generate_prepared`,
+    which must run in category order because cross-category EAN dedup is
+    first-writer-wins.
+    """
+
+    category: str
+    country: str
+    validated: list[dict]
+    tally: _Tally
+    memo: _ProductMemo
+    fetch_seconds: float = 0.0
+
+
+def prepare_category(
+    category: str,
+    max_products: int = 30,
+    min_completeness: float = 0.0,
+    max_warnings: int = 3,
+    country: str = "PL",
+    limiter: TokenBucket | None = None,
+) -> PreparedCategory:
+    """Phases 1-3 of :func:`run_pipeline`, without printing.
+
+    Holds at most ``max_products * 3`` validated products.  Pass a shared
+    *limiter* to keep concurrent callers within one OFF request budget.
+    """
+    started = time.monotonic()
+    memo = _ProductMemo(category, get_cache())
+    tally = _Tally()
+    validated = list(
+        _validated_stream(
+            category,
+            memo,
+            tally,
+            max_results=max_products * 3,
+            off_country=_COUNTRY_OFF_NAME.get(country, country.lower()),
+            min_completeness=min_completeness,
+            max_warnings=max_warnings,
+            limiter=limiter,
+            progress=False,
+        )
+    )
+    return PreparedCategory(category, country, validated, tally, memo, round(time.monotonic() - started, 3))
+
+
+def generate_prepared(
+    prepared: PreparedCategory,
+    max_products: int = 30,
+    output_dir: str | Path | None = None,
+    dry_run: bool = False,
+    batch_size: int = BATCH_SIZE,
+    output_format: str = "sql",
+    compress: bool = False,
+    diff: bool = False,
+) -> dict:
+    """Phases 4-5 of :func:`run_pipeline` for a :func:`prepare_category` result.
+
+    Prints the same report as :func:`run_pipeline` but never exits: an
+    empty category returns statistics with ``products == 0``.
+    """
+    category, country = prepared.category, prepared.country
+    if output_dir is None:
+        output_dir = PIPELINE_DIR / pipeline_dir_slug(category, country)
+    selected = select_products(
+        category,
+        prepared.validated,
+        prepared.tally,
+        country=country,
+        max_products=max_products,
+        output_dir=output_dir,
+    )
+    stats = {
+        "products": 0,
+        "raw_products": 0,
+        "unchanged_products": 0,
+        "sql_regenerated": False,
+    }
+    if not _print_fetch_summary(prepared.memo, prepared.tally):
+        return stats
+    return generate_selected(
+        category,
+        selected,
+        prepared.tally,
+        prepared.memo,
+        country=country,
+        max_products=max_products,
+        output_dir=output_dir,
+        dry_run=dry_run,
+        batch_size=batch_size,
+        output_format=output_format,
+        compress=compress,
+        diff=diff,
+    )
+
+
+def select_products(
+    category: str,
+    validated: Iterable[dict],
+    tally: _Tally,
+    *,
+    country: str,
+    max_products: int,
+    pipeline_dir: Path | None = None,
+    output_dir: str | Path | None = None,
+    listed_eans: list[str] | None = None,
+) -> list[dict]:
+    """Phase 4: dedup and keep the *max_products* most market-relevant products.
+
+    Consumes *validated* (typically the :func:`_validate_products` stream)
+    in one pass: within-run dedup, cross-category EAN dedup against the
+    folders under *pipeline_dir* (default ``db/pipelines``) other than the
+    run's own *output_dir* (default :func:`pipeline_dir_slug`), then a
+    bounded top-K by market score (:func:`top_k_by_market_score`).  Counts go into *tally*.
+
+    Products from an EAN list (*listed_eans*) are all kept and never
+    compete on market score; only the other products go through the
+    top-K, for the remaining ``max_products - len(listed_eans)`` places.
+
+    Returns
+    -------
+    list[dict]
+        The selected products: listed ones first (in input order), then
+        the rest, highest market score first (ties in input order).
+    """
+    pipeline_base = pipeline_dir if pipeline_dir is not None else PIPELINE_DIR
+    own_slug = Path(output_dir).name if output_dir is not None else pipeline_dir_slug(category, country)
+    existing_eans = _collect_existing_eans(pipeline_base, own_slug)
+
+    def counted(products: Iterable[dict]) -> Iterator[dict]:
+        for p in products:
+            tally.unique += 1
+            yield p
+
+    unique = counted(_dedup(validated))
+    kept = _cross_category_ean_dedup(unique, existing_eans, tally.ean_dropped)
+    if not listed_eans:
+        return top_k_by_market_score(kept, max_products, country)
+
+    listed = set(listed_eans)
+    pinned: list[dict] = []
+
+    def searched() -> Iterator[dict]:
+        for p in kept:
+            if p.get("ean") in listed:
+                pinned.append(p)
+            else:
+                yield p
+
+    search = searched()
+    ranked = top_k_by_market_score(search, max(max_products - len(listed_eans), 0), country)
+    for _ in search:  # no search places left: top_k returned without reading the stream
+        pass
+    return pinned + ranked
+
+
+def select_and_generate(
+    category: str,
+    validated: Iterable[dict],
+    tally: _Tally,
+    memo: _ProductMemo,
+    *,
+    country: str,
+    max_products: int,
+    output_dir: str | Path,
+    dry_run: bool = False,
+    batch_size: int = BATCH_SIZE,
+    output_format: str = "sql",
+    compress: bool = False,
+    diff: bool = False,
+    pipeline_dir: Path | None = None,
+) -> dict:
+    """Phases 4-5: :func:`select_products` followed by :func:`generate_selected`.
+
+    Shared by :func:`run_pipeline` (OFF API) and :mod:`pipeline.dump_ingest`
+    (OFF data dump).  *validated* / *tally* come from :func:`_validate_products`
+    (or an equivalent producer).
+
+    Returns
+    -------
+    dict
+        Run statistics (see :func:`run_pipeline`); ``products`` is 0 when
+        nothing survived and no SQL was generated.
+    """
+    selected = select_products(
+        category,
+        validated,
+        tally,
+        country=country,
+        max_products=max_products,
+        pipeline_dir=pipeline_dir,
+        output_dir=output_dir,
+    )
+    return generate_selected(
+        category,
+        selected,
+        tally,
+        memo,
+        country=country,
+        max_products=max_products,
+        output_dir=output_dir,
+        dry_run=dry_run,
+        batch_size=batch_size,
+        output_format=output_format,
+        compress=compress,
+        diff=diff,
+    )
+
+
+def generate_selected(
+    category: str,
+    selected: list[dict],
+    tally: _Tally,
+    memo: _ProductMemo,
+    *,
+    country: str,
+    max_products: int,
+    output_dir: str | Path,
+    dry_run: bool = False,
+    batch_size: int = BATCH_SIZE,
+    output_format: str = "sql",
+    compress: bool = False,
+    diff: bool = False,
+) -> dict:
+    """Phase 5: report the selection and generate SQL for it.
+
+    SQL generation is skipped when the selected products are all unchanged
+    since the last generation into *output_dir*.  With *diff* the delta
+    against that generation is written first, and summarised in the
+    returned ``delta`` statistics.
+
+    Returns
+    -------
+    dict
+        Run statistics (see :func:`run_pipeline`); ``products`` is 0 when
+        nothing survived and no SQL was generated.
+    """
+    print(f"  After dedup: {tally.unique} unique products")
+    if tally.warn_count:
+        print(f"  Warnings: {tally.warn_count} products outside expected ranges")
+
+    if tally.ean_dropped:
+        print(
+            f"  Cross-category EAN dedup: {len(tally.ean_dropped)} product(s) removed"
+            " (EAN already in another category)"
+        )
+        for dp in tally.ean_dropped:
             print(f"    ✗ {dp.get('brand', '?')} / {dp.get('product_name', '?')} (EAN {dp.get('ean', '?')})")
 
     # Anomaly report — blocked products with absolute cap violations
-    if blocked:
+    if tally.blocked:
         print()
-        print(f"  ANOMALY REPORT — {len(blocked)} product(s) blocked:")
-        for bp in blocked:
+        print(f"  ANOMALY REPORT — {len(tally.blocked)} product(s) blocked:")
+        for bp in tally.blocked:
             name = bp.get("product_name", "unknown")
             brand = bp.get("brand", "unknown")
             errors = bp.get("anomaly_errors", [])
@@ -271,25 +827,69 @@ def run_pipeline(
                 print(f"    ✗ {brand} / {name}: {err}")
         print()
 
-    if not unique:
+    stats = {
+        "products": len(selected),
+        "raw_products": memo.total,
+        "unchanged_products": memo.unchanged,
+        "sql_regenerated": False,
+    }
+
+    if not selected:
         print("\nNo valid products found after extraction/validation/dedup.")
         print("  This may mean the OFF API returned too few results or the")
         print("  category terms need expanding.  Try increasing --max-products.")
-        sys.exit(0)
+        return stats
 
-    # Sort by market relevance (highest score first)
-    unique.sort(key=lambda p: market_score(p, country), reverse=True)
-    unique = unique[:max_products]
-
-    if len(unique) < max_products:
+    if len(selected) < max_products:
         print(
-            f"  NOTE: Only {len(unique)} of {max_products} requested products"
+            f"  NOTE: Only {len(selected)} of {max_products} requested products"
             f" passed validation.  SQL will be generated for what we have."
         )
     print()
 
-    # 5. Generate SQL
-    _generate_sql_output(category, unique, output_dir, dry_run, country, batch_size)
+    if diff and not dry_run:
+        # Against the last applied generation (the folder's promoted snapshot).
+        delta = sql_generator.generate_delta(category, selected, output_dir, country=country, compress=compress)
+        stats["delta"] = delta.summary()
+        baseline = "previous generation" if delta.had_snapshot else "no previous snapshot — all new"
+        print(
+            f"Delta vs {baseline}: {delta.new} new, {delta.changed} changed, {delta.removed} removed, "
+            f"{delta.unchanged} unchanged"
+        )
+        print(
+            f"  ~{delta.rows_delta:,} row writes instead of ~{delta.rows_full:,} for a full refresh "
+            f"({delta.reduction:.0%} fewer) -> {delta.path.name}"
+        )
+
+    # 5. Generate SQL — skipped when the selected products are all unchanged
+    cache = memo.cache
+    digest = (
+        None
+        if dry_run or cache is None
+        else _generation_digest(category, selected, country, batch_size, output_format, compress)
+    )
+    if digest is not None and digest == cache.generation_digest(output_dir) and any(
+        Path(output_dir).glob("PIPELINE__*.sql*")
+    ):
+        print(f"All {len(selected)} products unchanged since the last generation — SQL in {output_dir} is current.")
+        return stats
+
+    _generate_sql_output(category, selected, str(output_dir), dry_run, country, batch_size, output_format, compress)
+    stats["sql_regenerated"] = not dry_run
+    if not dry_run:
+        ean_registry.folder_written(output_dir)
+    if digest is not None:
+        cache.set_generation_digest(output_dir, digest)
+    return stats
+
+
+def _size_label(name: str, products: list[dict]) -> str:
+    """Row count shown next to a single (unbatched) products, nutrition or payload file."""
+    if sql_generator.COPY_PAYLOAD_STEP in name or "__01_insert_products" in name:
+        return f" ({len(products)} products)"
+    if "__03_add_nutrition" in name:
+        return f" ({len(products)} nutrition rows)"
+    return ""
 
 
 def _generate_sql_output(
@@ -299,37 +899,39 @@ def _generate_sql_output(
     dry_run: bool,
     country: str = "PL",
     batch_size: int = BATCH_SIZE,
+    output_format: str = "sql",
+    compress: bool = False,
 ) -> None:
     """Phase 5: generate SQL files or print dry-run summary."""
     slug = _slug(category)
-    use_batching = batch_size > 0 and len(products) > batch_size
 
     if dry_run:
-        if use_batching:
+        names = sql_generator.pipeline_file_names(
+            Path(output_dir).name, products, country, batch_size, output_format, compress
+        )
+        if output_format == "copy":
+            print("[DRY RUN] Would generate COPY payload and driver in:", output_dir)
+        elif batch_size > 0 and len(products) > batch_size:
             n_batches = math.ceil(len(products) / batch_size)
             print(f"[DRY RUN] Would generate batched SQL ({n_batches} batches of {batch_size}) in: {output_dir}")
-            for i in range(1, n_batches + 1):
-                print(f"  PIPELINE__{slug}__01_batch_{i:03d}_insert_products.sql")
-            for i in range(1, n_batches + 1):
-                print(f"  PIPELINE__{slug}__03_batch_{i:03d}_add_nutrition.sql")
         else:
             print("[DRY RUN] Would generate SQL files in:", output_dir)
-            print(f"  PIPELINE__{slug}__01_insert_products.sql ({len(products)} products)")
-            print(f"  PIPELINE__{slug}__03_add_nutrition.sql ({len(products)} nutrition rows)")
-        print(f"  PIPELINE__{slug}__04_scoring.sql")
-        print(f"  PIPELINE__{slug}__05_source_provenance.sql")
-        print(f"  PIPELINE__{slug}__06_add_images.sql")
+        for name in names:
+            print(f"  {name}{_size_label(name, products)}")
         return
 
     print("Generating SQL files...")
-    files = generate_pipeline(category, products, output_dir, country=country, batch_size=batch_size)
+    files = generate_pipeline(
+        category,
+        products,
+        output_dir,
+        country=country,
+        batch_size=batch_size,
+        output_format=output_format,
+        compress=compress,
+    )
     for f in files:
-        size_label = ""
-        if "01_insert" in f.name or "01_batch" in f.name:
-            size_label = f" ({len(products)} products)" if "01_insert" in f.name else ""
-        elif "03_add_nutrition" in f.name:
-            size_label = f" ({len(products)} nutrition rows)"
-        print(f"  OK {f.name}{size_label}")
+        print(f"  OK {f.name}{_size_label(f.name, products)}")
 
     print()
     print("Pipeline ready! Run with:")
@@ -341,6 +943,36 @@ def _generate_sql_output(
 # ---------------------------------------------------------------------------
 
 
+def collect_eans(eans: str | None = None, ean_file: str | Path | None = None) -> list[str]:
+    """The EAN list of an EAN-list run: comma-separated *eans*, then *ean_file*.
+
+    The file holds one EAN per line; blank lines and ``#`` comments are
+    ignored.  Values that are not 8 or 13 digits are dropped with a
+    warning.  Exits when *ean_file* does not exist.
+    """
+    ean_list: list[str] = []
+    if eans:
+        ean_list.extend(e.strip() for e in eans.split(",") if e.strip())
+    if ean_file:
+        ean_path = Path(ean_file)
+        if not ean_path.exists():
+            print(f"ERROR: EAN file not found: {ean_path}")
+            sys.exit(1)
+        for line in ean_path.read_text(encoding="utf-8").splitlines():
+            clean = line.strip()
+            if clean and not clean.startswith("#"):
+                ean_list.append(clean)
+
+    invalid = [e for e in ean_list if not e.isdigit() or len(e) not in (8, 13)]
+    if invalid:
+        print(
+            f"WARNING: Skipping {len(invalid)} invalid EANs: "
+            f"{', '.join(invalid[:5])}{'...' if len(invalid) > 5 else ''}"
+        )
+        ean_list = [e for e in ean_list if e.isdigit() and len(e) in (8, 13)]
+    return ean_list
+
+
 def main() -> None:
     """Parse arguments and run the pipeline."""
     parser = argparse.ArgumentParser(
@@ -354,8 +986,8 @@ def main() -> None:
     parser.add_argument(
         "--max-products",
         type=int,
-        default=30,
-        help="Maximum products to include (default: 30)",
+        default=None,
+        help="Maximum products to include (default: 30, or every EAN of an EAN-list run)",
     )
     parser.add_argument(
         "--output-dir",
@@ -390,23 +1022,80 @@ def main() -> None:
         default=BATCH_SIZE,
         help=f"Max products per batch SQL file (default: {BATCH_SIZE}). 0 = no batching.",
     )
+    parser.add_argument(
+        "--format",
+        choices=sql_generator.OUTPUT_FORMATS,
+        default="sql",
+        help="Output format: per-step SQL files, or a CSV payload + COPY driver (default: sql)",
+    )
+    parser.add_argument(
+        "--gzip",
+        action="store_true",
+        help="Write the SQL/CSV files gzip-compressed (*.sql.gz, *.csv.gz)",
+    )
+    parser.add_argument(
+        "--diff",
+        action="store_true",
+        help="Also write DELTA__<slug>__changes.sql: only what changed since the previous generation",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Concurrent OFF fetch threads (default: 1 = serial)",
+    )
+    parser.add_argument(
+        "--rps",
+        type=float,
+        default=None,
+        help=f"Global OFF requests/second budget when --workers > 1 (default: {DEFAULT_RPS:g})",
+    )
+    source = parser.add_argument_group("acquisition (default: search the category's OFF tags and terms)")
+    source.add_argument("--eans", default=None, help="Comma-separated EAN barcodes to fetch")
+    source.add_argument("--ean-file", default=None, help="Text file with one EAN barcode per line")
+    source.add_argument(
+        "--off-tag",
+        action="append",
+        default=None,
+        help="OFF category tag to search instead of the category's own (e.g. en:chips); repeatable",
+    )
 
+    add_cache_arguments(parser)
     args = parser.parse_args()
+    configure_from_args(parser, args)
 
     logging.basicConfig(
         level=logging.INFO,
         format="%(levelname)s: %(message)s",
     )
 
+    eans = None
+    if args.eans or args.ean_file:
+        eans = collect_eans(args.eans, args.ean_file)
+        if not eans:
+            print("ERROR: No valid EANs to fetch.")
+            sys.exit(1)
+    max_products = args.max_products
+    if max_products is None:
+        # An EAN list is fetched whole; a search adds the usual 30 on top.
+        max_products = (len(eans) if eans else 0) + (30 if args.off_tag or not eans else 0)
+
     run_pipeline(
         category=args.category,
-        max_products=args.max_products,
+        max_products=max_products,
         output_dir=args.output_dir,
         dry_run=args.dry_run,
         min_completeness=args.min_completeness,
         max_warnings=args.max_warnings,
         country=args.country.upper(),
         batch_size=args.batch_size,
+        output_format=args.format,
+        compress=args.gzip,
+        diff=args.diff,
+        workers=args.workers,
+        rps=args.rps,
+        eans=eans,
+        off_tags=args.off_tag,
     )
 
 
@@ -8,19 +8,50 @@ Generates the 6-file SQL pattern used by every category pipeline:
 4. ``PIPELINE__{cat}__05_source_provenance.sql``
 5. ``PIPELINE__{cat}__06_add_images.sql``
 6. ``PIPELINE__{cat}__07_store_availability.sql``
+
+With ``output_format="copy"`` the folder instead holds a CSV payload
+(``PIPELINE__{cat}__00_copy_payload.csv``) and one driver,
+``PIPELINE__{cat}__01_copy_load.sql``, that ``\\copy``-loads the payload into
+a temp staging table and runs the same six steps as set-based statements.
+
+Categories larger than ``batch_size`` get every step split into
+``PIPELINE__{cat}__{NN}_batch_{nnn}_{step}.sql`` files instead.
+
+:func:`generate_delta` writes ``DELTA__{cat}__changes.sql`` instead: only
+the statements that take the last applied generation (recorded per product
+in the folder's ``.snapshot.json``) to the new product set.
 """
 
 from __future__ import annotations
 
+import csv
 import datetime
 import hashlib
+import json
+import re
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from dataclasses import dataclass, field, fields
+from itertools import islice
 from pathlib import Path
+from typing import Any
+
+from pipeline.utils import COLUMN_SEP, open_text, replace_column, write_atomic
 
 # ---------------------------------------------------------------------------
 # Helpers
 # ---------------------------------------------------------------------------
 
 
+# Curly single quotes become apostrophes, then apostrophes are doubled.
+_QUOTE_ESCAPES = (("\u2019", "'"), ("\u2018", "'"), ("'", "''"))
+
+# The leading number of a cell ("12.5 g" → "12.5"); the column form matches
+# one whole ``COLUMN_SEP``-terminated cell and captures its number.
+_NUMBER_RE = re.compile(r"[0-9.\-]+")
+_NUMBER_CELL_RE = re.compile(rf"[^0-9.\-{COLUMN_SEP}]*([0-9.\-]*)[^{COLUMN_SEP}]*{COLUMN_SEP}")
+_NOT_A_NUMBER = {"": "null", ".": "null", "-": "null", "-.": "null"}
+
+
 def _sql_text(value: str | None) -> str:
     """Wrap a value in single quotes, escaping internal apostrophes.
 
@@ -31,9 +62,17 @@ def _sql_text(value: str | None) -> str:
     if value is None:
         return "null"
     s = str(value)
-    # Normalise Unicode curly single-quotes to ASCII apostrophe
-    s = s.replace("\u2019", "'").replace("\u2018", "'")
-    return "'" + s.replace("'", "''") + "'"
+    for old, new in _QUOTE_ESCAPES:
+        s = s.replace(old, new)
+    return "'" + s + "'"
+
+
+def _sql_texts(values: Sequence[str | None]) -> list[str]:
+    """:func:`_sql_text` over a whole column, escaped in one pass."""
+    literals = replace_column(["" if v is None else str(v) for v in values], _QUOTE_ESCAPES, "'", "'")
+    if None in values:
+        literals = ["null" if v is None else lit for v, lit in zip(values, literals, strict=True)]
+    return literals
 
 
 def _sql_num(value: str | float | int | None) -> str:
@@ -44,19 +83,19 @@ def _sql_num(value: str | float | int | None) -> str:
     """
     if value is None:
         return "null"
-    s = str(value).strip()
-    if not s:
-        return "null"
-    # Strip trailing units / whitespace
-    cleaned = ""
-    for ch in s:
-        if ch in "0123456789.-":
-            cleaned += ch
-        elif cleaned:
-            break
-    if not cleaned or cleaned in (".", "-", "-."):
+    match = _NUMBER_RE.search(str(value))
+    if match is None:
         return "null"
-    return cleaned
+    return _NOT_A_NUMBER.get(match.group(), match.group())
+
+
+def _sql_nums(values: Sequence[str | float | int | None]) -> list[str]:
+    """:func:`_sql_num` over a whole column, matched in one regex pass."""
+    cells = ["" if v is None else str(v) for v in values]
+    joined = COLUMN_SEP.join(cells) + COLUMN_SEP
+    if joined.count(COLUMN_SEP) != len(cells):  # a cell contains the separator
+        return [_sql_num(v) for v in values]
+    return [_NOT_A_NUMBER.get(n, n) for n in _NUMBER_CELL_RE.findall(joined)]
 
 
 def _sql_null_or_text(value: str | None) -> str:
@@ -153,52 +192,266 @@ def _extract_stores(raw: str | None, country: str = "PL") -> list[str]:
 
 
 # ---------------------------------------------------------------------------
-# Individual file generators
+# Columnar product batch
 # ---------------------------------------------------------------------------
 
+_NUTRITION_KEYS = (
+    "calories",
+    "total_fat_g",
+    "saturated_fat_g",
+    "trans_fat_g",
+    "carbs_g",
+    "sugars_g",
+    "fibre_g",
+    "protein_g",
+    "salt_g",
+)
+
+# OFF image key → (image_type, alt-text label); the file 06 image rows.
+_IMAGE_TYPES = (
+    ("image_front_url", "front", "Front"),
+    ("image_ingredients_url", "ingredients", "Ingredients"),
+    ("image_nutrition_url", "nutrition_label", "Nutrition Label"),
+)
+
+# Products escaped per pass in _Columns.from_products: the column-wise
+# escapers build joined temporaries several times a column's size.
+_SLAB_ROWS = 10_000
+
+
+@dataclass
+class _Columns:
+    """A product batch escaped once, as parallel columns of SQL literals.
+
+    Every step file is built from these columns instead of re-escaping
+    the product dicts per step; :meth:`slice` gives the rows of one
+    batch file.
+    """
 
-def _gen_01_insert_products(category: str, products: list[dict], today: str, country: str = "PL") -> str:
-    """Generate file 01 — insert_products.sql."""
-    lines: list[str] = []
-
-    # Values rows
-    for i, p in enumerate(products):
-        brand = _sql_text(p["brand"])
-        name = _sql_text(p["product_name"])
-        ean = _sql_text(p.get("ean") or "")
-        product_type = _sql_text(p.get("product_type", "Grocery"))
-        prep = _sql_null_or_text(p.get("prep_method"))
-        store = _sql_null_or_text(_normalize_store(p.get("store_availability")))
-        controversies = _sql_text(p.get("controversies", "none"))
-
-        comma = "," if i < len(products) - 1 else ""
-        lines.append(
-            f"  ({_sql_text(country)}, {brand}, {product_type}, {_sql_text(category)}, "
-            f"{name}, {prep}, {store}, {controversies}, {ean}){comma}"
+    brand: list[str] = field(default_factory=list)
+    name: list[str] = field(default_factory=list)
+    key: list[str] = field(default_factory=list)  # "brand, name" — the join key in files 03-07
+    ean: list[str] = field(default_factory=list)  # '' when the product has no EAN
+    has_ean: list[bool] = field(default_factory=list)
+    product_type: list[str] = field(default_factory=list)
+    prep_method: list[str] = field(default_factory=list)
+    store: list[str] = field(default_factory=list)  # primary chain (products.store_availability)
+    controversies: list[str] = field(default_factory=list)
+    nutrition: list[str] = field(default_factory=list)  # the nine nutrient literals, comma-joined
+    nutri_score: list[str] = field(default_factory=list)
+    nova: list[str] = field(default_factory=list)
+    provenance: list[str] = field(default_factory=list)  # "source_url, source_ean"
+    images: list[str] = field(default_factory=list)  # the product's file 06 rows, "" when none
+    stores: list[list[str]] = field(default_factory=list)  # chain literals for file 07
+    identity_key: list[str] = field(default_factory=list)
+
+    @classmethod
+    def from_products(cls, products: list[dict], country: str) -> _Columns:
+        """Escape *products* a slab at a time, so only one slab's temporaries are alive."""
+        if len(products) <= _SLAB_ROWS:
+            return cls._from_slab(products, country)
+        cols = cls()
+        for start in range(0, len(products), _SLAB_ROWS):
+            slab = cls._from_slab(products[start : start + _SLAB_ROWS], country)
+            for f in fields(cls):
+                getattr(cols, f.name).extend(getattr(slab, f.name))
+        return cols
+
+    @classmethod
+    def _from_slab(cls, products: list[dict], country: str) -> _Columns:
+        brands = _sql_texts([p["brand"] for p in products])
+        names = _sql_texts([p["product_name"] for p in products])
+        keys = [f"{brand}, {name}" for brand, name in zip(brands, names, strict=True)]
+        eans = [p.get("ean") or "" for p in products]
+        ean_literals = _sql_texts(eans)
+
+        # Low-cardinality fields (product type, labels, store strings …)
+        # are escaped once per distinct value and the literal is shared.
+        literals: dict[tuple, str] = {}
+        chains: dict[str | None, tuple[str, list[str]]] = {}
+        for raw in {p.get("store_availability") for p in products}:
+            chains[raw] = (_sql_null_or_text(_normalize_store(raw)), _sql_texts(_extract_stores(raw, country)))
+        novas = [p.get("nova_classification") or "" for p in products]
+
+        nutrient_columns = [_sql_nums([p[k] for p in products]) for k in _NUTRITION_KEYS]
+        source_urls = _sql_texts([f"https://world.openfoodfacts.org/product/{ean}" for ean in eans])
+
+        return cls(
+            brand=brands,
+            name=names,
+            key=keys,
+            ean=ean_literals,
+            has_ean=[bool(ean) for ean in eans],
+            product_type=[_literal(literals, _sql_text, p.get("product_type", "Grocery")) for p in products],
+            prep_method=[_literal(literals, _sql_null_or_text, p.get("prep_method")) for p in products],
+            store=[chains[p.get("store_availability")][0] for p in products],
+            controversies=[_literal(literals, _sql_text, p.get("controversies", "none")) for p in products],
+            nutrition=[", ".join(values) for values in zip(*nutrient_columns, strict=True)],
+            nutri_score=[_literal(literals, _sql_null_or_text, p.get("nutri_score_label")) for p in products],
+            nova=[_literal(literals, _sql_text, nova if nova in ("1", "2", "3", "4") else "4") for nova in novas],
+            provenance=[
+                f"{url}, {ean_literal}" if ean else "null, null"
+                for ean, url, ean_literal in zip(eans, source_urls, ean_literals, strict=True)
+            ],
+            images=_image_rows(products, eans, keys),
+            stores=[chains[p.get("store_availability")][1] for p in products],
+            identity_key=[_identity_key(p["brand"], p["product_name"]) for p in products],
         )
 
-    values_block = "\n".join(lines)
+    def __len__(self) -> int:
+        return len(self.key)
+
+    def slice(self, start: int, end: int) -> _Columns:
+        """Rows ``start:end`` as a new batch."""
+        return _Columns(**{f.name: getattr(self, f.name)[start:end] for f in fields(self)})
+
+    def take(self, indices: Sequence[int]) -> _Columns:
+        """The rows at *indices*, in that order, as a new batch."""
+        return _Columns(**{f.name: [getattr(self, f.name)[i] for i in indices] for f in fields(self)})
+
+
+def _literal(cache: dict[tuple, str], to_sql: Callable[[Any], str], value: Any) -> str:
+    """``to_sql(value)``, memoised in *cache*."""
+    try:
+        return cache[to_sql, value]
+    except KeyError:
+        literal = cache[to_sql, value] = to_sql(value)
+        return literal
+    except TypeError:  # unhashable value
+        return to_sql(value)
+
+
+def _image_rows(products: list[dict], eans: list[str], keys: list[str]) -> list[str]:
+    """Each product's file 06 rows (its https images, comma-joined; "" when none)."""
+    rows: list[list[str]] = [[] for _ in products]
+    for off_key, image_type, label in _IMAGE_TYPES:
+        with_image = [
+            i
+            for i, (p, ean) in enumerate(zip(products, eans, strict=True))
+            if ean and (p.get(off_key) or "").startswith("https://")
+        ]
+        urls = _sql_texts([products[i][off_key] for i in with_image])
+        alts = _sql_texts([f"{label} — EAN {eans[i]}" for i in with_image])
+        off_ids = _sql_texts([f"{image_type}_{eans[i]}" for i in with_image])
+        image_type_literal = _sql_text(image_type)
+        is_primary = "true" if image_type == "front" else "false"
+        for i, url, alt, off_id in zip(with_image, urls, alts, off_ids, strict=True):
+            rows[i].append(f"    ({keys[i]}, {url}, 'off_api', {image_type_literal}, {is_primary}, {alt}, {off_id})")
+    return [",\n".join(product_rows) for product_rows in rows]
+
+
+# Rows per chunk yielded by the file generators: big enough that writes are
+# cheap, small enough that no file is ever held in memory whole.
+_CHUNK_ITEMS = 1000
+
+
+def _joined(items: Iterable[str], sep: str = ",\n") -> Iterator[str]:
+    """``sep.join(items)``, yielded a chunk of :data:`_CHUNK_ITEMS` items at a time."""
+    it = iter(items)
+    chunk = sep.join(islice(it, _CHUNK_ITEMS))
+    if not chunk:
+        return
+    yield chunk
+    while chunk := sep.join(islice(it, _CHUNK_ITEMS)):
+        yield sep + chunk
+
+
+def _insert_values(cols: _Columns, country: str, category: str) -> Iterator[str]:
+    """The ``values`` rows of the step 01 insert."""
+    c, k = _sql_text(country), _sql_text(category)
+    return _joined(
+        f"  ({c}, {brand}, {product_type}, {k}, {name}, {prep}, {store}, {controversies}, {ean})"
+        for brand, product_type, name, prep, store, controversies, ean in zip(
+            cols.brand,
+            cols.product_type,
+            cols.name,
+            cols.prep_method,
+            cols.store,
+            cols.controversies,
+            cols.ean,
+            strict=True,
+        )
+    )
 
-    # Product names for deprecation block
-    name_literals = ", ".join(_sql_text(p["product_name"]) for p in products)
+
+def _keyed_values(cols: _Columns, column: list[str]) -> Iterator[str]:
+    """``(brand, name, <column>)`` rows, one per product."""
+    return _joined(f"    ({key}, {value})" for key, value in zip(cols.key, column, strict=True))
+
+
+def _release_eans(cols: _Columns) -> list[str]:
+    """Literals of the batch's EANs (empty when none)."""
+    return [ean for ean, has_ean in zip(cols.ean, cols.has_ean, strict=True) if has_ean]
+
+
+def _identity_keys(cols: _Columns) -> Iterator[str]:
+    return _joined((f"'{key}'" for key in sorted(set(cols.identity_key))), ", ")
+
+
+def _deprecate_removed(category: str, cols: _Columns, country: str) -> Iterator[str]:
+    """Step 01's postscript: deprecate the category's products that are not in *cols*.
+
+    An anti-join on ``identity_key`` against the batch's keys as a
+    ``VALUES`` list, which Postgres hashes once, rather than a
+    ``product_name not in (…)`` list compared row by row — and which,
+    unlike the name list, tells two brands' same-named products apart.
+    """
+    yield f"""
+-- 2. DEPRECATE removed products (anti-join on identity_key)
+update products p
+set is_deprecated = true, deprecated_reason = 'Removed from pipeline batch'
+where p.country = {_sql_text(country)} and p.category = {_sql_text(category)}
+  and p.is_deprecated is not true
+  and not exists (
+    select 1
+    from (
+      values
+"""
+    yield from _joined(f"        ('{key}')" for key in sorted(set(cols.identity_key)))
+    yield """
+    ) as k(identity_key)
+    where k.identity_key = p.identity_key
+  );
+"""
+
+
+# ---------------------------------------------------------------------------
+# Individual file generators
+#
+# Each generator yields its file as a sequence of text chunks, which
+# generate_pipeline streams to disk without building the whole file.
+# ---------------------------------------------------------------------------
+
+
+def _gen_01_insert_products(category: str, cols: _Columns, today: str, country: str = "PL") -> Iterator[str]:
+    """Generate file 01 — insert_products.sql."""
+    yield f"""\
+-- PIPELINE ({category}): insert products
+-- Source: Open Food Facts API (automated pipeline)
+-- Generated: {today}
+
+-- 0a. DEPRECATE old products in this category & release their EANs
+update products
+set is_deprecated = true, deprecated_reason = 'Replaced by pipeline refresh', ean = null
+where country = {_sql_text(country)}
+  and category = {_sql_text(category)}
+  and is_deprecated is not true;
+"""
 
     # EAN list for cross-category release
-    eans_with_values = [p.get("ean", "") for p in products if p.get("ean")]
-    ean_release_block = ""
-    if eans_with_values:
-        ean_literals = ", ".join(_sql_text(e) for e in eans_with_values)
-        ean_release_block = f"""
+    ean_literals = _release_eans(cols)
+    if ean_literals:
+        yield """
 -- 0b. Release EANs across ALL categories to prevent unique constraint conflicts
 update products set ean = null
-where ean in ({ean_literals})
+where ean in ("""
+        yield from _joined(ean_literals, ", ")
+        yield """)
   and ean is not null;
 """
 
     # Identity-key list for cross-category conflict deprecation
-    identity_keys = [_identity_key(p["brand"], p["product_name"]) for p in products]
-    unique_keys = sorted(set(identity_keys))
-    key_literals = ", ".join(_sql_text(k) for k in unique_keys)
-    identity_key_block = f"""
+    yield f"""
 -- 0c. Deprecate cross-category products whose identity_key collides with this batch
 update products
 set is_deprecated = true,
@@ -206,26 +459,17 @@ set is_deprecated = true,
     ean = null
 where country = {_sql_text(country)}
   and category != {_sql_text(category)}
-  and identity_key in ({key_literals})
+  and identity_key in ("""
+    yield from _identity_keys(cols)
+    yield """)
   and is_deprecated is not true;
-"""
-
-    return f"""\
--- PIPELINE ({category}): insert products
--- Source: Open Food Facts API (automated pipeline)
--- Generated: {today}
 
--- 0a. DEPRECATE old products in this category & release their EANs
-update products
-set is_deprecated = true, deprecated_reason = 'Replaced by pipeline refresh', ean = null
-where country = {_sql_text(country)}
-  and category = {_sql_text(category)}
-  and is_deprecated is not true;
-{ean_release_block}{identity_key_block}
 -- 1. INSERT products
 insert into products (country, brand, product_type, category, product_name, prep_method, store_availability, controversies, ean)
 values
-{values_block}
+"""
+    yield from _insert_values(cols, country, category)
+    yield """
 on conflict (country, brand, product_name) do update set
   category = excluded.category,
   ean = excluded.ean,
@@ -234,42 +478,13 @@ on conflict (country, brand, product_name) do update set
   controversies = excluded.controversies,
   prep_method = excluded.prep_method,
   is_deprecated = false;
-
--- 2. DEPRECATE removed products
-update products
-set is_deprecated = true, deprecated_reason = 'Removed from pipeline batch'
-where country = {_sql_text(country)} and category = {_sql_text(category)}
-  and is_deprecated is not true
-  and product_name not in ({name_literals});
 """
+    yield from _deprecate_removed(category, cols, country)
 
 
-def _gen_03_add_nutrition(category: str, products: list[dict], country: str = "PL") -> str:
+def _gen_03_add_nutrition(category: str, cols: _Columns, country: str = "PL") -> Iterator[str]:
     """Generate file 03 — add_nutrition.sql."""
-    nutrition_lines: list[str] = []
-    for i, p in enumerate(products):
-        brand = _sql_text(p["brand"])
-        name = _sql_text(p["product_name"])
-        vals = ", ".join(
-            _sql_num(p[k])
-            for k in (
-                "calories",
-                "total_fat_g",
-                "saturated_fat_g",
-                "trans_fat_g",
-                "carbs_g",
-                "sugars_g",
-                "fibre_g",
-                "protein_g",
-                "salt_g",
-            )
-        )
-        comma = "," if i < len(products) - 1 else ""
-        nutrition_lines.append(f"    ({brand}, {name}, {vals}){comma}")
-
-    nutrition_block = "\n".join(nutrition_lines)
-
-    return f"""\
+    yield f"""\
 -- PIPELINE ({category}): add nutrition facts
 -- Source: Open Food Facts verified per-100g data
 
@@ -283,6 +498,13 @@ where product_id in (
 );
 
 -- 2) Insert
+{_NUTRITION_INSERT_HEAD}"""
+    yield from _keyed_values(cols, cols.nutrition)
+    yield _nutrition_insert_tail(category, country)
+
+
+# The nutrition upsert around its values rows (files 03 and 03_batch_*).
+_NUTRITION_INSERT_HEAD = """\
 insert into nutrition_facts
   (product_id, calories, total_fat_g, saturated_fat_g, trans_fat_g,
    carbs_g, sugars_g, fibre_g, protein_g, salt_g)
@@ -292,7 +514,11 @@ select
   d.carbs_g, d.sugars_g, d.fibre_g, d.protein_g, d.salt_g
 from (
   values
-{nutrition_block}
+"""
+
+
+def _nutrition_insert_tail(category: str, country: str) -> str:
+    return f"""
 ) as d(brand, product_name, calories, total_fat_g, saturated_fat_g, trans_fat_g,
        carbs_g, sugars_g, fibre_g, protein_g, salt_g)
 join products p on p.country = {_sql_text(country)} and p.brand = d.brand and p.product_name = d.product_name
@@ -310,45 +536,24 @@ on conflict (product_id) do update set
 """
 
 
-def _gen_04_scoring(category: str, products: list[dict], today: str, country: str = "PL") -> str:
-    """Generate file 04 — scoring.sql."""
-
-    # (additives_count and ingredients_raw are now derived from
-    #  product_ingredient + ingredient_ref junction at query time;
-    #  no INSERT/UPDATE to ingredients table needed.)
-
-    # Nutri-Score values
-    ns_lines: list[str] = []
-    for i, p in enumerate(products):
-        ns = p.get("nutri_score_label")
-        comma = "," if i < len(products) - 1 else ""
-        ns_lines.append(
-            f"    ({_sql_text(p['brand'])}, {_sql_text(p['product_name'])}, {_sql_null_or_text(ns)}){comma}"
-        )
-    nutriscore_block = "\n".join(ns_lines)
-
-    # NOVA values
-    nova_lines: list[str] = []
-    for i, p in enumerate(products):
-        nova_raw = p.get("nova_classification") or ""
-        nova = nova_raw if nova_raw in ("1", "2", "3", "4") else "4"
-        comma = "," if i < len(products) - 1 else ""
-        nova_lines.append(f"    ({_sql_text(p['brand'])}, {_sql_text(p['product_name'])}, {_sql_text(nova)}){comma}")
-    nova_block = "\n".join(nova_lines)
-
-    scoring_sql = f"""\
--- PIPELINE ({category}): scoring
--- Generated: {today}
-
--- 2. Nutri-Score
+def _label_update(cols: _Columns, column: list[str], target: str, alias: str, country: str) -> Iterator[str]:
+    """``update products`` setting *target* from *column*, joined on brand and name (file 04)."""
+    yield f"""\
 update products p set
-  nutri_score_label = d.ns
+  {target} = d.{alias}
 from (
   values
-{nutriscore_block}
-) as d(brand, product_name, ns)
+"""
+    yield from _keyed_values(cols, column)
+    yield f"""
+) as d(brand, product_name, {alias})
 where p.country = {_sql_text(country)} and p.brand = d.brand and p.product_name = d.product_name;
+"""
+
 
+def _nutri_score_source(category: str, country: str) -> str:
+    """Step 04's category-wide Nutri-Score source derivation (after every label is set)."""
+    return f"""\
 -- 2b. Nutri-Score source provenance (derived from label)
 update products p set
   nutri_score_source = case
@@ -360,62 +565,52 @@ update products p set
 where p.country = {_sql_text(country)}
   and p.category = {_sql_text(category)}
   and p.is_deprecated is not true;
+"""
 
--- 3. NOVA classification
-update products p set
-  nova_classification = d.nova
-from (
-  values
-{nova_block}
-) as d(brand, product_name, nova)
-where p.country = {_sql_text(country)} and p.brand = d.brand and p.product_name = d.product_name;
 
+def _score_call(category: str, country: str) -> str:
+    return f"""\
 -- 0/1/4/5. Score category (concern defaults, unhealthiness, flags, confidence)
 CALL score_category({_sql_text(category)}, 100, {_sql_text(country)});
 """
 
-    return scoring_sql
 
+def _gen_04_scoring(category: str, cols: _Columns, today: str, country: str = "PL") -> Iterator[str]:
+    """Generate file 04 — scoring.sql."""
 
-def _gen_05_source_provenance(category: str, products: list[dict], today: str, country: str = "PL") -> str:
-    """Generate file 05 — source provenance.
-
-    Updates ``products`` with source URL, EAN, and type for every
-    product in the category.
-    """
-    # Build (brand, product_name, ean, source_url) values
-    prov_lines: list[str] = []
-
-    for i, p in enumerate(products):
-        brand = _sql_text(p["brand"])
-        name = _sql_text(p["product_name"])
-        ean = p.get("ean") or ""
-        comma = "," if i < len(products) - 1 else ""
-
-        # Source URL: if we have an EAN, link to the OFF product page
-        if ean:
-            source_url = _sql_text(f"https://world.openfoodfacts.org/product/{ean}")
-            source_ean = _sql_text(ean)
-        else:
-            source_url = "null"
-            source_ean = "null"
+    # (additives_count and ingredients_raw are now derived from
+    #  product_ingredient + ingredient_ref junction at query time;
+    #  no INSERT/UPDATE to ingredients table needed.)
 
-        prov_lines.append(f"    ({brand}, {name}, {source_url}, {source_ean}){comma}")
+    yield f"""\
+-- PIPELINE ({category}): scoring
+-- Generated: {today}
 
-    prov_block = "\n".join(prov_lines)
+-- 2. Nutri-Score
+"""
+    yield from _label_update(cols, cols.nutri_score, "nutri_score_label", "ns", country)
+    yield "\n"
+    yield _nutri_score_source(category, country)
+    yield """
+-- 3. NOVA classification
+"""
+    yield from _label_update(cols, cols.nova, "nova_classification", "nova", country)
+    yield "\n"
+    yield _score_call(category, country)
 
-    return f"""\
--- PIPELINE ({category}): source provenance
--- Generated: {today}
 
--- 1. Update source info on products
+def _provenance_update(category: str, cols: _Columns, country: str) -> Iterator[str]:
+    """File 05's source-info ``UPDATE`` for the products in *cols*."""
+    yield """\
 UPDATE products p SET
   source_type = 'off_api',
   source_url = d.source_url,
   source_ean = d.source_ean
 FROM (
   VALUES
-{prov_block}
+"""
+    yield from _keyed_values(cols, cols.provenance)
+    yield f"""
 ) AS d(brand, product_name, source_url, source_ean)
 WHERE p.country = {_sql_text(country)} AND p.brand = d.brand
   AND p.product_name = d.product_name
@@ -423,56 +618,32 @@ WHERE p.country = {_sql_text(country)} AND p.brand = d.brand
 """
 
 
-def _gen_06_add_images(category: str, products: list[dict], today: str, country: str = "PL") -> str:
-    """Generate file 06 — add product images.
+def _gen_05_source_provenance(category: str, cols: _Columns, today: str, country: str = "PL") -> Iterator[str]:
+    """Generate file 05 — source provenance.
 
-    Inserts image URLs from the OFF API into the ``product_images`` table.
-    Each product can have up to 3 images: front, ingredients, nutrition_label.
+    Updates ``products`` with source URL, EAN, and type for every
+    product in the category.
     """
-    # Gather products that have image URLs
-    image_rows: list[str] = []
-    for p in products:
-        ean = p.get("ean") or ""
-        if not ean:
-            continue
-
-        brand = _sql_text(p["brand"])
-        name = _sql_text(p["product_name"])
-
-        # Try each image type
-        for off_key, image_type in [
-            ("image_front_url", "front"),
-            ("image_ingredients_url", "ingredients"),
-            ("image_nutrition_url", "nutrition_label"),
-        ]:
-            url = p.get(off_key)
-            if not url or not url.startswith("https://"):
-                continue
-
-            is_primary = "true" if image_type == "front" else "false"
-            off_id = _sql_text(f"{image_type}_{ean}")
-            alt = _sql_text(f"{image_type.replace('_', ' ').title()} — EAN {ean}")
-
-            image_rows.append(
-                f"    ({brand}, {name}, {_sql_text(url)}, 'off_api', "
-                f"{_sql_text(image_type)}, {is_primary}, {alt}, {off_id})"
-            )
-
-    if not image_rows:
-        return f"""\
--- PIPELINE ({category}): add product images
+    yield f"""\
+-- PIPELINE ({category}): source provenance
 -- Generated: {today}
 
--- No product images available from OFF API for this category.
+-- 1. Update source info on products
 """
+    yield from _provenance_update(category, cols, country)
 
-    image_block = ",\n".join(image_rows)
 
+def _no_images(category: str, today: str) -> str:
     return f"""\
 -- PIPELINE ({category}): add product images
--- Source: Open Food Facts API image URLs
 -- Generated: {today}
 
+-- No product images available from OFF API for this category.
+"""
+
+
+def _images_delete(category: str, country: str) -> str:
+    return f"""\
 -- 1. Remove existing OFF images for this category
 DELETE FROM product_images
 WHERE source = 'off_api'
@@ -481,15 +652,21 @@ WHERE source = 'off_api'
     WHERE p.country = {_sql_text(country)} AND p.category = {_sql_text(category)}
       AND p.is_deprecated IS NOT TRUE
   );
+"""
 
--- 2. Insert images
+
+def _images_insert(category: str, cols: _Columns, country: str) -> Iterator[str]:
+    """File 06's image ``INSERT`` for the products in *cols* (which have images)."""
+    yield """\
 INSERT INTO product_images
   (product_id, url, source, image_type, is_primary, alt_text, off_image_id)
 SELECT
   p.product_id, d.url, d.source, d.image_type, d.is_primary, d.alt_text, d.off_image_id
 FROM (
   VALUES
-{image_block}
+"""
+    yield from _joined(rows for rows in cols.images if rows)
+    yield f"""
 ) AS d(brand, product_name, url, source, image_type, is_primary, alt_text, off_image_id)
 JOIN products p ON p.country = {_sql_text(country)} AND p.brand = d.brand AND p.product_name = d.product_name
   AND p.category = {_sql_text(category)} AND p.is_deprecated IS NOT TRUE
@@ -501,33 +678,41 @@ ON CONFLICT (off_image_id) WHERE off_image_id IS NOT NULL DO UPDATE SET
 """
 
 
-def _gen_07_store_availability(category: str, products: list[dict], today: str, country: str = "PL") -> str:
-    """Generate file 07 — store availability junction inserts."""
-    rows: list[str] = []
-    for p in products:
-        stores = _extract_stores(p.get("store_availability"), country)
-        if not stores:
-            continue
-        brand = _sql_text(p["brand"])
-        name = _sql_text(p["product_name"])
-        for store_name in stores:
-            rows.append(f"    ({brand}, {name}, {_sql_text(store_name)})")
+def _gen_06_add_images(category: str, cols: _Columns, today: str, country: str = "PL") -> Iterator[str]:
+    """Generate file 06 — add product images.
 
-    if not rows:
-        return f"""\
--- PIPELINE ({category}): store availability
+    Inserts image URLs from the OFF API into the ``product_images`` table.
+    Each product can have up to 3 images: front, ingredients, nutrition_label.
+    """
+    if not any(cols.images):
+        yield _no_images(category, today)
+        return
+
+    yield f"""\
+-- PIPELINE ({category}): add product images
+-- Source: Open Food Facts API image URLs
 -- Generated: {today}
 
--- No store availability data found for this category.
 """
+    yield _images_delete(category, country)
+    yield """
+-- 2. Insert images
+"""
+    yield from _images_insert(category, cols, country)
 
-    values_block = ",\n".join(rows)
 
+def _no_stores(category: str, today: str) -> str:
     return f"""\
 -- PIPELINE ({category}): store availability
--- Source: Open Food Facts API store field
 -- Generated: {today}
 
+-- No store availability data found for this category.
+"""
+
+
+def _stores_insert(category: str, cols: _Columns, country: str) -> Iterator[str]:
+    """File 07's junction ``INSERT`` for the products in *cols* (which have stores)."""
+    yield """\
 INSERT INTO product_store_availability (product_id, store_id, verified_at, source)
 SELECT
   p.product_id,
@@ -536,7 +721,11 @@ SELECT
   'pipeline'
 FROM (
   VALUES
-{values_block}
+"""
+    yield from _joined(
+        f"    ({key}, {store})" for key, stores in zip(cols.key, cols.stores, strict=True) for store in stores
+    )
+    yield f"""
 ) AS d(brand, product_name, store_name)
 JOIN products p ON p.country = {_sql_text(country)} AND p.brand = d.brand AND p.product_name = d.product_name
   AND p.category = {_sql_text(category)} AND p.is_deprecated IS NOT TRUE
@@ -545,12 +734,52 @@ ON CONFLICT (product_id, store_id) DO NOTHING;
 """
 
 
+def _gen_07_store_availability(category: str, cols: _Columns, today: str, country: str = "PL") -> Iterator[str]:
+    """Generate file 07 — store availability junction inserts."""
+    if not any(cols.stores):
+        yield _no_stores(category, today)
+        return
+
+    yield f"""\
+-- PIPELINE ({category}): store availability
+-- Source: Open Food Facts API store field
+-- Generated: {today}
+
+"""
+    yield from _stores_insert(category, cols, country)
+
+
 # ---------------------------------------------------------------------------
 # Batching support
 # ---------------------------------------------------------------------------
 
 BATCH_SIZE = 100
 
+# The per-step files of the SQL format, in apply order.
+PIPELINE_STEPS = (
+    "01_insert_products",
+    "03_add_nutrition",
+    "04_scoring",
+    "05_source_provenance",
+    "06_add_images",
+    "07_store_availability",
+)
+
+
+def _batch_file_name(step: str, batch_num: int) -> str:
+    """``01_insert_products`` → ``01_batch_{nnn}_insert_products.sql``."""
+    prefix, name = step.split("_", 1)
+    return f"{prefix}_batch_{batch_num:03d}_{name}.sql"
+
+
+def _unbatched_steps(cols: _Columns) -> set[str]:
+    """Steps written as their single explanatory file even when batching (no images / no stores)."""
+    return {
+        step
+        for step, present in (("06_add_images", any(cols.images)), ("07_store_availability", any(cols.stores)))
+        if not present
+    }
+
 
 def _chunk(items: list, size: int) -> list[list]:
     """Split *items* into chunks of at most *size* elements."""
@@ -559,50 +788,51 @@ def _chunk(items: list, size: int) -> list[list]:
 
 def _gen_01_batch(
     category: str,
-    batch_products: list[dict],
-    all_products: list[dict],
+    batch: _Columns,
+    all_cols: _Columns,
     today: str,
     country: str,
     batch_num: int,
     total_batches: int,
     batch_start: int,
     batch_end: int,
-) -> str:
+) -> Iterator[str]:
     """Generate one batch file for step 01 (insert products).
 
     Batch 1 includes preamble (deprecation, EAN release, cross-category).
     Last batch includes postscript (deprecate removed products).
     All batches include an INSERT with ON CONFLICT.
     """
-    parts: list[str] = [
-        f"-- PIPELINE ({category}): insert products",
-        f"-- Batch {batch_num}/{total_batches}: products {batch_start}-{batch_end}",
-        "-- Source: Open Food Facts API (automated pipeline)",
-        f"-- Generated: {today}",
-    ]
+    yield f"""\
+-- PIPELINE ({category}): insert products
+-- Batch {batch_num}/{total_batches}: products {batch_start}-{batch_end}
+-- Source: Open Food Facts API (automated pipeline)
+-- Generated: {today}
+"""
 
     # ── Preamble (first batch only) ──────────────────────────────────────
     if batch_num == 1:
-        parts.append(f"""
+        yield f"""
 -- 0a. DEPRECATE old products in this category & release their EANs
 update products
 set is_deprecated = true, deprecated_reason = 'Replaced by pipeline refresh', ean = null
 where country = {_sql_text(country)}
   and category = {_sql_text(category)}
-  and is_deprecated is not true;""")
+  and is_deprecated is not true;
+"""
 
-        eans = [p.get("ean", "") for p in all_products if p.get("ean")]
-        if eans:
-            ean_literals = ", ".join(_sql_text(e) for e in eans)
-            parts.append(f"""
+        ean_literals = _release_eans(all_cols)
+        if ean_literals:
+            yield """
 -- 0b. Release EANs across ALL categories to prevent unique constraint conflicts
 update products set ean = null
-where ean in ({ean_literals})
-  and ean is not null;""")
+where ean in ("""
+            yield from _joined(ean_literals, ", ")
+            yield """)
+  and ean is not null;
+"""
 
-        keys = sorted({_identity_key(p["brand"], p["product_name"]) for p in all_products})
-        key_literals = ", ".join(_sql_text(k) for k in keys)
-        parts.append(f"""
+        yield f"""
 -- 0c. Deprecate cross-category products whose identity_key collides with this batch
 update products
 set is_deprecated = true,
@@ -610,31 +840,20 @@ set is_deprecated = true,
     ean = null
 where country = {_sql_text(country)}
   and category != {_sql_text(category)}
-  and identity_key in ({key_literals})
-  and is_deprecated is not true;""")
+  and identity_key in ("""
+        yield from _identity_keys(all_cols)
+        yield """)
+  and is_deprecated is not true;
+"""
 
     # ── INSERT block ─────────────────────────────────────────────────────
-    lines: list[str] = []
-    for i, p in enumerate(batch_products):
-        brand = _sql_text(p["brand"])
-        name = _sql_text(p["product_name"])
-        ean = _sql_text(p.get("ean") or "")
-        product_type = _sql_text(p.get("product_type", "Grocery"))
-        prep = _sql_null_or_text(p.get("prep_method"))
-        store = _sql_null_or_text(_normalize_store(p.get("store_availability")))
-        controversies = _sql_text(p.get("controversies", "none"))
-        comma = "," if i < len(batch_products) - 1 else ""
-        lines.append(
-            f"  ({_sql_text(country)}, {brand}, {product_type}, {_sql_text(category)}, "
-            f"{name}, {prep}, {store}, {controversies}, {ean}){comma}"
-        )
-    values_block = "\n".join(lines)
-
-    parts.append(f"""
+    yield f"""
 -- 1. INSERT products (batch {batch_num}/{total_batches})
 insert into products (country, brand, product_type, category, product_name, prep_method, store_availability, controversies, ean)
 values
-{values_block}
+"""
+    yield from _insert_values(batch, country, category)
+    yield """
 on conflict (country, brand, product_name) do update set
   category = excluded.category,
   ean = excluded.ean,
@@ -642,68 +861,37 @@ on conflict (country, brand, product_name) do update set
   store_availability = excluded.store_availability,
   controversies = excluded.controversies,
   prep_method = excluded.prep_method,
-  is_deprecated = false;""")
+  is_deprecated = false;
+"""
 
     # ── Postscript (last batch only) ─────────────────────────────────────
     if batch_num == total_batches:
-        name_literals = ", ".join(_sql_text(p["product_name"]) for p in all_products)
-        parts.append(f"""
--- 2. DEPRECATE removed products
-update products
-set is_deprecated = true, deprecated_reason = 'Removed from pipeline batch'
-where country = {_sql_text(country)} and category = {_sql_text(category)}
-  and is_deprecated is not true
-  and product_name not in ({name_literals});""")
-
-    parts.append("")  # trailing newline
-    return "\n".join(parts)
+        yield from _deprecate_removed(category, all_cols, country)
 
 
 def _gen_03_batch(
     category: str,
-    batch_products: list[dict],
+    batch: _Columns,
     country: str,
     batch_num: int,
     total_batches: int,
     batch_start: int,
     batch_end: int,
-) -> str:
+) -> Iterator[str]:
     """Generate one batch file for step 03 (add nutrition).
 
     Batch 1 includes the DELETE (clean existing rows).
     All batches include an INSERT with ON CONFLICT.
     """
-    nutrition_lines: list[str] = []
-    for i, p in enumerate(batch_products):
-        brand = _sql_text(p["brand"])
-        name = _sql_text(p["product_name"])
-        vals = ", ".join(
-            _sql_num(p[k])
-            for k in (
-                "calories",
-                "total_fat_g",
-                "saturated_fat_g",
-                "trans_fat_g",
-                "carbs_g",
-                "sugars_g",
-                "fibre_g",
-                "protein_g",
-                "salt_g",
-            )
-        )
-        comma = "," if i < len(batch_products) - 1 else ""
-        nutrition_lines.append(f"    ({brand}, {name}, {vals}){comma}")
-    nutrition_block = "\n".join(nutrition_lines)
-
-    parts: list[str] = [
-        f"-- PIPELINE ({category}): add nutrition facts",
-        f"-- Batch {batch_num}/{total_batches}: products {batch_start}-{batch_end}",
-        "-- Source: Open Food Facts verified per-100g data",
-    ]
+    yield f"""\
+-- PIPELINE ({category}): add nutrition facts
+-- Batch {batch_num}/{total_batches}: products {batch_start}-{batch_end}
+-- Source: Open Food Facts verified per-100g data
+"""
 
     # DELETE existing — only in first batch
     if batch_num == 1:
-        parts.append(f"""
+        yield f"""
 -- 1) Remove existing
 delete from nutrition_facts
 where product_id in (
@@ -711,24 +899,341 @@ where product_id in (
   from products p
   where p.country = {_sql_text(country)} and p.category = {_sql_text(category)}
     and p.is_deprecated is not true
-);""")
+);
+"""
 
-    parts.append(f"""
+    yield f"""
 -- 2) Insert (batch {batch_num}/{total_batches})
+{_NUTRITION_INSERT_HEAD}"""
+    yield from _keyed_values(batch, batch.nutrition)
+    yield _nutrition_insert_tail(category, country)
+
+
+def _gen_04_batch(
+    category: str,
+    batch: _Columns,
+    today: str,
+    country: str,
+    batch_num: int,
+    total_batches: int,
+    batch_start: int,
+    batch_end: int,
+) -> Iterator[str]:
+    """Generate one batch file for step 04 (scoring).
+
+    All batches set their products' Nutri-Score and NOVA labels.
+    Last batch derives the Nutri-Score source and scores the category,
+    once every label is in place.
+    """
+    yield f"""\
+-- PIPELINE ({category}): scoring
+-- Batch {batch_num}/{total_batches}: products {batch_start}-{batch_end}
+-- Generated: {today}
+
+-- 2. Nutri-Score (batch {batch_num}/{total_batches})
+"""
+    yield from _label_update(batch, batch.nutri_score, "nutri_score_label", "ns", country)
+    yield f"""
+-- 3. NOVA classification (batch {batch_num}/{total_batches})
+"""
+    yield from _label_update(batch, batch.nova, "nova_classification", "nova", country)
+
+    if batch_num == total_batches:
+        yield "\n"
+        yield _nutri_score_source(category, country)
+        yield "\n"
+        yield _score_call(category, country)
+
+
+def _gen_05_batch(
+    category: str,
+    batch: _Columns,
+    today: str,
+    country: str,
+    batch_num: int,
+    total_batches: int,
+    batch_start: int,
+    batch_end: int,
+) -> Iterator[str]:
+    """Generate one batch file for step 05 (source provenance)."""
+    yield f"""\
+-- PIPELINE ({category}): source provenance
+-- Batch {batch_num}/{total_batches}: products {batch_start}-{batch_end}
+-- Generated: {today}
+
+-- 1. Update source info on products (batch {batch_num}/{total_batches})
+"""
+    yield from _provenance_update(category, batch, country)
+
+
+def _gen_06_batch(
+    category: str,
+    batch: _Columns,
+    today: str,
+    country: str,
+    batch_num: int,
+    total_batches: int,
+    batch_start: int,
+    batch_end: int,
+) -> Iterator[str]:
+    """Generate one batch file for step 06 (add images).
+
+    Batch 1 includes the DELETE of the category's OFF images.
+    Batches whose products have no images insert nothing.
+    """
+    yield f"""\
+-- PIPELINE ({category}): add product images
+-- Batch {batch_num}/{total_batches}: products {batch_start}-{batch_end}
+-- Source: Open Food Facts API image URLs
+-- Generated: {today}
+"""
+
+    # DELETE existing — only in first batch
+    if batch_num == 1:
+        yield "\n"
+        yield _images_delete(category, country)
+
+    if not any(batch.images):
+        yield """
+-- No product images in this batch.
+"""
+        return
+
+    yield f"""
+-- 2. Insert images (batch {batch_num}/{total_batches})
+"""
+    yield from _images_insert(category, batch, country)
+
+
+def _gen_07_batch(
+    category: str,
+    batch: _Columns,
+    today: str,
+    country: str,
+    batch_num: int,
+    total_batches: int,
+    batch_start: int,
+    batch_end: int,
+) -> Iterator[str]:
+    """Generate one batch file for step 07 (store availability)."""
+    yield f"""\
+-- PIPELINE ({category}): store availability
+-- Batch {batch_num}/{total_batches}: products {batch_start}-{batch_end}
+-- Source: Open Food Facts API store field
+-- Generated: {today}
+
+"""
+    if not any(batch.stores):
+        yield "-- No store availability data in this batch.\n"
+        return
+    yield from _stores_insert(category, batch, country)
+
+
+# ---------------------------------------------------------------------------
+# COPY output
+# ---------------------------------------------------------------------------
+
+OUTPUT_FORMATS = ("sql", "copy")
+
+COPY_PAYLOAD_STEP = "00_copy_payload"
+COPY_DRIVER_STEP = "01_copy_load"
+COPY_STAGING_TABLE = "pipeline_stage"
+
+# Staging columns in payload order (the CSV header), with their SQL types.
+_COPY_COLUMNS: tuple[tuple[str, str], ...] = (
+    ("brand", "text"),
+    ("product_name", "text"),
+    ("identity_key", "text"),
+    ("product_type", "text"),
+    ("prep_method", "text"),
+    ("store_availability", "text"),
+    ("controversies", "text"),
+    ("ean", "text"),
+    *((key, "numeric") for key in _NUTRITION_KEYS),
+    ("nutri_score_label", "text"),
+    ("nova_classification", "text"),
+    *((key, "text") for key, _type, _label in _IMAGE_TYPES),
+    ("stores", "text"),
+)
+
+
+def copy_payload_path(driver: Path) -> Path:
+    """The CSV payload that belongs to a ``01_copy_load`` driver file."""
+    return driver.with_name(driver.name.replace(f"__{COPY_DRIVER_STEP}.sql", f"__{COPY_PAYLOAD_STEP}.csv"))
+
+
+def copy_payload_eans(payload: Path) -> set[str]:
+    """Return the EANs in a COPY payload (empty if unreadable)."""
+    try:
+        with open_text(payload, newline="") as fh:
+            return {row["ean"] for row in csv.DictReader(fh) if row.get("ean")}
+    except OSError:
+        return set()
+
+
+def _csv_text(value: str | None) -> str:
+    """Quoted CSV field with the same normalisation as :func:`_sql_text`.
+
+    ``None`` becomes an unquoted empty field, which ``COPY … (format csv)``
+    reads as NULL; an empty string stays ``""``.
+    """
+    if value is None:
+        return ""
+    s = str(value).replace("\u2019", "'").replace("\u2018", "'")
+    return '"' + s.replace('"', '""') + '"'
+
+
+def _csv_num(value: str | float | int | None) -> str:
+    """Bare numeric CSV field (empty = NULL), cleaned like :func:`_sql_num`."""
+    num = _sql_num(value)
+    return "" if num == "null" else num
+
+
+def _copy_row(p: dict, country: str) -> str:
+    """One payload line for product *p*, matching the values files 01--07 would write."""
+    ean = p.get("ean") or None
+    nova_raw = p.get("nova_classification") or ""
+    images = []
+    for off_key, _image_type, _label in _IMAGE_TYPES:
+        url = p.get(off_key)
+        images.append(_csv_text(url) if ean and url and url.startswith("https://") else "")
+    fields = [
+        _csv_text(p["brand"]),
+        _csv_text(p["product_name"]),
+        _identity_key(p["brand"], p["product_name"]),
+        _csv_text(p.get("product_type", "Grocery")),
+        _csv_text(p.get("prep_method") or None),
+        _csv_text(_normalize_store(p.get("store_availability"))),
+        _csv_text(p.get("controversies", "none")),
+        _csv_text(ean),
+        *(_csv_num(p[k]) for k in _NUTRITION_KEYS),
+        _csv_text(p.get("nutri_score_label") or None),
+        nova_raw if nova_raw in ("1", "2", "3", "4") else "4",
+        *images,
+        _csv_text("|".join(_extract_stores(p.get("store_availability"), country)) or None),
+    ]
+    return ",".join(fields)
+
+
+def _gen_copy_payload(products: list[dict], country: str) -> Iterator[str]:
+    """Generate the CSV payload: a header line, then one line per product."""
+    yield ",".join(name for name, _type in _COPY_COLUMNS)
+    for chunk in _joined((_copy_row(p, country) for p in products), "\n"):
+        yield "\n" + chunk
+    yield "\n"
+
+
+def _gen_copy_driver(
+    category: str, products: list[dict], today: str, country: str, slug: str, compress: bool = False
+) -> str:
+    """Generate the ``01_copy_load`` driver for the payload.
+
+    Loads the payload into a temp staging table with ``\\copy … from
+    pstdin`` and then runs steps 01--07 as set-based statements joined to
+    the staging table, in the same order and with the same semantics as
+    the per-step files.  Image and store sections are omitted when no
+    product has images / recognised stores, as files 06 and 07 are.
+    """
+    c, k = _sql_text(country), _sql_text(category)
+    stage = COPY_STAGING_TABLE
+    suffix = ".gz" if compress else ""
+    payload = f"PIPELINE__{slug}__{COPY_PAYLOAD_STEP}.csv{suffix}"
+    driver = f"PIPELINE__{slug}__{COPY_DRIVER_STEP}.sql{suffix}"
+    stdin_apply = (
+        f"gunzip -c {payload} | psql -v ON_ERROR_STOP=1 -1 -f <(gunzip -c {driver})"
+        if compress
+        else f"psql -v ON_ERROR_STOP=1 -1 -f {driver} < {payload}"
+    )
+    columns = ",\n".join(f"  {name} {sql_type}" for name, sql_type in _COPY_COLUMNS)
+    match_product = (
+        f"p.country = {c} and p.brand = s.brand and p.product_name = s.product_name\n"
+        f"  and p.category = {k} and p.is_deprecated is not true"
+    )
+
+    has_images = any(
+        p.get("ean") and any((p.get(key) or "").startswith("https://") for key, _t, _l in _IMAGE_TYPES)
+        for p in products
+    )
+    has_stores = any(_extract_stores(p.get("store_availability"), country) for p in products)
+
+    parts = [
+        f"""\
+-- PIPELINE ({category}): COPY bulk load
+-- Payload: {payload} ({len(products)} products)
+-- Source: Open Food Facts API (automated pipeline)
+-- Generated: {today}
+--
+-- Apply with `python -m pipeline.apply <folder>`, or feed the payload on stdin:
+--   {stdin_apply}
+
+drop table if exists {stage};
+create temp table {stage} (
+{columns}
+);
+
+\\copy {stage} from pstdin with (format csv, header true)
+
+analyze {stage};
+
+-- 0a. DEPRECATE old products in this category & release their EANs
+update products
+set is_deprecated = true, deprecated_reason = 'Replaced by pipeline refresh', ean = null
+where country = {c}
+  and category = {k}
+  and is_deprecated is not true;
+
+-- 0b. Release EANs across ALL categories to prevent unique constraint conflicts
+update products p set ean = null
+from {stage} s
+where p.ean = s.ean;
+
+-- 0c. Deprecate cross-category products whose identity_key collides with this batch
+update products p
+set is_deprecated = true,
+    deprecated_reason = 'Reassigned to {category} by pipeline',
+    ean = null
+where p.country = {c}
+  and p.category != {k}
+  and p.identity_key in (select s.identity_key from {stage} s)
+  and p.is_deprecated is not true;
+
+-- 1. INSERT products
+insert into products (country, brand, product_type, category, product_name, prep_method, store_availability, controversies, ean)
+select {c}, s.brand, s.product_type, {k}, s.product_name, s.prep_method, s.store_availability, s.controversies,
+       coalesce(s.ean, '')
+from {stage} s
+on conflict (country, brand, product_name) do update set
+  category = excluded.category,
+  ean = excluded.ean,
+  product_type = excluded.product_type,
+  store_availability = excluded.store_availability,
+  controversies = excluded.controversies,
+  prep_method = excluded.prep_method,
+  is_deprecated = false;
+
+-- 2. DEPRECATE removed products (anti-join on identity_key)
+update products p
+set is_deprecated = true, deprecated_reason = 'Removed from pipeline batch'
+where p.country = {c} and p.category = {k}
+  and p.is_deprecated is not true
+  and not exists (select 1 from {stage} s where s.identity_key = p.identity_key);
+
+-- 3. Nutrition facts (remove existing, then insert)
+delete from nutrition_facts nf
+using products p
+where nf.product_id = p.product_id
+  and p.country = {c} and p.category = {k}
+  and p.is_deprecated is not true;
+
 insert into nutrition_facts
   (product_id, calories, total_fat_g, saturated_fat_g, trans_fat_g,
    carbs_g, sugars_g, fibre_g, protein_g, salt_g)
 select
   p.product_id,
-  d.calories, d.total_fat_g, d.saturated_fat_g, d.trans_fat_g,
-  d.carbs_g, d.sugars_g, d.fibre_g, d.protein_g, d.salt_g
-from (
-  values
-{nutrition_block}
-) as d(brand, product_name, calories, total_fat_g, saturated_fat_g, trans_fat_g,
-       carbs_g, sugars_g, fibre_g, protein_g, salt_g)
-join products p on p.country = {_sql_text(country)} and p.brand = d.brand and p.product_name = d.product_name
-  and p.category = {_sql_text(category)} and p.is_deprecated is not true
+  s.calories, s.total_fat_g, s.saturated_fat_g, s.trans_fat_g,
+  s.carbs_g, s.sugars_g, s.fibre_g, s.protein_g, s.salt_g
+from {stage} s
+join products p on {match_product}
 on conflict (product_id) do update set
   calories = excluded.calories,
   total_fat_g = excluded.total_fat_g,
@@ -738,10 +1243,509 @@ on conflict (product_id) do update set
   sugars_g = excluded.sugars_g,
   fibre_g = excluded.fibre_g,
   protein_g = excluded.protein_g,
-  salt_g = excluded.salt_g;""")
+  salt_g = excluded.salt_g;
+
+-- 4. Nutri-Score and NOVA
+update products p set
+  nutri_score_label = s.nutri_score_label,
+  nova_classification = s.nova_classification
+from {stage} s
+where p.country = {c} and p.brand = s.brand and p.product_name = s.product_name;
+
+-- 4b. Nutri-Score source provenance (derived from label)
+update products p set
+  nutri_score_source = case
+    when p.nutri_score_label is null            then null
+    when p.nutri_score_label = 'NOT-APPLICABLE' then null
+    when p.nutri_score_label = 'UNKNOWN'        then 'unknown'
+    else 'off_computed'
+  end
+where p.country = {c}
+  and p.category = {k}
+  and p.is_deprecated is not true;
+
+-- 4c. Score category (concern defaults, unhealthiness, flags, confidence)
+CALL score_category({k}, 100, {c});
+
+-- 5. Source provenance
+update products p set
+  source_type = 'off_api',
+  source_url = 'https://world.openfoodfacts.org/product/' || s.ean,
+  source_ean = s.ean
+from {stage} s
+where {match_product};
+""",
+    ]
+
+    if has_images:
+        parts.append(f"""
+-- 6. Product images (remove existing OFF images, then insert)
+delete from product_images pi
+using products p
+where pi.product_id = p.product_id
+  and pi.source = 'off_api'
+  and p.country = {c} and p.category = {k}
+  and p.is_deprecated is not true;
+
+insert into product_images
+  (product_id, url, source, image_type, is_primary, alt_text, off_image_id)
+select
+  p.product_id, i.url, 'off_api', i.image_type, i.image_type = 'front',
+  i.label || ' — EAN ' || s.ean, i.image_type || '_' || s.ean
+from {stage} s
+cross join lateral (
+  values
+    ('front', 'Front', s.image_front_url),
+    ('ingredients', 'Ingredients', s.image_ingredients_url),
+    ('nutrition_label', 'Nutrition Label', s.image_nutrition_url)
+) as i(image_type, label, url)
+join products p on {match_product}
+where i.url is not null
+on conflict (off_image_id) where off_image_id is not null do update set
+  url = excluded.url,
+  image_type = excluded.image_type,
+  is_primary = excluded.is_primary,
+  alt_text = excluded.alt_text;
+""")
+
+    if has_stores:
+        parts.append(f"""
+-- 7. Store availability
+insert into product_store_availability (product_id, store_id, verified_at, source)
+select p.product_id, sr.store_id, now(), 'pipeline'
+from {stage} s
+cross join lateral unnest(string_to_array(s.stores, '|')) as st(store_name)
+join products p on {match_product}
+join store_ref sr on sr.country = {c} and sr.store_name = st.store_name and sr.is_active = true
+on conflict (product_id, store_id) do nothing;
+""")
+
+    parts.append(f"\ndrop table {stage};\n")
+    return "".join(parts)
+
+
+# ---------------------------------------------------------------------------
+# Incremental (diff) output
+# ---------------------------------------------------------------------------
+
+# Per-folder record of what the last applied generation wrote, product by
+# product.  generate_pipeline writes the pending one; promote_snapshot makes it
+# the baseline once the folder has been applied.
+SNAPSHOT_FILENAME = ".snapshot.json"
+PENDING_SNAPSHOT_FILENAME = ".snapshot.pending.json"
+SNAPSHOT_VERSION = 1
+
+DELTA_STEP = "changes"
+
+# The steps fingerprinted per product; a product is re-emitted for a step
+# only when its fingerprint for that step changed.
+_DELTA_STEPS = ("01", "03", "04", "05", "06", "07")
+
+
+def _fingerprint(*parts: str) -> str:
+    return hashlib.blake2b(COLUMN_SEP.join(parts).encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _step_fingerprints(cols: _Columns) -> Iterator[list[str]]:
+    """Per product, one fingerprint per :data:`_DELTA_STEPS` step of the SQL it renders to."""
+    for i in range(len(cols)):
+        yield [
+            _fingerprint(cols.product_type[i], cols.prep_method[i], cols.store[i], cols.controversies[i], cols.ean[i]),
+            _fingerprint(cols.nutrition[i]),
+            _fingerprint(cols.nutri_score[i], cols.nova[i]),
+            _fingerprint(cols.provenance[i]),
+            _fingerprint(cols.images[i]),
+            _fingerprint(*cols.stores[i]),
+        ]
+
 
-    parts.append("")  # trailing newline
-    return "\n".join(parts)
+def _write_snapshot(out: Path, cols: _Columns, category: str, country: str) -> None:
+    """Record *cols* as the folder's pending snapshot: identity_key → [brand/name literals, fingerprints]."""
+    products = {
+        ident: [key, prints]
+        for ident, key, prints in zip(cols.identity_key, cols.key, _step_fingerprints(cols), strict=True)
+    }
+    snapshot = {"version": SNAPSHOT_VERSION, "category": category, "country": country, "products": products}
+    write_atomic(out / PENDING_SNAPSHOT_FILENAME, [json.dumps(snapshot, ensure_ascii=False, separators=(",", ":"))])
+
+
+def promote_snapshot(output_dir: str | Path) -> bool:
+    """Make the folder's pending snapshot the baseline of the next :func:`generate_delta`.
+
+    Call it once the folder's generation has been committed to the
+    database (full files or delta); :func:`pipeline.apply.apply_folder`
+    does.  Returns ``False`` when there was no pending snapshot.
+    """
+    out = Path(output_dir)
+    try:
+        (out / PENDING_SNAPSHOT_FILENAME).replace(out / SNAPSHOT_FILENAME)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def _load_snapshot(out: Path, category: str, country: str) -> dict[str, list] | None:
+    """The folder's snapshot products, or ``None`` when missing, unreadable or for other inputs."""
+    try:
+        snapshot = json.loads((out / SNAPSHOT_FILENAME).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if (snapshot.get("version"), snapshot.get("category"), snapshot.get("country")) != (
+        SNAPSHOT_VERSION,
+        category,
+        country,
+    ):
+        return None
+    return snapshot["products"]
+
+
+@dataclass
+class _ProductDiff:
+    """How a product set differs from a snapshot (indices into its columns)."""
+
+    new: list[int] = field(default_factory=list)
+    changed: list[int] = field(default_factory=list)  # existing products with any step changed
+    steps: dict[str, list[int]] = field(default_factory=lambda: {step: [] for step in _DELTA_STEPS})
+    removed: list[str] = field(default_factory=list)  # brand/name literals no longer generated
+    unchanged: int = 0
+
+
+def _diff_products(cols: _Columns, previous: dict[str, list]) -> _ProductDiff:
+    diff = _ProductDiff()
+    keys = set(cols.key)
+    seen: set[str] = set()
+    for i, (ident, key, prints) in enumerate(zip(cols.identity_key, cols.key, _step_fingerprints(cols), strict=True)):
+        seen.add(ident)
+        old = previous.get(ident)
+        if old is None or old[0] != key:
+            # New, or renamed within the identity (e.g. a case change): the
+            # upsert creates a new row, so every step is re-emitted.
+            diff.new.append(i)
+            for step in _DELTA_STEPS:
+                diff.steps[step].append(i)
+            if old is not None and old[0] not in keys:
+                diff.removed.append(old[0])
+            continue
+        changed = [
+            step
+            for step, new_print, old_print in zip(_DELTA_STEPS, prints, old[1], strict=True)
+            if new_print != old_print
+        ]
+        for step in changed:
+            diff.steps[step].append(i)
+        if changed:
+            diff.changed.append(i)
+        else:
+            diff.unchanged += 1
+    diff.removed += [old[0] for ident, old in previous.items() if ident not in seen and old[0] not in keys]
+    return diff
+
+
+@dataclass
+class DeltaResult:
+    """What :func:`generate_delta` wrote, with estimated row writes.
+
+    ``rows_full`` estimates the row writes of applying the full
+    ``PIPELINE__*`` files (deprecate-everything refresh); ``rows_delta``
+    those of the ``DELTA__`` file.  Both count one write per row an
+    ``insert`` / ``update`` / ``delete`` touches, including the category
+    rescore, and assume the previous generation is what the database holds.
+    """
+
+    path: Path
+    had_snapshot: bool
+    new: int
+    changed: int
+    removed: int
+    unchanged: int
+    rows_full: int
+    rows_delta: int
+
+    @property
+    def reduction(self) -> float:
+        """Fraction of the full refresh's row writes the delta avoids."""
+        return 1 - self.rows_delta / self.rows_full if self.rows_full else 0.0
+
+    def summary(self) -> dict:
+        return {
+            "file": self.path.name,
+            "had_snapshot": self.had_snapshot,
+            "new": self.new,
+            "changed": self.changed,
+            "removed": self.removed,
+            "unchanged": self.unchanged,
+            "rows_full": self.rows_full,
+            "rows_delta": self.rows_delta,
+            "reduction": round(self.reduction, 3),
+        }
+
+
+def _image_count(cols: _Columns, indices: Iterable[int]) -> int:
+    return sum(cols.images[i].count("\n") + 1 for i in indices if cols.images[i])
+
+
+def _estimate_full_rows(cols: _Columns, previous_active: int) -> int:
+    n = len(cols)
+    images = _image_count(cols, range(n))
+    return (
+        previous_active  # 0a: deprecate every active product
+        + sum(cols.has_ean)  # 0b: release EANs
+        + n  # 1: upsert
+        + 2 * n  # 03: delete + insert nutrition
+        + 3 * n  # 04: Nutri-Score, its source, NOVA
+        + n  # 04: score_category rescores the category
+        + n  # 05: provenance
+        + 2 * images  # 06: delete + insert images
+        + sum(map(len, cols.stores))  # 07: store links
+    )
+
+
+def _estimate_delta_rows(cols: _Columns, diff: _ProductDiff) -> int:
+    steps = diff.steps
+    rescore = bool(diff.removed or steps["01"] or steps["03"] or steps["04"])
+    return (
+        len(diff.removed)
+        + sum(cols.has_ean[i] for i in steps["01"])
+        + len(steps["01"])
+        + len(steps["03"])
+        + len(steps["04"])
+        + (len(cols) if rescore else 0)
+        + len(steps["05"])
+        + _image_count(cols, steps["06"]) * 2
+        + sum(len(cols.stores[i]) for i in steps["07"])
+    )
+
+
+def _gen_delta(category: str, cols: _Columns, diff: _ProductDiff, today: str, country: str) -> Iterator[str]:
+    """Generate the ``DELTA__`` file: only the statements for what changed.
+
+    Mirrors files 01--07 restricted to the products in *diff*: removed
+    products are deprecated by name (not everything then un-deprecated),
+    nutrition / scores / provenance are upserted for changed rows only,
+    and the category is rescored only when a scoring input changed.
+    """
+    c, k = _sql_text(country), _sql_text(category)
+    yield f"""-- DELTA ({category}): incremental refresh against the previous generation
+-- Generated: {today}
+-- {len(diff.new)} new, {len(diff.changed)} changed, {len(diff.removed)} removed, {diff.unchanged} unchanged
+"""
+    if diff.removed:
+        yield """
+-- 1. DEPRECATE products removed since the previous generation
+update products p
+set is_deprecated = true, deprecated_reason = 'Removed from pipeline batch', ean = null
+from (
+  values
+"""
+        yield from _joined(f"    ({key})" for key in diff.removed)
+        yield f"""
+) as d(brand, product_name)
+where p.country = {c} and p.category = {k}
+  and p.brand = d.brand and p.product_name = d.product_name
+  and p.is_deprecated is not true;
+"""
+
+    upserted = cols.take(diff.steps["01"])
+    if len(upserted):
+        ean_literals = _release_eans(upserted)
+        if ean_literals:
+            yield """
+-- 2a. Release the upserted EANs across ALL categories
+update products set ean = null
+where ean in ("""
+            yield from _joined(ean_literals, ", ")
+            yield """)
+  and ean is not null;
+"""
+        yield f"""
+-- 2b. Deprecate cross-category products whose identity_key collides with an upserted product
+update products
+set is_deprecated = true,
+    deprecated_reason = 'Reassigned to {category} by pipeline',
+    ean = null
+where country = {c}
+  and category != {k}
+  and identity_key in ("""
+        yield from _identity_keys(upserted)
+        yield """)
+  and is_deprecated is not true;
+
+-- 2c. UPSERT new and changed products
+insert into products (country, brand, product_type, category, product_name, prep_method, store_availability, controversies, ean)
+values
+"""
+        yield from _insert_values(upserted, country, category)
+        yield """
+on conflict (country, brand, product_name) do update set
+  category = excluded.category,
+  ean = excluded.ean,
+  product_type = excluded.product_type,
+  store_availability = excluded.store_availability,
+  controversies = excluded.controversies,
+  prep_method = excluded.prep_method,
+  is_deprecated = false;
+"""
+
+    nutrition = cols.take(diff.steps["03"])
+    if len(nutrition):
+        yield f"""
+-- 3. Nutrition facts of new and changed products
+{_NUTRITION_INSERT_HEAD}"""
+        yield from _keyed_values(nutrition, nutrition.nutrition)
+        yield _nutrition_insert_tail(category, country)
+
+    scores = cols.take(diff.steps["04"])
+    if len(scores):
+        yield """
+-- 4. Nutri-Score (with its source) and NOVA of new and changed products
+update products p set
+  nutri_score_label = d.ns,
+  nutri_score_source = case
+    when d.ns is null            then null
+    when d.ns = 'NOT-APPLICABLE' then null
+    when d.ns = 'UNKNOWN'        then 'unknown'
+    else 'off_computed'
+  end,
+  nova_classification = d.nova
+from (
+  values
+"""
+        yield from _keyed_values(
+            scores, [f"{ns}, {nova}" for ns, nova in zip(scores.nutri_score, scores.nova, strict=True)]
+        )
+        yield f"""
+) as d(brand, product_name, ns, nova)
+where p.country = {c} and p.brand = d.brand and p.product_name = d.product_name;
+"""
+    if diff.removed or len(upserted) or len(nutrition) or len(scores):
+        yield f"""
+-- 4b. Rescore the category (a scoring input changed)
+CALL score_category({k}, 100, {c});
+"""
+
+    provenance = cols.take(diff.steps["05"])
+    if len(provenance):
+        yield """
+-- 5. Source provenance of new and changed products
+UPDATE products p SET
+  source_type = 'off_api',
+  source_url = d.source_url,
+  source_ean = d.source_ean
+FROM (
+  VALUES
+"""
+        yield from _keyed_values(provenance, provenance.provenance)
+        yield f"""
+) AS d(brand, product_name, source_url, source_ean)
+WHERE p.country = {c} AND p.brand = d.brand
+  AND p.product_name = d.product_name
+  AND p.category = {k} AND p.is_deprecated IS NOT TRUE;
+"""
+
+    images = cols.take(diff.steps["06"])
+    if len(images):
+        yield """
+-- 6a. Replace the OFF images of products whose images changed
+DELETE FROM product_images pi
+USING products p, (
+  VALUES
+"""
+        yield from _joined(f"    ({key})" for key in images.key)
+        yield f"""
+) AS d(brand, product_name)
+WHERE pi.source = 'off_api' AND pi.product_id = p.product_id
+  AND p.country = {c} AND p.category = {k}
+  AND p.brand = d.brand AND p.product_name = d.product_name;
+"""
+        if any(images.images):
+            yield """
+-- 6b. Insert their images
+INSERT INTO product_images
+  (product_id, url, source, image_type, is_primary, alt_text, off_image_id)
+SELECT
+  p.product_id, d.url, d.source, d.image_type, d.is_primary, d.alt_text, d.off_image_id
+FROM (
+  VALUES
+"""
+            yield from _joined(rows for rows in images.images if rows)
+            yield f"""
+) AS d(brand, product_name, url, source, image_type, is_primary, alt_text, off_image_id)
+JOIN products p ON p.country = {c} AND p.brand = d.brand AND p.product_name = d.product_name
+  AND p.category = {k} AND p.is_deprecated IS NOT TRUE
+ON CONFLICT (off_image_id) WHERE off_image_id IS NOT NULL DO UPDATE SET
+  url = EXCLUDED.url,
+  image_type = EXCLUDED.image_type,
+  is_primary = EXCLUDED.is_primary,
+  alt_text = EXCLUDED.alt_text;
+"""
+
+    stores = cols.take(diff.steps["07"])
+    if any(stores.stores):
+        yield """
+-- 7. Store availability of new and changed products
+INSERT INTO product_store_availability (product_id, store_id, verified_at, source)
+SELECT
+  p.product_id,
+  sr.store_id,
+  NOW(),
+  'pipeline'
+FROM (
+  VALUES
+"""
+        yield from _joined(
+            f"    ({key}, {store})" for key, chains in zip(stores.key, stores.stores, strict=True) for store in chains
+        )
+        yield f"""
+) AS d(brand, product_name, store_name)
+JOIN products p ON p.country = {c} AND p.brand = d.brand AND p.product_name = d.product_name
+  AND p.category = {k} AND p.is_deprecated IS NOT TRUE
+JOIN store_ref sr ON sr.country = {c} AND sr.store_name = d.store_name AND sr.is_active = true
+ON CONFLICT (product_id, store_id) DO NOTHING;
+"""
+
+
+def generate_delta(
+    category: str,
+    products: list[dict],
+    output_dir: str | Path,
+    country: str = "PL",
+    compress: bool = False,
+) -> DeltaResult:
+    """Write ``DELTA__{slug}__changes.sql``: *products* diffed against the folder's snapshot.
+
+    The snapshot (:data:`SNAPSHOT_FILENAME`) is the last generation
+    applied from the folder, product by product, keyed by identity_key:
+    :func:`generate_pipeline` records its products as pending, and
+    :func:`promote_snapshot` promotes them once the folder is applied.
+    The delta emits only the inserts, updates and deprecations needed to
+    take a database holding that generation to *products*; it is meant to
+    be applied (``pipeline.apply --delta``) instead of the full files.  A
+    delta that fails or is never applied leaves the baseline where it was,
+    so the next one still covers its changes.  Without a usable snapshot
+    every product counts as new and nothing is deprecated.
+    """
+    out = Path(output_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    cols = _Columns.from_products(products, country)
+    previous = _load_snapshot(out, category, country)
+    diff = _diff_products(cols, previous or {})
+    today = datetime.date.today().isoformat()
+
+    path = out / f"DELTA__{out.name}__{DELTA_STEP}.sql{'.gz' if compress else ''}"
+    write_atomic(path, _gen_delta(category, cols, diff, today, country), compress=compress)
+    twin = path.with_name(path.name.removesuffix(".gz") if compress else f"{path.name}.gz")
+    twin.unlink(missing_ok=True)
+
+    return DeltaResult(
+        path=path,
+        had_snapshot=previous is not None,
+        new=len(diff.new),
+        changed=len(diff.changed),
+        removed=len(diff.removed),
+        unchanged=diff.unchanged,
+        rows_full=_estimate_full_rows(cols, len(previous) if previous is not None else len(cols)),
+        rows_delta=_estimate_delta_rows(cols, diff),
+    )
 
 
 # ---------------------------------------------------------------------------
@@ -749,17 +1753,65 @@ on conflict (product_id) do update set
 # ---------------------------------------------------------------------------
 
 
+def pipeline_file_names(
+    slug: str,
+    products: list[dict],
+    country: str = "PL",
+    batch_size: int = BATCH_SIZE,
+    output_format: str = "sql",
+    compress: bool = False,
+) -> list[str]:
+    """Names of the files :func:`generate_pipeline` writes for *products* into folder *slug*, in order.
+
+    Same layout as the generator (single files, or one per batch and
+    step), without generating anything — for dry runs.
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"output_format must be one of {OUTPUT_FORMATS}, got {output_format!r}")
+    if output_format == "copy":
+        names = [f"{COPY_PAYLOAD_STEP}.csv", f"{COPY_DRIVER_STEP}.sql"]
+    else:
+        cols = _Columns.from_products(products, country)
+        if batch_size > 0 and len(cols) > batch_size:
+            total_batches = -(-len(cols) // batch_size)
+            unbatched = _unbatched_steps(cols)
+            names = []
+            for step in PIPELINE_STEPS:
+                if step in unbatched:
+                    names.append(f"{step}.sql")
+                else:
+                    names.extend(_batch_file_name(step, n) for n in range(1, total_batches + 1))
+        else:
+            names = [f"{step}.sql" for step in PIPELINE_STEPS]
+    suffix = ".gz" if compress else ""
+    return [f"PIPELINE__{slug}__{name}{suffix}" for name in names]
+
+
 def generate_pipeline(
     category: str,
     products: list[dict],
     output_dir: str,
     country: str = "PL",
     batch_size: int = BATCH_SIZE,
+    output_format: str = "sql",
+    compress: bool = False,
 ) -> list[Path]:
     """Generate SQL pipeline files for *category* in *country*.
 
-    When ``len(products) > batch_size``, steps 01 and 03 are split into
-    multiple batch files.  Steps 04--07 always produce a single file.
+    When ``len(products) > batch_size``, every step (01 and 03--07) is
+    split into batch files of *batch_size* products, so no statement
+    carries more than one batch's ``VALUES`` and, applied a file per
+    transaction (``RUN_LOCAL.ps1``), no lock outlives its batch.
+    Category-wide statements run once: the deprecations in the first and
+    last 01 batch, the nutrition and image deletes in the first 03/06
+    batch, and the Nutri-Score source and ``score_category`` call in the
+    last 04 batch.
+    With ``output_format="copy"`` a CSV payload and its ``01_copy_load``
+    driver are written instead (*batch_size* does not apply).
+
+    Files are streamed to disk chunk by chunk and each replaces its
+    predecessor atomically (see :func:`pipeline.utils.write_atomic`), so
+    an interrupted run never leaves a half-written ``PIPELINE__*`` file.
 
     Parameters
     ----------
@@ -774,12 +1826,26 @@ def generate_pipeline(
     batch_size:
         Maximum products per batch file (default ``BATCH_SIZE``).
         Set to ``0`` to disable batching.
+    output_format:
+        ``"sql"`` (default): the per-step SQL files.  ``"copy"``: CSV
+        payload plus COPY driver.  Files of the other format are removed.
+    compress:
+        Gzip every file (``*.sql.gz`` / ``*.csv.gz``, read transparently
+        by :mod:`pipeline.apply`).  Uncompressed twins are removed, and
+        vice versa.
+
+    Every run also records the generated products in the folder's
+    :data:`PENDING_SNAPSHOT_FILENAME`; once the folder is applied,
+    :func:`promote_snapshot` makes it the baseline of the next
+    :func:`generate_delta`.
 
     Returns
     -------
     list[Path]
         Paths of the generated files.
     """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"output_format must be one of {OUTPUT_FORMATS}, got {output_format!r}")
     out = Path(output_dir)
     out.mkdir(parents=True, exist_ok=True)
 
@@ -788,90 +1854,82 @@ def generate_pipeline(
     # check_pipeline_structure.py expectations).
     slug = out.name
     today = datetime.date.today().isoformat()
+    suffix = ".gz" if compress else ""
 
     files: list[Path] = []
-    use_batching = batch_size > 0 and len(products) > batch_size
-
-    if use_batching:
-        chunks = _chunk(products, batch_size)
-        total_batches = len(chunks)
-
-        # Clean up stale single-file or old batch versions
-        for old in out.glob(f"PIPELINE__{slug}__01_insert_products.sql"):
-            old.unlink()
-        for old in out.glob(f"PIPELINE__{slug}__01_batch_*_insert_products.sql"):
-            old.unlink()
-        for old in out.glob(f"PIPELINE__{slug}__03_add_nutrition.sql"):
-            old.unlink()
-        for old in out.glob(f"PIPELINE__{slug}__03_batch_*_add_nutrition.sql"):
-            old.unlink()
-
-        # 01 — batched insert products
-        offset = 0
-        for batch_num, chunk in enumerate(chunks, 1):
-            batch_start = offset + 1
-            batch_end = offset + len(chunk)
-            offset += len(chunk)
-            path = out / f"PIPELINE__{slug}__01_batch_{batch_num:03d}_insert_products.sql"
-            path.write_text(
-                _gen_01_batch(
-                    category, chunk, products, today, country,
-                    batch_num, total_batches, batch_start, batch_end,
-                ),
-                encoding="utf-8",
-            )
-            files.append(path)
-
-        # 03 — batched add nutrition
-        offset = 0
-        for batch_num, chunk in enumerate(chunks, 1):
-            batch_start = offset + 1
-            batch_end = offset + len(chunk)
-            offset += len(chunk)
-            path = out / f"PIPELINE__{slug}__03_batch_{batch_num:03d}_add_nutrition.sql"
-            path.write_text(
-                _gen_03_batch(
-                    category, chunk, country,
-                    batch_num, total_batches, batch_start, batch_end,
-                ),
-                encoding="utf-8",
-            )
-            files.append(path)
-    else:
-        # Clean up stale batch files from previous runs
-        for old in out.glob(f"PIPELINE__{slug}__01_batch_*_insert_products.sql"):
-            old.unlink()
-        for old in out.glob(f"PIPELINE__{slug}__03_batch_*_add_nutrition.sql"):
-            old.unlink()
-
-        # 01 — single insert products
-        path01 = out / f"PIPELINE__{slug}__01_insert_products.sql"
-        path01.write_text(_gen_01_insert_products(category, products, today, country), encoding="utf-8")
-        files.append(path01)
-
-        # 03 — single add nutrition
-        path03 = out / f"PIPELINE__{slug}__03_add_nutrition.sql"
-        path03.write_text(_gen_03_add_nutrition(category, products, country), encoding="utf-8")
-        files.append(path03)
-
-    # 04 — scoring (always single file)
-    path04 = out / f"PIPELINE__{slug}__04_scoring.sql"
-    path04.write_text(_gen_04_scoring(category, products, today, country), encoding="utf-8")
-    files.append(path04)
-
-    # 05 — source provenance (always single file)
-    path05 = out / f"PIPELINE__{slug}__05_source_provenance.sql"
-    path05.write_text(_gen_05_source_provenance(category, products, today, country), encoding="utf-8")
-    files.append(path05)
-
-    # 06 — add images (always single file)
-    path06 = out / f"PIPELINE__{slug}__06_add_images.sql"
-    path06.write_text(_gen_06_add_images(category, products, today, country), encoding="utf-8")
-    files.append(path06)
-
-    # 07 — store availability (always single file)
-    path07 = out / f"PIPELINE__{slug}__07_store_availability.sql"
-    path07.write_text(_gen_07_store_availability(category, products, today, country), encoding="utf-8")
-    files.append(path07)
 
+    def write(name: str, chunks: Iterable[str]) -> None:
+        path = out / f"PIPELINE__{slug}__{name}{suffix}"
+        write_atomic(path, chunks, compress=compress)
+        files.append(path)
+
+    if output_format == "copy":
+        write(f"{COPY_PAYLOAD_STEP}.csv", _gen_copy_payload(products, country))
+        write(f"{COPY_DRIVER_STEP}.sql", [_gen_copy_driver(category, products, today, country, slug, compress)])
+        owned = ["*.sql", f"{COPY_PAYLOAD_STEP}.csv"]
+    else:
+        cols = _Columns.from_products(products, country)
+        if batch_size > 0 and len(cols) > batch_size:
+            bounds = [(start, min(start + batch_size, len(cols))) for start in range(0, len(cols), batch_size)]
+            batches = [cols.slice(start, end) for start, end in bounds]
+            total_batches = len(bounds)
+
+            def write_batches(step: str, gen: Callable[..., Iterable[str]], *args: Any) -> None:
+                """One ``{NN}_batch_{nnn}_{name}.sql`` file per batch, ``gen(category, batch, *args, …)``."""
+                for batch_num, (batch, (start, end)) in enumerate(zip(batches, bounds, strict=True), 1):
+                    write(
+                        _batch_file_name(step, batch_num),
+                        gen(category, batch, *args, batch_num, total_batches, start + 1, end),
+                    )
+
+            write_batches("01_insert_products", _gen_01_batch, cols, today, country)
+            write_batches("03_add_nutrition", _gen_03_batch, country)
+            write_batches("04_scoring", _gen_04_batch, today, country)
+            write_batches("05_source_provenance", _gen_05_batch, today, country)
+            # A category without images/stores still gets its single explanatory file.
+            unbatched = _unbatched_steps(cols)
+            if "06_add_images" in unbatched:
+                write("06_add_images.sql", [_no_images(category, today)])
+            else:
+                write_batches("06_add_images", _gen_06_batch, today, country)
+            if "07_store_availability" in unbatched:
+                write("07_store_availability.sql", [_no_stores(category, today)])
+            else:
+                write_batches("07_store_availability", _gen_07_batch, today, country)
+        else:
+            write("01_insert_products.sql", _gen_01_insert_products(category, cols, today, country))
+            write("03_add_nutrition.sql", _gen_03_add_nutrition(category, cols, country))
+            write("04_scoring.sql", _gen_04_scoring(category, cols, today, country))
+            write("05_source_provenance.sql", _gen_05_source_provenance(category, cols, today, country))
+            write("06_add_images.sql", _gen_06_add_images(category, cols, today, country))
+            write("07_store_availability.sql", _gen_07_store_availability(category, cols, today, country))
+        owned = [
+            "01_insert_products.sql",
+            "01_batch_*_insert_products.sql",
+            "03_add_nutrition.sql",
+            "03_batch_*_add_nutrition.sql",
+            "04_scoring.sql",
+            "04_batch_*_scoring.sql",
+            "05_source_provenance.sql",
+            "05_batch_*_source_provenance.sql",
+            "06_add_images.sql",
+            "06_batch_*_add_images.sql",
+            "07_store_availability.sql",
+            "07_batch_*_store_availability.sql",
+            f"{COPY_PAYLOAD_STEP}.csv",
+            f"{COPY_DRIVER_STEP}.sql",
+        ]
+
+    # Clean up what earlier runs left behind: the other format, the other
+    # batching layout, the other compression.
+    written = set(files)
+    for pattern in owned:
+        for old in [*out.glob(f"PIPELINE__{slug}__{pattern}"), *out.glob(f"PIPELINE__{slug}__{pattern}.gz")]:
+            if old not in written:
+                old.unlink()
+
+    # What the next generate_delta diffs against, once this generation is applied.
+    if output_format == "copy":
+        cols = _Columns.from_products(products, country)
+    _write_snapshot(out, cols, category, country)
     return files
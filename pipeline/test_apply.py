@@ -0,0 +1,505 @@
+"""Unit tests for pipeline.apply — transactional apply of pipeline SQL folders."""
+
+from __future__ import annotations
+
+import gzip
+import subprocess
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from pipeline import apply, db
+from pipeline.conftest import make_products
+from pipeline.sql_generator import (
+    _NUTRITION_KEYS,
+    PENDING_SNAPSHOT_FILENAME,
+    SNAPSHOT_FILENAME,
+    generate_delta,
+    generate_pipeline,
+)
+
+# ─── Helpers ─────────────────────────────────────────────────────────────
+
+
+def _folder(root: Path, name: str, eans: list[str], steps: dict[str, str] | None = None) -> Path:
+    folder = root / name
+    folder.mkdir()
+    values = ", ".join(f"('Brand', 'Product {ean}', '{ean}')" for ean in eans)
+    (folder / f"PIPELINE__{name}__01_insert_products.sql").write_text(
+        f"INSERT INTO products (brand, product_name, ean) VALUES {values};\n", encoding="utf-8"
+    )
+    for step, sql in (steps or {}).items():
+        (folder / f"PIPELINE__{name}__{step}.sql").write_text(sql, encoding="utf-8")
+    return folder
+
+
+class _FakeCursor:
+    def __init__(self, log: list[str]) -> None:
+        self.log = log
+        self._results: list[tuple[str, int]] = []
+
+    def __enter__(self) -> _FakeCursor:
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        pass
+
+    def execute(self, sql: str) -> None:
+        if "FAIL" in sql:
+            raise db.DatabaseError('relation "nope" does not exist')
+        self.log.append("EXECUTE")
+        self._results = [(f"INSERT 0 {sql.count('(')}", sql.count("("))]
+
+    @property
+    def statusmessage(self) -> str:
+        return self._results[0][0]
+
+    @property
+    def rowcount(self) -> int:
+        return self._results[0][1]
+
+    def nextset(self) -> bool:
+        return False
+
+    @contextmanager
+    def copy(self, statement: str) -> Iterator[_FakeCopy]:
+        copy = _FakeCopy()
+        yield copy
+        rows = copy.data.count(b"\n") - 1  # minus the header line
+        self.log.append(f"{statement} ({rows} rows)")
+        self._results = [(f"COPY {rows}", rows)]
+
+
+class _FakeCopy:
+    def __init__(self) -> None:
+        self.data = b""
+
+    def write(self, chunk: bytes) -> None:
+        self.data += chunk
+
+
+class _FakeConn:
+    def __init__(self, log: list[str]) -> None:
+        self.log = log
+        self.depth = 0
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        kind = "SAVEPOINT" if self.depth else "BEGIN"
+        self.depth += 1
+        self.log.append(kind)
+        try:
+            yield
+        except BaseException:
+            self.log.append(f"ROLLBACK {kind}")
+            raise
+        else:
+            self.log.append(f"COMMIT {kind}")
+        finally:
+            self.depth -= 1
+
+    def cursor(self) -> _FakeCursor:
+        return _FakeCursor(self.log)
+
+
+class _FakePool(db.PoolBackend):
+    def __init__(self) -> None:
+        self.log: list[str] = []
+
+    @contextmanager
+    def connection(self) -> Iterator[_FakeConn]:
+        yield _FakeConn(self.log)
+
+
+# ─── Pooled backend ──────────────────────────────────────────────────────
+
+
+class TestApplyPooled:
+    def test_one_transaction_with_savepoints(self, tmp_path: Path):
+        folder = _folder(tmp_path, "dairy", ["5900000000001", "5900000000002"], {"03_add_nutrition": "UPDATE x;"})
+        pool = _FakePool()
+        result = apply.apply_folder(folder, backend=pool)
+        assert result.committed
+        assert pool.log == [
+            "BEGIN",
+            "SAVEPOINT",
+            "EXECUTE",
+            "COMMIT SAVEPOINT",
+            "SAVEPOINT",
+            "EXECUTE",
+            "COMMIT SAVEPOINT",
+            "COMMIT BEGIN",
+        ]
+        assert [f.name for f in result.files] == [
+            "PIPELINE__dairy__01_insert_products.sql",
+            "PIPELINE__dairy__03_add_nutrition.sql",
+        ]
+        assert result.files[0].statements == [("INSERT 0 3", 3)]
+        assert result.rows_affected == 3
+
+    def test_failure_rolls_back_category(self, tmp_path: Path):
+        folder = _folder(tmp_path, "dairy", ["5900000000001"], {"03_add_nutrition": "FAIL;"})
+        pool = _FakePool()
+        with pytest.raises(apply.ApplyError) as excinfo:
+            apply.apply_folder(folder, backend=pool)
+        assert pool.log[-2:] == ["ROLLBACK SAVEPOINT", "ROLLBACK BEGIN"]
+        result = excinfo.value.result
+        assert not result.committed
+        assert result.failed_file == "PIPELINE__dairy__03_add_nutrition.sql"
+        assert "does not exist" in result.error
+
+    def test_empty_folder_touches_nothing(self, tmp_path: Path):
+        pool = _FakePool()
+        result = apply.apply_folder(tmp_path / "missing", backend=pool)
+        assert result.committed
+        assert pool.log == []
+
+
+# ─── psql backend ────────────────────────────────────────────────────────
+
+
+class TestApplyPsql:
+    @mock.patch("pipeline.db.subprocess.run")
+    def test_single_session_script_and_output(self, mock_run: mock.MagicMock, tmp_path: Path):
+        folder = _folder(tmp_path, "bread", ["5900000000003"], {"03_add_nutrition": "UPDATE x;\nUPDATE y;"})
+        mock_run.return_value = subprocess.CompletedProcess(
+            args=["psql"],
+            returncode=0,
+            stdout=(
+                "Timing is on.\n@@apply PIPELINE__bread__01_insert_products.sql\nSAVEPOINT\nTime: 0.1 ms\n"
+                "INSERT 0 1\nTime: 2.0 ms\nRELEASE\n@@apply PIPELINE__bread__03_add_nutrition.sql\n"
+                "UPDATE 5\nTime: 3.0 ms\nUPDATE 0\nTime: 1.0 ms\nCOMMIT\n"
+            ),
+            stderr="",
+        )
+        result = apply.apply_folder(folder, backend=db.PsqlBackend())
+        script = mock_run.call_args.kwargs["input"]
+        assert script.splitlines()[1] == "BEGIN;"
+        assert script.count("\nSAVEPOINT pipeline_file;") == script.count("RELEASE SAVEPOINT pipeline_file;") == 2
+        assert script.rstrip().endswith("COMMIT;")
+        assert result.files[1].statements == [("UPDATE 5", 5), ("UPDATE 0", 0)]
+        assert result.files[1].seconds == pytest.approx(0.004)
+        assert result.rows_affected == 6
+
+    @mock.patch("pipeline.db.subprocess.run")
+    def test_error_line_maps_to_file(self, mock_run: mock.MagicMock, tmp_path: Path):
+        folder = _folder(tmp_path, "bread", ["5900000000003"], {"03_add_nutrition": "SELECT 1;\nUPDATE nope;"})
+        script, starts = apply._psql_apply_script(apply.sql_files(folder))
+        bad_line = script.splitlines().index("UPDATE nope;") + 1
+        mock_run.return_value = subprocess.CompletedProcess(
+            args=["psql"], returncode=3, stdout="", stderr=f'psql:<stdin>:{bad_line}: ERROR:  relation "nope"'
+        )
+        with pytest.raises(apply.ApplyError) as excinfo:
+            apply.apply_folder(folder, backend=db.PsqlBackend())
+        assert excinfo.value.result.failed_file == "PIPELINE__bread__03_add_nutrition.sql"
+        assert starts[0][1] == "PIPELINE__bread__01_insert_products.sql"
+
+
+# ─── COPY-format folders ─────────────────────────────────────────────────
+
+
+def _copy_folder(root: Path, eans: list[str], *, compress: bool = False) -> Path:
+    products = [
+        {
+            "brand": "Brand",
+            "product_name": f"Product {ean}",
+            "ean": ean,
+            **dict.fromkeys(_NUTRITION_KEYS, 1),
+        }
+        for ean in eans
+    ]
+    folder = root / "dairy"
+    generate_pipeline("Dairy", products, str(folder), output_format="copy", compress=compress)
+    return folder
+
+
+class TestApplyCopyFormat:
+    def test_pooled_streams_payload_into_copy(self, tmp_path: Path):
+        folder = _copy_folder(tmp_path, ["5900000000001", "5900000000002"])
+        pool = _FakePool()
+        result = apply.apply_folder(folder, backend=pool)
+        assert result.committed
+        assert pool.log[:4] == [
+            "BEGIN",
+            "SAVEPOINT",
+            "EXECUTE",  # drop / create staging table
+            "COPY pipeline_stage FROM STDIN with (format csv, header true) (2 rows)",
+        ]
+        assert pool.log[4:] == ["EXECUTE", "COMMIT SAVEPOINT", "COMMIT BEGIN"]
+        assert ("COPY 2", 2) in result.files[0].statements
+
+    def test_psql_script_inlines_payload(self, tmp_path: Path):
+        folder = _copy_folder(tmp_path, ["5900000000001"])
+        script, _starts = apply._psql_apply_script(apply.sql_files(folder))
+        lines = script.splitlines()
+        copy_at = lines.index("\\copy pipeline_stage from pstdin with (format csv, header true)")
+        assert lines[copy_at + 1].startswith("brand,product_name,")
+        assert lines[copy_at + 2].startswith('"Brand","Product 5900000000001",')
+        assert lines[copy_at + 3] == "\\."
+        assert lines[copy_at + 4] == ""
+
+    def test_folder_eans_read_payload(self, tmp_path: Path):
+        folder = _copy_folder(tmp_path, ["5900000000001", "5900000000002"])
+        assert apply.folder_eans(folder) == {"5900000000001", "5900000000002"}
+
+
+# ─── gzip-compressed folders ─────────────────────────────────────────────
+
+
+class TestApplyCompressed:
+    def test_sql_files_include_gz_in_step_order(self, tmp_path: Path):
+        folder = _folder(tmp_path, "dairy", ["5900000000001"], {"04_scoring": "SELECT 1;"})
+        (folder / "PIPELINE__dairy__03_add_nutrition.sql.gz").write_bytes(gzip.compress(b"SELECT 3;"))
+        assert [p.name for p in apply.sql_files(folder)] == [
+            "PIPELINE__dairy__01_insert_products.sql",
+            "PIPELINE__dairy__03_add_nutrition.sql.gz",
+            "PIPELINE__dairy__04_scoring.sql",
+        ]
+
+    def test_psql_script_matches_plain_folder(self, tmp_path: Path):
+        plain = _copy_folder(tmp_path / "plain", ["5900000000001"])
+        packed = _copy_folder(tmp_path / "packed", ["5900000000001"], compress=True)
+        assert all(p.name.endswith(".gz") for p in packed.glob("PIPELINE__*"))
+        plain_script, _ = apply._psql_apply_script(apply.sql_files(plain))
+        packed_script, _ = apply._psql_apply_script(apply.sql_files(packed))
+
+        def statements(script: str) -> list[str]:
+            return [line.replace(".gz", "") for line in script.splitlines() if not line.startswith("--")]
+
+        assert statements(packed_script) == statements(plain_script)
+
+    def test_pooled_streams_decompressed_payload(self, tmp_path: Path):
+        folder = _copy_folder(tmp_path, ["5900000000001", "5900000000002"], compress=True)
+        pool = _FakePool()
+        result = apply.apply_folder(folder, backend=pool)
+        assert result.committed
+        assert "COPY pipeline_stage FROM STDIN with (format csv, header true) (2 rows)" in pool.log
+
+    def test_folder_eans_read_gz_files(self, tmp_path: Path):
+        folder = _copy_folder(tmp_path, ["5900000000001"], compress=True)
+        sql = _folder(tmp_path, "bread", ["5900000000002"])
+        insert = sql / "PIPELINE__bread__01_insert_products.sql"
+        (sql / f"{insert.name}.gz").write_bytes(gzip.compress(insert.read_bytes()))
+        insert.unlink()
+        assert apply.folder_eans(folder) == {"5900000000001"}
+        assert apply.folder_eans(sql) == {"5900000000002"}
+
+
+# ─── Delta files ─────────────────────────────────────────────────────────
+
+
+class TestApplyDelta:
+    def test_delta_applies_only_the_delta_file(self, tmp_path: Path):
+        folder = _folder(tmp_path, "dairy", ["5900000000001"], {"03_add_nutrition": "UPDATE x;"})
+        (folder / "DELTA__dairy__changes.sql").write_text("UPDATE y;", encoding="utf-8")
+        pool = _FakePool()
+        result = apply.apply_folder(folder, backend=pool, delta=True)
+        assert result.committed
+        assert [f.name for f in result.files] == ["DELTA__dairy__changes.sql"]
+
+    def test_full_apply_ignores_the_delta_file(self, tmp_path: Path):
+        folder = _folder(tmp_path, "dairy", ["5900000000001"])
+        (folder / "DELTA__dairy__changes.sql").write_text("UPDATE y;", encoding="utf-8")
+        assert [p.name for p in apply.sql_files(folder)] == ["PIPELINE__dairy__01_insert_products.sql"]
+
+    def test_folder_without_delta_is_a_no_op(self, tmp_path: Path):
+        folder = _folder(tmp_path, "dairy", ["5900000000001"])
+        pool = _FakePool()
+        result = apply.apply_folder(folder, backend=pool, delta=True)
+        assert result.committed
+        assert pool.log == []
+
+    def test_failed_delta_keeps_the_baseline(self, tmp_path: Path):
+        folder = tmp_path / "dairy"
+        products = make_products(5)
+        generate_pipeline("Dairy", products[:3], str(folder))
+        apply.apply_folder(folder, backend=_FakePool())
+        assert (folder / SNAPSHOT_FILENAME).exists()
+
+        # Tonight's delta adds product 4, but fails to apply.
+        delta = generate_delta("Dairy", products[:4], folder)
+        generate_pipeline("Dairy", products[:4], str(folder))
+        delta.path.write_text(delta.path.read_text(encoding="utf-8") + "FAIL;\n", encoding="utf-8")
+        with pytest.raises(apply.ApplyError):
+            apply.apply_folder(folder, backend=_FakePool(), delta=True)
+        assert (folder / PENDING_SNAPSHOT_FILENAME).exists()
+
+        # Tomorrow's delta still carries product 4.
+        retry = generate_delta("Dairy", products, folder)
+        assert (retry.new, retry.unchanged) == (2, 3)
+        generate_pipeline("Dairy", products, str(folder))
+        assert apply.apply_folder(folder, backend=_FakePool(), delta=True).committed
+        assert not (folder / PENDING_SNAPSHOT_FILENAME).exists()
+        assert generate_delta("Dairy", products, folder).unchanged == 5
+
+
+# ─── Manifest (--skip-unchanged) ─────────────────────────────────────────
+
+
+class TestApplyManifest:
+    def test_unchanged_folder_is_skipped(self, tmp_path: Path):
+        folder = _folder(tmp_path, "dairy", ["5900000000001"], {"03_add_nutrition": "UPDATE x;"})
+        apply.apply_folder(folder, backend=_FakePool(), fingerprint="db1")
+        assert (folder / apply.MANIFEST_FILENAME).exists()
+
+        pool = _FakePool()
+        result = apply.apply_folder(folder, backend=pool, fingerprint="db1")
+        assert result.skipped and result.committed
+        assert result.files == []
+        assert pool.log == []
+
+    def test_changed_file_is_applied_again(self, tmp_path: Path):
+        folder = _folder(tmp_path, "dairy", ["5900000000001"], {"03_add_nutrition": "UPDATE x;"})
+        apply.apply_folder(folder, backend=_FakePool(), fingerprint="db1")
+        (folder / "PIPELINE__dairy__03_add_nutrition.sql").write_text("UPDATE y;", encoding="utf-8")
+        result = apply.apply_folder(folder, backend=_FakePool(), fingerprint="db1")
+        assert not result.skipped
+        assert apply.folder_unchanged(folder, "db1")
+
+    def test_new_or_removed_file_is_a_change(self, tmp_path: Path):
+        folder = _folder(tmp_path, "dairy", ["5900000000001"], {"03_add_nutrition": "UPDATE x;"})
+        apply.apply_folder(folder, backend=_FakePool(), fingerprint="db1")
+        (folder / "PIPELINE__dairy__04_scoring.sql").write_text("CALL s();", encoding="utf-8")
+        assert not apply.folder_unchanged(folder, "db1")
+        (folder / "PIPELINE__dairy__04_scoring.sql").unlink()
+        (folder / "PIPELINE__dairy__03_add_nutrition.sql").unlink()
+        assert not apply.folder_unchanged(folder, "db1")
+
+    def test_other_database_is_applied(self, tmp_path: Path):
+        folder = _folder(tmp_path, "dairy", ["5900000000001"])
+        apply.apply_folder(folder, backend=_FakePool(), fingerprint="db1")
+        result = apply.apply_folder(folder, backend=_FakePool(), fingerprint="db2")
+        assert not result.skipped
+        assert apply.folder_unchanged(folder, "db2")
+        assert not apply.folder_unchanged(folder, "db1")
+
+    def test_failed_apply_records_nothing(self, tmp_path: Path):
+        folder = _folder(tmp_path, "dairy", ["5900000000001"], {"03_add_nutrition": "FAIL;"})
+        with pytest.raises(apply.ApplyError):
+            apply.apply_folder(folder, backend=_FakePool(), fingerprint="db1")
+        assert not (folder / apply.MANIFEST_FILENAME).exists()
+
+    def test_without_fingerprint_manifest_is_ignored(self, tmp_path: Path):
+        folder = _folder(tmp_path, "dairy", ["5900000000001"])
+        apply.apply_folder(folder, backend=_FakePool(), fingerprint="db1")
+        pool = _FakePool()
+        assert not apply.apply_folder(folder, backend=pool).skipped
+        assert pool.log[0] == "BEGIN"
+
+    def test_delta_neither_reads_nor_writes_it(self, tmp_path: Path):
+        folder = _folder(tmp_path, "dairy", ["5900000000001"])
+        (folder / "DELTA__dairy__changes.sql").write_text("UPDATE y;", encoding="utf-8")
+        result = apply.apply_folder(folder, backend=_FakePool(), delta=True, fingerprint="db1")
+        assert not result.skipped
+        assert not (folder / apply.MANIFEST_FILENAME).exists()
+
+    @pytest.mark.parametrize("content", ["{not json", '{"version": 0, "fingerprint": "db1", "files": {}}'])
+    def test_unreadable_manifest_means_changed(self, tmp_path: Path, content: str):
+        folder = _folder(tmp_path, "dairy", ["5900000000001"])
+        (folder / apply.MANIFEST_FILENAME).write_text(content, encoding="utf-8")
+        assert not apply.folder_unchanged(folder, "db1")
+
+    def test_generation_date_is_not_a_change(self, tmp_path: Path):
+        folder = _folder(
+            tmp_path, "dairy", ["5900000000001"], {"03_add_nutrition": "-- Generated: 2026-01-01\nUPDATE x;"}
+        )
+        apply.apply_folder(folder, backend=_FakePool(), fingerprint="db1")
+        path = folder / "PIPELINE__dairy__03_add_nutrition.sql"
+        path.write_text("-- Generated: 2026-01-02\nUPDATE x;", encoding="utf-8")
+        assert apply.folder_unchanged(folder, "db1")
+        path.write_text("-- Generated: 2026-01-02\nUPDATE y;", encoding="utf-8")
+        assert not apply.folder_unchanged(folder, "db1")
+
+    def test_gzip_files_are_hashed_decompressed(self, tmp_path: Path):
+        folder = tmp_path / "dairy"
+        folder.mkdir()
+        path = folder / "PIPELINE__dairy__01_insert_products.sql.gz"
+        with gzip.GzipFile(path, "wb", mtime=1) as gz:
+            gz.write(b"-- Generated: 2026-01-01\nINSERT x;\n")
+        first = apply.file_hashes(folder)
+        with gzip.GzipFile(path, "wb", mtime=2) as gz:
+            gz.write(b"-- Generated: 2026-01-02\nINSERT x;\n")
+        assert apply.file_hashes(folder) == first
+
+    def test_copy_payload_is_hashed(self, tmp_path: Path):
+        folder = _copy_folder(tmp_path, ["5900000000001"])
+        apply.apply_folder(folder, backend=_FakePool(), fingerprint="db1")
+        payload = next(folder.glob("PIPELINE__*.csv"))
+        payload.write_text(payload.read_text(encoding="utf-8").replace("Brand", "Other"), encoding="utf-8")
+        assert not apply.folder_unchanged(folder, "db1")
+
+    def test_apply_folders_fingerprints_once(self, tmp_path: Path):
+        folders = [_folder(tmp_path, "a", ["1111111111111"]), _folder(tmp_path, "b", ["2222222222222"])]
+        with mock.patch("pipeline.apply.db_fingerprint", return_value="db1") as fingerprint:
+            first = apply.apply_folders(folders, backend=_FakePool(), skip_unchanged=True)
+            second = apply.apply_folders(folders, jobs=2, backend=_FakePool(), skip_unchanged=True)
+        assert fingerprint.call_count == 2
+        assert [r.skipped for r in first] == [False, False]
+        assert [r.skipped for r in second] == [True, True]
+
+
+# ─── Concurrent apply ────────────────────────────────────────────────────
+
+
+class TestApplyFolders:
+    def test_overlapping_eans_wait_disjoint_run_together(self, tmp_path: Path):
+        folders = [
+            _folder(tmp_path, "a", ["1111111111111"]),
+            _folder(tmp_path, "b", ["2222222222222"]),
+            _folder(tmp_path, "c", ["1111111111111", "3333333333333"]),  # overlaps a
+        ]
+        lock = threading.Lock()
+        active: set[str] = set()
+        seen_together: list[set[str]] = []
+        finished: list[str] = []
+
+        def fake_apply(folder, backend=None, delta=False, fingerprint=None):
+            with lock:
+                active.add(folder.name)
+                seen_together.append(set(active))
+            time.sleep(0.05)
+            with lock:
+                active.discard(folder.name)
+                finished.append(folder.name)
+            return apply.ApplyResult(folder.name, committed=True)
+
+        with mock.patch("pipeline.apply.apply_folder", side_effect=fake_apply):
+            results = apply.apply_folders(folders, jobs=3, backend=_FakePool())
+
+        assert [r.folder for r in results] == ["a", "b", "c"]
+        assert any({"a", "b"} <= group for group in seen_together)
+        assert not any({"a", "c"} <= group for group in seen_together)
+        assert finished.index("a") < finished.index("c")
+
+    def test_deadlock_is_retried_alone(self, tmp_path: Path):
+        folders = [_folder(tmp_path, "a", ["1111111111111"]), _folder(tmp_path, "b", ["2222222222222"])]
+        attempts: list[str] = []
+
+        def fake_apply(folder, backend=None, delta=False, fingerprint=None):
+            attempts.append(folder.name)
+            if folder.name == "b" and attempts.count("b") == 1:
+                raise apply.ApplyError(apply.ApplyResult("b", error="deadlock detected"))
+            return apply.ApplyResult(folder.name, committed=True)
+
+        with mock.patch("pipeline.apply.apply_folder", side_effect=fake_apply):
+            results = apply.apply_folders(folders, jobs=2, backend=_FakePool())
+
+        assert attempts.count("b") == 2
+        assert all(r.committed for r in results)
+
+    def test_sequential_reports_failures(self, tmp_path: Path):
+        folders = [_folder(tmp_path, "a", ["1111111111111"]), _folder(tmp_path, "b", ["2222222222222"])]
+
+        def fake_apply(folder, backend=None, delta=False, fingerprint=None):
+            if folder.name == "a":
+                raise apply.ApplyError(apply.ApplyResult("a", error="boom"))
+            return apply.ApplyResult(folder.name, committed=True)
+
+        with mock.patch("pipeline.apply.apply_folder", side_effect=fake_apply):
+            results = apply.apply_folders(folders)
+        assert [r.committed for r in results] == [False, True]
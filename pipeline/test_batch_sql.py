@@ -7,59 +7,30 @@ small categories.
 
 from __future__ import annotations
 
+import gzip
 from pathlib import Path
+from unittest import mock
 
 import pytest
 
-from pipeline.sql_generator import _chunk, generate_pipeline
+from pipeline.conftest import make_products
+from pipeline.sql_generator import _chunk, _identity_key, generate_pipeline, pipeline_file_names
+from pipeline.utils import write_atomic
 
 # ---------------------------------------------------------------------------
-# Fixtures
+# Helpers
 # ---------------------------------------------------------------------------
 
-_PRODUCT_TEMPLATE = {
-    "brand": "TestBrand",
-    "product_name": "Product",
-    "ean": "5900000000000",
-    "product_type": "Grocery",
-    "prep_method": "not-applicable",
-    "store_availability": None,
-    "controversies": "none",
-    "calories": 100,
-    "total_fat_g": 5.0,
-    "saturated_fat_g": 2.0,
-    "trans_fat_g": 0.0,
-    "carbs_g": 15.0,
-    "sugars_g": 5.0,
-    "fibre_g": 1.0,
-    "protein_g": 3.0,
-    "salt_g": 0.5,
-    "nutri_score_label": "C",
-    "nutri_score_source": "off_computed",
-    "nova_group": "3",
-    "source_url": "https://world.openfoodfacts.org/product/1234",
-    "image_url": "https://images.openfoodfacts.org/img.jpg",
-}
-
-
-def _make_products(n: int) -> list[dict]:
-    """Create *n* distinct product dicts for testing."""
-    products = []
-    for i in range(1, n + 1):
-        p = dict(_PRODUCT_TEMPLATE)
-        p["brand"] = f"Brand{i}"
-        p["product_name"] = f"Product {i}"
-        p["ean"] = f"{5900000000000 + i}"
-        products.append(p)
-    return products
-
 
-@pytest.fixture()
-def tmp_output(tmp_path: Path) -> Path:
-    """Return a fresh output directory for a fake category."""
-    out = tmp_path / "test-cat"
-    out.mkdir()
-    return out
+def _with_images_and_stores(n: int) -> list[dict]:
+    """*n* products; every other one has a front image and every third a store."""
+    products = make_products(n)
+    for i, p in enumerate(products):
+        if i % 2 == 0:
+            p["image_front_url"] = f"https://images.openfoodfacts.org/{i}.jpg"
+        if i % 3 == 0:
+            p["store_availability"] = "Biedronka"
+    return products
 
 
 # ---------------------------------------------------------------------------
@@ -94,7 +65,7 @@ class TestSingleFileMode:
     """When product count ≤ batch_size, output matches original single-file format."""
 
     def test_single_files_below_threshold(self, tmp_output: Path) -> None:
-        products = _make_products(50)
+        products = make_products(50)
         files = generate_pipeline("TestCat", products, str(tmp_output), batch_size=100)
         names = [f.name for f in files]
         assert "PIPELINE__test-cat__01_insert_products.sql" in names
@@ -102,19 +73,19 @@ class TestSingleFileMode:
         assert not any("_batch_" in n for n in names)
 
     def test_single_file_at_exact_threshold(self, tmp_output: Path) -> None:
-        products = _make_products(100)
+        products = make_products(100)
         files = generate_pipeline("TestCat", products, str(tmp_output), batch_size=100)
         names = [f.name for f in files]
         assert "PIPELINE__test-cat__01_insert_products.sql" in names
         assert not any("_batch_" in n for n in names)
 
     def test_unbatched_always_has_six_files(self, tmp_output: Path) -> None:
-        products = _make_products(10)
+        products = make_products(10)
         files = generate_pipeline("TestCat", products, str(tmp_output), batch_size=100)
         assert len(files) == 6
 
     def test_batch_size_zero_disables_batching(self, tmp_output: Path) -> None:
-        products = _make_products(200)
+        products = make_products(200)
         files = generate_pipeline("TestCat", products, str(tmp_output), batch_size=0)
         names = [f.name for f in files]
         assert "PIPELINE__test-cat__01_insert_products.sql" in names
@@ -127,21 +98,19 @@ class TestSingleFileMode:
 
 
 class TestBatchedMode:
-    """When product count > batch_size, steps 01 and 03 are split into batch files."""
+    """When product count > batch_size, every step is split into batch files."""
 
     def test_batch_file_count(self, tmp_output: Path) -> None:
-        products = _make_products(250)
+        products = make_products(250)
         files = generate_pipeline("TestCat", products, str(tmp_output), batch_size=100)
         names = [f.name for f in files]
-        # 3 batch files for 01 + 3 batch files for 03 + 4 single files (04-07) = 10
-        assert len(files) == 10
-        batch_01 = [n for n in names if "01_batch" in n]
-        batch_03 = [n for n in names if "03_batch" in n]
-        assert len(batch_01) == 3
-        assert len(batch_03) == 3
+        # 3 batch files each for 01, 03, 04, 05 + single 06/07 (no images or stores) = 14
+        assert len(files) == 14
+        for step in ("01", "03", "04", "05"):
+            assert len([n for n in names if f"{step}_batch" in n]) == 3
 
     def test_batch_filenames_sort_correctly(self, tmp_output: Path) -> None:
-        products = _make_products(250)
+        products = make_products(250)
         files = generate_pipeline("TestCat", products, str(tmp_output), batch_size=100)
         names = [f.name for f in files]
         # Verify batch numbering is zero-padded and sorts correctly
@@ -153,7 +122,7 @@ class TestBatchedMode:
         ]
 
     def test_batch_naming_pattern(self, tmp_output: Path) -> None:
-        products = _make_products(150)
+        products = make_products(150)
         files = generate_pipeline("TestCat", products, str(tmp_output), batch_size=100)
         names = [f.name for f in files]
         assert "PIPELINE__test-cat__01_batch_001_insert_products.sql" in names
@@ -161,14 +130,47 @@ class TestBatchedMode:
         assert "PIPELINE__test-cat__03_batch_001_add_nutrition.sql" in names
         assert "PIPELINE__test-cat__03_batch_002_add_nutrition.sql" in names
 
-    def test_steps_04_through_07_remain_single(self, tmp_output: Path) -> None:
-        products = _make_products(200)
-        files = generate_pipeline("TestCat", products, str(tmp_output), batch_size=100)
+    def test_steps_04_through_07_are_batched(self, tmp_output: Path) -> None:
+        files = generate_pipeline("TestCat", _with_images_and_stores(200), str(tmp_output), batch_size=100)
+        names = [f.name for f in files]
+        for step in ("04_batch_{}_scoring", "05_batch_{}_source_provenance", "06_batch_{}_add_images"):
+            for n in ("001", "002"):
+                assert f"PIPELINE__test-cat__{step.format(n)}.sql" in names
+        assert "PIPELINE__test-cat__07_batch_002_store_availability.sql" in names
+        assert not any(n.endswith(("04_scoring.sql", "06_add_images.sql")) for n in names)
+
+    def test_no_images_or_stores_keeps_single_files(self, tmp_output: Path) -> None:
+        files = generate_pipeline("TestCat", make_products(200), str(tmp_output), batch_size=100)
         names = [f.name for f in files]
-        assert "PIPELINE__test-cat__04_scoring.sql" in names
-        assert "PIPELINE__test-cat__05_source_provenance.sql" in names
         assert "PIPELINE__test-cat__06_add_images.sql" in names
         assert "PIPELINE__test-cat__07_store_availability.sql" in names
+        assert not any("06_batch" in n or "07_batch" in n for n in names)
+
+
+# ---------------------------------------------------------------------------
+# Planned file names (dry run)
+# ---------------------------------------------------------------------------
+
+
+class TestPipelineFileNames:
+    @pytest.mark.parametrize(
+        ("n", "kwargs"),
+        [
+            (5, {}),
+            (250, {}),
+            (250, {"compress": True}),
+            (150, {"output_format": "copy"}),
+        ],
+    )
+    def test_matches_generated_files(self, tmp_output: Path, n: int, kwargs: dict) -> None:
+        for products in (make_products(n), _with_images_and_stores(n)):
+            files = generate_pipeline("TestCat", products, str(tmp_output), **kwargs)
+            assert pipeline_file_names("test-cat", products, **kwargs) == [f.name for f in files]
+
+    def test_batches_every_step(self) -> None:
+        names = pipeline_file_names("test-cat", _with_images_and_stores(250))
+        assert len(names) == 6 * 3
+        assert names[-1] == "PIPELINE__test-cat__07_batch_003_store_availability.sql"
 
 
 # ---------------------------------------------------------------------------
@@ -180,7 +182,7 @@ class TestBatchContent:
     """Validate SQL content in batch files."""
 
     def test_first_batch_has_preamble(self, tmp_output: Path) -> None:
-        products = _make_products(150)
+        products = make_products(150)
         generate_pipeline("TestCat", products, str(tmp_output), batch_size=100)
         batch1 = (tmp_output / "PIPELINE__test-cat__01_batch_001_insert_products.sql").read_text()
         assert "0a. DEPRECATE old products" in batch1
@@ -188,7 +190,7 @@ class TestBatchContent:
         assert "0c. Deprecate cross-category" in batch1
 
     def test_middle_batch_no_preamble(self, tmp_output: Path) -> None:
-        products = _make_products(350)
+        products = make_products(350)
         generate_pipeline("TestCat", products, str(tmp_output), batch_size=100)
         batch2 = (tmp_output / "PIPELINE__test-cat__01_batch_002_insert_products.sql").read_text()
         assert "0a. DEPRECATE" not in batch2
@@ -196,21 +198,33 @@ class TestBatchContent:
         assert "0c. Deprecate cross-category" not in batch2
 
     def test_last_batch_has_postscript(self, tmp_output: Path) -> None:
-        products = _make_products(150)
+        products = make_products(150)
         generate_pipeline("TestCat", products, str(tmp_output), batch_size=100)
         batch2 = (tmp_output / "PIPELINE__test-cat__01_batch_002_insert_products.sql").read_text()
         assert "2. DEPRECATE removed products" in batch2
 
     def test_postscript_lists_all_products(self, tmp_output: Path) -> None:
-        products = _make_products(150)
+        products = make_products(150)
         generate_pipeline("TestCat", products, str(tmp_output), batch_size=100)
         batch2 = (tmp_output / "PIPELINE__test-cat__01_batch_002_insert_products.sql").read_text()
-        # All 150 product names should be listed in the NOT IN clause
+        # All 150 identity keys are in the anti-join's VALUES list
+        postscript = batch2.split("2. DEPRECATE removed products", 1)[1]
         for p in products:
-            assert p["product_name"] in batch2
+            assert f"('{_identity_key(p['brand'], p['product_name'])}')" in postscript
+
+    def test_postscript_is_an_identity_key_anti_join(self, tmp_output: Path) -> None:
+        products = make_products(3)
+        products.append({**products[0], "brand": "OtherBrand", "ean": "5900000000099"})
+        generate_pipeline("TestCat", products, str(tmp_output), batch_size=2)
+        last = (tmp_output / "PIPELINE__test-cat__01_batch_002_insert_products.sql").read_text()
+        postscript = last.split("2. DEPRECATE removed products", 1)[1]
+        assert "not in (" not in postscript
+        assert "where k.identity_key = p.identity_key" in postscript
+        # Same name, different brand: a distinct key, not covered by the first product's.
+        assert postscript.count("        ('") == 4
 
     def test_every_batch_has_on_conflict(self, tmp_output: Path) -> None:
-        products = _make_products(250)
+        products = make_products(250)
         generate_pipeline("TestCat", products, str(tmp_output), batch_size=100)
         for i in range(1, 4):
             path = tmp_output / f"PIPELINE__test-cat__01_batch_{i:03d}_insert_products.sql"
@@ -218,19 +232,19 @@ class TestBatchContent:
             assert "on conflict (country, brand, product_name)" in content.lower()
 
     def test_nutrition_batch_1_has_delete(self, tmp_output: Path) -> None:
-        products = _make_products(150)
+        products = make_products(150)
         generate_pipeline("TestCat", products, str(tmp_output), batch_size=100)
         batch1 = (tmp_output / "PIPELINE__test-cat__03_batch_001_add_nutrition.sql").read_text()
         assert "delete from nutrition_facts" in batch1.lower()
 
     def test_nutrition_batch_2_no_delete(self, tmp_output: Path) -> None:
-        products = _make_products(150)
+        products = make_products(150)
         generate_pipeline("TestCat", products, str(tmp_output), batch_size=100)
         batch2 = (tmp_output / "PIPELINE__test-cat__03_batch_002_add_nutrition.sql").read_text()
         assert "delete from nutrition_facts" not in batch2.lower()
 
     def test_nutrition_all_batches_have_on_conflict(self, tmp_output: Path) -> None:
-        products = _make_products(250)
+        products = make_products(250)
         generate_pipeline("TestCat", products, str(tmp_output), batch_size=100)
         for i in range(1, 4):
             path = tmp_output / f"PIPELINE__test-cat__03_batch_{i:03d}_add_nutrition.sql"
@@ -238,13 +252,47 @@ class TestBatchContent:
             assert "on conflict (product_id)" in content.lower()
 
     def test_batch_header_comment(self, tmp_output: Path) -> None:
-        products = _make_products(150)
+        products = make_products(150)
         generate_pipeline("TestCat", products, str(tmp_output), batch_size=100)
         batch1 = (tmp_output / "PIPELINE__test-cat__01_batch_001_insert_products.sql").read_text()
         assert "Batch 1/2: products 1-100" in batch1
         batch2 = (tmp_output / "PIPELINE__test-cat__01_batch_002_insert_products.sql").read_text()
         assert "Batch 2/2: products 101-150" in batch2
 
+    def test_only_last_scoring_batch_scores_the_category(self, tmp_output: Path) -> None:
+        generate_pipeline("TestCat", make_products(250), str(tmp_output), batch_size=100)
+        batches = [(tmp_output / f"PIPELINE__test-cat__04_batch_{i:03d}_scoring.sql").read_text() for i in range(1, 4)]
+        assert [b.count("CALL score_category(") for b in batches] == [0, 0, 1]
+        assert [b.count("2b. Nutri-Score source") for b in batches] == [0, 0, 1]
+        # The labels are set before the source is derived from them.
+        assert batches[2].index("3. NOVA") < batches[2].index("2b. Nutri-Score source")
+
+    def test_step_batches_carry_only_their_products(self, tmp_output: Path) -> None:
+        generate_pipeline("TestCat", _with_images_and_stores(250), str(tmp_output), batch_size=100)
+        for step in ("04_batch_{:03d}_scoring", "05_batch_{:03d}_source_provenance", "06_batch_{:03d}_add_images"):
+            batch2 = (tmp_output / f"PIPELINE__test-cat__{step.format(2)}.sql").read_text()
+            assert "'Product 101'" in batch2
+            assert "'Product 99'" not in batch2
+            assert "'Product 201'" not in batch2
+        stores2 = (tmp_output / "PIPELINE__test-cat__07_batch_002_store_availability.sql").read_text()
+        assert stores2.count("'Biedronka')") == len(range(102, 200, 3))  # indices 100-199
+
+    def test_image_delete_only_in_first_batch(self, tmp_output: Path) -> None:
+        generate_pipeline("TestCat", _with_images_and_stores(250), str(tmp_output), batch_size=100)
+        deletes = [
+            (tmp_output / f"PIPELINE__test-cat__06_batch_{i:03d}_add_images.sql").read_text().count("DELETE FROM")
+            for i in range(1, 4)
+        ]
+        assert deletes == [1, 0, 0]
+
+    def test_batch_without_images_inserts_nothing(self, tmp_output: Path) -> None:
+        products = make_products(150)
+        products[0]["image_front_url"] = "https://images.openfoodfacts.org/0.jpg"
+        generate_pipeline("TestCat", products, str(tmp_output), batch_size=100)
+        batch2 = (tmp_output / "PIPELINE__test-cat__06_batch_002_add_images.sql").read_text()
+        assert "INSERT INTO" not in batch2
+        assert "No product images in this batch" in batch2
+
 
 # ---------------------------------------------------------------------------
 # Stale file cleanup
@@ -256,35 +304,108 @@ class TestStaleFileCleanup:
 
     def test_single_to_batch_cleans_single_files(self, tmp_output: Path) -> None:
         # First run: small → single files
-        generate_pipeline("TestCat", _make_products(50), str(tmp_output), batch_size=100)
+        generate_pipeline("TestCat", make_products(50), str(tmp_output), batch_size=100)
         assert (tmp_output / "PIPELINE__test-cat__01_insert_products.sql").exists()
 
         # Second run: large → batch files (should delete single file)
-        generate_pipeline("TestCat", _make_products(200), str(tmp_output), batch_size=100)
+        generate_pipeline("TestCat", make_products(200), str(tmp_output), batch_size=100)
         assert not (tmp_output / "PIPELINE__test-cat__01_insert_products.sql").exists()
         assert (tmp_output / "PIPELINE__test-cat__01_batch_001_insert_products.sql").exists()
 
     def test_batch_to_single_cleans_batch_files(self, tmp_output: Path) -> None:
         # First run: large → batch files
-        generate_pipeline("TestCat", _make_products(200), str(tmp_output), batch_size=100)
+        generate_pipeline("TestCat", make_products(200), str(tmp_output), batch_size=100)
         assert (tmp_output / "PIPELINE__test-cat__01_batch_001_insert_products.sql").exists()
 
         # Second run: small → single files (should delete batch files)
-        generate_pipeline("TestCat", _make_products(50), str(tmp_output), batch_size=100)
+        generate_pipeline("TestCat", make_products(50), str(tmp_output), batch_size=100)
         assert (tmp_output / "PIPELINE__test-cat__01_insert_products.sql").exists()
         assert not (tmp_output / "PIPELINE__test-cat__01_batch_001_insert_products.sql").exists()
 
     def test_rebatch_cleans_old_batches(self, tmp_output: Path) -> None:
         # First run: 300 products → 3 batches
-        generate_pipeline("TestCat", _make_products(300), str(tmp_output), batch_size=100)
+        generate_pipeline("TestCat", make_products(300), str(tmp_output), batch_size=100)
         assert (tmp_output / "PIPELINE__test-cat__01_batch_003_insert_products.sql").exists()
 
         # Second run: 150 products → 2 batches (batch 003 should be deleted)
-        generate_pipeline("TestCat", _make_products(150), str(tmp_output), batch_size=100)
+        generate_pipeline("TestCat", make_products(150), str(tmp_output), batch_size=100)
         assert (tmp_output / "PIPELINE__test-cat__01_batch_002_insert_products.sql").exists()
         assert not (tmp_output / "PIPELINE__test-cat__01_batch_003_insert_products.sql").exists()
 
 
+# ---------------------------------------------------------------------------
+# Streaming, atomic and gzip-compressed writes
+# ---------------------------------------------------------------------------
+
+
+class TestStreamingWrite:
+    """Files are streamed to a temp file and renamed into place."""
+
+    def test_no_temp_files_left(self, tmp_output: Path) -> None:
+        generate_pipeline("TestCat", make_products(250), str(tmp_output), batch_size=100)
+        assert not [p.name for p in tmp_output.iterdir() if p.name.endswith(".tmp")]
+
+    def test_failed_write_keeps_previous_file(self, tmp_path: Path) -> None:
+        target = tmp_path / "PIPELINE__x__01_insert_products.sql"
+        target.write_text("old\n", encoding="utf-8")
+
+        def chunks():
+            yield "new, partial"
+            raise RuntimeError("generator failed")
+
+        with pytest.raises(RuntimeError):
+            write_atomic(target, chunks())
+        assert target.read_text(encoding="utf-8") == "old\n"
+        assert [p.name for p in tmp_path.iterdir()] == [target.name]
+
+    def test_failed_generation_keeps_previous_folder(self, tmp_output: Path) -> None:
+        generate_pipeline("TestCat", make_products(50), str(tmp_output))
+        before = {p.name: p.read_bytes() for p in tmp_output.glob("PIPELINE__*")}
+
+        def failing_05(*args, **kwargs):
+            yield "-- partial"
+            raise RuntimeError("boom")
+
+        with (
+            mock.patch("pipeline.sql_generator._gen_05_source_provenance", failing_05),
+            pytest.raises(RuntimeError),
+        ):
+            generate_pipeline("TestCat", make_products(60), str(tmp_output))
+        after = {p.name for p in tmp_output.glob("PIPELINE__*")}
+        assert after == set(before)
+        assert (tmp_output / "PIPELINE__test-cat__05_source_provenance.sql").read_bytes() == before[
+            "PIPELINE__test-cat__05_source_provenance.sql"
+        ]
+
+    def test_slabbed_escaping_matches_single_pass(self, tmp_path: Path) -> None:
+        products = make_products(250)
+        whole = generate_pipeline("TestCat", products, str(tmp_path / "whole" / "test-cat"), batch_size=100)
+        with mock.patch("pipeline.sql_generator._SLAB_ROWS", 7):
+            slabbed = generate_pipeline("TestCat", products, str(tmp_path / "slabbed" / "test-cat"), batch_size=100)
+        assert [p.read_bytes() for p in slabbed] == [p.read_bytes() for p in whole]
+
+    def test_gzip_round_trip(self, tmp_path: Path) -> None:
+        plain = generate_pipeline("TestCat", make_products(250), str(tmp_path / "plain" / "test-cat"), batch_size=100)
+        packed = generate_pipeline(
+            "TestCat", make_products(250), str(tmp_path / "packed" / "test-cat"), batch_size=100, compress=True
+        )
+        assert [f"{p.name}.gz" for p in plain] == [p.name for p in packed]
+        for p, gz in zip(plain, packed, strict=True):
+            assert gzip.decompress(gz.read_bytes()) == p.read_bytes()
+
+    def test_gzip_output_is_deterministic(self, tmp_path: Path) -> None:
+        first = generate_pipeline("TestCat", make_products(20), str(tmp_path / "a" / "test-cat"), compress=True)
+        second = generate_pipeline("TestCat", make_products(20), str(tmp_path / "b" / "test-cat"), compress=True)
+        assert [p.read_bytes() for p in first] == [p.read_bytes() for p in second]
+
+    def test_switching_compression_removes_twins(self, tmp_output: Path) -> None:
+        generate_pipeline("TestCat", make_products(20), str(tmp_output))
+        generate_pipeline("TestCat", make_products(20), str(tmp_output), compress=True)
+        assert all(p.name.endswith(".sql.gz") for p in tmp_output.glob("PIPELINE__*"))
+        generate_pipeline("TestCat", make_products(20), str(tmp_output))
+        assert all(p.name.endswith(".sql") for p in tmp_output.glob("PIPELINE__*"))
+
+
 # ---------------------------------------------------------------------------
 # check_pipeline_structure.py integration
 # ---------------------------------------------------------------------------
@@ -296,7 +417,7 @@ class TestStructureCheckerCompat:
     def test_batch_files_satisfy_required_steps(self, tmp_output: Path) -> None:
         from check_pipeline_structure import _check_required_files
 
-        products = _make_products(200)
+        products = make_products(200)
         generate_pipeline("test-cat", products, str(tmp_output), batch_size=100)
         violations = _check_required_files("test-cat", tmp_output)
         assert violations == []
@@ -304,7 +425,24 @@ class TestStructureCheckerCompat:
     def test_single_files_still_recognised(self, tmp_output: Path) -> None:
         from check_pipeline_structure import _check_required_files
 
-        products = _make_products(50)
+        products = make_products(50)
         generate_pipeline("test-cat", products, str(tmp_output), batch_size=100)
         violations = _check_required_files("test-cat", tmp_output)
         assert violations == []
+
+    def test_gzip_files_recognised(self, tmp_output: Path) -> None:
+        from check_pipeline_structure import check_category
+
+        generate_pipeline("test-cat", make_products(200), str(tmp_output), batch_size=100, compress=True)
+        assert check_category(tmp_output) == []
+
+    def test_batched_scoring_needs_call_in_last_batch(self, tmp_output: Path) -> None:
+        from check_pipeline_structure import check_category
+
+        generate_pipeline("test-cat", _with_images_and_stores(250), str(tmp_output), batch_size=100)
+        assert check_category(tmp_output) == []
+        last = tmp_output / "PIPELINE__test-cat__04_batch_003_scoring.sql"
+        last.write_text(last.read_text().replace("CALL score_category", "-- score_category"))
+        assert check_category(tmp_output) == [
+            "[test-cat/PIPELINE__test-cat__04_batch_003_scoring.sql] Missing CALL score_category()"
+        ]
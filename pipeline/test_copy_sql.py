@@ -0,0 +1,156 @@
+"""Tests for the COPY output format of the SQL generator (``--format copy``)."""
+
+from __future__ import annotations
+
+import csv
+from pathlib import Path
+
+import pytest
+
+from check_pipeline_structure import check_category
+from pipeline.conftest import PRODUCT_TEMPLATE, make_products
+from pipeline.sql_generator import (
+    COPY_DRIVER_STEP,
+    COPY_PAYLOAD_STEP,
+    _identity_key,
+    copy_payload_eans,
+    copy_payload_path,
+    generate_pipeline,
+)
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+
+def _payload_rows(out: Path) -> list[dict]:
+    with (out / f"PIPELINE__test-cat__{COPY_PAYLOAD_STEP}.csv").open(encoding="utf-8", newline="") as fh:
+        return list(csv.DictReader(fh))
+
+
+# ---------------------------------------------------------------------------
+# Files written
+# ---------------------------------------------------------------------------
+
+
+class TestCopyFiles:
+    def test_payload_and_driver_only(self, tmp_output: Path) -> None:
+        files = generate_pipeline("TestCat", make_products(250), str(tmp_output), output_format="copy")
+        assert [f.name for f in files] == [
+            f"PIPELINE__test-cat__{COPY_PAYLOAD_STEP}.csv",
+            f"PIPELINE__test-cat__{COPY_DRIVER_STEP}.sql",
+        ]
+        assert sorted(p.name for p in tmp_output.glob("PIPELINE__*")) == sorted(f.name for f in files)
+        assert copy_payload_path(files[1]) == files[0]
+        assert len(_payload_rows(tmp_output)) == 250
+
+    def test_switching_format_removes_the_other(self, tmp_output: Path) -> None:
+        generate_pipeline("TestCat", make_products(5), str(tmp_output))
+        generate_pipeline("TestCat", make_products(5), str(tmp_output), output_format="copy")
+        assert not list(tmp_output.glob("PIPELINE__test-cat__0[3-7]_*.sql"))
+
+        generate_pipeline("TestCat", make_products(5), str(tmp_output))
+        assert not (tmp_output / f"PIPELINE__test-cat__{COPY_DRIVER_STEP}.sql").exists()
+        assert not (tmp_output / f"PIPELINE__test-cat__{COPY_PAYLOAD_STEP}.csv").exists()
+        assert (tmp_output / "PIPELINE__test-cat__01_insert_products.sql").exists()
+
+    def test_unknown_format_rejected(self, tmp_output: Path) -> None:
+        with pytest.raises(ValueError, match="output_format"):
+            generate_pipeline("TestCat", make_products(1), str(tmp_output), output_format="parquet")
+
+
+# ---------------------------------------------------------------------------
+# Payload values
+# ---------------------------------------------------------------------------
+
+
+class TestCopyPayload:
+    def test_values_match_sql_generation(self, tmp_output: Path) -> None:
+        p = dict(
+            PRODUCT_TEMPLATE, product_name='Mleko \u2019Łaciate\u2019 "3,2%"', sugars_g="5 g", nova_classification="x"
+        )
+        generate_pipeline("TestCat", [p], str(tmp_output), output_format="copy")
+        row = _payload_rows(tmp_output)[0]
+        assert row["product_name"] == "Mleko 'Łaciate' \"3,2%\""
+        assert row["sugars_g"] == "5"
+        assert row["nova_classification"] == "4"
+        assert row["identity_key"] == _identity_key(p["brand"], p["product_name"])
+
+    def test_null_versus_empty_text(self, tmp_output: Path) -> None:
+        p = dict(PRODUCT_TEMPLATE, ean="", controversies="", fibre_g=None)
+        generate_pipeline("TestCat", [p], str(tmp_output), output_format="copy")
+        line = (tmp_output / f"PIPELINE__test-cat__{COPY_PAYLOAD_STEP}.csv").read_text(encoding="utf-8")
+        fields = next(csv.reader([line.splitlines()[1]]))
+        header = line.splitlines()[0].split(",")
+        raw = dict(zip(header, line.splitlines()[1].split(","), strict=True))
+        assert raw["controversies"] == '""'  # empty string, not NULL
+        assert raw["ean"] == ""  # NULL
+        assert raw["fibre_g"] == ""
+        assert len(fields) == len(header)
+
+    def test_images_need_ean_and_https(self, tmp_output: Path) -> None:
+        products = make_products(2)
+        products[0].update(image_front_url="https://img/1.jpg", image_ingredients_url="http://img/1i.jpg")
+        products[1].update(ean="", image_front_url="https://img/2.jpg")
+        generate_pipeline("TestCat", products, str(tmp_output), output_format="copy")
+        rows = _payload_rows(tmp_output)
+        assert rows[0]["image_front_url"] == "https://img/1.jpg"
+        assert rows[0]["image_ingredients_url"] == ""
+        assert rows[1]["image_front_url"] == ""
+
+    def test_stores_and_eans(self, tmp_output: Path) -> None:
+        products = make_products(2)
+        products[0]["store_availability"] = "Lidl, Biedronka, corner shop"
+        generate_pipeline("TestCat", products, str(tmp_output), output_format="copy")
+        rows = _payload_rows(tmp_output)
+        assert rows[0]["stores"] == "Biedronka|Lidl"
+        assert rows[0]["store_availability"] == "Biedronka"
+        assert rows[1]["stores"] == ""
+        payload = tmp_output / f"PIPELINE__test-cat__{COPY_PAYLOAD_STEP}.csv"
+        assert copy_payload_eans(payload) == {"5900000000001", "5900000000002"}
+
+
+# ---------------------------------------------------------------------------
+# Driver SQL
+# ---------------------------------------------------------------------------
+
+
+class TestCopyDriver:
+    def _driver(self, out: Path) -> str:
+        return (out / f"PIPELINE__test-cat__{COPY_DRIVER_STEP}.sql").read_text(encoding="utf-8")
+
+    def test_loads_then_upserts(self, tmp_output: Path) -> None:
+        generate_pipeline("TestCat", make_products(3), str(tmp_output), country="DE", output_format="copy")
+        sql = self._driver(tmp_output)
+        lines = sql.splitlines()
+        assert "\\copy pipeline_stage from pstdin with (format csv, header true)" in lines
+        assert sql.index("\\copy") < sql.index("insert into products")
+        assert "on conflict (country, brand, product_name) do update" in sql
+        assert "CALL score_category('TestCat', 100, 'DE');" in sql
+        assert "values" not in sql.lower()  # no per-product literals in the driver
+        assert lines[-1] == "drop table pipeline_stage;"
+
+    def test_deprecates_removed_products_by_identity_key(self, tmp_output: Path) -> None:
+        generate_pipeline("TestCat", make_products(3), str(tmp_output), output_format="copy")
+        sql = self._driver(tmp_output)
+        assert "not exists (select 1 from pipeline_stage s where s.identity_key = p.identity_key)" in sql
+        assert "s.product_name = p.product_name" not in sql
+
+    def test_image_and_store_sections_only_when_needed(self, tmp_output: Path) -> None:
+        generate_pipeline("TestCat", make_products(3), str(tmp_output), output_format="copy")
+        sql = self._driver(tmp_output)
+        assert "product_images" not in sql
+        assert "product_store_availability" not in sql
+
+        products = make_products(3)
+        products[0].update(image_front_url="https://img/1.jpg", store_availability="Lidl")
+        generate_pipeline("TestCat", products, str(tmp_output), output_format="copy")
+        sql = self._driver(tmp_output)
+        assert "insert into product_images" in sql
+        assert "insert into product_store_availability" in sql
+
+    def test_structure_check_accepts_copy_folder(self, tmp_output: Path) -> None:
+        generate_pipeline("test-cat", make_products(3), str(tmp_output), output_format="copy")
+        assert check_category(tmp_output) == []
+        (tmp_output / f"PIPELINE__test-cat__{COPY_PAYLOAD_STEP}.csv").unlink()
+        assert check_category(tmp_output) == [f"[test-cat] Missing: PIPELINE__test-cat__{COPY_PAYLOAD_STEP}.csv"]
@@ -0,0 +1,196 @@
+"""Unit tests for pipeline.db — shared Postgres access (psycopg pool / psql)."""
+
+from __future__ import annotations
+
+import subprocess
+from collections.abc import Iterator
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from pipeline import db
+
+# ─── Helpers ─────────────────────────────────────────────────────────────
+
+
+class _FakeBackend:
+    name = "fake"
+
+    def __init__(self, rows: list[tuple]) -> None:
+        self.rows = rows
+        self.calls: list[tuple] = []
+
+    def fetch_all(self, query: str, params: db.Params = None) -> list[tuple]:
+        self.calls.append((query, params))
+        return list(self.rows)
+
+    def stream(self, query: str, params: db.Params = None, chunk_size: int = 0) -> Iterator[tuple]:
+        self.calls.append((query, params))
+        yield from self.rows
+
+    def close(self) -> None:
+        pass
+
+
+@pytest.fixture(autouse=True)
+def _reset_backend() -> Iterator[None]:
+    yield
+    db.set_backend(None)
+
+
+def _completed(stdout: str = "", returncode: int = 0, stderr: str = "") -> subprocess.CompletedProcess:
+    return subprocess.CompletedProcess(args=["psql"], returncode=returncode, stdout=stdout, stderr=stderr)
+
+
+# ─── psql_argv ───────────────────────────────────────────────────────────
+
+
+class TestPsqlArgv:
+    def test_docker_mode(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Without DATABASE_URL / PGHOST, uses docker exec."""
+        monkeypatch.delenv("DATABASE_URL", raising=False)
+        monkeypatch.delenv("PGHOST", raising=False)
+        cmd = db.psql_argv("-c", "SELECT 1;")
+        assert cmd[:3] == ["docker", "exec", "-i"]
+        assert db.DB_CONTAINER in cmd
+        assert cmd[-2:] == ["-c", "SELECT 1;"]
+
+    def test_direct_mode(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """With DATABASE_URL, uses psql directly."""
+        monkeypatch.setenv("DATABASE_URL", "postgresql://localhost/test")
+        cmd = db.psql_argv("-c", "SELECT 1;")
+        assert cmd[:2] == ["psql", "postgresql://localhost/test"]
+        assert "docker" not in cmd
+
+    def test_pghost_mode(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """With only PGHOST, psql reads the connection from the PG* variables."""
+        monkeypatch.delenv("DATABASE_URL", raising=False)
+        monkeypatch.setenv("PGHOST", "localhost")
+        assert db.psql_argv("-c", "SELECT 1;") == ["psql", "-c", "SELECT 1;"]
+
+
+# ─── psql_script ─────────────────────────────────────────────────────────
+
+
+class TestPsqlScript:
+    def test_without_params_is_verbatim(self) -> None:
+        assert db.psql_script("SELECT '100%s' ") == "SELECT '100%s';\n"
+
+    def test_binds_variables(self) -> None:
+        script = db.psql_script("SELECT * FROM products WHERE category = %s AND country = %s", ("Dairy", "PL"))
+        assert script.splitlines() == [
+            "\\set p1 'Dairy'",
+            "\\set p2 'PL'",
+            "SELECT * FROM products WHERE category = :'p1' AND country = :'p2';",
+        ]
+
+    def test_values_never_reach_the_query_text(self) -> None:
+        script = db.psql_script("SELECT %s", ("x'; DROP TABLE products; --\nline\\2",))
+        meta, query = script.splitlines()
+        assert query == "SELECT :'p1';"
+        assert meta == "\\set p1 'x''; DROP TABLE products; --\\nline\\\\2'"
+
+    def test_null_bool_list_and_percent(self) -> None:
+        script = db.psql_script("SELECT %s, %s, %s WHERE name LIKE 'a%%'", (None, True, ["590", 'with "quote"', None]))
+        assert script.splitlines() == [
+            "\\set p2 'true'",
+            '\\set p3 \'{"590","with \\\\"quote\\\\"",NULL}\'',
+            "SELECT NULL, :'p2', :'p3' WHERE name LIKE 'a%';",
+        ]
+
+    @pytest.mark.parametrize("params", [("a",), ("a", "b", "c")])
+    def test_param_count_mismatch(self, params: tuple) -> None:
+        with pytest.raises(db.DatabaseError):
+            db.psql_script("SELECT %s, %s", params)
+
+
+# ─── PsqlBackend ─────────────────────────────────────────────────────────
+
+
+class TestPsqlBackend:
+    @mock.patch("pipeline.db.subprocess.run")
+    def test_fetch_all_parses_csv(self, mock_run: mock.MagicMock) -> None:
+        mock_run.return_value = _completed('1,"Mleko, 3,2%",\\N\n2,"two\nlines",t\n')
+        rows = db.PsqlBackend().fetch_all("SELECT a, b, c FROM t WHERE x = %s", ("y",))
+        assert rows == [("1", "Mleko, 3,2%", None), ("2", "two\nlines", "t")]
+        args = mock_run.call_args
+        assert "--csv" in args.args[0]
+        assert args.kwargs["input"].startswith("\\set p1 'y'\n")
+
+    @mock.patch("pipeline.db.subprocess.run", return_value=_completed(returncode=3, stderr="ERROR: boom"))
+    def test_error_raises_database_error(self, _mock_run: mock.MagicMock) -> None:
+        with pytest.raises(db.DatabaseError, match="boom"):
+            db.PsqlBackend().execute("CALL score_category(%s)", ("Dairy",))
+
+    @mock.patch("pipeline.db.subprocess.run", side_effect=FileNotFoundError("docker"))
+    def test_missing_binary(self, _mock_run: mock.MagicMock) -> None:
+        with pytest.raises(db.DatabaseError, match="could not start psql"):
+            db.PsqlBackend().fetch_all("SELECT 1")
+
+    @mock.patch("pipeline.db.subprocess.run", return_value=_completed())
+    def test_execute_file_is_one_transaction(self, mock_run: mock.MagicMock, tmp_path: Path) -> None:
+        sql_file = tmp_path / "PIPELINE__x__01.sql"
+        sql_file.write_text("INSERT INTO t VALUES (1);\nINSERT INTO t VALUES (2);\n", encoding="utf-8")
+        db.set_backend(db.PsqlBackend())
+        db.execute_file(sql_file)
+        argv = mock_run.call_args.args[0]
+        assert "-1" in argv
+        assert argv[-2:] == ["-f", "-"]
+        assert mock_run.call_args.kwargs["input"] == sql_file.read_text(encoding="utf-8")
+
+
+# ─── Query helpers ───────────────────────────────────────────────────────
+
+
+class TestHelpers:
+    def test_fetch_all_applies_types(self) -> None:
+        db.set_backend(_FakeBackend([("1", "Dairy", "t"), ("2", None, "f")]))
+        rows = db.fetch_all("SELECT 1", types=(int, str, db.to_bool))
+        assert rows == [(1, "Dairy", True), (2, None, False)]
+
+    def test_fetch_value_default(self) -> None:
+        db.set_backend(_FakeBackend([]))
+        assert db.fetch_value("SELECT count(*) FROM t", type=int, default=0) == 0
+        db.set_backend(_FakeBackend([("15",)]))
+        assert db.fetch_value("SELECT count(*) FROM t", type=int) == 15
+
+    def test_params_are_passed_through(self) -> None:
+        backend = _FakeBackend([])
+        db.set_backend(backend)
+        db.fetch_one("SELECT * FROM products WHERE ean = %s", ("5900000000000",))
+        assert backend.calls == [("SELECT * FROM products WHERE ean = %s", ("5900000000000",))]
+
+    def test_stream_is_lazy(self) -> None:
+        db.set_backend(_FakeBackend([("1",), ("2",)]))
+        rows = db.stream("SELECT 1", types=(int,))
+        assert next(rows) == (1,)
+        assert list(rows) == [(2,)]
+
+    @pytest.mark.parametrize(("value", "expected"), [(True, True), ("t", True), ("f", False), (0, False)])
+    def test_to_bool(self, value: object, expected: bool) -> None:
+        assert db.to_bool(value) is expected
+
+
+# ─── Backend selection ───────────────────────────────────────────────────
+
+
+class TestBackendSelection:
+    def test_psql_without_psycopg(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setattr(db, "psycopg", None)
+        monkeypatch.setenv("DATABASE_URL", "postgresql://localhost/test")
+        assert isinstance(db.get_backend(), db.PsqlBackend)
+
+    def test_pool_with_database_url(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setattr(db, "psycopg", mock.MagicMock())
+        monkeypatch.setenv("DATABASE_URL", "postgresql://localhost/test")
+        backend = db.get_backend()
+        assert isinstance(backend, db.PoolBackend)
+        assert backend.conninfo == "postgresql://localhost/test"
+
+    def test_backend_is_shared_until_closed(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setattr(db, "psycopg", None)
+        first = db.get_backend()
+        assert db.get_backend() is first
+        db.close()
+        assert db.get_backend() is not first
@@ -0,0 +1,170 @@
+"""Tests for incremental (diff) output of the SQL generator (``--diff``)."""
+
+from __future__ import annotations
+
+import json
+import re
+from pathlib import Path
+
+from pipeline.conftest import make_products
+from pipeline.sql_generator import (
+    PENDING_SNAPSHOT_FILENAME,
+    SNAPSHOT_FILENAME,
+    generate_delta,
+    generate_pipeline,
+    promote_snapshot,
+)
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+
+def _products(n: int) -> list[dict]:
+    """*n* products with a store and a front image, so every delta section has rows."""
+    return make_products(
+        n, store_availability="Biedronka, Lidl", image_front_url="https://images.openfoodfacts.org/front.jpg"
+    )
+
+
+def _generated(out: Path, products: list[dict]) -> None:
+    """A previous generation of *products* into *out*, applied to the database."""
+    generate_pipeline("TestCat", products, str(out))
+    assert promote_snapshot(out)
+
+
+def _sections(sql: str) -> list[str]:
+    """The numbered ``-- N.`` section headers of a delta file."""
+    return re.findall(r"^-- (\d+[a-z]?\.) ", sql, re.MULTILINE)
+
+
+# ---------------------------------------------------------------------------
+# Snapshot
+# ---------------------------------------------------------------------------
+
+
+class TestSnapshot:
+    def test_written_pending_by_every_generation(self, tmp_output: Path) -> None:
+        generate_pipeline("TestCat", _products(3), str(tmp_output))
+        assert not (tmp_output / SNAPSHOT_FILENAME).exists()
+        snapshot = json.loads((tmp_output / PENDING_SNAPSHOT_FILENAME).read_text(encoding="utf-8"))
+        assert (snapshot["category"], snapshot["country"]) == ("TestCat", "PL")
+        assert len(snapshot["products"]) == 3
+
+        assert promote_snapshot(tmp_output)
+        assert not (tmp_output / PENDING_SNAPSHOT_FILENAME).exists()
+        assert json.loads((tmp_output / SNAPSHOT_FILENAME).read_text(encoding="utf-8")) == snapshot
+        assert not promote_snapshot(tmp_output)
+
+    def test_copy_format_writes_it_too(self, tmp_output: Path) -> None:
+        generate_pipeline("TestCat", _products(3), str(tmp_output), output_format="copy")
+        promote_snapshot(tmp_output)
+        assert generate_delta("TestCat", _products(3), tmp_output).unchanged == 3
+
+    def test_unapplied_generation_is_not_the_baseline(self, tmp_output: Path) -> None:
+        products = _products(5)
+        _generated(tmp_output, products[:3])
+        # Generated (and its delta produced) but never applied: the next delta still starts from 3.
+        generate_delta("TestCat", products[:4], tmp_output)
+        generate_pipeline("TestCat", products[:4], str(tmp_output))
+        result = generate_delta("TestCat", products, tmp_output)
+        assert (result.new, result.unchanged) == (2, 3)
+
+    def test_other_country_is_not_a_baseline(self, tmp_output: Path) -> None:
+        _generated(tmp_output, _products(3))
+        result = generate_delta("TestCat", _products(3), tmp_output, country="DE")
+        assert not result.had_snapshot
+        assert result.new == 3
+
+    def test_corrupt_snapshot_is_ignored(self, tmp_output: Path) -> None:
+        (tmp_output / SNAPSHOT_FILENAME).write_text("{not json", encoding="utf-8")
+        assert generate_delta("TestCat", _products(2), tmp_output).new == 2
+
+
+# ---------------------------------------------------------------------------
+# Delta content
+# ---------------------------------------------------------------------------
+
+
+class TestDelta:
+    def test_unchanged_rerun_touches_nothing(self, tmp_output: Path) -> None:
+        products = _products(50)
+        _generated(tmp_output, products)
+        result = generate_delta("TestCat", products, tmp_output)
+        assert (result.new, result.changed, result.removed, result.unchanged) == (0, 0, 0, 50)
+        assert result.rows_delta == 0
+        assert result.rows_full > 0
+        assert result.reduction == 1.0
+        assert _sections(result.path.read_text(encoding="utf-8")) == []
+
+    def test_without_snapshot_everything_is_new(self, tmp_output: Path) -> None:
+        result = generate_delta("TestCat", _products(5), tmp_output)
+        sql = result.path.read_text(encoding="utf-8")
+        assert not result.had_snapshot
+        assert result.new == 5
+        assert "DEPRECATE" not in sql
+        assert "'Replaced by pipeline refresh'" not in sql
+        assert _sections(sql) == ["2a.", "2b.", "2c.", "3.", "4.", "4b.", "5.", "6a.", "6b.", "7."]
+
+    def test_nutrition_change_only_touches_nutrition_and_rescore(self, tmp_output: Path) -> None:
+        products = _products(10)
+        _generated(tmp_output, products)
+        products[3]["calories"] = 420
+        result = generate_delta("TestCat", products, tmp_output)
+        sql = result.path.read_text(encoding="utf-8")
+        assert (result.new, result.changed, result.unchanged) == (0, 1, 9)
+        assert _sections(sql) == ["3.", "4b."]
+        assert "('Brand4', 'Product 4', 420," in sql
+        assert "Brand5" not in sql
+
+    def test_removed_products_are_deprecated_by_name(self, tmp_output: Path) -> None:
+        products = _products(10)
+        _generated(tmp_output, products)
+        result = generate_delta("TestCat", products[:8], tmp_output)
+        sql = result.path.read_text(encoding="utf-8")
+        assert result.removed == 2
+        assert _sections(sql) == ["1.", "4b."]
+        assert "    ('Brand9', 'Product 9'),\n    ('Brand10', 'Product 10')\n) as d(brand, product_name)" in sql
+        # Like the full refresh, a removed product releases its EAN.
+        assert "set is_deprecated = true, deprecated_reason = 'Removed from pipeline batch', ean = null" in sql
+
+    def test_image_change_replaces_only_that_products_images(self, tmp_output: Path) -> None:
+        products = _products(4)
+        _generated(tmp_output, products)
+        products[0]["image_front_url"] = "https://images.openfoodfacts.org/new.jpg"
+        sql = generate_delta("TestCat", products, tmp_output).path.read_text(encoding="utf-8")
+        assert _sections(sql) == ["6a.", "6b."]
+        assert "new.jpg" in sql
+        assert "Brand2" not in sql
+
+    def test_case_rename_upserts_new_row_and_deprecates_old(self, tmp_output: Path) -> None:
+        products = _products(3)
+        _generated(tmp_output, products)
+        products[0]["product_name"] = "PRODUCT 1"
+        result = generate_delta("TestCat", products, tmp_output)
+        sql = result.path.read_text(encoding="utf-8")
+        assert (result.new, result.removed) == (1, 1)
+        assert "    ('Brand1', 'Product 1')\n) as d(brand, product_name)" in sql
+        assert "'Brand1', 'Grocery', 'TestCat', 'PRODUCT 1'" in sql
+
+    def test_rows_reduction_after_small_change(self, tmp_output: Path) -> None:
+        products = _products(100)
+        _generated(tmp_output, products)
+        products[0]["nutri_score_label"] = "A"
+        result = generate_delta("TestCat", products, tmp_output)
+        # One Nutri-Score update plus the category rescore.
+        assert result.rows_delta == 1 + 100
+        assert result.reduction > 0.9
+
+    def test_compressed_delta_replaces_plain_twin(self, tmp_output: Path) -> None:
+        plain = generate_delta("TestCat", _products(2), tmp_output).path
+        packed = generate_delta("TestCat", _products(2), tmp_output, compress=True).path
+        assert packed.name == f"{plain.name}.gz"
+        assert not plain.exists()
+
+    def test_delta_is_not_a_pipeline_file(self, tmp_output: Path) -> None:
+        _generated(tmp_output, _products(2))
+        generate_delta("TestCat", _products(3), tmp_output)
+        _generated(tmp_output, _products(3))
+        assert (tmp_output / "DELTA__test-cat__changes.sql").exists()
+        assert not [p for p in tmp_output.glob("PIPELINE__*") if "changes" in p.name]
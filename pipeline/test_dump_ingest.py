@@ -0,0 +1,132 @@
+"""Unit tests for pipeline.dump_ingest — streaming OFF dump ingestion."""
+
+from __future__ import annotations
+
+import gzip
+import json
+from pathlib import Path
+
+import pytest
+
+from pipeline import dump_ingest
+from pipeline.categories import DB_TO_OFF_TAGS
+
+DAIRY_TAG = DB_TO_OFF_TAGS["Dairy"][0]
+BREAD_TAG = DB_TO_OFF_TAGS["Bread"][0]
+
+# ─── Helpers ─────────────────────────────────────────────────────────────
+
+
+def _row(i: int, countries: list[str], tag: str, **extra) -> dict:
+    row = {
+        "code": f"{2000000000000 + i}",
+        "product_name": f"Test Product {i}",
+        "brands": f"Brand{i}",
+        "countries_tags": countries,
+        "categories_tags": [tag],
+        "last_modified_t": 1_700_000_000 + i,
+        "nutriments": {
+            "energy-kcal_100g": 250,
+            "fat_100g": 3.0,
+            "proteins_100g": 9.0,
+            "carbohydrates_100g": 45.0,
+            "sugars_100g": 3.0,
+            "salt_100g": 1.0,
+            "fiber_100g": 3.0,
+        },
+    }
+    row.update(extra)
+    return row
+
+
+def _write_dump(path: Path, rows: list[dict], garbage: bool = False) -> Path:
+    with gzip.open(path, "wt", encoding="utf-8") as fh:
+        for row in rows:
+            fh.write(json.dumps(row) + "\n")
+        if garbage:
+            fh.write('{"countries_tags": ["en:poland"], broken\n')
+    return path
+
+
+@pytest.fixture()
+def dump(tmp_path: Path) -> Path:
+    rows = [_row(i, ["en:poland"], BREAD_TAG) for i in range(1, 6)]
+    rows += [_row(i, ["en:germany"], BREAD_TAG) for i in range(6, 9)]
+    rows += [_row(i, ["en:france"], BREAD_TAG) for i in range(9, 12)]
+    rows += [_row(i, ["en:poland"], "en:unmapped-things") for i in range(12, 14)]
+    return _write_dump(tmp_path / "dump.jsonl.gz", rows, garbage=True)
+
+
+# ─── Readers ─────────────────────────────────────────────────────────────
+
+
+class TestReaders:
+    def test_prefilter_skips_other_countries(self, dump: Path):
+        rows = list(dump_ingest.iter_dump(dump, ["en:poland"]))
+        parsed = [r for r in rows if r is not None]
+        assert len(rows) == 14  # every line counted, incl. the malformed one
+        assert len(parsed) == 7
+        assert all("en:poland" in r["countries_tags"] for r in parsed)
+
+    def test_plain_jsonl(self, tmp_path: Path):
+        path = tmp_path / "dump.jsonl"
+        path.write_text(json.dumps(_row(1, ["en:poland"], BREAD_TAG)) + "\n", encoding="utf-8")
+        assert next(dump_ingest.iter_dump(path, ["en:poland"]))["code"] == "2000000000001"
+
+    def test_parquet_row_mapping(self):
+        row = {
+            "code": "1",
+            "product_name": [{"lang": "pl", "text": "Chleb"}, {"lang": "main", "text": "Chleb żytni"}],
+            "nutriments": [
+                {"name": "energy-kcal", "value": 250.0, "100g": 250.0},
+                {"name": "fat", "value": 3.0, "100g": None},
+            ],
+            "countries_tags": ["en:poland"],
+        }
+        product = dump_ingest._parquet_row_to_off(row)
+        assert product["product_name"] == "Chleb żytni"
+        assert product["nutriments"] == {"energy-kcal": 250.0, "energy-kcal_100g": 250.0, "fat": 3.0}
+        assert product["countries_tags"] == ["en:poland"]
+
+
+# ─── Scanning ────────────────────────────────────────────────────────────
+
+
+class TestScanDump:
+    def test_routes_by_country_and_category(self, dump: Path):
+        buckets, stats = dump_ingest.scan_dump(dump, ["PL", "DE"], ["Bread", "Dairy"], max_products=10)
+        assert stats["rows_scanned"] == 14
+        assert stats["rows_in_country"] == 10
+        assert stats["rows_routed"] == 8
+        assert len(buckets[("PL", "Bread")].heap) == 5
+        assert len(buckets[("DE", "Bread")].heap) == 3
+        assert buckets[("PL", "Dairy")].heap == []
+
+    def test_bucket_is_bounded(self, tmp_path: Path):
+        rows = [_row(i, ["en:poland"], BREAD_TAG) for i in range(1, 51)]
+        path = _write_dump(tmp_path / "big.jsonl.gz", rows)
+        buckets, _stats = dump_ingest.scan_dump(path, ["PL"], ["Bread"], max_products=4)
+        bucket = buckets[("PL", "Bread")]
+        assert len(bucket.heap) == 12
+        # Equal market scores → earliest dump rows win, returned in dump order.
+        assert [p["ean"] for p in bucket.candidates()] == [f"{2000000000000 + i}" for i in range(1, 13)]
+
+
+# ─── End to end ──────────────────────────────────────────────────────────
+
+
+class TestIngestDump:
+    def test_generates_pipeline_per_country(self, dump: Path, tmp_path: Path):
+        out = tmp_path / "pipelines"
+        stats = dump_ingest.ingest_dump(dump, ["PL", "DE"], categories=["Bread", "Dairy"], output_root=out)
+        assert stats["categories"]["bread"]["products"] == 5
+        assert stats["categories"]["bread-de"]["products"] == 3
+        assert stats["categories"]["dairy"]["products"] == 0
+        assert (out / "bread" / "PIPELINE__bread__01_insert_products.sql").is_file()
+        assert (out / "bread-de" / "PIPELINE__bread-de__01_insert_products.sql").is_file()
+        assert not (out / "dairy").exists()
+
+    def test_dry_run_writes_nothing(self, dump: Path, tmp_path: Path):
+        out = tmp_path / "pipelines"
+        dump_ingest.ingest_dump(dump, ["PL"], categories=["Bread"], output_root=out, dry_run=True)
+        assert not out.exists()
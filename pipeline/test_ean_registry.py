@@ -0,0 +1,130 @@
+"""Unit tests for pipeline.ean_registry — incremental EAN index over pipeline SQL."""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from pipeline import ean_registry, run
+from pipeline.ean_registry import EanRegistry
+
+# ─── Helpers ─────────────────────────────────────────────────────────────
+
+
+def _write_insert(root: Path, folder: str, eans: list[str], name: str | None = None) -> Path:
+    path = root / folder / (name or f"PIPELINE__{folder}__01_insert_products.sql")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    rows = ",\n".join(f"('PL', 'Brand', 'Product {e}', 'Dairy', '{e}')" for e in eans)
+    path.write_text(f"INSERT INTO products VALUES\n{rows};\n", encoding="utf-8")
+    return path
+
+
+def _write_payload(root: Path, folder: str, eans: list[str]) -> Path:
+    """A ``--format copy`` folder: COPY payload only, no insert SQL."""
+    path = root / folder / f"PIPELINE__{folder}__00_copy_payload.csv"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    rows = "".join(f'"Brand","Product {e}","{e}"\n' for e in eans)
+    path.write_text(f"brand,product_name,ean\n{rows}", encoding="utf-8")
+    return path
+
+
+def _bump_mtime(path: Path) -> None:
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+@pytest.fixture()
+def root(tmp_path: Path) -> Path:
+    _write_insert(tmp_path, "dairy", ["5900000000001", "5900000000002"])
+    _write_insert(tmp_path, "chips", ["5900000000003", "12345678"])
+    _write_insert(tmp_path, "chips-de", ["4000000000001", "5900000000001"])
+    (tmp_path / "empty").mkdir()
+    yield tmp_path
+    ean_registry.reset()
+
+
+# ─── EanRegistry ─────────────────────────────────────────────────────────
+
+
+class TestEanRegistry:
+    def test_existing_eans_excludes_own_folder(self, root: Path):
+        reg = EanRegistry(root)
+        assert reg.existing_eans("dairy") == {"5900000000003", "12345678", "4000000000001", "5900000000001"}
+        assert reg.existing_eans("chips") == {"5900000000001", "5900000000002", "4000000000001"}
+        assert reg.folders_for("5900000000001") == ["chips-de", "dairy"]
+
+    def test_unchanged_files_are_not_rescanned(self, root: Path):
+        EanRegistry(root).refresh()
+        reg = EanRegistry(root)
+        with mock.patch("pipeline.ean_registry.scan_sql_eans") as scan:
+            reg.existing_eans("dairy")
+        scan.assert_not_called()
+        assert reg.stats == {"files_scanned": 0, "files_reused": 3}
+
+    def test_modified_file_is_reindexed(self, root: Path):
+        reg = EanRegistry(root)
+        reg.refresh()
+        path = _write_insert(root, "chips", ["5900000000009"])
+        _bump_mtime(path)
+        assert reg.existing_eans("dairy") == {"5900000000009", "4000000000001", "5900000000001"}
+        assert reg.stats["files_scanned"] == 4
+
+    def test_removed_folder_is_dropped(self, root: Path):
+        reg = EanRegistry(root)
+        reg.refresh()
+        for f in (root / "chips-de").iterdir():
+            f.unlink()
+        (root / "chips-de").rmdir()
+        assert reg.folders_for("5900000000001") == ["dairy"]
+
+    def test_folder_written_refreshes_open_registry(self, root: Path):
+        reg = ean_registry.registry_for(root)
+        reg.refresh()
+        path = _write_insert(root, "dairy", ["5900000000007"])
+        _bump_mtime(path)
+        ean_registry.folder_written(root / "dairy")
+        with reg._lock:
+            rows = reg._conn.execute("SELECT ean FROM eans WHERE path LIKE 'dairy/%'").fetchall()
+        assert rows == [("5900000000007",)]
+
+    def test_copy_payload_eans_are_claimed(self, root: Path):
+        _write_payload(root, "juice", ["5900000000010", "5900000000011"])
+        reg = EanRegistry(root)
+        assert {"5900000000010", "5900000000011"} <= reg.existing_eans("dairy")
+        assert reg.folders_for("5900000000010") == ["juice"]
+        assert "5900000000010" not in reg.existing_eans("juice")
+
+    def test_registry_for_missing_dir(self, tmp_path: Path):
+        assert ean_registry.registry_for(tmp_path / "nope") is None
+
+
+# ─── pipeline.run integration ────────────────────────────────────────────
+
+
+class TestCollectExistingEans:
+    def _legacy_scan(self, root: Path, exclude: str) -> set[str]:
+        eans: set[str] = set()
+        for folder in root.iterdir():
+            if folder.is_dir() and folder.name != exclude:
+                for f in folder.glob(ean_registry.INSERT_GLOB):
+                    eans |= set(ean_registry.EAN_IN_SQL_RE.findall(f.read_text(encoding="utf-8")))
+        return eans
+
+    @pytest.mark.parametrize("exclude", ["dairy", "chips", "chips-de", "new-folder"])
+    def test_matches_direct_scan(self, root: Path, exclude: str):
+        assert run._collect_existing_eans(root, exclude) == self._legacy_scan(root, exclude)
+
+    def test_falls_back_to_scan_when_index_unavailable(self, root: Path):
+        with mock.patch("pipeline.ean_registry.registry_for", side_effect=sqlite3.OperationalError("locked")):
+            assert run._collect_existing_eans(root, "dairy") == self._legacy_scan(root, "dairy")
+
+    def test_copy_folder_is_claimed_with_and_without_index(self, root: Path):
+        _write_payload(root, "juice", ["5900000000010"])
+        assert "5900000000010" in run._collect_existing_eans(root, "dairy")
+        with mock.patch("pipeline.ean_registry.registry_for", side_effect=sqlite3.OperationalError("locked")):
+            assert "5900000000010" in run._collect_existing_eans(root, "dairy")
+            assert "5900000000010" not in run._collect_existing_eans(root, "juice")
@@ -0,0 +1,247 @@
+"""Unit tests for pipeline.http_cache — TTL, LRU eviction, offline replay."""
+
+from __future__ import annotations
+
+import argparse
+from unittest import mock
+
+import pytest
+
+from pipeline import http_cache, off_client
+from pipeline.http_cache import HttpCache, cache_key
+
+URL = "https://world.openfoodfacts.org/api/v2/product/5900000000001.json"
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _response(payload=None, status=200, headers=None):
+    resp = mock.Mock(status_code=status, headers=headers or {})
+    resp.json.return_value = payload
+    return resp
+
+
+@pytest.fixture()
+def clock() -> _Clock:
+    return _Clock()
+
+
+@pytest.fixture()
+def cache(tmp_path, clock):
+    c = HttpCache(tmp_path, ttl_hours=1, clock=clock)
+    yield c
+    c.close()
+
+
+@pytest.fixture()
+def active_cache(tmp_path):
+    c = http_cache.configure(tmp_path)
+    yield c
+    http_cache.configure(None)
+
+
+# ─── Keys ────────────────────────────────────────────────────────────────
+
+
+class TestCacheKey:
+    def test_param_order_is_irrelevant(self):
+        assert cache_key(URL, {"a": 1, "b": "x"}) == cache_key(URL, {"b": "x", "a": "1"})
+
+    def test_params_distinguish_entries(self):
+        assert cache_key(URL, {"page": 1}) != cache_key(URL, {"page": 2})
+
+    def test_no_params_equals_empty_params(self):
+        assert cache_key(URL) == cache_key(URL, {})
+
+
+# ─── HttpCache ───────────────────────────────────────────────────────────
+
+
+class TestHttpCache:
+    def test_roundtrip(self, cache):
+        payload = {"status": 1, "product": {"code": "5900000000001", "name": "Żurek"}}
+        cache.put(URL, {"fields": "code"}, payload)
+        assert cache.get(URL, {"fields": "code"}) == payload
+        assert cache.get(URL, {"fields": "other"}) is None
+
+    def test_expired_entry_is_a_miss(self, cache, clock):
+        cache.put(URL, None, {"status": 1})
+        clock.now += 3601
+        assert cache.get(URL) is None
+
+    def test_offline_ignores_ttl(self, tmp_path, clock):
+        HttpCache(tmp_path, clock=clock).put(URL, None, {"status": 1})
+        clock.now += 10 * 24 * 3600
+        offline = HttpCache(tmp_path, ttl_hours=1, offline=True, clock=clock)
+        assert offline.get(URL) == {"status": 1}
+
+    def test_persists_across_instances(self, tmp_path):
+        HttpCache(tmp_path).put(URL, None, [1, 2, 3])
+        assert HttpCache(tmp_path).get(URL) == [1, 2, 3]
+
+    def test_lru_eviction(self, tmp_path, clock):
+        payload = {"pad": "x" * 100}
+        probe = HttpCache(tmp_path / "probe", clock=clock)
+        probe.put(URL, None, payload)
+        entry_size = probe._conn.execute("SELECT size FROM responses").fetchone()[0]
+
+        # Room for two entries, not three.
+        c = HttpCache(tmp_path, max_mb=2.5 * entry_size / (1024 * 1024), clock=clock)
+        for name in ("a", "b"):
+            clock.now += 1
+            c.put(f"{URL}?{name}", None, payload)
+        clock.now += 1
+        c.get(f"{URL}?a")  # "b" is now least recently used
+        clock.now += 1
+        c.put(f"{URL}?c", None, payload)
+
+        assert c.get(f"{URL}?a") == payload
+        assert c.get(f"{URL}?b") is None
+        assert c.get(f"{URL}?c") == payload
+
+    def test_fetch_calls_through_on_miss_only(self, cache):
+        fetch = mock.Mock(return_value={"status": 1})
+        assert cache.fetch(URL, None, fetch) == {"status": 1}
+        assert cache.fetch(URL, None, fetch) == {"status": 1}
+        assert fetch.call_count == 1
+
+    def test_fetch_does_not_cache_failures(self, cache):
+        fetch = mock.Mock(return_value=None)
+        assert cache.fetch(URL, None, fetch) is None
+        assert cache.fetch(URL, None, fetch) is None
+        assert fetch.call_count == 2
+
+    def test_offline_miss_never_fetches(self, tmp_path):
+        c = HttpCache(tmp_path, offline=True)
+        fetch = mock.Mock(return_value={"status": 1})
+        assert c.fetch(URL, None, fetch) is None
+        fetch.assert_not_called()
+
+
+# ─── Conditional revalidation ────────────────────────────────────────────
+
+
+class TestRevalidation:
+    def test_stale_entry_sends_validators_and_reuses_on_304(self, cache, clock):
+        payload = {"status": 1, "product": {"code": "1", "name": "x" * 500}}
+        cache.put(URL, None, payload, etag='"v1"', last_modified="Wed, 01 Jan 2026 00:00:00 GMT")
+        clock.now += 7200
+        seen: list[dict] = []
+
+        def fetch(headers):
+            seen.append(headers)
+            return http_cache.Fetched(None, not_modified=True)
+
+        assert cache.revalidate(URL, None, fetch) == payload
+        assert seen == [{"If-None-Match": '"v1"', "If-Modified-Since": "Wed, 01 Jan 2026 00:00:00 GMT"}]
+        assert cache.stats["revalidated"] == 1
+        assert cache.stats["bytes_saved"] > 500
+        # The 304 refreshed the TTL — the next call is a plain hit.
+        assert cache.revalidate(URL, None, fetch) == payload
+        assert len(seen) == 1
+
+    def test_changed_entry_replaces_body_and_validators(self, cache, clock):
+        cache.put(URL, None, {"v": 1}, etag='"v1"')
+        clock.now += 7200
+        new = http_cache.Fetched({"v": 2}, etag='"v2"')
+        assert cache.revalidate(URL, None, lambda _h: new) == {"v": 2}
+        clock.now += 7200
+        seen: list[dict] = []
+        cache.revalidate(URL, None, lambda h: seen.append(h) or http_cache.Fetched(None, not_modified=True))
+        assert seen == [{"If-None-Match": '"v2"'}]
+
+    def test_miss_sends_no_validators(self, cache):
+        seen: list[dict] = []
+        cache.revalidate(URL, None, lambda h: seen.append(h) or http_cache.Fetched({"v": 1}))
+        assert seen == [{}]
+
+    def test_off_client_handles_304(self, active_cache):
+        session = mock.Mock()
+        session.get.return_value = _response({"status": 1}, headers={"ETag": '"abc"'})
+        off_client._get_json(session, URL, {})
+        active_cache._ttl = -1  # everything is stale
+        session.get.return_value = _response(status=304)
+        assert off_client._get_json(session, URL, {}) == {"status": 1}
+        assert session.get.call_args.kwargs["headers"] == {"If-None-Match": '"abc"'}
+        assert active_cache.stats["revalidated"] == 1
+
+
+class TestProductRecords:
+    def test_record_keyed_on_last_modified(self, cache):
+        cache.put_record("extract", "Dairy", "590", 100, {"ean": "590"})
+        assert cache.get_record("extract", "Dairy", "590", 100) == (True, {"ean": "590"})
+        assert cache.get_record("extract", "Dairy", "590", 101) == (False, None)
+        assert cache.get_record("extract", "Bread", "590", 100) == (False, None)
+
+    def test_none_record_is_a_hit(self, cache):
+        cache.put_record("extract", "Dairy", "590", 100, None)
+        assert cache.get_record("extract", "Dairy", "590", 100) == (True, None)
+
+    def test_generation_digest(self, cache, tmp_path):
+        assert cache.generation_digest(tmp_path / "dairy") is None
+        cache.set_generation_digest(tmp_path / "dairy", "abc")
+        assert cache.generation_digest(tmp_path / "dairy") == "abc"
+
+
+# ─── Process-wide cache ──────────────────────────────────────────────────
+
+
+class TestCachedJson:
+    def test_disabled_by_default(self):
+        fetch = mock.Mock(return_value={"status": 1})
+        http_cache.cached_json(URL, None, fetch)
+        http_cache.cached_json(URL, None, fetch)
+        assert fetch.call_count == 2
+        assert not http_cache.last_request_cached()
+
+    def test_last_request_cached_tracks_hits(self, active_cache):
+        fetch = mock.Mock(return_value={"status": 1})
+        http_cache.cached_json(URL, None, fetch)
+        assert not http_cache.last_request_cached()
+        http_cache.cached_json(URL, None, fetch)
+        assert http_cache.last_request_cached()
+
+    def test_off_client_get_json_uses_cache(self, active_cache):
+        session = mock.Mock()
+        session.get.return_value = _response({"status": 1, "product": {"code": "1"}})
+        first = off_client._get_json(session, URL, {"fields": "code"})
+        second = off_client._get_json(session, URL, {"fields": "code"})
+        assert first == second == {"status": 1, "product": {"code": "1"}}
+        assert session.get.call_count == 1
+
+
+# ─── CLI ─────────────────────────────────────────────────────────────────
+
+
+class TestCacheArguments:
+    def _parse(self, argv):
+        parser = argparse.ArgumentParser()
+        http_cache.add_cache_arguments(parser)
+        return parser, parser.parse_args(argv)
+
+    def test_no_cache_dir_disables_cache(self):
+        parser, args = self._parse([])
+        assert http_cache.configure_from_args(parser, args) is None
+        assert http_cache.get_cache() is None
+
+    def test_offline_requires_cache_dir(self):
+        parser, args = self._parse(["--offline"])
+        with pytest.raises(SystemExit):
+            http_cache.configure_from_args(parser, args)
+
+    def test_cli_args_roundtrip(self, tmp_path):
+        parser, args = self._parse(["--cache-dir", str(tmp_path), "--cache-ttl", "6", "--offline"])
+        try:
+            cache = http_cache.configure_from_args(parser, args)
+            _, replay = self._parse(cache.cli_args())
+            assert replay.cache_dir == str(tmp_path)
+            assert replay.cache_ttl == 6
+            assert replay.offline
+        finally:
+            http_cache.configure(None)
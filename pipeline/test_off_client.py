@@ -0,0 +1,484 @@
+"""Unit tests for pipeline.off_client — search paging and concurrent fetch."""
+
+from __future__ import annotations
+
+import threading
+
+import pytest
+import requests
+
+from pipeline import off_client
+from pipeline.rate_limit import AdaptiveTokenBucket, TokenBucket
+
+# ─── Helpers ─────────────────────────────────────────────────────────────
+
+
+def _fake_api(catalog: dict[str, int], fail: set[tuple[str, int]] | None = None):
+    """Return a fake ``_get_json`` serving *catalog* (query → product count).
+
+    Product codes overlap between queries so first-seen dedup is exercised.
+    """
+    fail = fail or set()
+    calls: list[tuple[str, int]] = []
+    lock = threading.Lock()
+
+    def fake_get_json(session, url, params, limiter=None):
+        query = params.get("categories_tags_en") or params.get("search_terms")
+        page = params["page"]
+        with lock:
+            calls.append((query, page))
+        if (query, page) in fail:
+            return None
+        total = catalog.get(query, 0)
+        start = (page - 1) * params["page_size"]
+        stop = min(start + params["page_size"], total)
+        # Every query shares codes 0..9 so later queries hit duplicates.
+        products = [{"code": f"{query}-{i}" if i >= 10 else f"shared-{i}"} for i in range(start, stop)]
+        return {"count": total, "products": products}
+
+    return fake_get_json, calls
+
+
+@pytest.fixture()
+def no_sleep(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(off_client.time, "sleep", lambda _s: None)
+
+
+@pytest.fixture()
+def two_tag_category(monkeypatch: pytest.MonkeyPatch) -> str:
+    monkeypatch.setitem(off_client.DB_TO_OFF_TAGS, "TestCat", ["en:a", "en:b"])
+    monkeypatch.setitem(off_client.CATEGORY_SEARCH_TERMS, "TestCat", ["term one", "term two"])
+    return "TestCat"
+
+
+def _codes(products: list[dict]) -> list[str]:
+    return [p["code"] for p in products]
+
+
+# ─── TokenBucket ─────────────────────────────────────────────────────────
+
+
+class TestTokenBucket:
+    def _bucket(self, rate: float, burst: int = 1) -> tuple[TokenBucket, list[float]]:
+        now = [0.0]
+        sleeps: list[float] = []
+
+        def sleep(seconds: float) -> None:
+            sleeps.append(seconds)
+            now[0] += seconds
+
+        return TokenBucket(rate, burst=burst, clock=lambda: now[0], sleep=sleep), sleeps
+
+    def test_first_request_is_free(self) -> None:
+        bucket, sleeps = self._bucket(2.0)
+        assert bucket.acquire() == 0.0
+        assert sleeps == []
+
+    def test_requests_are_spaced_by_rate(self) -> None:
+        bucket, sleeps = self._bucket(4.0)
+        for _ in range(5):
+            bucket.acquire()
+        assert sleeps == pytest.approx([0.25, 0.25, 0.25, 0.25])
+
+    def test_burst_allows_back_to_back_requests(self) -> None:
+        bucket, sleeps = self._bucket(1.0, burst=3)
+        for _ in range(3):
+            bucket.acquire()
+        assert sleeps == []
+        bucket.acquire()
+        assert sleeps == pytest.approx([1.0])
+
+    def test_invalid_rate_raises(self) -> None:
+        with pytest.raises(ValueError, match="rate"):
+            TokenBucket(0)
+
+    def test_invalid_burst_raises(self) -> None:
+        with pytest.raises(ValueError, match="burst"):
+            TokenBucket(1.0, burst=0)
+
+
+class TestAdaptiveTokenBucket:
+    def _bucket(self, ceiling: float, **kwargs: float) -> tuple[AdaptiveTokenBucket, list[float]]:
+        now = [0.0]
+
+        def sleep(seconds: float) -> None:
+            now[0] += seconds
+
+        bucket = AdaptiveTokenBucket(ceiling, clock=lambda: now[0], sleep=sleep, **kwargs)
+        return bucket, now
+
+    def test_congestion_halves_rate_and_success_restores_it(self) -> None:
+        bucket, _now = self._bucket(4.0, increase=1.0)
+        bucket.on_failure(congested=True)
+        assert bucket.rate == 2.0
+        bucket.on_success()
+        bucket.on_success()
+        bucket.on_success()
+        assert bucket.rate == 4.0
+        assert (bucket.successes, bucket.failures, bucket.backoffs) == (3, 1, 1)
+
+    def test_one_backoff_per_interval(self) -> None:
+        bucket, now = self._bucket(4.0)
+        for _ in range(4):  # one overload seen by four in-flight requests
+            bucket.on_failure(congested=True)
+        assert (bucket.rate, bucket.backoffs, bucket.failures) == (2.0, 1, 4)
+        now[0] += 1.0
+        bucket.on_failure(congested=True)
+        assert bucket.rate == 1.0
+
+    def test_rate_stays_within_floor_and_ceiling(self) -> None:
+        bucket, now = self._bucket(2.0, floor=0.5)
+        for _ in range(10):
+            now[0] += 10
+            bucket.on_failure(congested=True)
+        assert bucket.rate == 0.5
+        for _ in range(100):
+            bucket.on_success()
+        assert bucket.rate == 2.0
+
+    def test_plain_failure_keeps_rate(self) -> None:
+        bucket, _now = self._bucket(2.0)
+        bucket.on_failure(congested=False)
+        assert (bucket.rate, bucket.failures, bucket.backoffs) == (2.0, 1, 0)
+
+    def test_counts_requests(self) -> None:
+        bucket, _now = self._bucket(10.0)
+        for _ in range(3):
+            bucket.acquire()
+        assert bucket.requests == 3
+
+    def test_invalid_decrease_raises(self) -> None:
+        with pytest.raises(ValueError, match="decrease"):
+            AdaptiveTokenBucket(1.0, decrease=1.0)
+
+
+# ─── _fetch_json feedback ────────────────────────────────────────────────
+
+
+class _Response:
+    def __init__(self, status: int, body: dict | None = None) -> None:
+        self.status_code = status
+        self.headers: dict[str, str] = {}
+        self._body = body or {}
+
+    def json(self) -> dict:
+        return self._body
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise requests.HTTPError(response=self)
+
+
+class _Session:
+    def __init__(self, *outcomes: object) -> None:
+        self.outcomes = list(outcomes)
+
+    def get(self, url, params=None, timeout=None, headers=None):
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+class TestFetchJsonFeedback:
+    def _fetch(self, *outcomes: object) -> tuple[object, AdaptiveTokenBucket]:
+        limiter = AdaptiveTokenBucket(1000.0)
+        fetched = off_client._fetch_json(_Session(*outcomes), "https://off/x", {}, limiter, {})
+        return fetched, limiter
+
+    @pytest.mark.parametrize(
+        "failure",
+        [_Response(429), _Response(503), requests.ConnectionError("RemoteDisconnected")],
+    )
+    def test_congestion_backs_off_then_recovers(self, no_sleep: None, failure: object) -> None:
+        fetched, limiter = self._fetch(failure, _Response(200, {"ok": 1}))
+        assert fetched.payload == {"ok": 1}
+        assert (limiter.requests, limiter.failures, limiter.backoffs, limiter.successes) == (2, 1, 1, 1)
+
+    def test_client_error_does_not_back_off(self, no_sleep: None) -> None:
+        _fetched, limiter = self._fetch(_Response(400), _Response(200))
+        assert (limiter.failures, limiter.backoffs) == (1, 0)
+
+    def test_404_is_an_answer_not_a_retry(self) -> None:
+        fetched, limiter = self._fetch(_Response(404))
+        assert fetched.payload == {"status": 0}
+        assert (limiter.requests, limiter.failures) == (1, 0)
+
+
+# ─── search_products (serial vs concurrent) ───────────────────────────────
+
+
+class TestConcurrentSearch:
+    @pytest.mark.parametrize("max_results", [5, 60, 120, 175, 500])
+    @pytest.mark.parametrize("workers", [2, 4, 8])
+    def test_matches_serial_order(
+        self,
+        monkeypatch: pytest.MonkeyPatch,
+        no_sleep: None,
+        two_tag_category: str,
+        max_results: int,
+        workers: int,
+    ) -> None:
+        catalog = {"en:a": 120, "en:b": 30, "term one": 75, "term two": 200}
+        fake, _calls = _fake_api(catalog)
+        monkeypatch.setattr(off_client, "_get_json", fake)
+
+        serial = off_client.search_products(two_tag_category, max_results=max_results)
+        concurrent = off_client.search_products(two_tag_category, max_results=max_results, workers=workers, rps=1000)
+        assert _codes(concurrent) == _codes(serial)
+        assert len(set(_codes(concurrent))) == len(concurrent)
+
+    def test_failed_page_skips_rest_of_query(
+        self,
+        monkeypatch: pytest.MonkeyPatch,
+        no_sleep: None,
+        two_tag_category: str,
+    ) -> None:
+        catalog = {"en:a": 150, "en:b": 30, "term one": 75, "term two": 10}
+        fake, _calls = _fake_api(catalog, fail={("en:a", 2)})
+        monkeypatch.setattr(off_client, "_get_json", fake)
+
+        serial = off_client.search_products(two_tag_category, max_results=400)
+        concurrent = off_client.search_products(two_tag_category, max_results=400, workers=4, rps=1000)
+        assert _codes(concurrent) == _codes(serial)
+        assert "en:a-120" not in _codes(concurrent)
+
+    def test_stops_fetching_once_full(
+        self,
+        monkeypatch: pytest.MonkeyPatch,
+        two_tag_category: str,
+    ) -> None:
+        catalog = {"en:a": 5000, "en:b": 5000, "term one": 5000, "term two": 5000}
+        fake, calls = _fake_api(catalog)
+        monkeypatch.setattr(off_client, "_get_json", fake)
+
+        results = off_client.search_products(two_tag_category, max_results=100, workers=3, rps=1000)
+        assert len(results) == 100
+        # Only a bounded amount of speculative work beyond the 2 needed pages.
+        assert len(calls) <= 2 + 2 * 3
+
+    def test_uses_shared_rate_limiter(
+        self,
+        monkeypatch: pytest.MonkeyPatch,
+        two_tag_category: str,
+    ) -> None:
+        limiters: set[int] = set()
+        fake, _calls = _fake_api({"en:a": 200})
+
+        def tracking_get_json(session, url, params, limiter=None):
+            assert limiter is not None
+            limiters.add(id(limiter))
+            return fake(session, url, params, limiter)
+
+        monkeypatch.setattr(off_client, "_get_json", tracking_get_json)
+        off_client.search_products(two_tag_category, max_results=150, workers=4, rps=500)
+        assert len(limiters) == 1
+
+
+# ─── iter_search_products (page stream) ──────────────────────────────────
+
+
+class TestIterSearchProducts:
+    @pytest.mark.parametrize("workers", [1, 3])
+    def test_pages_concatenate_to_search_products(
+        self,
+        monkeypatch: pytest.MonkeyPatch,
+        no_sleep: None,
+        two_tag_category: str,
+        workers: int,
+    ) -> None:
+        fake, _calls = _fake_api({"en:a": 120, "en:b": 30, "term one": 75})
+        monkeypatch.setattr(off_client, "_get_json", fake)
+
+        pages = list(off_client.iter_search_products(two_tag_category, max_results=175, workers=workers, rps=1000))
+        assert all(pages)
+        flat = [p for page in pages for p in page]
+        assert _codes(flat) == _codes(off_client.search_products(two_tag_category, max_results=175))
+
+    def test_serial_pages_are_fetched_on_demand(
+        self,
+        monkeypatch: pytest.MonkeyPatch,
+        no_sleep: None,
+        two_tag_category: str,
+    ) -> None:
+        fake, calls = _fake_api({"en:a": 500})
+        monkeypatch.setattr(off_client, "_get_json", fake)
+
+        pages = off_client.iter_search_products(two_tag_category, max_results=400)
+        assert len(next(pages)) == off_client.PAGE_SIZE
+        assert calls == [("en:a", 1)]
+        pages.close()
+
+    def test_explicit_tags_replace_category_tags_and_terms(
+        self,
+        monkeypatch: pytest.MonkeyPatch,
+        no_sleep: None,
+        two_tag_category: str,
+    ) -> None:
+        fake, calls = _fake_api({"en:a": 120, "en:crisps": 30, "term one": 75})
+        monkeypatch.setattr(off_client, "_get_json", fake)
+
+        pages = off_client.iter_search_products(two_tag_category, max_results=500, off_tags=["en:crisps"])
+        assert len([p for page in pages for p in page]) == 30
+        assert {query for query, _page in calls} == {"en:crisps"}
+
+
+# ─── Batched barcode lookup ──────────────────────────────────────────────
+
+
+def _fake_product_api(missing: set[str] = frozenset(), unindexed: set[str] = frozenset(), down: bool = False):
+    """Return a fake ``_get_json`` serving the search ``code=`` filter and the product endpoint.
+
+    *missing* codes are unknown to OFF; *unindexed* ones are only found
+    by the product endpoint; with *down* every search request fails.
+    """
+    calls: list[tuple[str, dict]] = []
+    lock = threading.Lock()
+
+    def fake_get_json(session, url, params, limiter=None):
+        if url == off_client.OFF_SEARCH_URL:
+            with lock:
+                calls.append(("search", params))
+            if down:
+                return None
+            codes = params["code"].split(",")
+            return {"products": [{"code": c} for c in codes if c not in missing | unindexed]}
+        ean = url.rsplit("/", 1)[-1].removesuffix(".json")
+        with lock:
+            calls.append((ean, params))
+        if ean in missing:
+            return {"status": 0}
+        return {"status": 1, "product": {"code": ean}}
+
+    return fake_get_json, calls
+
+
+def _eans(n: int) -> list[str]:
+    return [f"{5900000000000 + i}" for i in range(n)]
+
+
+class TestProductsByCodes:
+    @pytest.mark.parametrize("workers", [1, 4])
+    def test_one_search_per_batch(self, monkeypatch: pytest.MonkeyPatch, no_sleep: None, workers: int) -> None:
+        fake, calls = _fake_product_api()
+        monkeypatch.setattr(off_client, "_get_json", fake)
+
+        found = off_client.fetch_products_by_codes(_eans(250), workers=workers, rps=1000)
+        assert list(found) == _eans(250)
+        assert [name for name, _params in calls] == ["search"] * 3
+        assert sorted(len(params["code"].split(",")) for _name, params in calls) == [50, 100, 100]
+
+    def test_misses_fall_back_to_product_endpoint(self, monkeypatch: pytest.MonkeyPatch, no_sleep: None) -> None:
+        eans = _eans(10)
+        fake, calls = _fake_product_api(missing={eans[1]}, unindexed={eans[2]})
+        monkeypatch.setattr(off_client, "_get_json", fake)
+
+        results = dict(off_client.iter_products_by_codes(eans))
+        assert results[eans[1]] is None
+        assert results[eans[2]] == {"code": eans[2]}
+        assert [name for name, _params in calls] == ["search", eans[1], eans[2]]
+
+    def test_without_fallback_misses_stay_missing(self, monkeypatch: pytest.MonkeyPatch, no_sleep: None) -> None:
+        eans = _eans(5)
+        fake, calls = _fake_product_api(unindexed={eans[0]})
+        monkeypatch.setattr(off_client, "_get_json", fake)
+        assert eans[0] not in off_client.fetch_products_by_codes(eans, fallback=False)
+        assert len(calls) == 1
+
+    def test_failed_search_fetches_each_code(self, monkeypatch: pytest.MonkeyPatch, no_sleep: None) -> None:
+        fake, calls = _fake_product_api(down=True)
+        monkeypatch.setattr(off_client, "_get_json", fake)
+        assert list(off_client.fetch_products_by_codes(_eans(3))) == _eans(3)
+        assert len(calls) == 1 + 3
+
+    def test_fields_are_restricted_and_keyed_by_code(self, monkeypatch: pytest.MonkeyPatch, no_sleep: None) -> None:
+        fake, calls = _fake_product_api(unindexed={"5900000000000"})
+        monkeypatch.setattr(off_client, "_get_json", fake)
+        off_client.fetch_products_by_codes(_eans(2), fields="images,image_front_url")
+        assert [params["fields"] for _name, params in calls] == ["code,images,image_front_url"] * 2
+
+    def test_serial_requests_are_throttled(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        sleeps: list[float] = []
+        monkeypatch.setattr(off_client.time, "sleep", sleeps.append)
+        monkeypatch.setattr(off_client, "last_request_cached", lambda: False)
+        fake, _calls = _fake_product_api(unindexed={"5900000000000"})
+        monkeypatch.setattr(off_client, "_get_json", fake)
+        off_client.fetch_products_by_codes(_eans(3))
+        assert sleeps == [off_client.REQUEST_DELAY] * 2
+
+
+class TestIterProductsByEans:
+    @pytest.mark.parametrize("workers", [1, 4])
+    def test_input_order_without_duplicates_or_misses(
+        self,
+        monkeypatch: pytest.MonkeyPatch,
+        no_sleep: None,
+        workers: int,
+    ) -> None:
+        eans = _eans(120)
+        fake, _calls = _fake_product_api(missing={eans[3], eans[70]})
+        monkeypatch.setattr(off_client, "_get_json", fake)
+
+        pages = list(off_client.iter_products_by_eans([*eans, eans[0]], workers=workers, rps=1000))
+        assert [len(page) for page in pages] == [off_client.PAGE_SIZE - 1, off_client.PAGE_SIZE - 1, 20]
+        assert _codes([p for page in pages for p in page]) == [e for e in eans if e not in (eans[3], eans[70])]
+
+    def test_batches_are_fetched_on_demand(self, monkeypatch: pytest.MonkeyPatch, no_sleep: None) -> None:
+        fake, calls = _fake_product_api()
+        monkeypatch.setattr(off_client, "_get_json", fake)
+
+        pages = off_client.iter_products_by_eans(_eans(500))
+        next(pages)
+        assert len(calls) == 1
+        pages.close()
+
+    def test_fetch_product_by_ean(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        fake, _calls = _fake_product_api(missing={"404"})
+        monkeypatch.setattr(off_client, "_get_json", fake)
+        assert off_client.fetch_product_by_ean("5900000000001") == {"code": "5900000000001"}
+        assert off_client.fetch_product_by_ean("404") is None
+
+
+# ─── Market scoring / top-K ──────────────────────────────────────────────
+
+
+def _scored_product(i: int) -> dict:
+    return {
+        "ean": "590123456789" if i % 4 == 0 else "400123456789" if i % 4 == 1 else "123",
+        "product_name": "Żurek" if i % 3 == 0 else "Käse" if i % 3 == 1 else "Plain",
+        "store_availability": ["Biedronka, Lidl", "REWE", "", None][i % 4],
+        "_completeness": [0.9, 0.1, "n/a"][i % 3],
+    }
+
+
+class TestMarketScore:
+    @pytest.mark.parametrize(
+        ("product", "country", "expected"),
+        [
+            (
+                {"ean": "5901234567890", "product_name": "Żurek", "store_availability": "Żabka", "_completeness": 1},
+                "PL",
+                7,
+            ),
+            ({"ean": "4001234567890", "product_name": "Käse", "store_availability": "REWE City"}, "DE", 6),
+            ({"ean": "4001234567890", "product_name": "Käse", "store_availability": "REWE City"}, "PL", 0),
+            ({"ean": "5901234567890", "_completeness": 0.6}, "FR", 1),
+            ({"ean": None, "product_name": None, "store_availability": None}, "PL", 0),
+        ],
+    )
+    def test_scores(self, product: dict, country: str, expected: int) -> None:
+        assert off_client.market_score(product, country) == expected
+
+    def test_polish_market_score_matches_pl(self) -> None:
+        products = [_scored_product(i) for i in range(12)]
+        assert [off_client.polish_market_score(p) for p in products] == [
+            off_client.market_score(p, "PL") for p in products
+        ]
+
+    @pytest.mark.parametrize("country", ["PL", "DE", "FR"])
+    @pytest.mark.parametrize("k", [0, 1, 7, 50, 500])
+    def test_top_k_matches_stable_sort(self, country: str, k: int) -> None:
+        products = [_scored_product(i) for i in range(120)]
+        expected = sorted(products, key=lambda p: off_client.market_score(p, country), reverse=True)[:k]
+        result = off_client.top_k_by_market_score(iter(products), k, country)
+        assert [id(p) for p in result] == [id(p) for p in expected]
@@ -4,37 +4,19 @@ from __future__ import annotations
 
 import json
 import subprocess
+import threading
+import time
 from pathlib import Path
 from unittest import mock
 
 import pytest
 
-from pipeline.orchestrate import (
-    DB_CONTAINER,
-    PipelineOrchestrator,
-    _psql_cmd,
-)
-
-# ─── _psql_cmd ───────────────────────────────────────────────────────────
-
-
-class TestPsqlCmd:
-    def test_docker_mode(self, monkeypatch: pytest.MonkeyPatch) -> None:
-        """Without DATABASE_URL, uses docker exec."""
-        monkeypatch.delenv("DATABASE_URL", raising=False)
-        cmd = _psql_cmd("SELECT 1;")
-        assert "docker" in cmd
-        assert DB_CONTAINER in cmd
-        assert "SELECT 1;" in cmd
-
-    def test_direct_mode(self, monkeypatch: pytest.MonkeyPatch) -> None:
-        """With DATABASE_URL, uses psql directly."""
-        monkeypatch.setenv("DATABASE_URL", "postgresql://localhost/test")
-        cmd = _psql_cmd("SELECT 1;")
-        assert cmd[0] == "psql"
-        assert "postgresql://localhost/test" in cmd
-        assert "docker" not in cmd
+from pipeline import db
+from pipeline.apply import ApplyResult, FileResult
+from pipeline.orchestrate import PHASES, PipelineOrchestrator
+from pipeline.run import PreparedCategory
 
+_RUN_STATS = {"products": 20, "raw_products": 40, "unchanged_products": 30, "sql_regenerated": True}
 
 # ─── PipelineOrchestrator.__init__ ────────────────────────────────────────
 
@@ -76,7 +58,7 @@ class TestOrchestratorInit:
 
 class TestRunCategory:
     @mock.patch("pipeline.orchestrate._run_psql", return_value="0")
-    @mock.patch("pipeline.orchestrate.run_pipeline")
+    @mock.patch("pipeline.orchestrate.run_pipeline", return_value=_RUN_STATS)
     def test_dry_run_skips_execution(
         self,
         mock_run_pipeline: mock.MagicMock,
@@ -133,7 +115,7 @@ class TestRunCategory:
 
 
 class TestRunAll:
-    @mock.patch("pipeline.orchestrate.run_pipeline")
+    @mock.patch("pipeline.orchestrate.run_pipeline", return_value=_RUN_STATS)
     def test_run_all_dry_run(
         self,
         mock_run_pipeline: mock.MagicMock,
@@ -150,7 +132,7 @@ class TestRunAll:
         assert isinstance(report["duration_seconds"], float)
         assert mock_run_pipeline.call_count == 2
 
-    @mock.patch("pipeline.orchestrate.run_pipeline")
+    @mock.patch("pipeline.orchestrate.run_pipeline", return_value=_RUN_STATS)
     def test_report_written(
         self,
         mock_run_pipeline: mock.MagicMock,
@@ -173,6 +155,117 @@ class TestRunAll:
         assert data["country"] == "PL"
         assert data["dry_run"] is True
 
+    @mock.patch("pipeline.orchestrate.run_pipeline", return_value=_RUN_STATS)
+    def test_report_unchanged_ratio(
+        self,
+        mock_run_pipeline: mock.MagicMock,
+        tmp_path: Path,
+    ) -> None:
+        """Unchanged-product counts are aggregated across categories."""
+        orch = PipelineOrchestrator(country="PL", categories=["Dairy", "Bread"], dry_run=True)
+        with mock.patch("pipeline.orchestrate.REPORTS_DIR", tmp_path):
+            report = orch.run_all()
+
+        assert report["raw_products_checked"] == 80
+        assert report["unchanged_products"] == 60
+        assert report["unchanged_ratio"] == 0.75
+        assert report["http_bytes_saved"] == 0
+        assert report["category_results"][0]["unchanged_products"] == 30
+
+
+# ─── --jobs (concurrent fetch, serialized apply) ─────────────────────────
+
+
+_CATEGORIES = ["Bread", "Chips", "Dairy", "Drinks", "Sweets"]
+_APPLIED = ApplyResult("x", files=[FileResult(f"PIPELINE__x__0{i}.sql") for i in range(6)], committed=True)
+
+
+class TestConcurrentJobs:
+    def _live(self, orch: PipelineOrchestrator, tmp_path: Path, **patches) -> dict:
+        with (
+            mock.patch("pipeline.orchestrate.REPORTS_DIR", tmp_path),
+            mock.patch.object(orch, "_detect_stale_products", return_value=0),
+            mock.patch.object(orch, "_execute_sql_files", return_value=_APPLIED),
+            mock.patch.object(orch, "_enrich_category"),
+            mock.patch.object(orch, "_score_category"),
+        ):
+            if patches:
+                with (
+                    mock.patch("pipeline.orchestrate.prepare_category", patches["prepare"]),
+                    mock.patch("pipeline.orchestrate.generate_prepared", patches["generate"]),
+                ):
+                    return orch.run_all()
+            with mock.patch("pipeline.orchestrate.run_pipeline", return_value=_RUN_STATS):
+                return orch.run_all()
+
+    def test_matches_sequential_and_serializes_generation(self, tmp_path: Path) -> None:
+        lock = threading.Lock()
+        in_fetch = {"now": 0, "max": 0}
+        in_generate: list[str] = []
+        order: list[str] = []
+
+        def prepare(category, **kwargs):
+            assert kwargs["limiter"] is not None
+            with lock:
+                in_fetch["now"] += 1
+                in_fetch["max"] = max(in_fetch["max"], in_fetch["now"])
+            time.sleep(0.05)
+            with lock:
+                in_fetch["now"] -= 1
+            return PreparedCategory(category, "PL", [], mock.Mock(), mock.Mock(), fetch_seconds=0.05)
+
+        def generate(prepared, **kwargs):
+            assert not in_generate, "generation must not overlap"
+            in_generate.append(prepared.category)
+            order.append(prepared.category)
+            in_generate.pop()
+            return _RUN_STATS
+
+        sequential = self._live(PipelineOrchestrator("PL", categories=_CATEGORIES), tmp_path)
+        concurrent = self._live(
+            PipelineOrchestrator("PL", categories=_CATEGORIES, jobs=3),
+            tmp_path,
+            prepare=prepare,
+            generate=generate,
+        )
+
+        assert order == _CATEGORIES
+        assert in_fetch["max"] > 1
+
+        def strip(results):
+            return [{k: v for k, v in r.items() if k != "timings"} for r in results]
+
+        assert strip(concurrent["category_results"]) == strip(sequential["category_results"])
+        assert concurrent.keys() == sequential.keys()
+        assert concurrent["jobs"] == 3
+        assert concurrent["category_results"][0]["timings"]["fetch"] == 0.05
+        assert concurrent["phase_seconds"]["fetch"] == pytest.approx(0.25)
+
+    def test_fetch_error_is_reported_per_category(self, tmp_path: Path) -> None:
+        def prepare(category, **kwargs):
+            if category == "Chips":
+                raise RuntimeError("OFF timeout")
+            return PreparedCategory(category, "PL", [], mock.Mock(), mock.Mock())
+
+        report = self._live(
+            PipelineOrchestrator("PL", categories=_CATEGORIES, jobs=2),
+            tmp_path,
+            prepare=prepare,
+            generate=mock.Mock(return_value=_RUN_STATS),
+        )
+        statuses = {r["category"]: r["status"] for r in report["category_results"]}
+        assert statuses.pop("Chips") == "error"
+        assert set(statuses.values()) == {"success"}
+        assert report["errors"] == ["Chips: OFF timeout"]
+
+    @mock.patch("pipeline.orchestrate.run_pipeline", return_value=_RUN_STATS)
+    def test_sequential_result_has_timings(self, mock_run_pipeline: mock.MagicMock, tmp_path: Path) -> None:
+        orch = PipelineOrchestrator(country="PL", categories=["Dairy"], dry_run=True)
+        with mock.patch("pipeline.orchestrate.REPORTS_DIR", tmp_path):
+            report = orch.run_all()
+        assert set(report["category_results"][0]["timings"]) == set(PHASES)
+        assert "timings" in mock_run_pipeline.call_args.kwargs
+
 
 # ─── _detect_stale_products ───────────────────────────────────────────────
 
@@ -183,14 +276,14 @@ class TestDetectStale:
         orch = PipelineOrchestrator(country="PL", categories=["Dairy"], dry_run=True)
         count = orch._detect_stale_products("Dairy")
         assert count == 15
-        # Verify query contains category and country
-        call_arg = mock_psql.call_args[0][0]
-        assert "Dairy" in call_arg
-        assert "PL" in call_arg
+        # Category, country and age are bound parameters, not interpolated
+        query, params = mock_psql.call_args[0]
+        assert params == ("Dairy", "PL", 90)
+        assert "Dairy" not in query
 
     @mock.patch(
         "pipeline.orchestrate._run_psql",
-        side_effect=subprocess.CalledProcessError(1, "psql"),
+        side_effect=db.DatabaseError("connection refused"),
     )
     def test_error_returns_zero(self, mock_psql: mock.MagicMock) -> None:
         orch = PipelineOrchestrator(country="PL", categories=["Dairy"], dry_run=True)
@@ -198,31 +291,84 @@ class TestDetectStale:
         assert count == 0
 
 
+# ─── _score_category ──────────────────────────────────────────────────────
+
+
+class TestScoreCategory:
+    @mock.patch("pipeline.orchestrate.db.execute")
+    def test_binds_category_name(self, mock_execute: mock.MagicMock) -> None:
+        orch = PipelineOrchestrator(country="PL", categories=["Dairy"], dry_run=True)
+        orch._score_category("Nuts, Seeds & Legumes")
+        mock_execute.assert_called_once_with("CALL score_category(%s);", ("Nuts, Seeds & Legumes",))
+
+
 # ─── _execute_sql_files ───────────────────────────────────────────────────
 
 
 class TestExecuteSqlFiles:
     def test_nonexistent_directory(self, tmp_path: Path) -> None:
         orch = PipelineOrchestrator(country="PL", categories=["Dairy"], dry_run=True)
-        count = orch._execute_sql_files(tmp_path / "no-such-dir")
-        assert count == 0
+        applied = orch._execute_sql_files(tmp_path / "no-such-dir")
+        assert applied.files == []
 
-    @mock.patch("pipeline.orchestrate._execute_sql_file")
+    @mock.patch("pipeline.apply.db.get_backend", return_value=db.PsqlBackend())
+    @mock.patch("pipeline.db.subprocess.run")
     def test_executes_in_order(
         self,
-        mock_exec: mock.MagicMock,
+        mock_run: mock.MagicMock,
+        _mock_backend: mock.MagicMock,
         tmp_path: Path,
     ) -> None:
         # Create mock SQL files
+        (tmp_path / "PIPELINE__test__04_scoring.sql").write_text("SELECT 3;")
         (tmp_path / "PIPELINE__test__01_insert.sql").write_text("SELECT 1;")
         (tmp_path / "PIPELINE__test__03_nutrition.sql").write_text("SELECT 2;")
-        (tmp_path / "PIPELINE__test__04_scoring.sql").write_text("SELECT 3;")
         (tmp_path / "other_file.sql").write_text("SKIP")
+        names = sorted(p.name for p in tmp_path.glob("PIPELINE__*.sql"))
+        mock_run.return_value = subprocess.CompletedProcess(
+            args=["psql"], returncode=0, stdout="".join(f"@@apply {n}\nINSERT 0 1\n" for n in names), stderr=""
+        )
 
         orch = PipelineOrchestrator(country="PL", categories=["Dairy"], dry_run=True)
-        count = orch._execute_sql_files(tmp_path)
-        assert count == 3
-        assert mock_exec.call_count == 3
-        # Verify sorted order
-        called_names = [Path(c.args[0]).name for c in mock_exec.call_args_list]
-        assert called_names == sorted(called_names)
+        applied = orch._execute_sql_files(tmp_path)
+        # One psql session for the whole folder, files in sorted order
+        assert mock_run.call_count == 1
+        script = mock_run.call_args.kwargs["input"]
+        assert script.index("SELECT 1;") < script.index("SELECT 2;") < script.index("SELECT 3;")
+        assert "SKIP" not in script
+        assert [f.name for f in applied.files] == names
+        assert applied.rows_affected == 3
+
+    @mock.patch("pipeline.orchestrate.apply_folder")
+    def test_diff_applies_the_delta(self, mock_apply: mock.MagicMock, tmp_path: Path) -> None:
+        orch = PipelineOrchestrator(country="PL", categories=["Dairy"], diff=True)
+        orch._execute_sql_files(tmp_path)
+        mock_apply.assert_called_once_with(tmp_path, delta=True, fingerprint=None)
+
+    @mock.patch("pipeline.orchestrate.db_fingerprint", return_value="db1")
+    @mock.patch("pipeline.orchestrate.apply_folder")
+    def test_skip_unchanged_fingerprints_once(
+        self, mock_apply: mock.MagicMock, mock_fingerprint: mock.MagicMock, tmp_path: Path
+    ) -> None:
+        orch = PipelineOrchestrator(country="PL", categories=["Dairy"], skip_unchanged=True)
+        orch._execute_sql_files(tmp_path / "a")
+        orch._execute_sql_files(tmp_path / "b")
+        assert mock_fingerprint.call_count == 1
+        mock_apply.assert_called_with(tmp_path / "b", delta=False, fingerprint="db1")
+
+    def test_skipped_folder_is_reported(self, tmp_path: Path) -> None:
+        orch = PipelineOrchestrator(country="PL", categories=["Bread", "Dairy"], skip_unchanged=True)
+        skipped = ApplyResult("x", committed=True, skipped=True)
+        with (
+            mock.patch("pipeline.orchestrate.REPORTS_DIR", tmp_path),
+            mock.patch("pipeline.orchestrate.run_pipeline", return_value=_RUN_STATS),
+            mock.patch.object(orch, "_detect_stale_products", return_value=0),
+            mock.patch.object(orch, "_execute_sql_files", side_effect=[skipped, _APPLIED]),
+            mock.patch.object(orch, "_enrich_category"),
+            mock.patch.object(orch, "_score_category"),
+        ):
+            report = orch.run_all()
+        assert report["sql_folders_skipped"] == 1
+        bread, dairy = report["category_results"]
+        assert bread["sql_skipped"] and bread["sql_files_executed"] == 0
+        assert "sql_skipped" not in dairy and dairy["sql_files_executed"] == 6
@@ -0,0 +1,363 @@
+"""Unit tests for pipeline.run — streaming selection, unchanged-product reuse and SQL skip."""
+
+from __future__ import annotations
+
+import threading
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from pipeline import http_cache, run
+from pipeline.utils import prefetch
+
+# ─── Helpers ─────────────────────────────────────────────────────────────
+
+
+def _raw(i: int, last_modified_t: int | None = 1_700_000_000) -> dict:
+    """A raw OFF search hit that survives extraction and validation."""
+    raw = {
+        "code": f"{2000000000000 + i}",
+        "product_name": f"Test Yogurt {i}",
+        "brands": f"Brand{i}",
+        "categories_tags": [],
+        "nutriments": {
+            "energy-kcal_100g": 80,
+            "fat_100g": 3.0,
+            "proteins_100g": 4.0,
+            "carbohydrates_100g": 6.0,
+            "sugars_100g": 5.0,
+            "salt_100g": 0.1,
+        },
+    }
+    if last_modified_t is not None:
+        raw["last_modified_t"] = last_modified_t
+    return raw
+
+
+@pytest.fixture()
+def cache(tmp_path: Path):
+    c = http_cache.configure(tmp_path / "cache")
+    yield c
+    http_cache.configure(None)
+
+
+def _pages(raws: list[dict], page_size: int = 2):
+    return iter([raws[i : i + page_size] for i in range(0, len(raws), page_size)])
+
+
+def _run(raws: list[dict], out: Path) -> dict:
+    with mock.patch("pipeline.run.iter_search_products", return_value=_pages(raws)):
+        return run.run_pipeline("Dairy", max_products=10, output_dir=str(out))
+
+
+# ─── _ProductMemo ────────────────────────────────────────────────────────
+
+
+class TestProductMemo:
+    def test_without_cache_processes_everything(self):
+        memo = run._ProductMemo("Dairy")
+        assert memo.extract(_raw(1))["product_name"] == "Test Yogurt 1"
+        assert memo.unchanged == 0
+
+    def test_unchanged_product_skips_extraction(self, cache):
+        run._ProductMemo("Dairy", cache).extract(_raw(1))
+        memo = run._ProductMemo("Dairy", cache)
+        with mock.patch("pipeline.run.extract_product_data") as extract:
+            product = memo.extract(_raw(1))
+        extract.assert_not_called()
+        assert product["ean"] == "2000000000001"
+        assert memo.unchanged == 1
+
+    def test_modified_product_is_re_extracted(self, cache):
+        run._ProductMemo("Dairy", cache).extract(_raw(1))
+        memo = run._ProductMemo("Dairy", cache)
+        memo.extract(_raw(1, last_modified_t=1_800_000_000))
+        assert memo.unchanged == 0
+
+    def test_unchanged_product_skips_validation(self, cache):
+        memo = run._ProductMemo("Dairy", cache)
+        first = memo.validate(memo.extract(_raw(1)))
+        with mock.patch("pipeline.run.validate_product") as validate:
+            again = memo.validate(memo.extract(_raw(1)))
+        validate.assert_not_called()
+        assert again == first
+
+    def test_changed_processing_code_is_not_reused(self, cache):
+        memo = run._ProductMemo("Dairy", cache)
+        memo.validate(memo.extract(_raw(1)))
+        with mock.patch("pipeline.run._processing_version", return_value="patched"):
+            memo = run._ProductMemo("Dairy", cache)
+            with mock.patch("pipeline.run.validate_product", wraps=run.validate_product) as validate:
+                memo.validate(memo.extract(_raw(1)))
+        assert memo.unchanged == 0
+        validate.assert_called_once()
+
+    def test_missing_last_modified_is_never_reused(self, cache):
+        run._ProductMemo("Dairy", cache).extract(_raw(1, last_modified_t=None))
+        memo = run._ProductMemo("Dairy", cache)
+        memo.extract(_raw(1, last_modified_t=None))
+        assert memo.unchanged == 0
+
+
+# ─── run_pipeline ────────────────────────────────────────────────────────
+
+
+class TestRunPipelineReuse:
+    def test_returns_stats_without_cache(self, tmp_path: Path):
+        stats = _run([_raw(i) for i in range(1, 4)], tmp_path / "dairy")
+        assert stats == {"products": 3, "raw_products": 3, "unchanged_products": 0, "sql_regenerated": True}
+
+    def test_unchanged_run_skips_sql_regeneration(self, cache, tmp_path: Path):
+        out = tmp_path / "dairy"
+        raws = [_raw(i) for i in range(1, 4)]
+        assert _run(raws, out)["sql_regenerated"] is True
+        files = sorted(out.glob("PIPELINE__*.sql"))
+        mtimes = [f.stat().st_mtime_ns for f in files]
+
+        with mock.patch("pipeline.run.generate_pipeline") as generate:
+            stats = _run(raws, out)
+        generate.assert_not_called()
+        assert stats["unchanged_products"] == 3
+        assert stats["sql_regenerated"] is False
+        assert [f.stat().st_mtime_ns for f in files] == mtimes
+
+    def test_modified_product_regenerates(self, cache, tmp_path: Path):
+        out = tmp_path / "dairy"
+        _run([_raw(i) for i in range(1, 4)], out)
+        stats = _run([_raw(1), _raw(2), _raw(3, last_modified_t=1_800_000_000)], out)
+        assert stats["unchanged_products"] == 2
+        assert stats["sql_regenerated"] is True
+
+    def test_changed_processing_code_regenerates(self, cache, tmp_path: Path):
+        out = tmp_path / "dairy"
+        raws = [_raw(i) for i in range(1, 4)]
+        _run(raws, out)
+        with mock.patch("pipeline.run._processing_version", return_value="patched"):
+            assert _run(raws, out)["sql_regenerated"] is True
+
+    def test_deleted_output_regenerates(self, cache, tmp_path: Path):
+        out = tmp_path / "dairy"
+        raws = [_raw(i) for i in range(1, 4)]
+        _run(raws, out)
+        for f in out.glob("PIPELINE__*.sql"):
+            f.unlink()
+        assert _run(raws, out)["sql_regenerated"] is True
+
+
+# ─── Streaming selection ─────────────────────────────────────────────────
+
+
+class TestStreamingSelection:
+    def test_select_products_consumes_stream_once(self, tmp_path: Path):
+        tally = run._Tally()
+        consumed: list[int] = []
+
+        def stream():
+            for i in range(1, 6):
+                consumed.append(i)
+                yield run.validate_product(run._ProductMemo("Dairy").extract(_raw(i)), "Dairy")
+
+        dupe = run.validate_product(run._ProductMemo("Dairy").extract(_raw(1)), "Dairy")
+        selected = run.select_products(
+            "Dairy",
+            iter([*stream(), dupe]),
+            tally,
+            country="PL",
+            max_products=3,
+            pipeline_dir=tmp_path,
+        )
+        assert consumed == [1, 2, 3, 4, 5]
+        assert tally.unique == 5
+        assert [p["ean"] for p in selected] == ["2000000000001", "2000000000002", "2000000000003"]
+
+    def test_own_output_folder_is_not_another_category(self, tmp_path: Path):
+        # fetch_off_category writes Chips/PL to "chips-pl", not pipeline_dir_slug's "chips".
+        own = tmp_path / "chips-pl"
+        own.mkdir()
+        (own / "PIPELINE__chips-pl__01_insert_products.sql").write_text(
+            "INSERT INTO products VALUES ('PL', 'B', 'P', 'Chips', '2000000000001');\n", encoding="utf-8"
+        )
+        product = run.validate_product(run._ProductMemo("Chips").extract(_raw(1)), "Chips")
+        kwargs = {"country": "PL", "max_products": 3, "pipeline_dir": tmp_path}
+        assert run.select_products("Chips", iter([dict(product)]), run._Tally(), **kwargs) == []
+        selected = run.select_products("Chips", iter([dict(product)]), run._Tally(), output_dir=own, **kwargs)
+        assert [p["ean"] for p in selected] == ["2000000000001"]
+
+    def test_listed_products_skip_the_top_k(self, tmp_path: Path):
+        products = [run.validate_product(run._ProductMemo("Dairy").extract(_raw(i)), "Dairy") for i in (1, 2)]
+        kwargs = {"country": "PL", "pipeline_dir": tmp_path, "listed_eans": ["2000000000002"]}
+        # No places left for search results: the listed product is still kept, alone.
+        selected = run.select_products("Dairy", iter(products), run._Tally(), max_products=1, **kwargs)
+        assert [p["ean"] for p in selected] == ["2000000000002"]
+
+    def test_tally_counts_warnings_and_blocks(self):
+        tally = run._Tally(max_blocked=1)
+        assert not tally.admit({"anomaly_errors": ["a"]}, max_warnings=3)
+        assert not tally.admit({"anomaly_errors": ["b"]}, max_warnings=3)
+        assert tally.admit({"validation_warnings": ["w"]}, max_warnings=3)
+        assert not tally.admit({"validation_warnings": ["w"] * 4}, max_warnings=3)
+        assert (tally.validated, tally.warn_count, len(tally.blocked)) == (1, 4, 1)
+
+    def test_search_failure_keeps_products_received(self, tmp_path: Path):
+        def pages():
+            yield [_raw(1), _raw(2)]
+            raise RuntimeError("OFF is down")
+
+        with mock.patch("pipeline.run.iter_search_products", return_value=pages()):
+            stats = run.run_pipeline("Dairy", max_products=10, output_dir=str(tmp_path / "dairy"))
+        assert stats["products"] == 2
+
+    def test_no_products_exits(self, tmp_path: Path):
+        with pytest.raises(SystemExit) as exc:
+            _run([], tmp_path / "dairy")
+        assert exc.value.code == 0
+
+
+# ─── prefetch ────────────────────────────────────────────────────────────
+
+
+class TestPrefetch:
+    def test_preserves_order(self):
+        assert list(prefetch(range(20), depth=3)) == list(range(20))
+
+    def test_producer_runs_ahead_on_another_thread(self):
+        produced: list[int] = []
+        threads: set[str] = set()
+        second = threading.Event()
+
+        def source():
+            for i in range(3):
+                threads.add(threading.current_thread().name)
+                produced.append(i)
+                if i == 1:
+                    second.set()
+                yield i
+
+        items = prefetch(source(), depth=1)
+        assert next(items) == 0
+        # Item 1 is produced while the consumer still holds item 0.
+        assert second.wait(timeout=2)
+        assert list(items) == [1, 2]
+        assert threads == {"prefetch"}
+
+    def test_producer_error_is_reraised(self):
+        def source():
+            yield 1
+            raise ValueError("boom")
+
+        items = prefetch(source())
+        assert next(items) == 1
+        with pytest.raises(ValueError, match="boom"):
+            next(items)
+
+    def test_early_close_stops_producer(self):
+        closed = threading.Event()
+
+        def source():
+            try:
+                yield from range(1000)
+            finally:
+                closed.set()
+
+        items = prefetch(source(), depth=1)
+        assert next(items) == 0
+        items.close()
+        assert closed.is_set()
+
+
+# ─── Two-stage API ───────────────────────────────────────────────────────
+
+
+class TestPrepareAndGenerate:
+    def test_matches_run_pipeline(self, tmp_path: Path):
+        raws = [_raw(i) for i in range(1, 6)]
+        expected = _run(raws, tmp_path / "a")
+        with mock.patch("pipeline.run.iter_search_products", return_value=_pages(raws)) as search:
+            prepared = run.prepare_category("Dairy", max_products=10, limiter=mock.sentinel.limiter)
+        assert search.call_args.kwargs["limiter"] is mock.sentinel.limiter
+        assert len(prepared.validated) == 5
+        stats = run.generate_prepared(prepared, max_products=10, output_dir=tmp_path / "b")
+        assert stats == expected
+        a = [f.read_text(encoding="utf-8") for f in sorted((tmp_path / "a").glob("*__01_*.sql"))]
+        assert a == [f.read_text(encoding="utf-8") for f in sorted((tmp_path / "b").glob("*__01_*.sql"))]
+
+    def test_empty_category_does_not_exit(self, tmp_path: Path):
+        with mock.patch("pipeline.run.iter_search_products", return_value=_pages([])):
+            prepared = run.prepare_category("Dairy")
+        assert run.generate_prepared(prepared, output_dir=tmp_path)["products"] == 0
+
+
+# ─── EAN-list and tag modes ──────────────────────────────────────────────
+
+
+class TestAcquisitionModes:
+    def test_ean_list_skips_search_and_keeps_other_categories(self, tmp_path: Path):
+        raws = [_raw(i) for i in range(1, 4)]
+        raws[0]["categories_tags"] = ["en:chips"]
+        with (
+            mock.patch("pipeline.run.iter_products_by_eans", return_value=_pages(raws)) as by_ean,
+            mock.patch("pipeline.run.iter_search_products") as search,
+        ):
+            eans = [raw["code"] for raw in raws]
+            stats = run.run_pipeline("Dairy", max_products=3, output_dir=str(tmp_path / "dairy"), eans=eans, workers=4)
+        search.assert_not_called()
+        assert by_ean.call_args.args == (eans,)
+        assert by_ean.call_args.kwargs["workers"] == 4
+        assert stats["products"] == 3
+
+    def test_ean_list_then_tag_search(self, tmp_path: Path):
+        with (
+            mock.patch("pipeline.run.iter_products_by_eans", return_value=_pages([_raw(1)])),
+            mock.patch("pipeline.run.iter_search_products", return_value=_pages([_raw(1), _raw(2)])) as search,
+        ):
+            stats = run.run_pipeline(
+                "Dairy", max_products=5, output_dir=str(tmp_path / "dairy"), eans=["1"], off_tags=["en:yogurts"]
+            )
+        assert search.call_args.kwargs["off_tags"] == ["en:yogurts"]
+        assert stats == {"products": 2, "raw_products": 3, "unchanged_products": 0, "sql_regenerated": True}
+
+    def test_listed_eans_are_never_outscored_by_search_results(self, tmp_path: Path):
+        listed = [_raw(1), _raw(2)]
+        found = [_raw(i) for i in range(3, 6)]
+        for raw in found:  # Polish GS1 prefix and a known retailer: a higher market score
+            raw["code"] = f"59{raw['code'][2:]}"
+            raw["stores"] = "Biedronka"
+        out = tmp_path / "dairy"
+        with (
+            mock.patch("pipeline.run.iter_products_by_eans", return_value=_pages(listed)),
+            mock.patch("pipeline.run.iter_search_products", return_value=_pages(found)) as search,
+        ):
+            # fetch_off_category's budget: the EAN list plus --limit 1 search result.
+            stats = run.run_pipeline(
+                "Dairy", max_products=3, output_dir=str(out), eans=["2000000000001", "2000000000002"], off_tags=["x"]
+            )
+        assert search.call_args.kwargs["max_results"] == 3
+        assert stats["products"] == 3
+        sql = next(out.glob("PIPELINE__*__01_insert_products.sql")).read_text(encoding="utf-8")
+        assert "2000000000001" in sql
+        assert "2000000000002" in sql
+        assert "5900000000003" in sql
+        assert "5900000000004" not in sql
+
+    def test_explicit_source_allows_categories_without_search_terms(self, tmp_path: Path):
+        with mock.patch("pipeline.run.iter_search_products", return_value=_pages([_raw(1)])):
+            stats = run.run_pipeline("Not A Category", output_dir=str(tmp_path / "x"), off_tags=["en:x"])
+        assert stats["products"] == 1
+
+    def test_search_filters_products_of_other_categories(self, tmp_path: Path):
+        raws = [_raw(1), _raw(2)]
+        raws[0]["categories_tags"] = ["en:chips"]
+        assert _run(raws, tmp_path / "dairy")["products"] == 1
+
+
+class TestCollectEans:
+    def test_arguments_then_file(self, tmp_path: Path, capsys):
+        ean_file = tmp_path / "eans.txt"
+        ean_file.write_text("# store visit\n5900073020262\n\nnot-an-ean\n12345678\n", encoding="utf-8")
+        assert run.collect_eans("5905187114760, 123", ean_file) == ["5905187114760", "5900073020262", "12345678"]
+        assert "Skipping 2 invalid EANs: 123, not-an-ean" in capsys.readouterr().out
+
+    def test_missing_file_exits(self, tmp_path: Path):
+        with pytest.raises(SystemExit):
+            run.collect_eans(None, tmp_path / "missing.txt")
@@ -0,0 +1,147 @@
+"""Property tests: column-wise SQL escaping matches the per-value helpers.
+
+Each property is checked over many randomly generated columns (seeded, so
+failures reproduce) drawn from an alphabet rich in the characters the
+escapers care about: straight and curly quotes, backslashes, NUL, the
+column separator itself, digits, signs and non-ASCII text.
+"""
+
+from __future__ import annotations
+
+import random
+
+import pytest
+
+from enrich_ingredients import (
+    sql_escape as enrich_escape,
+    sql_escape_column as enrich_escape_column,
+)
+from pipeline.sql_generator import _sql_num, _sql_nums, _sql_text, _sql_texts
+from pipeline.utils import COLUMN_SEP, replace_column
+
+SEEDS = range(25)
+
+_ALPHABET = "ab Z09.-'\u2018\u2019\\\x00\n\tŁżé—€😀" + COLUMN_SEP
+
+
+def _rng(seed: int) -> random.Random:
+    return random.Random(seed)  # noqa: S311 — reproducible test data, not security-sensitive
+
+
+def _text(rnd: random.Random) -> str:
+    return "".join(rnd.choice(_ALPHABET) for _ in range(rnd.randint(0, 12)))
+
+
+def _column(rnd: random.Random, *, with_sep: bool) -> list[str]:
+    values = [_text(rnd) for _ in range(rnd.randint(0, 40))]
+    if with_sep:
+        return values
+    return [v.replace(COLUMN_SEP, "") for v in values]
+
+
+def _cell(rnd: random.Random) -> object:
+    """A nutrient cell as OFF / the validator hands it over."""
+    kind = rnd.randrange(6)
+    if kind == 0:
+        return None
+    if kind == 1:
+        return rnd.randint(-500, 5000)
+    if kind == 2:
+        return rnd.choice([rnd.uniform(-100, 1000), 1e-05, 1e21, float("nan"), float("inf"), -0.0])
+    if kind == 3:
+        return rnd.choice([True, False])
+    if kind == 4:
+        prefix, suffix = rnd.choice(["", " ", "~", "<"]), rnd.choice(["", " g", "kcal", "-5"])
+        return f"{prefix}{rnd.uniform(0, 99):.{rnd.randint(0, 3)}f}{suffix}"
+    return _text(rnd)
+
+
+def _reference_sql_num(value: object) -> str:
+    """``_sql_num`` as originally written (per-character loop)."""
+    if value is None:
+        return "null"
+    s = str(value).strip()
+    if not s:
+        return "null"
+    cleaned = ""
+    for ch in s:
+        if ch in "0123456789.-":
+            cleaned += ch
+        elif cleaned:
+            break
+    if not cleaned or cleaned in (".", "-", "-."):
+        return "null"
+    return cleaned
+
+
+def _reference_sql_text(value: object) -> str:
+    """``_sql_text`` as originally written (chained replaces)."""
+    if value is None:
+        return "null"
+    s = str(value).replace("\u2019", "'").replace("\u2018", "'")
+    return "'" + s.replace("'", "''") + "'"
+
+
+# ─── replace_column ──────────────────────────────────────────────────────
+
+
+class TestReplaceColumn:
+    @pytest.mark.parametrize("seed", SEEDS)
+    @pytest.mark.parametrize("with_sep", [False, True])
+    def test_matches_per_value_replace(self, seed: int, with_sep: bool):
+        rnd = _rng(seed)
+        values = _column(rnd, with_sep=with_sep)
+        pairs = [(rnd.choice("a'\\\x00"), rnd.choice(["", "''", "xy", "\\\\"])) for _ in range(rnd.randint(0, 3))]
+        expected = []
+        for value in values:
+            for old, new in pairs:
+                value = value.replace(old, new)
+            expected.append("<" + value + ">")
+        assert replace_column(values, pairs, "<", ">") == expected
+
+    def test_empty_column(self):
+        assert replace_column([], [("'", "''")], "'", "'") == []
+
+    def test_empty_strings_keep_their_slots(self):
+        assert replace_column(["", "it's", ""], [("'", "''")], "'", "'") == ["''", "'it''s'", "''"]
+
+
+# ─── sql_generator ───────────────────────────────────────────────────────
+
+
+class TestSqlGeneratorColumns:
+    @pytest.mark.parametrize("seed", SEEDS)
+    @pytest.mark.parametrize("with_sep", [False, True])
+    def test_sql_texts(self, seed: int, with_sep: bool):
+        rnd = _rng(seed)
+        values: list[object] = [*_column(rnd, with_sep=with_sep), None, 12.5, 7]
+        rnd.shuffle(values)
+        assert _sql_texts(values) == [_sql_text(v) for v in values]
+        assert [_sql_text(v) for v in values] == [_reference_sql_text(v) for v in values]
+
+    @pytest.mark.parametrize("seed", SEEDS)
+    def test_sql_nums(self, seed: int):
+        rnd = _rng(seed)
+        values = [_cell(rnd) for _ in range(rnd.randint(0, 60))]
+        expected = [_reference_sql_num(v) for v in values]
+        assert [_sql_num(v) for v in values] == expected
+        assert _sql_nums(values) == expected
+
+    @pytest.mark.parametrize(
+        ("value", "literal"),
+        [("12.5 g", "12.5"), ("~3", "3"), ("-.", "null"), ("--1", "--1"), ("", "null"), ("1e-05", "1"), (None, "null")],
+    )
+    def test_sql_num_examples(self, value: object, literal: str):
+        assert _sql_num(value) == _sql_nums([value])[0] == literal
+
+
+# ─── enrich_ingredients ──────────────────────────────────────────────────
+
+
+class TestScriptEscapers:
+    @pytest.mark.parametrize("seed", SEEDS)
+    def test_enrich_sql_escape_column(self, seed: int):
+        rnd = _rng(seed)
+        values: list[str | None] = [*_column(rnd, with_sep=seed % 2 == 0), None]
+        rnd.shuffle(values)
+        assert enrich_escape_column(values) == [enrich_escape(v) for v in values]
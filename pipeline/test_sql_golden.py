@@ -0,0 +1,309 @@
+"""Golden-output tests for the SQL generator.
+
+The product batches behind every generated folder in ``db/pipelines`` are
+reconstructed from its committed SQL (01 inserts, 03 nutrition, 04 labels,
+06 images, 07 stores) and regenerated; the output must hash to the digests
+recorded from the generator before the columnar rewrite.  A few synthetic
+batches cover what the committed data doesn't: batching, missing EANs,
+curly quotes, non-https images, German stores and the COPY format.
+
+After an intentional output change, print the new digests with::
+
+    python -m pipeline.test_sql_golden
+"""
+
+from __future__ import annotations
+
+import hashlib
+import re
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from pipeline.sql_generator import generate_pipeline
+
+PIPELINE_DIR = Path(__file__).resolve().parent.parent / "db" / "pipelines"
+GENERATED_MARKER = "-- Source: Open Food Facts API (automated pipeline)"
+
+_TOKEN_RE = re.compile(r"'(?:[^']|'')*'|null|true|false|-?[\d.]+")
+_ROW_RE = re.compile(r"^\s+\((.*)\),?$")
+_GENERATED_RE = re.compile(r"^-- Generated: .*$", re.MULTILINE)
+_NUTRIENTS = (
+    "calories",
+    "total_fat_g",
+    "saturated_fat_g",
+    "trans_fat_g",
+    "carbs_g",
+    "sugars_g",
+    "fibre_g",
+    "protein_g",
+    "salt_g",
+)
+_IMAGE_KEYS = {
+    "front": "image_front_url",
+    "ingredients": "image_ingredients_url",
+    "nutrition_label": "image_nutrition_url",
+}
+
+# ─── Reconstruction ──────────────────────────────────────────────────────
+
+
+def _value_rows(text: str, start: str, end: str) -> list[list[str | None]]:
+    """Literal tuples (one per line) between *start* and *end* in *text*."""
+    segment = text.split(start, 1)[1].split(end, 1)[0]
+    rows = []
+    for line in segment.splitlines():
+        match = _ROW_RE.match(line)
+        if not match:
+            continue
+        values: list[str | None] = []
+        for literal in _TOKEN_RE.findall(match.group(1)):
+            if literal == "null":
+                values.append(None)
+            elif literal.startswith("'"):
+                values.append(literal[1:-1].replace("''", "'"))
+            else:
+                values.append(literal)
+        if values:
+            rows.append(values)
+    return rows
+
+
+def reconstruct(folder: Path) -> tuple[str, str, list[dict]]:
+    """(category, country, products) that the folder's SQL was generated from."""
+
+    def read(step: str) -> str:
+        path = folder / f"PIPELINE__{folder.name}__{step}.sql"
+        return path.read_text(encoding="utf-8") if path.is_file() else ""
+
+    inserts = _value_rows(read("01_insert_products"), "insert into products", "on conflict")
+    country, category = inserts[0][0], inserts[0][3]
+    products = [
+        {
+            "brand": brand,
+            "product_name": name,
+            "product_type": product_type,
+            "prep_method": prep,
+            "store_availability": store,
+            "controversies": controversies,
+            "ean": ean,
+        }
+        for _c, brand, product_type, _cat, name, prep, store, controversies, ean in inserts
+    ]
+    for p, row in zip(products, _value_rows(read("03_add_nutrition"), "values", ") as d("), strict=True):
+        p.update(zip(_NUTRIENTS, row[2:], strict=True))
+    scoring = read("04_scoring")
+    nutri = _value_rows(scoring, "-- 2. Nutri-Score", ") as d(")
+    nova = _value_rows(scoring, "-- 3. NOVA", ") as d(")
+    for p, ns_row, nova_row in zip(products, nutri, nova, strict=True):
+        p["nutri_score_label"] = ns_row[2]
+        p["nova_classification"] = nova_row[2]
+
+    by_key = {(p["brand"], p["product_name"]): p for p in products}
+    images = read("06_add_images")
+    if "VALUES" in images:
+        for brand, name, url, _src, image_type, *_rest in _value_rows(images, "VALUES", ") AS d("):
+            if image_type in _IMAGE_KEYS:  # older folders also carry e.g. "packaging"
+                by_key[(brand, name)][_IMAGE_KEYS[image_type]] = url
+    stores: dict[tuple, list[str]] = {}
+    availability = read("07_store_availability")
+    if "VALUES" in availability:
+        for brand, name, store in _value_rows(availability, "VALUES", ") AS d("):
+            stores.setdefault((brand, name), []).append(store)
+    for p in products:
+        chains = stores.get((p["brand"], p["product_name"]), [])
+        if p["store_availability"] and p["store_availability"] not in chains:
+            chains = [p["store_availability"], *chains]
+        p["store_availability"] = ", ".join(chains) or None
+    return category, country, products
+
+
+def generated_folders() -> list[Path]:
+    """Folders under ``db/pipelines`` written by the generator (not hand-maintained)."""
+    folders = []
+    for folder in sorted(PIPELINE_DIR.iterdir()):
+        insert = folder / f"PIPELINE__{folder.name}__01_insert_products.sql"
+        if insert.is_file() and GENERATED_MARKER in insert.read_text(encoding="utf-8"):
+            folders.append(folder)
+    return folders
+
+
+# ─── Synthetic batches ───────────────────────────────────────────────────
+
+
+def _edge_products() -> list[dict]:
+    base = {
+        "product_type": "Grocery",
+        "prep_method": "not-applicable",
+        "controversies": "none",
+        **dict.fromkeys(_NUTRIENTS, "1.5"),
+        "nutri_score_label": "B",
+        "nova_classification": "2",
+    }
+    return [
+        {**base, "brand": "Łowicz", "product_name": "Dżem \u2018extra\u2019 O'Brien", "ean": "5900397000001"},
+        {**base, "brand": "No EAN", "product_name": "Bez kodu", "ean": "", "image_front_url": "https://x/1.jpg"},
+        {
+            **base,
+            "brand": "Units",
+            "product_name": "Sól",
+            "ean": "5900397000002",
+            "salt_g": "12.5 g",
+            "sugars_g": "<0.5",
+            "fibre_g": None,
+            "calories": "-",
+            "nutri_score_label": None,
+            "nova_classification": "9",
+        },
+        {"brand": "Defaults", "product_name": "Minimal", "ean": "20123456", **dict.fromkeys(_NUTRIENTS)},
+        {
+            **base,
+            "brand": "Pics",
+            "product_name": "All three",
+            "ean": "5900397000003",
+            "image_front_url": "https://img/f.jpg",
+            "image_ingredients_url": "http://img/i.jpg",
+            "image_nutrition_url": "https://img/n.jpg",
+            "store_availability": "Lidl, Biedronka, Żabka, Edeka",
+        },
+        {
+            **base,
+            "brand": "Shops",
+            "product_name": "REWE und dm",
+            "ean": "4000000000001",
+            "store_availability": "REWE, dm-drogerie, Aldi Süd",
+            "prep_method": None,
+        },
+    ]
+
+
+def _many_products(n: int) -> list[dict]:
+    return [
+        {
+            "brand": f"Brand {i % 7}",
+            "product_name": f"Product {i}",
+            "ean": f"590{i:010d}" if i % 5 else "",
+            **{key: str(i % (j + 3)) for j, key in enumerate(_NUTRIENTS)},
+            "nutri_score_label": "ABCDE"[i % 5],
+            "nova_classification": str(i % 5),
+            "store_availability": "Kaufland" if i % 3 else None,
+            "image_front_url": f"https://img/{i}.jpg",
+        }
+        for i in range(n)
+    ]
+
+
+SYNTHETIC: dict[str, tuple[str, str, list[dict], int, str]] = {
+    # name: (category, country, products, batch_size, output_format)
+    "edge-pl": ("Dairy", "PL", _edge_products(), 100, "sql"),
+    "edge-de": ("Dairy", "DE", _edge_products(), 100, "sql"),
+    "batched": ("Snacks", "PL", _many_products(250), 100, "sql"),
+    "edge-copy": ("Dairy", "PL", _edge_products(), 100, "copy"),
+}
+
+
+# ─── Digests ─────────────────────────────────────────────────────────────
+
+
+def output_digest(category: str, country: str, products: list[dict], batch_size: int, output_format: str) -> str:
+    """SHA-256 over the names and contents of the generated files (dates blanked)."""
+    with tempfile.TemporaryDirectory() as tmp:
+        files = generate_pipeline(
+            category, products, str(Path(tmp) / "golden"), country, batch_size, output_format=output_format
+        )
+        h = hashlib.sha256()
+        for path in files:
+            h.update(path.name.encode())
+            h.update(_GENERATED_RE.sub("-- Generated:", path.read_text(encoding="utf-8")).encode())
+        return h.hexdigest()
+
+
+GOLDEN_PIPELINES: dict[str, str] = {
+    "alcohol": "a58fa609616ba79a0fe1c77ce550a6f313737b73dd67856cd3f81cdec934c63a",
+    "alcohol-de": "3a416b31bff800cc40c70470a90cd8055e9901c13186d58017cdb5ec260cd8ba",
+    "baby": "e420dd9a6972c88ee3798d4c880d217a13e1975c2bdec4117f758e6ec192c847",
+    "baby-de": "cefbee42f18438144f3eaacc14c754c3257bcdbb59189066e9226b37cc3418e4",
+    "bread": "80eeff06e5db0d5d85aeb14b6e93fe21514dc6b043fb80bc03dfffb7959c7d2a",
+    "bread-de": "4e205754317d03a3c8ccde53cda9cae093ba41c00b7cd88856aa2f6826a1deeb",
+    "breakfast-grain-based": "db6d197357b9b87382fc76022668d58bfca02ebf7e0206db6e3ea1ba9eb661bf",
+    "breakfast-grain-based-de": "a6074a83c434d0165101066ee76a93c62f336ad453cb8745dbc2e1cfb0bbbd38",
+    "canned-goods": "a2c19a1d516a8d5d2c37304751112b4f37cde5bcbc824ae33ce1bc31ba8820d4",
+    "canned-goods-de": "90618488cd21a382281d4a6a0853b93fec4c9bb5797f62dd639892ddd3403951",
+    "cereals": "d5491d1f6a6a448f13bb7537f37db6528d016f7772b7cd97c4e248cadbc9aaa2",
+    "cereals-de": "e29030066ee1fda6c0d312bf9ff2c24cddcc213e63934de8c64c7372541eaa46",
+    "chips": "f3084a30c41b43edf7ce29aa77ba083b3af32551fdbd7ac0bc2cd0ea58a5346e",
+    "chips-de": "819dda2bf967141b03098671ea721758776d4bd2e98b39e0a48c95fe0233a096",
+    "chips-pl": "f07170d2419bf209f633ba767365546daa3e81d950695ffab7989566c96b566f",
+    "coffee-tea": "5174ea71b4af89d6461de0c0671ef9ec6042c2949e3aec1751b69b742410a38e",
+    "coffee-tea-de": "33547a0fc221840f7fc5e413639696d30a9c34b212f673e29bbb833dd5e7ef8e",
+    "condiments": "43c4b687495ddb4f3f01a5b7c67fb6467497b0566e4d5a380dc58a39be31acc1",
+    "condiments-de": "4bcc4ba38feb3277b9b71faf12266dd97eabf736402d35b1905d00df3ed71fcf",
+    "dairy": "05339a1e44db51e00f8b817f6665c938d0b9cade0b3dabc14440411e1e78e551",
+    "dairy-de": "b1337c5374b5bfd9b84720634dd862874f633203484e71bb6bbd68c85fd9f1eb",
+    "desserts-ice-cream": "852c7b258a9e4b371a3c3800fa76cf2740ec1c60b410c164f99ac5ad270d7439",
+    "desserts-ice-cream-de": "8a42a332d0132052f2fb9840ffc504d824dc3fd54fec031c627c9a8c1ea38b99",
+    "drinks": "9e59c2160faf0a732ca509c73cfbcfbda6f7c925baf4c5a70b3fd0a1c47df031",
+    "drinks-de": "43e7c206d94a82d72d2c5c92800b7d0aea013ae8d3b2142090f3c2c669d2ecbf",
+    "frozen-prepared": "628c1223ec190c52a83c9306807f72b12911eae34786211e647f7da7d544aad8",
+    "frozen-prepared-de": "d3f51c7816f806a147c14d2c15e5ad88546b23116c79f46dc895b966de7a4555",
+    "frozen-vegetables": "bf5f27584e4135f01b48c0728b01f4404a655512d9ad8d1285e240b58be5e521",
+    "frozen-vegetables-de": "18bd2d291b06af82acc7430541f507aeea1fd5d0fb5da58ee3f0c21b5790603c",
+    "instant-frozen": "5769966a9cfc0d68286bf93478df91a8318e8c9169eebe9c4ea78c7a94191f54",
+    "instant-frozen-de": "c2274b1769c84e4d2f3db2b56f89c399edc3342f712833d53bf858c833680ac5",
+    "meat": "d6c35e9e6b0e77bf4db6eed725394fee6c13703de90f4b6ca00621afcb69517a",
+    "meat-de": "c425482b36c4f62a65e213122ab5772e63411240e8c77d7202dccd29094a0df5",
+    "nuts-seeds-legumes": "693ec30f1fc8cbb0566e4c1aa4b3504a218fca564c16dd075f5fc2060d4dbc4e",
+    "nuts-seeds-legumes-de": "27fe129e3c64312191946d68bf2f427ab6d13a5dedbbe90a8a5ed7a309dfe952",
+    "oils-vinegars": "4d68b40064017bae93e7de8694202fc07736ba5c3f1e8c99038a00d9b00490f7",
+    "oils-vinegars-de": "a7bf30ef26d5687c4c1476d789bdec79229329eb15619159f217b9ab07668480",
+    "pasta-rice": "0b2fdb52a17cf92a961cc018058f3c7011cc4902ff262ba10a60922a002d1ce9",
+    "pasta-rice-de": "570a5414b1bbf4ac57f57790ec2fb41d76b7328480c1ed11f7f9a519b11e1cdf",
+    "plant-based-alternatives": "424e3b29102ea8e7055b93bd71f6c7dded5832403e53f1fcd418f07797446bae",
+    "plant-based-alternatives-de": "36723f24ab65facc25a66060ca942025380d754599c4222efabed7088ee0f1bb",
+    "ready-meals": "f54eb38232cff3373d09c1e68f892f9cfe25221ecabab24856429ba9de38d929",
+    "ready-meals-de": "538a9768282e2dc75178f3ccd71919980f3852b292aad869bb6bb74a8c5b5e0e",
+    "sauces": "1a27f573e4c4c1b6e110df185fe302f503b53978f5a2d8895fb7d2dd73c31b66",
+    "sauces-de": "4ff4a4ba72cc855a87896e18a7dd0deba8b8ac1c5e97f8413a64a3b532a88f5a",
+    "seafood-fish": "7dbd1d348223656020094a44f57c6afe37f530561e521359247fb7f33febc1d9",
+    "seafood-fish-de": "f2833c65833429036bacde4d8065bcf97287e5f61f30ac908ec0e9c7d2a6fe98",
+    "snacks": "55bba6889255927a9db8616bd9328a9c2634abf1357e008ae956d83863b2c2c1",
+    "snacks-de": "254b79125b27b2704b7e9792b41eb31049f4842e0546ae11a2ebe83a7b04acf0",
+    "soups": "7f671942c001bf2293ea1c92acaf1e3cea6a21266a559cce48c7002f93f01ad0",
+    "soups-de": "275205898ae4bcbd704db9437d4e7152c90c3ba1b5c0f6d89feccbe5964013bd",
+    "spices-seasonings": "63b10c40663bc7aae99da5a7298dc32017ccc367adbaa2947e69bc0ede88d7c6",
+    "spices-seasonings-de": "b2fae818166a818324442f22ad977e898454e0c2666a4666b86f92724bdb0290",
+    "spreads-dips": "a1f60aad14ae28ce9f420c2e589b35e34550f5fec9dd28bce177c1c648994c4c",
+    "spreads-dips-de": "e7657bd9b57af7aa8bbf715ac58b756f9ad57a5ffcfff0a725836098248ccee7",
+    "sweets": "eddd9d6ae8547419da9b87e70e9487e3609ebebf39f8923313de9830cad7b386",
+    "sweets-de": "50ba27467c55b2366803b5053b779b0fac412b6371e749086750df1030d01563",
+}
+
+GOLDEN_SYNTHETIC: dict[str, str] = {
+    "edge-pl": "cfab6f821c8cbc52947e80e6e8bfca00c4a0e2e3df65c9d699a6f6bd5cef2845",
+    "edge-de": "097a56da4c92a14b05acf2c974798037a1dad015e661c1aa9a49e747862d72ef",
+    "batched": "cf0e625eebd25a1679a94036e0c1ebae0fabdbc15abfc2bb58cb8dd008b1b0d3",
+    "edge-copy": "e05bf744c4e2ae3c00e0c1fb75cb4d5bc58439541e7d850598b75a1f9fb7648a",
+}
+
+
+class TestGoldenOutput:
+    def test_every_generated_folder_is_covered(self) -> None:
+        assert [f.name for f in generated_folders()] == sorted(GOLDEN_PIPELINES)
+
+    @pytest.mark.parametrize("name", sorted(GOLDEN_PIPELINES))
+    def test_pipeline_folder(self, name: str) -> None:
+        category, country, products = reconstruct(PIPELINE_DIR / name)
+        assert output_digest(category, country, products, 100, "sql") == GOLDEN_PIPELINES[name]
+
+    @pytest.mark.parametrize("name", sorted(SYNTHETIC))
+    def test_synthetic(self, name: str) -> None:
+        assert output_digest(*SYNTHETIC[name]) == GOLDEN_SYNTHETIC[name]
+
+
+if __name__ == "__main__":
+    for folder in generated_folders():
+        print(f'    "{folder.name}": "{output_digest(*reconstruct(folder), 100, "sql")}",')
+    print()
+    for name, args in SYNTHETIC.items():
+        print(f'    "{name}": "{output_digest(*args)}",')
@@ -2,6 +2,16 @@
 
 from __future__ import annotations
 
+import gzip
+import io
+import os
+import queue
+import secrets
+import threading
+from collections.abc import Iterable, Iterator, Sequence
+from pathlib import Path
+from typing import IO, Any
+
 
 def slug(category: str) -> str:
     """Convert a category name to a filesystem-safe slug.
@@ -16,3 +26,134 @@ def slug(category: str) -> str:
         .strip()
         .replace(" ", "-")
     )
+
+
+# Joins a column of values into one string for column-wise processing: the
+# ASCII unit separator, which does not occur in product text.
+COLUMN_SEP = "\x1f"
+
+
+def replace_column(
+    values: Sequence[str],
+    replacements: Sequence[tuple[str, str]],
+    prefix: str = "",
+    suffix: str = "",
+) -> list[str]:
+    """Apply a chain of ``str.replace`` calls to a whole column of strings.
+
+    Returns ``[prefix + v.replace(old, new)... + suffix for v in values]``,
+    but runs each replacement once over the joined column and splits it
+    back, instead of once per value.  None of *replacements*, *prefix* or
+    *suffix* may contain :data:`COLUMN_SEP`; a column whose values do
+    falls back to the per-value loop.
+    """
+    if not values:
+        return []
+    joined = COLUMN_SEP.join(values)
+    if joined.count(COLUMN_SEP) != len(values) - 1:
+        out = []
+        for value in values:
+            for old, new in replacements:
+                value = value.replace(old, new)
+            out.append(prefix + value + suffix)
+        return out
+    for old, new in replacements:
+        joined = joined.replace(old, new)
+    if prefix or suffix:
+        joined = prefix + joined.replace(COLUMN_SEP, suffix + COLUMN_SEP + prefix) + suffix
+    return joined.split(COLUMN_SEP)
+
+
+# Write buffer for :func:`write_atomic`.
+WRITE_BUFFER_BYTES = 1 << 20
+
+
+def write_atomic(path: Path, chunks: Iterable[str], *, compress: bool = False) -> None:
+    """Stream text *chunks* to *path* (UTF-8), replacing it atomically.
+
+    The chunks go through a :data:`WRITE_BUFFER_BYTES` buffer (and gzip
+    when *compress*) into a temp file beside *path*, which is renamed over
+    *path* with ``os.replace`` only once every chunk is written.  A crash
+    or an exception from *chunks* never leaves a half-written *path*;
+    the temp file is removed instead.
+    """
+    tmp = path.with_name(f".{path.name}.{secrets.token_hex(4)}.tmp")
+    try:
+        if compress:
+            # Level 6 as gzip(1); mtime=0 and no file name in the header: same text, same bytes.
+            with (
+                open(tmp, "xb", buffering=WRITE_BUFFER_BYTES) as raw,
+                gzip.GzipFile(filename="", mode="wb", compresslevel=6, fileobj=raw, mtime=0) as gz,
+                io.TextIOWrapper(gz, encoding="utf-8") as fh,
+            ):
+                fh.writelines(chunks)
+        else:
+            with open(tmp, "x", encoding="utf-8", buffering=WRITE_BUFFER_BYTES) as fh:
+                fh.writelines(chunks)
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def open_text(path: Path, **kwargs: Any) -> IO[str]:
+    """Open *path* for reading UTF-8 text, through gzip when it ends in ``.gz``."""
+    if path.suffix == ".gz":
+        return gzip.open(path, "rt", encoding="utf-8", **kwargs)
+    return path.open(encoding="utf-8", **kwargs)
+
+
+class _Done:
+    """End-of-stream marker, carrying the producer's exception if it failed."""
+
+    def __init__(self, error: BaseException | None = None) -> None:
+        self.error = error
+
+
+def prefetch(iterable: Iterable[Any], depth: int = 1) -> Iterator[Any]:
+    """Iterate *iterable* on a background thread, running up to *depth* items ahead.
+
+    Lets a slow producer (e.g. paged OFF search) overlap with the
+    consumer's work on the current item.  Items arrive in the original
+    order; an exception raised by the producer is re-raised in the
+    consumer.  Closing the returned generator early stops the producer at
+    its next item.
+    """
+    items: queue.Queue = queue.Queue(maxsize=max(depth, 1))
+    stop = threading.Event()
+
+    def put(item: Any) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        source = iter(iterable)
+        try:
+            for item in source:
+                if not put(item):
+                    return
+        except BaseException as exc:
+            put(_Done(exc))
+            return
+        finally:
+            # Release the producer's resources (sessions, worker pools) on this thread.
+            close = getattr(source, "close", None)
+            if close is not None:
+                close()
+        put(_Done())
+
+    worker = threading.Thread(target=produce, name="prefetch", daemon=True)
+    worker.start()
+    try:
+        while not isinstance(item := items.get(), _Done):
+            yield item
+        if item.error is not None:
+            raise item.error
+    finally:
+        stop.set()
+        worker.join()
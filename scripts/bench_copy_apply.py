@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Pipeline Apply Benchmark — per-step SQL files vs COPY payload + driver
+
+Generates the same synthetic category at several sizes (default 1k, 10k
+and 50k products) in both ``sql_generator`` output formats and applies
+each folder to the configured database with ``pipeline.apply``:
+
+* **sql**  — ``PIPELINE__*__01..07`` files with inline ``VALUES`` lists
+  (batched at ``--batch-size``, as ``pipeline.run`` writes them).
+* **copy** — ``00_copy_payload.csv`` streamed into a temp staging table by
+  the ``01_copy_load`` driver, then set-based upserts.
+
+Every apply is rolled back, so the database is left as it was, but it
+does run against the real schema (``products``, ``score_category`` …):
+point it at a local or scratch database.  The connection comes from
+DATABASE_URL, else the PG* variables when PGHOST is set, else the local
+Supabase stack — see ``pipeline.db``.
+
+Usage:
+    python scripts/bench_copy_apply.py
+    python scripts/bench_copy_apply.py --sizes 1000 10000 --formats copy
+    DATABASE_URL=postgresql://... python scripts/bench_copy_apply.py --category Chips
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pipeline import apply, db
+from pipeline.sql_generator import BATCH_SIZE, OUTPUT_FORMATS, generate_pipeline
+
+
+class RollbackPool(db.PoolBackend):
+    """Pool whose connections run inside a transaction that is always rolled back."""
+
+    @contextmanager
+    def connection(self) -> Iterator:
+        with super().connection() as conn, conn.transaction(force_rollback=True):
+            yield conn
+
+
+def make_products(n: int) -> list[dict]:
+    """*n* distinct, fully populated synthetic products (in-store EAN range)."""
+    return [
+        {
+            "brand": f"Bench Brand {i % 250}",
+            "product_name": f"Bench product {i}",
+            "ean": f"2{i:012d}",
+            "product_type": "Grocery",
+            "prep_method": "not-applicable",
+            "store_availability": "Lidl, Biedronka",
+            "controversies": "none",
+            "calories": 50 + i % 400,
+            "total_fat_g": (i % 300) / 10,
+            "saturated_fat_g": (i % 100) / 10,
+            "trans_fat_g": 0,
+            "carbs_g": (i % 700) / 10,
+            "sugars_g": (i % 200) / 10,
+            "fibre_g": (i % 50) / 10,
+            "protein_g": (i % 250) / 10,
+            "salt_g": (i % 30) / 10,
+            "nutri_score_label": "ABCDE"[i % 5],
+            "nova_classification": str(1 + i % 4),
+            "image_front_url": f"https://images.openfoodfacts.org/bench/{i}/front.jpg",
+            "image_nutrition_url": f"https://images.openfoodfacts.org/bench/{i}/nutrition.jpg",
+        }
+        for i in range(n)
+    ]
+
+
+def apply_rolled_back(folder: Path, backend: db.PoolBackend | db.PsqlBackend) -> float:
+    """Apply *folder* in one transaction that is rolled back; returns seconds."""
+    start = time.perf_counter()
+    if isinstance(backend, db.PoolBackend):
+        apply.apply_folder(folder, backend=backend)
+    else:
+        script, _starts = apply._psql_apply_script(apply.sql_files(folder))
+        backend.run_script(script.removesuffix("COMMIT;\n") + "ROLLBACK;\n", "-q")
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark applying SQL vs COPY pipeline output")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000], help="Products per run")
+    parser.add_argument("--formats", nargs="+", default=list(OUTPUT_FORMATS), choices=OUTPUT_FORMATS)
+    parser.add_argument("--category", default="Dairy", help="Existing category to load into (default: Dairy)")
+    parser.add_argument("--country", default="PL", help="Country code (default: PL)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Batch size for the sql format")
+    args = parser.parse_args()
+
+    backend = db.get_backend()
+    if isinstance(backend, db.PoolBackend):
+        backend = RollbackPool(backend.conninfo, max_idle=1)
+    try:
+        backend.fetch_all("SELECT 1")
+    except db.DatabaseError as exc:
+        print(f"skipped: no database ({exc})")
+        return
+    print(f"Backend: {backend.name}   category: {args.category} ({args.country})   every apply is rolled back\n")
+    print(f"{'products':>9}  {'format':<6} {'files':>5} {'MB':>7} {'generate':>9} {'apply':>9} {'rows/s':>10}")
+
+    for n in args.sizes:
+        products = make_products(n)
+        timings: dict[str, float] = {}
+        for fmt in args.formats:
+            with tempfile.TemporaryDirectory() as tmp:
+                folder = Path(tmp) / "bench"
+                t0 = time.perf_counter()
+                files = generate_pipeline(
+                    args.category, products, str(folder), args.country, args.batch_size, output_format=fmt
+                )
+                generated = time.perf_counter() - t0
+                size_mb = sum(f.stat().st_size for f in files) / 1e6
+                try:
+                    timings[fmt] = apply_rolled_back(folder, backend)
+                except db.DatabaseError as exc:
+                    print(f"{n:>9,}  {fmt:<6} failed: {str(exc).strip().splitlines()[0]}")
+                    continue
+            print(
+                f"{n:>9,}  {fmt:<6} {len(files):>5} {size_mb:>7.2f} {generated:>8.2f}s "
+                f"{timings[fmt]:>8.2f}s {n / timings[fmt]:>10,.0f}"
+            )
+        if len(timings) == 2:
+            print(f"{'':>9}  copy is {timings['sql'] / timings['copy']:.1f}x faster to apply\n")
+    backend.close()
+
+
+if __name__ == "__main__":
+    main()
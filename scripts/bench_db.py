@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Database Round-Trip Benchmark — psql subprocess vs pooled psycopg connection
+
+Runs the same N small parameterised queries (default 1,000) through both
+``pipeline.db`` backends against the configured database and reports
+queries/second:
+
+* **psql**    — ``PsqlBackend``: one ``psql`` (or ``docker exec … psql``)
+  process per query, as every DB script did before ``pipeline.db``.
+* **psycopg** — ``PoolBackend``: one pooled connection, server-side
+  parameter binding.
+
+Both must return the same results.  The connection comes from
+DATABASE_URL, else the PG* variables when PGHOST is set, else the local
+Supabase stack (``pipeline.db.LOCAL_DATABASE_URL`` for psycopg, docker exec
+for psql).  The psycopg leg needs ``pip install "psycopg[binary]"``.
+
+Usage:
+    python scripts/bench_db.py
+    python scripts/bench_db.py --queries 200 --backends psql
+    DATABASE_URL=postgresql://... python scripts/bench_db.py
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pipeline import db
+
+QUERY = "SELECT %s::int * 2, md5(%s)"
+
+
+def make_backend(name: str) -> db.PoolBackend | db.PsqlBackend:
+    if name == "psql":
+        return db.PsqlBackend()
+    if os.environ.get("DATABASE_URL"):
+        return db.PoolBackend(os.environ["DATABASE_URL"], max_idle=1)
+    return db.PoolBackend("" if os.environ.get("PGHOST") else db.LOCAL_DATABASE_URL, max_idle=1)
+
+
+def run(backend: db.PoolBackend | db.PsqlBackend, n: int) -> tuple[float, list[tuple]]:
+    t0 = time.perf_counter()
+    results = [tuple(map(str, backend.fetch_all(QUERY, (i, f"ean-{i}"))[0])) for i in range(n)]
+    return time.perf_counter() - t0, results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark pipeline.db backends")
+    parser.add_argument("--queries", type=int, default=1000, help="Queries per backend (default: 1000)")
+    parser.add_argument("--backends", nargs="+", default=["psql", "psycopg"], choices=["psql", "psycopg"])
+    args = parser.parse_args()
+
+    timings: dict[str, float] = {}
+    results: dict[str, list[tuple]] = {}
+    for name in args.backends:
+        try:
+            backend = make_backend(name)
+            backend.fetch_all("SELECT 1")  # connect / warm up outside the timing
+            timings[name], results[name] = run(backend, args.queries)
+            backend.close()
+        except db.DatabaseError as exc:
+            print(f"{name:<8} skipped: {exc}")
+            continue
+        elapsed = timings[name]
+        print(
+            f"{name:<8} {args.queries:,} queries in {elapsed:7.2f}s  "
+            f"{args.queries / elapsed:9,.0f} q/s  {elapsed / args.queries * 1000:7.2f} ms/query"
+        )
+
+    if len(results) == 2:
+        same = "yes" if results["psql"] == results["psycopg"] else "NO — MISMATCH"
+        print(f"Speedup:  {timings['psql'] / timings['psycopg']:.0f}x   identical results: {same}")
+
+
+if __name__ == "__main__":
+    main()
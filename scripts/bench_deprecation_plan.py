@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Deprecation Plan Benchmark — ``product_name not in (…)`` vs the identity_key anti-join
+
+Loads N synthetic products (default 1,000 and 10,000, the shapes of
+``bench_sql_generator.py``) into one category by applying a generated
+step 01 file, then runs ``EXPLAIN (ANALYZE, BUFFERS)`` on both forms of
+step 01's deprecation postscript for a batch that dropped 1% of them:
+the old per-row ``product_name not in (…)`` list and the ``not exists``
+anti-join against a ``VALUES`` list of identity keys.  Prints the top
+plan node, the execution time and the rows each form deprecates.
+
+Everything runs inside one transaction per size that is rolled back at
+the end (each EXPLAIN in its own savepoint), so the database is left as
+it was.  Point it at a local database; needs ``psycopg`` (see
+``pipeline.db``).
+
+Usage:
+    python scripts/bench_deprecation_plan.py
+    python scripts/bench_deprecation_plan.py --products 1000 10000 50000 --removed 0.05
+"""
+
+from __future__ import annotations
+
+import argparse
+import re
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_sql_generator import make_products
+
+from pipeline import db
+from pipeline.sql_generator import _Columns, _deprecate_removed, _joined, _sql_text, generate_pipeline
+from pipeline.utils import open_text
+
+_EXECUTION_TIME_RE = re.compile(r"Execution Time: ([\d.]+) ms")
+
+
+def not_in_statement(category: str, cols: _Columns, country: str) -> str:
+    """The deprecation as step 01 used to write it: a product-name list."""
+    names = "".join(_joined(cols.name, ", "))
+    return (
+        "update products\n"
+        "set is_deprecated = true, deprecated_reason = 'Removed from pipeline batch'\n"
+        f"where country = {_sql_text(country)} and category = {_sql_text(category)}\n"
+        "  and is_deprecated is not true\n"
+        f"  and product_name not in ({names})"
+    )
+
+
+def anti_join_statement(category: str, cols: _Columns, country: str) -> str:
+    """The deprecation as step 01 writes it now, comment line dropped."""
+    sql = "".join(_deprecate_removed(category, cols, country))
+    return "\n".join(line for line in sql.splitlines() if not line.lstrip().startswith("--")).strip().rstrip(";")
+
+
+def explain(conn, statement: str) -> tuple[str, float, int]:
+    """(top plan node, execution ms, rows updated) of *statement*, rolled back."""
+    with conn.transaction(force_rollback=True), conn.cursor() as cur:
+        cur.execute(f"EXPLAIN (ANALYZE, BUFFERS) {statement}")
+        plan = [row[0] for row in cur.fetchall()]
+    with conn.transaction(force_rollback=True), conn.cursor() as cur:
+        cur.execute(statement)
+        updated = cur.rowcount
+    match = next(filter(None, (_EXECUTION_TIME_RE.search(line) for line in plan)), None)
+    node = next((line.strip().lstrip("-> ") for line in plan[1:] if "->" in line), plan[0])
+    return node, float(match.group(1)) if match else 0.0, updated
+
+
+def bench(backend: db.PoolBackend, n: int, removed: float, category: str, country: str) -> None:
+    """Load *n* products, then compare both deprecation forms for a batch missing *removed* of them."""
+    products = make_products(n)
+    kept = _Columns.from_products(products[: n - int(n * removed)], country)
+    with tempfile.TemporaryDirectory() as tmp, backend.connection() as conn, conn.transaction(force_rollback=True):
+        folder = Path(tmp) / "bench"
+        generate_pipeline(category, products, str(folder), country, batch_size=0)
+        with open_text(next(folder.glob("PIPELINE__*__01_*"))) as fh, conn.cursor() as cur:
+            cur.execute(fh.read())
+        for label, statement in (
+            ("not in (names)", not_in_statement(category, kept, country)),
+            ("anti-join (keys)", anti_join_statement(category, kept, country)),
+        ):
+            node, ms, updated = explain(conn, statement)
+            print(f"{n:>8,} {label:<18} {ms:>9.1f}ms {updated:>8,}  {node[:60]}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the step 01 deprecation query plans")
+    parser.add_argument(
+        "--products", type=int, nargs="+", default=[1_000, 10_000], help="Category sizes (default: 1000 10000)"
+    )
+    parser.add_argument("--removed", type=float, default=0.01, help="Share of products dropped (default: 0.01)")
+    parser.add_argument("--category", default="Dairy", help="Category the products are filed under (default: Dairy)")
+    parser.add_argument("--country", default="PL", help="Country code (default: PL)")
+    args = parser.parse_args()
+
+    backend = db.get_backend()
+    if not isinstance(backend, db.PoolBackend):
+        raise SystemExit("bench_deprecation_plan needs psycopg and a reachable database (see pipeline.db)")
+
+    print(f"{args.category}/{args.country}, {args.removed:.0%} removed, rolled back after each size\n")
+    print(f"{'products':>8} {'form':<18} {'exec':>11} {'updated':>8}  plan")
+    for n in args.products:
+        bench(backend, n, args.removed, args.category, args.country.upper())
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
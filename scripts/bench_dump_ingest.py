@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Dump Ingestion Benchmark — rows/sec and peak RSS for pipeline.dump_ingest
+
+Writes a synthetic OFF-style JSONL.gz dump (a configurable share of PL / DE
+products spread across the mapped categories, the rest from other
+countries, each row padded to a realistic size), then runs
+``pipeline.dump_ingest.ingest_dump`` for PL+DE into a temporary folder and
+reports throughput and peak resident memory.
+
+Peak RSS should stay flat as --rows grows: only the bounded per-category
+candidate sets are held in memory.
+
+Usage:
+    python scripts/bench_dump_ingest.py                       # 200k rows
+    python scripts/bench_dump_ingest.py --rows 2000000 --pad 2000   # multi-GB uncompressed
+    python scripts/bench_dump_ingest.py --dump existing.jsonl.gz    # reuse a dump
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import gzip
+import io
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pipeline import dump_ingest
+from pipeline.categories import DB_TO_OFF_TAGS
+
+OTHER_COUNTRIES = ["en:france", "en:spain", "en:italy", "en:united-kingdom", "en:united-states"]
+
+
+def _peak_rss_mb() -> float | None:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def write_dump(path: Path, rows: int, local_share: float, pad: int, seed: int = 42) -> int:
+    """Write *rows* synthetic products; returns the uncompressed byte count."""
+    rng = random.Random(seed)  # noqa: S311 — synthetic data, not security-sensitive
+    tags = [tag for cat_tags in DB_TO_OFF_TAGS.values() for tag in cat_tags]
+    filler = "lorem ipsum " * (pad // 12 + 1)
+    written = 0
+    with gzip.open(path, "wt", encoding="utf-8", compresslevel=1) as fh:
+        for i in range(rows):
+            roll = rng.random()
+            if roll < local_share * 0.6:
+                countries = ["en:poland"]
+            elif roll < local_share:
+                countries = ["en:germany"]
+            else:
+                countries = [rng.choice(OTHER_COUNTRIES)]
+            row = {
+                "code": f"{2000000000000 + i}",
+                "product_name": f"Product {i}",
+                "brands": f"Brand{i % 5000}",
+                "countries_tags": countries,
+                "categories_tags": ["en:foods", rng.choice(tags)],
+                "last_modified_t": 1_700_000_000 + i,
+                "stores": rng.choice(["Biedronka", "Lidl", "Rewe", ""]),
+                "nutriments": {
+                    "energy-kcal_100g": rng.randint(20, 600),
+                    "fat_100g": round(rng.uniform(0, 40), 1),
+                    "proteins_100g": round(rng.uniform(0, 30), 1),
+                    "carbohydrates_100g": round(rng.uniform(0, 80), 1),
+                    "sugars_100g": round(rng.uniform(0, 30), 1),
+                    "salt_100g": round(rng.uniform(0, 3), 2),
+                },
+                "ingredients_text": filler[:pad],
+            }
+            line = json.dumps(row) + "\n"
+            written += len(line)
+            fh.write(line)
+    return written
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark OFF dump ingestion")
+    parser.add_argument("--rows", type=int, default=200_000, help="Synthetic dump rows (default: 200000)")
+    parser.add_argument("--local-share", type=float, default=0.05, help="Share of PL+DE rows (default: 0.05)")
+    parser.add_argument("--pad", type=int, default=1500, help="Filler bytes per row (default: 1500)")
+    parser.add_argument("--max-products", type=int, default=100, help="Products per category (default: 100)")
+    parser.add_argument("--dump", default=None, help="Use an existing dump instead of generating one")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_path = Path(tmp)
+        if args.dump:
+            dump = Path(args.dump)
+            print(f"Dump:          {dump}")
+        else:
+            dump = tmp_path / "dump.jsonl.gz"
+            t0 = time.perf_counter()
+            raw_bytes = write_dump(dump, args.rows, args.local_share, args.pad)
+            print(
+                f"Dump:          {args.rows:,} rows, {raw_bytes / 1e9:.2f} GB uncompressed, "
+                f"{dump.stat().st_size / 1e6:.0f} MB gz (written in {time.perf_counter() - t0:.1f}s)"
+            )
+
+        rss_before = _peak_rss_mb()
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            stats = dump_ingest.ingest_dump(
+                dump, ["PL", "DE"], max_products=args.max_products, output_root=tmp_path / "pipelines"
+            )
+        elapsed = time.perf_counter() - t0
+        rss_after = _peak_rss_mb()
+
+    generated = sum(1 for s in stats["categories"].values() if s["products"])
+    print(f"Scan:          {stats['rows_scanned']:,} rows in {stats['seconds']:.1f}s")
+    print(f"Throughput:    {stats['rows_scanned'] / stats['seconds']:,.0f} rows/s (scan)")
+    print(f"Total:         {elapsed:.1f}s incl. SQL generation for {generated} category folders")
+    print(f"Routed:        {stats['rows_routed']:,} rows matched PL/DE + a category")
+    if rss_after is not None:
+        print(f"Peak RSS:      {rss_after:.0f} MB (before ingest: {rss_before:.0f} MB)")
+    else:
+        print("Peak RSS:      n/a on this platform")
+
+
+if __name__ == "__main__":
+    main()
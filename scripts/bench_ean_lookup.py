@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+EAN Lookup Benchmark — one request per EAN vs the batched search lookup
+
+Starts a local stub of the OFF ``/api/v2/search`` (``code=`` filter) and
+``/api/v2/product/{ean}.json`` endpoints with a fixed per-request latency,
+then looks up N EANs (default 5,000) twice: one product request per EAN,
+as ``enrich_ingredients`` and ``image_importer`` used to, and through
+``pipeline.off_client.fetch_products_by_codes``.  A share of the EANs is
+unknown to the stub and another share is missing from its search index,
+so the batched run exercises the per-EAN fallback.  Reports requests per
+endpoint and wall-clock time, plus the time the same requests would take
+at the production inter-request delay.  Both runs must find the same
+products.
+
+No network access is needed — the real OFF API is never contacted.
+
+Usage:
+    python scripts/bench_ean_lookup.py
+    python scripts/bench_ean_lookup.py --eans 20000 --latency 0.02 --unindexed 0.05
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pipeline import off_client
+
+PRODUCTION_DELAY = off_client.REQUEST_DELAY
+FIELDS = "ingredients,allergens_tags,traces_tags"
+
+
+# ─── Stub server ─────────────────────────────────────────────────────────────
+
+
+def _make_handler(
+    latency: float, missing: set[str], unindexed: set[str], requests: Counter
+) -> type[BaseHTTPRequestHandler]:
+    lock = threading.Lock()
+
+    def product(code: str) -> dict:
+        return {"code": code, "ingredients": [{"id": "en:water"}], "allergens_tags": [], "traces_tags": []}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            url = urlparse(self.path)
+            if url.path.endswith("/search"):
+                codes = parse_qs(url.query).get("code", [""])[0].split(",")
+                body = {"products": [product(c) for c in codes if c not in missing and c not in unindexed]}
+                endpoint = "search"
+            else:
+                code = url.path.rsplit("/", 1)[-1].removesuffix(".json")
+                body = {"status": 0} if code in missing else {"status": 1, "product": product(code)}
+                endpoint = "product"
+            with lock:
+                requests[endpoint] += 1
+            time.sleep(latency)
+            payload = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *_args: object) -> None:
+            pass
+
+    return Handler
+
+
+# ─── Benchmark ───────────────────────────────────────────────────────────────
+
+
+def per_ean(eans: list[str]) -> dict[str, dict]:
+    """The old lookup: one product request per EAN, throttled."""
+    found = {}
+    with off_client._session() as session:
+        for ean in eans:
+            product = off_client._get_product(session, ean, fields=FIELDS)
+            off_client._throttle()
+            if product is not None:
+                found[ean] = product
+    return found
+
+
+def timed(requests: Counter, lookup) -> tuple[float, dict[str, dict], Counter]:
+    requests.clear()
+    t0 = time.perf_counter()
+    found = lookup()
+    return time.perf_counter() - t0, found, Counter(requests)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark per-EAN vs batched OFF barcode lookups")
+    parser.add_argument("--eans", type=int, default=5_000, help="EANs to look up (default: 5000)")
+    parser.add_argument("--latency", type=float, default=0.005, help="Stub per-request latency in seconds")
+    parser.add_argument("--missing", type=float, default=0.05, help="Share of EANs unknown to OFF (default: 0.05)")
+    parser.add_argument(
+        "--unindexed", type=float, default=0.02, help="Share of EANs missing from the search index (default: 0.02)"
+    )
+    parser.add_argument("--batch-size", type=int, default=off_client.CODE_BATCH_SIZE, help="EANs per search request")
+    args = parser.parse_args()
+
+    eans = [f"590{i:010d}" for i in range(args.eans)]
+    missing = set(eans[:: round(1 / args.missing)]) if args.missing else set()
+    unindexed = set(eans[1 :: round(1 / args.unindexed)]) - missing if args.unindexed else set()
+
+    requests: Counter = Counter()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(args.latency, missing, unindexed, requests))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}/api/v2"
+    off_client.OFF_SEARCH_URL = f"{base}/search"
+    off_client.OFF_PRODUCT_URL = f"{base}/product/{{ean}}.json"
+    off_client.REQUEST_DELAY = 0.0
+
+    try:
+        runs = [
+            ("per EAN", *timed(requests, lambda: per_ean(eans))),
+            (
+                f"batched ({args.batch_size})",
+                *timed(requests, lambda: off_client.fetch_products_by_codes(eans, FIELDS, batch_size=args.batch_size)),
+            ),
+        ]
+    finally:
+        server.shutdown()
+
+    print(f"{args.eans:,} EANs: {len(missing):,} unknown, {len(unindexed):,} not in the search index")
+    print(f"stub latency {args.latency * 1000:.0f}ms/request; projected adds {PRODUCTION_DELAY:g}s per request\n")
+    print(f"{'lookup':<16} {'search':>7} {'product':>8} {'total':>7} {'wall':>8} {'projected':>11} {'found':>7}")
+    for label, seconds, found, counts in runs:
+        total = counts["search"] + counts["product"]
+        projected = seconds + total * PRODUCTION_DELAY
+        print(
+            f"{label:<16} {counts['search']:>7,} {counts['product']:>8,} {total:>7,} "
+            f"{seconds:>7.2f}s {projected / 60:>9.1f}min {len(found):>7,}"
+        )
+
+    if set(runs[0][2]) != set(runs[1][2]):
+        print("MISMATCH: the batched lookup found different products")
+        sys.exit(1)
+    print("\nOutput:   identical (same products found)")
+
+
+if __name__ == "__main__":
+    main()
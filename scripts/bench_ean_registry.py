@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+EAN Registry Benchmark — file scan vs persistent index for cross-category dedup
+
+A full orchestrator run looks up "EANs claimed by every other folder" once
+per pipeline folder.  This replays exactly those lookups against
+``db/pipelines`` (or --pipeline-dir) in orchestrator order and times:
+
+* **scan**  — the previous behaviour: regex-scan every ``01_insert_products``
+  SQL file for each folder.
+* **index (cold)** — ``pipeline.ean_registry.EanRegistry`` built from an empty
+  index file (first run after a fresh clone).
+* **index (warm)** — the same lookups on the now-populated index (every
+  later run; only changed files are re-scanned).
+
+The EAN sets must be identical for every folder.  The index file is kept
+in a temporary directory, so the real ``db/pipelines/.ean_registry.sqlite``
+is left alone.
+
+Usage:
+    python scripts/bench_ean_registry.py
+    python scripts/bench_ean_registry.py --pipeline-dir /path/to/pipelines
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pipeline.ean_registry import EAN_IN_SQL_RE, INSERT_GLOB, EanRegistry
+from pipeline.run import PIPELINE_DIR
+
+
+def legacy_existing_eans(pipeline_dir: Path, exclude_slug: str) -> set[str]:
+    """The pre-registry ``_collect_existing_eans``: read every insert file."""
+    eans: set[str] = set()
+    for folder in pipeline_dir.iterdir():
+        if not folder.is_dir() or folder.name == exclude_slug:
+            continue
+        for sql_file in folder.glob(INSERT_GLOB):
+            content = sql_file.read_text(encoding="utf-8")
+            for match in EAN_IN_SQL_RE.finditer(content):
+                eans.add(match.group(1))
+    return eans
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark cross-category EAN lookups")
+    parser.add_argument(
+        "--pipeline-dir", type=Path, default=PIPELINE_DIR, help="Pipelines root (default: db/pipelines)"
+    )
+    args = parser.parse_args()
+
+    root: Path = args.pipeline_dir
+    folders = sorted(p.name for p in root.iterdir() if p.is_dir())
+    sql_bytes = sum(f.stat().st_size for name in folders for f in (root / name).glob(INSERT_GLOB))
+    print(f"Pipelines:     {len(folders)} folders, {sql_bytes / 1e6:.1f} MB of insert SQL under {root}")
+
+    t0 = time.perf_counter()
+    expected = {name: legacy_existing_eans(root, name) for name in folders}
+    t_scan = time.perf_counter() - t0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        registry = EanRegistry(root, db_path=Path(tmp) / "registry.sqlite")
+        timings = []
+        for _ in ("cold", "warm"):
+            t0 = time.perf_counter()
+            got = {name: registry.existing_eans(name) for name in folders}
+            timings.append(time.perf_counter() - t0)
+            if got != expected:
+                sys.exit("ERROR: registry lookups differ from the file scan")
+        stats = registry.stats
+        registry.close()
+
+    t_cold, t_warm = timings
+    print(f"Scan:          {t_scan:7.3f}s  ({len(folders)} lookups)")
+    print(f"Index (cold):  {t_cold:7.3f}s  ({stats['files_scanned']} files indexed)")
+    print(f"Index (warm):  {t_warm:7.3f}s  ({t_scan / t_warm:.1f}x faster than scan)")
+    print("Results:       identical for every folder")
+
+
+if __name__ == "__main__":
+    main()
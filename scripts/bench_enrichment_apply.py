@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Enrichment Apply Benchmark — batched VALUES inserts vs staging tables
+
+Builds one enrichment migration per ``enrich_ingredients`` output format for
+a full country — every active product with an EAN in ``--country`` (or the
+first ``--products``), with ``--ingredients`` ingredient rows (a few of
+them sub-ingredients) and ``--allergens`` allergen rows each, named after
+real ``ingredient_ref`` entries so every join resolves — and applies each
+migration with psql the way it is applied for real:
+
+* **sql**  — ``INSERT … FROM (VALUES …)`` batches of 500 rows, each one
+  joining ``products`` and ``ingredient_ref`` on ``lower(name_en)`` again.
+* **staged** — plain ``INSERT … VALUES`` into unlogged staging tables,
+  ``ANALYZE``, then one set-based insert per table.
+
+Existing product_ingredient / product_allergen_info rows of those products
+are deleted first so the inserts do real work, the materialized-view
+refresh is left out (it is the same in both formats; ``--refresh`` keeps
+it), and the transaction is rolled back, so the database is left as it
+was.  Only the migration body is timed.  Without a database the migration
+sizes and generation times are still reported, for synthetic products.
+
+Usage:
+    python scripts/bench_enrichment_apply.py
+    python scripts/bench_enrichment_apply.py --country DE --ingredients 20
+    python scripts/bench_enrichment_apply.py --products 2000 --formats staged
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from enrich_ingredients import OUTPUT_FORMATS, generate_migration, sql_escape
+from pipeline import db
+
+ALLERGEN_TAGS = ("en:milk", "en:gluten", "en:soybeans", "en:eggs", "en:nuts", "en:sesame-seeds")
+REFRESH = "SELECT refresh_all_materialized_views();"
+
+
+def load_products(country: str, limit: int | None) -> list[tuple[str, str]]:
+    """(country, ean) of the active products with an EAN in *country*."""
+    rows = db.fetch_all(
+        "SELECT country, ean FROM products WHERE country = %s AND ean IS NOT NULL AND is_deprecated IS NOT TRUE"
+        " ORDER BY product_id" + (f" LIMIT {int(limit)}" if limit else ""),
+        (country,),
+    )
+    return [(c.strip(), e.strip()) for c, e in rows]
+
+
+def load_ingredient_names(limit: int = 2_000) -> list[str]:
+    """Up to *limit* ingredient_ref names, most common first."""
+    rows = db.fetch_all(
+        "SELECT ir.name_en FROM ingredient_ref ir"
+        " LEFT JOIN product_ingredient pi ON pi.ingredient_id = ir.ingredient_id"
+        " GROUP BY ir.name_en ORDER BY count(pi.product_id) DESC, ir.name_en"
+        f" LIMIT {int(limit)}"
+    )
+    return [name for (name,) in rows]
+
+
+def make_rows(
+    products: list[tuple[str, str]], names: list[str], per_product: int, allergens: int
+) -> tuple[list[dict], list[dict]]:
+    """Ingredient and allergen rows shaped like ``process_ingredients`` / ``process_allergens`` output."""
+    ingredient_rows: list[dict] = []
+    allergen_rows: list[dict] = []
+    for i, (country, ean) in enumerate(products):
+        parent = None
+        for position in range(1, per_product + 1):
+            name = names[(i * 7 + position * 13) % len(names)]
+            is_sub = parent is not None and position % 4 == 0
+            ingredient_rows.append(
+                {
+                    "country": country,
+                    "ean": ean,
+                    "ingredient_name": name,
+                    "position": position,
+                    "percent": 12.5 if position == 1 else None,
+                    "percent_estimate": round(100 / (position + 1), 2),
+                    "is_sub_ingredient": is_sub,
+                    "parent_ingredient_name": parent if is_sub else None,
+                }
+            )
+            parent = name
+        for k in range(allergens):
+            tag = ALLERGEN_TAGS[(i + k) % len(ALLERGEN_TAGS)]
+            allergen_rows.append({"country": country, "ean": ean, "tag": tag, "type": "contains" if k else "traces"})
+    return ingredient_rows, allergen_rows
+
+
+def bench_script(sql: str, products: list[tuple[str, str]], refresh: bool) -> str:
+    """*sql* wrapped for a rolled-back, timed psql run after clearing the products' rows."""
+    keys = ",\n".join(f"({sql_escape(c)}, {sql_escape(e)})" for c, e in products)
+    body = sql.replace("BEGIN;\n", "", 1).replace("\nCOMMIT;", "")
+    if not refresh:
+        body = body.replace(REFRESH, "")
+    return (
+        "BEGIN;\n"
+        "CREATE TEMP TABLE bench_products ON COMMIT DROP AS\n"
+        "SELECT p.product_id FROM products p\n"
+        f"JOIN (VALUES {keys}) AS k(country, ean) ON p.country = k.country AND p.ean = k.ean;\n"
+        "DELETE FROM product_ingredient WHERE product_id IN (SELECT product_id FROM bench_products);\n"
+        "DELETE FROM product_allergen_info WHERE product_id IN (SELECT product_id FROM bench_products);\n"
+        "SELECT clock_timestamp() AS bench_t0 \\gset\n"
+        f"{body}\n"
+        "SELECT extract(epoch FROM clock_timestamp() - :'bench_t0'::timestamptz);\n"
+        "ROLLBACK;\n"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark applying VALUES vs staged enrichment migrations")
+    parser.add_argument("--country", default="PL", help="Country to enrich (default: PL)")
+    parser.add_argument("--products", type=int, default=None, help="Cap on products (default: the whole country)")
+    parser.add_argument("--ingredients", type=int, default=12, help="Ingredient rows per product (default: 12)")
+    parser.add_argument("--allergens", type=int, default=3, help="Allergen rows per product (default: 3)")
+    parser.add_argument("--formats", nargs="+", default=list(OUTPUT_FORMATS), choices=OUTPUT_FORMATS)
+    parser.add_argument("--refresh", action="store_true", help="Keep the materialized-view refresh in the timing")
+    args = parser.parse_args()
+
+    country = args.country.upper()
+    try:
+        products = load_products(country, args.products)
+        names = load_ingredient_names()
+        backend: db.PsqlBackend | None = db.PsqlBackend()
+    except db.DatabaseError as exc:
+        print(f"no database ({str(exc).strip().splitlines()[0]}): sizes only, for synthetic products\n")
+        products = [(country, f"2{i:012d}") for i in range(args.products or 5_000)]
+        names = [f"Bench ingredient {i}" for i in range(2_000)]
+        backend = None
+    if not products or not names:
+        raise SystemExit(f"no products with EANs in {country}, or an empty ingredient_ref")
+
+    ingredient_rows, allergen_rows = make_rows(products, names, args.ingredients, args.allergens)
+    stats = {"processed": len(products), "with_ingredients": len(products), "with_allergens": len(products)}
+    print(
+        f"{country}: {len(products):,} products, {len(ingredient_rows):,} ingredient rows, "
+        f"{len(allergen_rows):,} allergen rows — rolled back after each format\n"
+    )
+    print(f"{'format':<6} {'MB':>7} {'generate':>9} {'apply':>9} {'rows/s':>10}")
+
+    timings: dict[str, float] = {}
+    for fmt in args.formats:
+        t0 = time.perf_counter()
+        sql = generate_migration(ingredient_rows, allergen_rows, {}, stats, fmt)
+        generated = time.perf_counter() - t0
+        size_mb = len(sql.encode()) / 1e6
+        if backend is None:
+            print(f"{fmt:<6} {size_mb:>7.2f} {generated:>8.2f}s {'-':>9} {'-':>10}")
+            continue
+        try:
+            out = backend.run_script(bench_script(sql, products, args.refresh), "-q", "-t", "-A")
+        except db.DatabaseError as exc:
+            print(f"{fmt:<6} failed: {str(exc).strip().splitlines()[0]}")
+            continue
+        timings[fmt] = float(out.split()[-1])
+        rows = len(ingredient_rows) + len(allergen_rows)
+        print(f"{fmt:<6} {size_mb:>7.2f} {generated:>8.2f}s {timings[fmt]:>8.2f}s {rows / timings[fmt]:>10,.0f}")
+
+    if len(timings) == 2:
+        print(f"\nstaged is {timings['sql'] / timings['staged']:.1f}x faster to apply")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
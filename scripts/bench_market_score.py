@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Market-Score Selection Benchmark — full sort vs bounded top-K
+
+Builds N synthetic candidate products (a mix of PL / DE / foreign EANs,
+names with and without diacritics, retailer strings of realistic length)
+and compares two ways of picking the ``k`` most market-relevant ones:
+
+* **sort** — the previous approach: ``market_score`` (re-resolving the
+  diacritic pattern and scanning the retailer set per product), full
+  ``list.sort`` then slice.
+* **top-k** — ``off_client.top_k_by_market_score``: precompiled
+  per-country matchers, one score per product, heap of size ``k``.
+
+Both must select the same products in the same order.
+
+Usage:
+    python scripts/bench_market_score.py                     # 10k and 100k, k=100
+    python scripts/bench_market_score.py --sizes 1000000 --k 5000 --country DE
+"""
+
+from __future__ import annotations
+
+import argparse
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pipeline import off_client
+
+NAMES = ["Jogurt naturalny", "Żurek śląski", "Käsekuchen", "Chips paprika", "Masło extra", "Brötchen"]
+STORES = ["Biedronka, Lidl, Żabka", "REWE, Edeka", "Carrefour Market, Auchan", "", "Walmart, Target, Costco"]
+PREFIXES = ["590", "400", "405", "300", "871"]
+
+
+def _legacy_market_score(product: dict, country_code: str = "PL") -> int:
+    """``market_score`` as it was before the matchers were precompiled."""
+    gs1_prefixes, retailers, diacritic_re = off_client._COUNTRY_MARKET_DATA[country_code]
+    score = 0
+    ean = product.get("ean", "")
+    if any(ean.startswith(prefix) for prefix in gs1_prefixes):
+        score += 3
+    if re.search(diacritic_re, product.get("product_name", "")):
+        score += 2
+    stores = (product.get("store_availability") or "").lower()
+    if any(r in stores for r in retailers):
+        score += 1
+    try:
+        completeness = float(product.get("_completeness", 0))
+    except (ValueError, TypeError):
+        completeness = 0.0
+    if completeness >= 0.5:
+        score += 1
+    return score
+
+
+def make_products(n: int) -> list[dict]:
+    return [
+        {
+            "ean": f"{PREFIXES[i % len(PREFIXES)]}{i:010d}",
+            "product_name": f"{NAMES[i % len(NAMES)]} {i}",
+            "store_availability": STORES[(i // 3) % len(STORES)],
+            "_completeness": (i % 10) / 10,
+        }
+        for i in range(n)
+    ]
+
+
+def bench(n: int, k: int, country: str, repeat: int) -> None:
+    products = make_products(n)
+
+    def full_sort() -> list[dict]:
+        ranked = list(products)
+        ranked.sort(key=lambda p: _legacy_market_score(p, country), reverse=True)
+        return ranked[:k]
+
+    def top_k() -> list[dict]:
+        return off_client.top_k_by_market_score(iter(products), k, country)
+
+    timings = {}
+    for label, fn in (("sort", full_sort), ("top-k", top_k)):
+        best = float("inf")
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            result = fn()
+            best = min(best, time.perf_counter() - t0)
+        timings[label] = (best, [p["ean"] for p in result])
+
+    (t_sort, sorted_eans), (t_topk, topk_eans) = timings["sort"], timings["top-k"]
+    same = "yes" if sorted_eans == topk_eans else "NO — MISMATCH"
+    print(
+        f"{n:>9,} candidates  k={k:<5}  sort {t_sort * 1000:8.1f} ms   "
+        f"top-k {t_topk * 1000:8.1f} ms   speedup {t_sort / t_topk:4.1f}x   identical: {same}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark market-score top-K selection")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000], help="Candidate counts")
+    parser.add_argument("--k", type=int, default=100, help="Products to select (default: 100)")
+    parser.add_argument("--country", default="PL", choices=sorted(off_client._COUNTRY_MARKET_DATA))
+    parser.add_argument("--repeat", type=int, default=3, help="Best-of repetitions (default: 3)")
+    args = parser.parse_args()
+
+    for n in args.sizes:
+        bench(n, args.k, args.country, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
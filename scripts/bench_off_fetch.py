@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+OFF Fetch Benchmark — serial vs concurrent search paging
+
+Starts a local stub of the OFF ``/api/v2/search`` endpoint with a fixed
+per-request latency, then runs ``pipeline.off_client.search_products`` in
+serial mode and in concurrent mode and reports wall-clock time for each.
+The returned product codes must be identical (same set, same order).
+
+No network access is needed — the real OFF API is never contacted.
+
+Usage:
+    python scripts/bench_off_fetch.py
+    python scripts/bench_off_fetch.py --latency 0.3 --products 400 --workers 8 --rps 10
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pipeline import off_client
+
+BENCH_CATEGORY = "BenchCategory"
+BENCH_TAGS = ["en:bench-a", "en:bench-b"]
+BENCH_TERMS = ["bench one", "bench two"]
+
+
+# ─── Stub server ─────────────────────────────────────────────────────────────
+
+
+def _make_handler(latency: float, per_query: int) -> type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            qs = parse_qs(urlparse(self.path).query)
+            query = (qs.get("categories_tags_en") or qs.get("search_terms") or [""])[0]
+            page = int(qs.get("page", ["1"])[0])
+            size = int(qs.get("page_size", ["50"])[0])
+            start = (page - 1) * size
+            stop = min(start + size, per_query)
+            products = [{"code": f"{query}-{i:05d}", "product_name": f"{query} {i}"} for i in range(start, stop)]
+            time.sleep(latency)
+            body = json.dumps({"count": per_query, "products": products}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *_args: object) -> None:
+            pass
+
+    return Handler
+
+
+# ─── Benchmark ───────────────────────────────────────────────────────────────
+
+
+def _timed(**kwargs: object) -> tuple[float, list[str]]:
+    t0 = time.perf_counter()
+    products = off_client.search_products(BENCH_CATEGORY, **kwargs)
+    return time.perf_counter() - t0, [p["code"] for p in products]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark serial vs concurrent OFF search fetching")
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub per-request latency in seconds")
+    parser.add_argument("--products", type=int, default=300, help="Products requested (max_results)")
+    parser.add_argument("--per-query", type=int, default=200, help="Products available per stub query")
+    parser.add_argument("--workers", type=int, default=6, help="Concurrent workers")
+    parser.add_argument("--rps", type=float, default=20.0, help="Request budget for the concurrent run")
+    parser.add_argument("--delay", type=float, default=0.0, help="Serial inter-request delay (production uses 1.0)")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(args.latency, args.per_query))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    off_client.OFF_SEARCH_URL = f"http://127.0.0.1:{server.server_address[1]}/api/v2/search"
+    off_client.REQUEST_DELAY = args.delay
+    off_client.DB_TO_OFF_TAGS[BENCH_CATEGORY] = BENCH_TAGS
+    off_client.CATEGORY_SEARCH_TERMS[BENCH_CATEGORY] = BENCH_TERMS
+
+    try:
+        serial_s, serial_codes = _timed(max_results=args.products)
+        conc_s, conc_codes = _timed(max_results=args.products, workers=args.workers, rps=args.rps)
+    finally:
+        server.shutdown()
+
+    print(f"Stub latency:  {args.latency:.2f}s/request, {args.per_query} products/query")
+    print(f"Serial:        {serial_s:7.2f}s  ({len(serial_codes)} products, delay {args.delay:.2f}s)")
+    print(f"Concurrent:    {conc_s:7.2f}s  ({len(conc_codes)} products, {args.workers} workers, {args.rps:g} rps)")
+    print(f"Speed-up:      {serial_s / conc_s:7.2f}x")
+
+    if serial_codes != conc_codes:
+        print("MISMATCH: concurrent result differs from serial result")
+        sys.exit(1)
+    print("Output:        identical (same products, same order)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Pipeline Apply Benchmark — statement cost and lock duration by batch size
+
+Generates one synthetic category (default 2,000 products, the shapes of
+``bench_sql_generator.py``) at several batch sizes and applies the files
+to a database the way ``RUN_LOCAL.ps1`` does: in name order, one
+transaction per file.  For every statement it records the parse/plan time
+(the wall time of a plain ``EXPLAIN``, which parses and plans without
+executing) and the execution time; a file's total time is how long the
+row locks it takes are held before its transaction commits.
+
+Each batch size runs inside one outer transaction that is rolled back at
+the end (every file is a savepoint), so the database is left as it was —
+but the category's rows stay locked while it runs: point it at a local
+database.  Needs ``psycopg`` (see ``pipeline.db``).
+
+Usage:
+    python scripts/bench_pipeline_apply.py
+    python scripts/bench_pipeline_apply.py --products 10000 --batch-sizes 100 1000 0
+    python scripts/bench_pipeline_apply.py --category Chips --country DE
+"""
+
+from __future__ import annotations
+
+import argparse
+import re
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_sql_generator import make_products
+
+from pipeline import db
+from pipeline.apply import sql_files
+from pipeline.sql_generator import generate_pipeline
+from pipeline.utils import open_text
+
+# Generated files end every statement with ";" at the end of a line.
+_STATEMENT_END_RE = re.compile(r";[ \t]*\n")
+_EXPLAINABLE = ("insert", "update", "delete", "select", "with")
+
+
+@dataclass
+class BatchRun:
+    """Timings of one batch size: per statement and per file (transaction)."""
+
+    batch_size: int
+    files: int = 0
+    plan_seconds: list[float] = field(default_factory=list)
+    exec_seconds: list[float] = field(default_factory=list)
+    file_seconds: list[float] = field(default_factory=list)
+
+
+def statements(sql: str) -> list[str]:
+    """The statements of a generated file, comment lines dropped."""
+    code = "\n".join(line for line in sql.splitlines() if not line.lstrip().startswith("--"))
+    return [s.strip() for s in _STATEMENT_END_RE.split(code + "\n") if s.strip()]
+
+
+def apply_timed(conn, files: list[Path], run: BatchRun) -> None:
+    """Apply *files* on *conn*, one savepoint per file, recording timings."""
+    for path in files:
+        with open_text(path) as fh:
+            sql = fh.read()
+        start = time.perf_counter()
+        with conn.transaction(), conn.cursor() as cur:
+            for statement in statements(sql):
+                if statement.lower().startswith(_EXPLAINABLE):
+                    t0 = time.perf_counter()
+                    cur.execute(f"EXPLAIN {statement}")
+                    cur.fetchall()
+                    run.plan_seconds.append(time.perf_counter() - t0)
+                t0 = time.perf_counter()
+                cur.execute(statement)
+                run.exec_seconds.append(time.perf_counter() - t0)
+        run.file_seconds.append(time.perf_counter() - start)
+        run.files += 1
+
+
+def bench(backend: db.PoolBackend, products: list[dict], category: str, country: str, batch_size: int) -> BatchRun:
+    """Generate at *batch_size* and apply inside a rolled-back transaction."""
+    run = BatchRun(batch_size)
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(tmp) / "bench"
+        generate_pipeline(category, products, str(folder), country, batch_size=batch_size)
+        with backend.connection() as conn, conn.transaction(force_rollback=True):
+            apply_timed(conn, sql_files(folder), run)
+    return run
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark applying pipeline SQL at several batch sizes")
+    parser.add_argument("--products", type=int, default=2_000, help="Synthetic products (default: 2000)")
+    parser.add_argument(
+        "--batch-sizes",
+        type=int,
+        nargs="+",
+        default=[100, 500, 2_000, 0],
+        help="Batch sizes to compare; 0 = unbatched (default: 100 500 2000 0)",
+    )
+    parser.add_argument("--category", default="Dairy", help="Category the products are filed under (default: Dairy)")
+    parser.add_argument("--country", default="PL", help="Country code (default: PL)")
+    args = parser.parse_args()
+
+    backend = db.get_backend()
+    if not isinstance(backend, db.PoolBackend):
+        raise SystemExit("bench_pipeline_apply needs psycopg and a reachable database (see pipeline.db)")
+
+    products = make_products(args.products)
+    print(f"{args.products:,} products as {args.category}/{args.country}, rolled back after each batch size\n")
+    print(
+        f"{'batch':>7} {'files':>6} {'stmts':>6} {'plan max':>10} {'exec max':>10} "
+        f"{'lock max':>10} {'lock p50':>10} {'total':>8}"
+    )
+    for batch_size in args.batch_sizes:
+        run = bench(backend, products, args.category, args.country.upper(), batch_size)
+        locks = sorted(run.file_seconds)
+        print(
+            f"{batch_size or 'all':>7} {run.files:>6} {len(run.exec_seconds):>6} "
+            f"{max(run.plan_seconds, default=0) * 1000:>8.1f}ms {max(run.exec_seconds) * 1000:>8.1f}ms "
+            f"{locks[-1] * 1000:>8.1f}ms {locks[len(locks) // 2] * 1000:>8.1f}ms {sum(locks):>7.2f}s"
+        )
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+SQL Escaping Benchmark — per-value helpers vs their column-wise versions
+
+Times each SQL literal helper on one synthetic column of N values
+(default 200,000: product names with apostrophes, curly quotes,
+diacritics and the odd backslash; nutrient cells as floats, ints and
+unit-suffixed strings), once calling the per-value helper in a loop and once through its
+column-wise counterpart, and checks that both produce the same literals.
+
+Usage:
+    python scripts/bench_sql_escape.py
+    python scripts/bench_sql_escape.py --values 1000000 --repeat 5
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from enrich_ingredients import (
+    sql_escape as enrich_escape,
+    sql_escape_column as enrich_escape_column,
+)
+from pipeline.sql_generator import _sql_num, _sql_nums, _sql_text, _sql_texts
+
+
+def make_texts(n: int) -> list[str]:
+    """*n* product-name-like strings, half with quotes to escape."""
+    shapes = ["Jogurt naturalny {i}", "Chipsy O'Brien {i} g", "Mleko \u2018łaciate\u2019 {i}%", "Ser żółty {i}"]
+    return [shapes[i % len(shapes)].format(i=i) if i % 1000 else f"C:\\{i}" for i in range(n)]
+
+
+def make_numbers(n: int) -> list[object]:
+    """*n* nutrient cells: floats, ints, unit strings and missing values."""
+    shapes: list[Callable[[int], object]] = [
+        lambda i: (i % 1000) / 10,
+        lambda i: i % 900,
+        lambda i: f"{i % 70}.5 g",
+        lambda i: None,
+    ]
+    return [shapes[i % len(shapes)](i) for i in range(n)]
+
+
+def best_of(repeat: int, fn: Callable[[], list[str]]) -> tuple[float, list[str]]:
+    """Best wall time of *repeat* calls, with the last result."""
+    best = float("inf")
+    result: list[str] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark per-value vs column-wise SQL escaping")
+    parser.add_argument("--values", type=int, default=200_000, help="Values per column (default: 200000)")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs; the best is reported (default: 3)")
+    args = parser.parse_args()
+
+    texts = make_texts(args.values)
+    numbers = make_numbers(args.values)
+    cases = [
+        ("sql_generator._sql_text", texts, _sql_text, _sql_texts),
+        ("sql_generator._sql_num", numbers, _sql_num, _sql_nums),
+        ("enrich_ingredients.sql_escape", texts, enrich_escape, enrich_escape_column),
+    ]
+
+    print(f"{args.values:,} values per column, best of {args.repeat}\n")
+    print(f"{'helper':<32} {'per value':>10} {'column':>10} {'speedup':>8}")
+    for name, values, scalar, column in cases:
+        loop_s, expected = best_of(args.repeat, lambda v=values, f=scalar: [f(x) for x in v])
+        column_s, got = best_of(args.repeat, lambda v=values, f=column: f(v))
+        if got != expected:
+            raise SystemExit(f"{name}: column output differs from the per-value helper")
+        print(f"{name:<32} {loop_s * 1000:>8.1f}ms {column_s * 1000:>8.1f}ms {loop_s / column_s:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+SQL Generator Benchmark — generate_pipeline on synthetic categories
+
+Generates N synthetic products (default 50,000, every field populated,
+a mix of diacritics, apostrophes, missing EANs, stores and images) and
+times ``pipeline.sql_generator.generate_pipeline`` into a temporary
+folder, reporting the best of ``--repeat`` runs, the peak traced
+allocations (``tracemalloc``) of one extra run and the process's peak RSS
+(Unix only; the products themselves are built before the first run).
+
+Usage:
+    python scripts/bench_sql_generator.py
+    python scripts/bench_sql_generator.py --products 10000 --batch-size 0
+    python scripts/bench_sql_generator.py --format copy
+    python scripts/bench_sql_generator.py --gzip
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pipeline.sql_generator import BATCH_SIZE, OUTPUT_FORMATS, generate_pipeline
+
+_BRANDS = ["Łaciate", "Piątnica", "O'Sullivan", "Zott", "Mlekovita", "Bakoma", "Żywiec Zdrój", "Müller"]
+
+
+def make_products(n: int) -> list[dict]:
+    """*n* distinct synthetic products with realistic field shapes."""
+    return [
+        {
+            "brand": _BRANDS[i % len(_BRANDS)],
+            "product_name": f"Jogurt naturalny 'kremowy' {i} g",
+            "ean": f"590{i:010d}" if i % 20 else "",
+            "product_type": "Grocery",
+            "prep_method": "fermented" if i % 2 else None,
+            "store_availability": "Biedronka, Lidl, Żabka" if i % 3 else None,
+            "controversies": "none",
+            "calories": 60 + i % 300,
+            "total_fat_g": f"{i % 30}.5",
+            "saturated_fat_g": (i % 100) / 10,
+            "trans_fat_g": 0,
+            "carbs_g": f"{i % 70} g",
+            "sugars_g": (i % 200) / 10,
+            "fibre_g": None if i % 7 == 0 else 1.2,
+            "protein_g": (i % 250) / 10,
+            "salt_g": (i % 30) / 10,
+            "nutri_score_label": "ABCDE"[i % 5],
+            "nova_classification": str(1 + i % 4),
+            "image_front_url": f"https://images.openfoodfacts.org/images/products/{i}/front_pl.jpg",
+            "image_nutrition_url": f"https://images.openfoodfacts.org/images/products/{i}/nutrition_pl.jpg",
+        }
+        for i in range(n)
+    ]
+
+
+def peak_rss_mb() -> float | None:
+    """Peak resident set size of this process so far, or None where unsupported."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3  # bytes on macOS, KiB elsewhere
+
+
+def generate(products: list[dict], batch_size: int, output_format: str, compress: bool) -> tuple[float, int, int]:
+    """One generation run: (seconds, files, bytes)."""
+    with tempfile.TemporaryDirectory() as tmp:
+        t0 = time.perf_counter()
+        files = generate_pipeline(
+            "Dairy",
+            products,
+            str(Path(tmp) / "dairy"),
+            batch_size=batch_size,
+            output_format=output_format,
+            compress=compress,
+        )
+        elapsed = time.perf_counter() - t0
+        return elapsed, len(files), sum(f.stat().st_size for f in files)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark pipeline.sql_generator")
+    parser.add_argument("--products", type=int, default=50_000, help="Synthetic products (default: 50000)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help=f"Batch size (default: {BATCH_SIZE})")
+    parser.add_argument("--format", default="sql", choices=OUTPUT_FORMATS, help="Output format (default: sql)")
+    parser.add_argument("--gzip", action="store_true", help="Write gzip-compressed files")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs; the best is reported (default: 3)")
+    args = parser.parse_args()
+
+    products = make_products(args.products)
+    rss_before = peak_rss_mb()
+    runs = [generate(products, args.batch_size, args.format, args.gzip) for _ in range(args.repeat)]
+    best, n_files, n_bytes = min(runs)
+    rss_after = peak_rss_mb()
+
+    tracemalloc.start()
+    generate(products, args.batch_size, args.format, args.gzip)
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    label = f"{args.format}, gzip" if args.gzip else args.format
+    print(f"{args.products:,} products -> {n_files} files, {n_bytes / 1e6:.1f} MB ({label})")
+    print(f"  generate: {best:.3f}s best of {args.repeat}   {args.products / best:,.0f} products/s")
+    print(f"  allocations: {peak / 1e6:.1f} MB peak traced")
+    if rss_before is not None and rss_after is not None:
+        print(f"  peak RSS: {rss_after:.1f} MB ({rss_after - rss_before:+.1f} MB over the input products)")
+
+
+if __name__ == "__main__":
+    main()
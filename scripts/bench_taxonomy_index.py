@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Ingredient Taxonomy Benchmark — per-item normalization vs the memoized TaxonomyIndex
+
+Builds a corpus of N products with OFF-shaped ingredient trees (default
+5,000): 5-25 top-level ingredients each, a fifth of them with nested
+sub-ingredients, drawn Zipf-style from a vocabulary of taxonomy ids
+(``en:sugar``, ``en:e330``, ``pl:mąka-pszenna`` …) and free-text labels,
+so that — as in real data — a few hundred ingredients make up most rows.
+``--dump`` uses real products from an OFF JSONL/Parquet dump instead.
+
+Runs ``process_ingredients`` over the corpus twice:
+
+* **legacy** — the previous implementation, which normalized, classified
+  (uncompiled ``re.match``) and resolved every ingredient of every product.
+* **index**  — one ``TaxonomyIndex`` shared by all products and passes;
+  its first pass includes building every record.
+
+Both must produce identical rows and new ingredient_ref entries.
+
+Usage:
+    python scripts/bench_taxonomy_index.py
+    python scripts/bench_taxonomy_index.py --products 50000 --repeat 5
+    python scripts/bench_taxonomy_index.py --dump openfoodfacts-products.jsonl.gz --country PL
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import re
+import sys
+import time
+from itertools import islice
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import enrich_ingredients
+from enrich_ingredients import TaxonomyIndex, process_ingredients
+
+BASE_IDS = [
+    "en:sugar",
+    "en:water",
+    "en:salt",
+    "en:wheat-flour",
+    "en:palm-oil",
+    "en:milk",
+    "en:egg",
+    "en:sunflower-oil",
+    "en:rapeseed-oil",
+    "en:cocoa-butter",
+    "en:skimmed-milk-powder",
+    "en:glucose-syrup",
+    "en:yeast",
+    "en:butter",
+    "en:cream",
+    "en:whey-powder",
+    "en:flavouring",
+    "en:natural-flavouring",
+    "en:potato",
+    "en:tomato",
+    "en:onion",
+    "en:garlic",
+    "en:pepper",
+    "pl:mąka-pszenna",
+    "pl:olej-rzepakowy",
+    "pl:cukier",
+    "de:weizenmehl",
+    "de:zucker",
+]
+ADDITIVES = ["en:e330", "en:e322", "en:e300", "en:e471", "en:e415", "en:e202", "en:e160a", "en:e950"]
+LABELS = ["Mąka PSZENNA", "przyprawy", "Zucker", "aromat naturalny", "sól", "Emulgator: lecytyny", "12%", "x"]
+
+
+def make_vocabulary(size: int) -> list[str]:
+    """*size* ingredient ids/texts, the most common first."""
+    vocab = BASE_IDS + ADDITIVES + LABELS
+    vocab += [f"en:ingredient-{i}" for i in range(size - len(vocab))]
+    return vocab[:size]
+
+
+def make_corpus(n: int, vocab_size: int, seed: int = 7) -> list[dict]:
+    """*n* OFF-shaped products whose ingredients follow a Zipf-like distribution."""
+    rng = random.Random(seed)  # noqa: S311 — reproducible corpus, not security-sensitive
+    vocab = make_vocabulary(vocab_size)
+    weights = [1 / (rank + 1) for rank in range(len(vocab))]
+
+    def item(depth: int) -> dict:
+        name = rng.choices(vocab, weights)[0]
+        node = (
+            {"id": name, "text": name.split(":", 1)[1].replace("-", " ").capitalize()}
+            if ":" in name
+            else {"text": name}
+        )
+        node["percent_estimate"] = round(rng.uniform(-1, 60), 3)
+        node["vegan"] = rng.choice(["en:yes", "en:no", "en:maybe", None])
+        if depth == 0 and rng.random() < 0.2:
+            node["ingredients"] = [item(depth + 1) for _ in range(rng.randint(1, 4))]
+        return node
+
+    return [{"ingredients": [item(0) for _ in range(rng.randint(5, 25))]} for _ in range(n)]
+
+
+def load_dump(path: str, country: str, n: int) -> list[dict]:
+    """The first *n* products with ingredients from an OFF dump."""
+    from pipeline.dump_ingest import iter_dump
+    from pipeline.run import _COUNTRY_OFF_NAME
+
+    tags = [f"en:{_COUNTRY_OFF_NAME[country]}"]
+    rows = (raw for raw in iter_dump(path, tags) if raw and raw.get("ingredients"))
+    return list(islice(rows, n))
+
+
+# ─── Previous implementation ─────────────────────────────────────────────────
+
+
+def _legacy_normalize(name: str) -> str:
+    name = name.strip()
+    if ":" in name:
+        name = name.split(":", 1)[1]
+    name = name.replace("-", " ").replace("_", " ")
+    name = re.sub(r"\s+", " ", name).strip()
+    return name.lower()
+
+
+def _legacy_is_additive(tag: str) -> bool:
+    return bool(re.match(r"(en:)?e\d{3}", tag.lower()))
+
+
+def legacy_process_ingredients(off_product, country, ean, ingredient_lookup, new_ingredients) -> list[dict]:
+    """``process_ingredients`` as it was before the taxonomy index."""
+    ingredients = off_product.get("ingredients", [])
+    if not ingredients:
+        return []
+    rows: list[dict] = []
+    strip = enrich_ingredients._strip_lang_prefix
+
+    def process_item(item: dict, pos: int, is_sub: bool, parent_name: str | None) -> int:
+        text = item.get("text", "").strip()
+        off_id = item.get("id", "").strip()
+        if not text and not off_id:
+            return pos
+        name_lower = _legacy_normalize(off_id or text)
+        if not name_lower or enrich_ingredients._is_garbage_name(name_lower):
+            return pos
+        if ingredient_lookup.get(name_lower) is None and name_lower not in new_ingredients:
+            new_ingredients[name_lower] = {
+                "name_en": enrich_ingredients._display_name_for(name_lower),
+                "is_additive": _legacy_is_additive(off_id) if off_id else False,
+                "vegan": strip(item.get("vegan", "unknown") or "unknown"),
+                "vegetarian": strip(item.get("vegetarian", "unknown") or "unknown"),
+                "from_palm_oil": strip(item.get("from_palm_oil", "unknown") or "unknown"),
+            }
+        display_name = enrich_ingredients._display_name_for(name_lower)
+        rows.append(
+            {
+                "country": country,
+                "ean": ean,
+                "ingredient_name": display_name,
+                "position": pos,
+                "percent": item.get("percent"),
+                "percent_estimate": enrich_ingredients._clamp_percent_estimate(item.get("percent_estimate")),
+                "is_sub_ingredient": is_sub,
+                "parent_ingredient_name": parent_name if is_sub else None,
+            }
+        )
+        next_pos = pos + 1
+        for sub in item.get("ingredients", []):
+            next_pos = process_item(sub, next_pos, True, display_name)
+        return next_pos
+
+    position = 1
+    for item in ingredients:
+        position = process_item(item, position, False, None)
+    return rows
+
+
+# ─── Benchmark ───────────────────────────────────────────────────────────────
+
+
+def _walk(corpus: list[dict]):
+    """Every ingredient item of *corpus*, sub-ingredients included."""
+    stack = [item for product in corpus for item in product.get("ingredients", [])]
+    while stack:
+        item = stack.pop()
+        yield item
+        stack.extend(item.get("ingredients", []))
+
+
+def run(corpus: list[dict], process, lookup) -> tuple[float, list[dict], dict[str, dict]]:
+    new_ingredients: dict[str, dict] = {}
+    rows: list[dict] = []
+    t0 = time.perf_counter()
+    for i, product in enumerate(corpus):
+        rows.extend(process(product, "PL", str(i), lookup, new_ingredients))
+    return time.perf_counter() - t0, rows, new_ingredients
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark process_ingredients with and without the taxonomy index")
+    parser.add_argument("--products", type=int, default=5_000, help="Products in the corpus (default: 5000)")
+    parser.add_argument("--vocabulary", type=int, default=3_000, help="Distinct ingredients (default: 3000)")
+    parser.add_argument("--known", type=float, default=0.8, help="Share of the vocabulary in ingredient_ref")
+    parser.add_argument("--repeat", type=int, default=3, help="Passes over the corpus (default: 3)")
+    parser.add_argument("--dump", default=None, help="Use products from an OFF JSONL/Parquet dump instead")
+    parser.add_argument("--country", default="PL", help="Country filter for --dump (default: PL)")
+    args = parser.parse_args()
+
+    if args.dump:
+        corpus = load_dump(args.dump, args.country.upper(), args.products)
+        source = f"{args.dump} ({args.country.upper()})"
+    else:
+        corpus = make_corpus(args.products, args.vocabulary)
+        source = f"synthetic, {args.vocabulary:,}-ingredient vocabulary"
+    vocab = make_vocabulary(args.vocabulary)
+    known = {_legacy_normalize(v): i for i, v in enumerate(vocab[: int(len(vocab) * args.known)], start=1)}
+    items = sum(1 for _ in _walk(corpus))
+    print(f"{len(corpus):,} products, {items:,} ingredient items ({source}); best of {args.repeat}\n")
+
+    index = TaxonomyIndex(known)
+    results = {}
+    for label, process, lookup in (
+        ("legacy", legacy_process_ingredients, known),
+        ("index", process_ingredients, index),
+    ):
+        runs = [run(corpus, process, lookup) for _ in range(args.repeat)]
+        results[label] = min(runs, key=lambda r: r[0])
+        seconds = results[label][0]
+        print(
+            f"{label:<7} first pass {runs[0][0] * 1000:9.1f} ms   best {seconds * 1000:9.1f} ms   "
+            f"{items / seconds:>12,.0f} items/s"
+        )
+
+    info = index.record.cache_info()
+    print(f"\nindex: {info.currsize:,} records memoized, {info.hits:,} hits / {info.misses:,} misses")
+    print(f"speedup {results['legacy'][0] / results['index'][0]:.1f}x")
+    if results["legacy"][1:] != results["index"][1:]:
+        print("MISMATCH: rows or new ingredients differ")
+        sys.exit(1)
+    print("Output:  identical (same rows and new ingredients)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+"""Tests for the enrich_ingredients checkpoint journal, ``--resume``, live progress and enrichment state."""
+
+from __future__ import annotations
+
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+import enrich_ingredients
+from enrich_ingredients import (
+    DAY,
+    RETRY_MAX,
+    EnrichJournal,
+    EnrichState,
+    apply_entry,
+    enrich_product,
+    progress_line,
+    retry_interval,
+)
+from pipeline.rate_limit import AdaptiveTokenBucket
+
+# ─── Fixtures ──────────────────────────────────────────────────────────────
+
+
+def _product(i: int, has_ingredients: bool = False) -> dict:
+    return {
+        "product_id": i,
+        "country": "DE",
+        "ean": f"400000000{i:04d}",
+        "brand": "Brand",
+        "product_name": f"Product {i}",
+        "category": "Dairy",
+        "has_ingredients": has_ingredients,
+    }
+
+
+def _off(i: int) -> dict:
+    return {
+        "ingredients": [
+            {"id": "en:milk", "text": "milk", "percent_estimate": 90},
+            {"id": f"en:spice-{i}", "text": f"spice {i}", "percent_estimate": 10},
+        ],
+        "allergens_tags": ["en:milk"],
+        "traces_tags": [],
+    }
+
+
+PRODUCTS = [_product(i) for i in range(1, 8)]
+OFF = {p["ean"]: _off(p["product_id"]) for p in PRODUCTS if p["product_id"] != 4}  # product 4 is not on OFF
+
+
+def _empty_stats() -> dict:
+    return {"processed": 0, "with_ingredients": 0, "with_allergens": 0, "not_found": 0, "api_errors": 0}
+
+
+@pytest.fixture()
+def enrich_env(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> dict:
+    """Run main() against fake DB/OFF data in *tmp_path*."""
+    monkeypatch.setattr(enrich_ingredients, "OUTPUT_DIR", tmp_path / "migrations")
+    monkeypatch.setattr(enrich_ingredients, "JOURNAL_DIR", tmp_path / "journal")
+    monkeypatch.setattr(enrich_ingredients, "STATE_DB", tmp_path / "state.sqlite")
+    monkeypatch.setattr(enrich_ingredients, "FLUSH_EVERY", 3)
+    monkeypatch.setattr(enrich_ingredients, "get_ingredient_ref", lambda: {"milk": 1})
+    (tmp_path / "migrations").mkdir()
+    env = {"interrupt_at": None, "looked_up": []}
+
+    def get_products(country_filter=None):
+        # The database still reports every product: nothing has been applied yet.
+        return [dict(p) for p in PRODUCTS]
+
+    def lookups(codes, fields=None, **kwargs):
+        for n, code in enumerate(codes, start=1):
+            if n == env["interrupt_at"]:
+                raise KeyboardInterrupt
+            env["looked_up"].append(code)
+            yield code, OFF.get(code)
+
+    monkeypatch.setattr(enrich_ingredients, "get_products", get_products)
+    monkeypatch.setattr(enrich_ingredients, "iter_products_by_codes", lookups)
+
+    def run(*argv: str) -> None:
+        env["looked_up"].clear()
+        monkeypatch.setattr(sys, "argv", ["enrich_ingredients.py", "--country", "DE", *argv])
+        enrich_ingredients.main()
+
+    env["run"] = run
+    env["lookups"] = lookups
+    env["migrations"] = tmp_path / "migrations"
+    env["journal"] = tmp_path / "journal" / "enrich_de.jsonl"
+    return env
+
+
+def _body(path: Path) -> str:
+    """Migration text without the timestamp line."""
+    return "\n".join(
+        line for line in path.read_text(encoding="utf-8").splitlines() if not line.startswith("-- Generated")
+    )
+
+
+# ─── EnrichJournal ─────────────────────────────────────────────────────────
+
+
+class TestEnrichJournal:
+    def test_round_trip(self, tmp_path: Path) -> None:
+        path = tmp_path / "j" / "enrich_de.jsonl"
+        journal = EnrichJournal.start(path, "20260101000000_populate_ingredients_allergens.sql")
+        journal.record({"country": "DE", "ean": "1", "found": False})
+        journal.record({"country": "DE", "ean": "2", "found": True, "allergens": []})
+        journal.close()
+
+        resumed = EnrichJournal.resume(path)
+        assert resumed is not None
+        assert resumed.migration == "20260101000000_populate_ingredients_allergens.sql"
+        assert resumed.done() == {("DE", "1"), ("DE", "2")}
+        resumed.discard()
+        assert not path.exists()
+
+    def test_torn_last_line_is_ignored(self, tmp_path: Path) -> None:
+        path = tmp_path / "enrich_de.jsonl"
+        journal = EnrichJournal.start(path, "m.sql")
+        journal.record({"country": "DE", "ean": "1", "found": False})
+        journal.close()
+        with open(path, "a", encoding="utf-8") as fh:
+            fh.write('{"country": "DE", "ean": "2", "fou')
+
+        resumed = EnrichJournal.resume(path)
+        assert resumed is not None
+        assert resumed.done() == {("DE", "1")}
+        resumed.close()
+
+    def test_missing_or_headerless_journal(self, tmp_path: Path) -> None:
+        assert EnrichJournal.resume(tmp_path / "none.jsonl") is None
+        (tmp_path / "empty.jsonl").write_text("", encoding="utf-8")
+        assert EnrichJournal.resume(tmp_path / "empty.jsonl") is None
+
+
+# ─── enrich_product / apply_entry ──────────────────────────────────────────
+
+
+class TestEntries:
+    def test_replay_rebuilds_rows_and_new_ingredients(self) -> None:
+        new_ingredients: dict[str, dict] = {}
+        entries = [enrich_product(p, OFF.get(p["ean"]), {"milk": 1}, new_ingredients) for p in PRODUCTS]
+        replayed: dict[str, dict] = {}
+        ingredient_rows: list[dict] = []
+        allergen_rows: list[dict] = []
+        stats = _empty_stats()
+        for entry in json.loads(json.dumps(entries)):
+            apply_entry(entry, stats, ingredient_rows, allergen_rows, replayed)
+        assert replayed == new_ingredients
+        assert list(replayed) == list(new_ingredients)
+        assert (stats["processed"], stats["not_found"], stats["with_allergens"]) == (7, 1, 6)
+        assert len(ingredient_rows) == 12
+
+    def test_existing_ingredients_are_not_reparsed(self) -> None:
+        entry = enrich_product(_product(1, has_ingredients=True), _off(1), {"milk": 1}, {})
+        assert "ingredients" not in entry
+        assert entry["new_ingredients"] == {}
+        assert entry["allergens"]
+
+
+# ─── main() --resume ───────────────────────────────────────────────────────
+
+
+class TestResume:
+    def test_interrupted_run_resumes_to_the_same_migration(self, enrich_env: dict) -> None:
+        enrich_env["run"]("--full")
+        [full] = enrich_env["migrations"].iterdir()
+        expected = _body(full)
+        full.unlink()
+        assert not enrich_env["journal"].exists()
+
+        enrich_env["interrupt_at"] = 5
+        enrich_env["run"]("--full")
+        [partial] = enrich_env["migrations"].iterdir()
+        assert "-- Products processed: 4" in partial.read_text(encoding="utf-8")
+        assert enrich_env["journal"].exists()
+
+        enrich_env["interrupt_at"] = None
+        enrich_env["run"]("--resume", "--full")
+        assert list(enrich_env["migrations"].iterdir()) == [partial]
+        assert enrich_env["looked_up"] == [p["ean"] for p in PRODUCTS[4:]]
+        assert _body(partial) == expected
+        assert not enrich_env["journal"].exists()
+
+    def test_crash_keeps_journal_and_last_flush(self, enrich_env: dict) -> None:
+        def crash(codes, fields=None, **kwargs):
+            for code in codes:
+                if code == PRODUCTS[4]["ean"]:
+                    raise RuntimeError("docker restart")
+                yield code, OFF.get(code)
+
+        enrich_ingredients.iter_products_by_codes = crash  # restored by the fixture's monkeypatch
+        with pytest.raises(RuntimeError):
+            enrich_env["run"]()
+        [partial] = enrich_env["migrations"].iterdir()
+        assert "-- Products processed: 3" in partial.read_text(encoding="utf-8")
+        journal = EnrichJournal.resume(enrich_env["journal"])
+        assert journal.done() == {("DE", p["ean"]) for p in PRODUCTS[:4]}
+        journal.close()
+
+    def test_new_run_replaces_a_journal_without_recorded_outcomes(
+        self, enrich_env: dict, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        monkeypatch.setattr(enrich_ingredients, "FLUSH_EVERY", 250)
+
+        def fails(codes, fields=None, **kwargs):
+            for code in codes:
+                if code == PRODUCTS[4]["ean"]:
+                    raise ConnectionError("connection reset")
+                yield code, OFF.get(code)
+
+        enrich_ingredients.iter_products_by_codes = fails  # restored by the fixture's monkeypatch
+        with pytest.raises(ConnectionError):
+            enrich_env["run"]()
+        # Nothing was flushed, so no outcome may be kept either.
+        assert list(enrich_env["migrations"].iterdir()) == []
+        assert enrich_env["journal"].exists()
+        state = EnrichState(enrich_ingredients.STATE_DB)
+        assert state.recorded({("DE", p["ean"]) for p in PRODUCTS}) == set()
+        state.close()
+
+        monkeypatch.setattr(enrich_ingredients, "iter_products_by_codes", enrich_env["lookups"])
+        enrich_env["run"]()
+        assert len(enrich_env["looked_up"]) == len(PRODUCTS)
+        assert not enrich_env["journal"].exists()
+
+    def test_new_run_keeps_a_journal_with_recorded_outcomes(self, enrich_env: dict) -> None:
+        def fails(codes, fields=None, **kwargs):
+            for code in codes:
+                if code == PRODUCTS[4]["ean"]:
+                    raise ConnectionError("connection reset")
+                yield code, OFF.get(code)
+
+        enrich_ingredients.iter_products_by_codes = fails  # restored by the fixture's monkeypatch
+        with pytest.raises(ConnectionError):
+            enrich_env["run"]()
+        [partial] = enrich_env["migrations"].iterdir()
+        assert "-- Products processed: 3" in partial.read_text(encoding="utf-8")
+
+        enrich_ingredients.iter_products_by_codes = enrich_env["lookups"]
+        with pytest.raises(SystemExit):
+            enrich_env["run"]()
+        assert enrich_env["looked_up"] == []
+        assert enrich_env["journal"].exists()
+
+        # Product 4 was journaled but rolled back; resuming writes every product into the migration.
+        enrich_env["run"]("--resume")
+        assert list(enrich_env["migrations"].iterdir()) == [partial]
+        assert "-- Products processed: 7" in partial.read_text(encoding="utf-8")
+        assert enrich_env["looked_up"] == [p["ean"] for p in PRODUCTS[4:]]
+
+
+# ─── progress_line ─────────────────────────────────────────────────────────
+
+
+class TestProgressLine:
+    def test_reports_rate_retries_and_eta(self) -> None:
+        limiter = AdaptiveTokenBucket(2.0)
+        limiter.requests, limiter.failures, limiter.backoffs = 30, 2, 1
+        limiter.rate = 1.5
+        line = progress_line(100, 400, 60.0, limiter)
+        assert line == "Processed 100/400 — 0.50 req/s (limit 1.50), retries: 2, backoffs: 1, ETA 3.0 min"
+
+    def test_no_eta_before_the_first_product(self) -> None:
+        assert progress_line(0, 400, 0.0, AdaptiveTokenBucket(1.0)).endswith("ETA ?")
+
+
+# ─── EnrichState ───────────────────────────────────────────────────────────
+
+
+def _entry(i: int, found: bool = True, allergens: bool = True) -> dict:
+    entry = {"country": "DE", "ean": _product(i)["ean"], "found": found}
+    if found:
+        entry["allergens"] = [{"tag": "en:milk"}] if allergens else []
+    return entry
+
+
+class TestEnrichState:
+    NOW = 1_000_000.0
+
+    def test_outcomes_and_exponential_retries(self, tmp_path: Path) -> None:
+        state = EnrichState(tmp_path / "state.sqlite")
+        assert state.record(_entry(1), self.NOW) == "enriched"
+        assert state.record(_entry(2, found=False), self.NOW) == "not_found"
+        assert state.record(_entry(3, allergens=False), self.NOW) == "no_ingredients"
+
+        due, reasons = state.select(PRODUCTS[:4], self.NOW + 1)
+        assert [p["product_id"] for p in due] == [4]
+        assert reasons == {"new": 1, "skipped": 3}
+
+        due, reasons = state.select(PRODUCTS[:3], self.NOW + DAY)
+        assert [p["product_id"] for p in due] == [2, 3]
+        assert reasons == {"retry": 2, "skipped": 1}
+
+        # Each miss doubles the wait, up to RETRY_MAX.
+        state.record(_entry(2, found=False), self.NOW + DAY)
+        assert state.select([PRODUCTS[1]], self.NOW + 2 * DAY)[0] == []
+        assert state.select([PRODUCTS[1]], self.NOW + 3 * DAY)[0] == [PRODUCTS[1]]
+        assert [retry_interval(n) / DAY for n in (1, 2, 3, 6, 20)] == [1, 2, 4, 30, 30]
+        assert state.select([PRODUCTS[0]], self.NOW + RETRY_MAX)[0] == [PRODUCTS[0]]
+        state.close()
+
+    def test_new_ean_is_a_new_product(self, tmp_path: Path) -> None:
+        state = EnrichState(tmp_path / "state.sqlite")
+        state.record(_entry(1, found=False), self.NOW)
+        # A pipeline upsert bumps products.updated_at; only the key decides.
+        upserted = dict(PRODUCTS[0], updated_at=self.NOW + 60)
+        new_ean = dict(PRODUCTS[0], ean="4000000009999")
+        assert state.select([upserted, new_ean], self.NOW + 120) == ([new_ean], {"skipped": 1, "new": 1})
+        state.close()
+
+    def test_outcomes_persist_across_connections(self, tmp_path: Path) -> None:
+        state = EnrichState(tmp_path / "state.sqlite")
+        state.record(_entry(1, found=False), self.NOW)
+        state.commit()
+        state.record(_entry(2), self.NOW)
+        state.close()  # product 2 was never committed: its migration was not written
+        state = EnrichState(tmp_path / "state.sqlite")
+        state.record(_entry(1, found=False), self.NOW)
+        assert state.select([PRODUCTS[0]], self.NOW + 1.5 * DAY)[0] == []  # second miss: 2 days
+        assert state.recorded({("DE", PRODUCTS[0]["ean"]), ("DE", PRODUCTS[1]["ean"])}) == {("DE", PRODUCTS[0]["ean"])}
+        state.close()
+
+
+class TestIncrementalRun:
+    def test_next_run_looks_up_only_new_products(self, enrich_env: dict) -> None:
+        enrich_env["run"]()
+        assert len(enrich_env["looked_up"]) == len(PRODUCTS)
+
+        PRODUCTS.append(_product(8))
+        old_ean = PRODUCTS[1]["ean"]
+        try:
+            PRODUCTS[1]["ean"] = "4000000009999"  # EAN corrected since its lookup
+            enrich_env["run"]()
+        finally:
+            PRODUCTS.pop()
+            PRODUCTS[1]["ean"] = old_ean
+        assert enrich_env["looked_up"] == ["4000000009999", _product(8)["ean"]]
+
+        enrich_env["run"]("--full")
+        assert len(enrich_env["looked_up"]) == len(PRODUCTS)
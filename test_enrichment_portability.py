@@ -9,11 +9,14 @@ from __future__ import annotations
 
 import pytest
 
-from check_enrichment_identity import validate_statement
+from check_enrichment_identity import split_sql_statements, validate_statement
 from enrich_ingredients import (
+    IngredientRecord,
+    TaxonomyIndex,
     _format_ingredient_row,
     _gen_ingredient_batch,
     _gen_ingredient_section,
+    generate_migration,
     process_ingredients,
 )
 
@@ -233,6 +236,51 @@ class TestProcessIngredients:
         assert rows[0]["ingredient_name"] == "Xylitol"
 
 
+# ─── TaxonomyIndex ─────────────────────────────────────────────────────────
+
+class TestTaxonomyIndex:
+    def test_record_fields(self):
+        index = TaxonomyIndex({"wheat flour": 10})
+        assert index.record("en:wheat-flour") == IngredientRecord("wheat flour", "Wheat Flour", False, False, 10)
+        assert index.record("en:e160a") == IngredientRecord("e160a", "E160A", True, False, None)
+        assert index.record("12%").garbage
+        assert index.record("  ").garbage
+
+    def test_each_name_is_normalized_once(self):
+        index = TaxonomyIndex({"sugar": 1})
+        product = {"ingredients": [{"id": "en:sugar", "text": "sugar"}, {"id": "en:salt", "text": "salt"}]}
+        for i in range(50):
+            process_ingredients(product, "PL", str(i), index, {})
+        info = index.record.cache_info()
+        assert (info.misses, info.hits) == (2, 98)
+
+    def test_memo_is_bounded(self):
+        index = TaxonomyIndex({}, maxsize=8)
+        for i in range(100):
+            index.record(f"en:ingredient-{i}")
+        assert index.record.cache_info().currsize == 8
+
+    def test_same_rows_as_a_plain_lookup(self):
+        off_product = {
+            "ingredients": [
+                {"id": "en:wheat-flour", "text": "mąka", "ingredients": [{"id": "en:e160a", "text": "E160a"}]},
+                {"text": "Sól morska"},
+                {"text": "E471a"},
+                {"id": "en:x", "text": "x"},
+            ]
+        }
+        lookup = {"wheat flour": 10}
+        plain_new: dict = {}
+        indexed_new: dict = {}
+        plain = process_ingredients(off_product, "PL", "1", lookup, plain_new)
+        indexed = process_ingredients(off_product, "PL", "1", TaxonomyIndex(lookup), indexed_new)
+        assert indexed == plain
+        assert indexed_new == plain_new
+        # Additive flag only comes from a taxonomy id, never from free text
+        assert plain_new["e160a"]["is_additive"] is True
+        assert plain_new["e471a"]["is_additive"] is False
+
+
 # ─── validate_statement (identity guard) ───────────────────────────────────
 
 class TestValidateStatement:
@@ -304,3 +352,99 @@ class TestValidateStatement:
         sql = "\n".join(_gen_ingredient_batch(rows))
         issues = validate_statement(sql)
         assert issues == [], f"Generated SQL failed identity guard: {issues}"
+
+
+# ─── generate_migration(output_format="staged") ────────────────────────────
+
+_STATS = {"processed": 2, "with_ingredients": 2, "with_allergens": 1}
+_ALLERGENS = [{"country": "PL", "ean": "5900000000001", "tag": "en:gluten", "type": "contains"}]
+
+
+def _ingredient_rows() -> list[dict]:
+    return [
+        {
+            "country": "PL",
+            "ean": "5900000000001",
+            "ingredient_name": "Flour",
+            "position": 1,
+            "percent": 55.5,
+            "percent_estimate": 55.5,
+            "is_sub_ingredient": False,
+            "parent_ingredient_name": None,
+        },
+        {
+            "country": "PL",
+            "ean": "5900000000001",
+            "ingredient_name": "Salt\tflakes \\ fine",
+            "position": 2,
+            "percent": None,
+            "percent_estimate": 2.0,
+            "is_sub_ingredient": True,
+            "parent_ingredient_name": "Flour",
+        },
+        {
+            "country": "DE",
+            "ean": "4000000000002",
+            "ingredient_name": "Sugar",
+            "position": 1,
+            "percent": None,
+            "percent_estimate": None,
+            "is_sub_ingredient": True,
+            "parent_ingredient_name": None,
+        },
+    ]
+
+
+def _stage_rows(sql: str, table: str) -> list[str]:
+    """The staged VALUES rows for *table*, one literal tuple per entry."""
+    rows = []
+    for block in sql.split(f"INSERT INTO {table} (")[1:]:
+        rows.extend(line.strip().rstrip(",;") for line in block.split(" VALUES\n", 1)[1].split(";\n", 1)[0].split("\n"))
+    return rows
+
+
+class TestStagedMigration:
+    def test_passes_identity_guard(self):
+        sql = generate_migration(_ingredient_rows(), _ALLERGENS, {}, _STATS, "staged")
+        inserts = [s for s in split_sql_statements(sql) if "insert into product_" in s.lower()]
+        assert len(inserts) == 2
+        for stmt in inserts:
+            assert validate_statement(stmt) == []
+
+    def test_one_set_based_insert_per_table(self):
+        rows = _ingredient_rows() * 400
+        sql = generate_migration(rows, _ALLERGENS * 700, {}, _STATS, "staged")
+        assert sql.count("INSERT INTO product_ingredient") == 1
+        assert sql.count("INSERT INTO product_allergen_info") == 1
+        assert "FROM (VALUES" not in sql
+        assert "CREATE UNLOGGED TABLE enrich_stage_ingredient" in sql
+        assert sql.index("ANALYZE enrich_stage_ingredient") < sql.index("INSERT INTO product_ingredient")
+        assert len(_stage_rows(sql, "enrich_stage_ingredient")) == 1200
+        assert len(_stage_rows(sql, "enrich_stage_allergen")) == 700
+
+    def test_no_psql_only_syntax(self):
+        # supabase db reset / db push cannot apply COPY FROM stdin or psql meta-commands
+        sql = generate_migration(_ingredient_rows(), _ALLERGENS, {}, _STATS, "staged")
+        assert "COPY" not in sql
+        assert "FROM stdin" not in sql
+        assert not [line for line in sql.splitlines() if line.startswith("\\")]
+
+    def test_stage_rows_are_escaped(self):
+        sql = generate_migration(_ingredient_rows(), _ALLERGENS, {}, _STATS, "staged")
+        rows = _stage_rows(sql, "enrich_stage_ingredient")
+        assert rows[0] == "('PL', '5900000000001', 'Flour', 1, 55.5, 55.5, false, NULL)"
+        assert rows[1] == "('PL', '5900000000001', E'Salt\tflakes \\\\ fine', 2, NULL, 2.0, true, 'Flour')"
+        # A sub-ingredient without a parent is demoted, as in the VALUES output
+        assert rows[2].endswith(", false, NULL)")
+        assert _stage_rows(sql, "enrich_stage_allergen") == ["('PL', '5900000000001', 'en:gluten', 'contains')"]
+
+    def test_same_statements_outside_the_staging(self):
+        values = generate_migration(_ingredient_rows(), _ALLERGENS, {}, _STATS)
+        staged = generate_migration(_ingredient_rows(), _ALLERGENS, {}, _STATS, "staged")
+        for line in ("JOIN ingredient_ref ir ON lower(ir.name_en) = lower(v.ingredient_name)", "COMMIT;"):
+            assert line in values
+            assert line in staged
+
+    def test_unknown_format_raises(self):
+        with pytest.raises(ValueError, match="output format"):
+            generate_migration([], [], {}, _STATS, "csv")
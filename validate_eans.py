@@ -12,10 +12,10 @@ Output format (last line):
     Results: N valid, M invalid
 """
 
-import os
-import subprocess
 import sys
 
+from pipeline import db
+
 
 def ean_check_digit(digits: str, length: int) -> str:
     """Compute the expected check digit for an EAN-8 or EAN-13 prefix.
@@ -52,10 +52,6 @@ def validate_ean(ean: str) -> tuple[bool, str]:
     return True, ""
 
 
-DB_CONTAINER = "supabase_db_tryvit"
-DB_USER = "postgres"
-DB_NAME = "postgres"
-
 QUERY = """
 SELECT brand, product_name, category, ean
 FROM products
@@ -67,61 +63,26 @@ ORDER BY category, brand, product_name;
 
 
 def main() -> int:
-    # Build psql command — CI mode (PGHOST set) uses psql directly,
-    # local mode uses docker exec into the Supabase container
-    if os.environ.get("PGHOST"):
-        cmd = ["psql", "-t", "-A", "-F", "|", "-c", QUERY]
-    else:
-        cmd = [
-            "docker",
-            "exec",
-            "-i",
-            DB_CONTAINER,
-            "psql",
-            "-U",
-            DB_USER,
-            "-d",
-            DB_NAME,
-            "-t",
-            "-A",
-            "-F",
-            "|",
-            "-c",
-            QUERY,
-        ]
-
-    # Query the database
-    result = subprocess.run(
-        cmd,
-        capture_output=True,
-        text=True,
-        encoding="utf-8",
-    )
-
-    if result.returncode != 0:
-        print(f"ERROR: Database query failed:\n{result.stderr}", file=sys.stderr)
-        return 2
-
-    lines = [line for line in result.stdout.strip().splitlines() if line.strip()]
-    if not lines:
-        print("WARNING: No products with EAN codes found.")
-        return 0
-
     valid_count = 0
     invalid_count = 0
     invalid_details: list[str] = []
 
-    for line in lines:
-        parts = line.split("|", 3)
-        if len(parts) < 4:
-            continue
-        brand, product_name, category, ean = parts
-        is_valid, reason = validate_ean(ean)
-        if is_valid:
-            valid_count += 1
-        else:
-            invalid_count += 1
-            invalid_details.append(f"  [{category}] {brand} — {product_name}: {reason}")
+    # Stream the rows — the check needs each product once, never the full list
+    try:
+        for brand, product_name, category, ean in db.stream(QUERY):
+            is_valid, reason = validate_ean(ean)
+            if is_valid:
+                valid_count += 1
+            else:
+                invalid_count += 1
+                invalid_details.append(f"  [{category}] {brand} — {product_name}: {reason}")
+    except db.DatabaseError as exc:
+        print(f"ERROR: Database query failed:\n{exc}", file=sys.stderr)
+        return 2
+
+    if valid_count + invalid_count == 0:
+        print("WARNING: No products with EAN codes found.")
+        return 0
 
     # Print results
     if invalid_details: